@@ -0,0 +1 @@
+""" performance benchmarks of remotelogin connections against in-process stand-in servers (see benchmarks.run) """
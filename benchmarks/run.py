@@ -0,0 +1,868 @@
+""" runs the remotelogin benchmarks against the stand-in servers of remotelogin.connections.tests.servers and prints
+    json results
+
+    python -m benchmarks.run [--quick] [--only open,commands,...] [--output results.json]
+
+    Every benchmark returns a dictionary so results can be stored and compared between releases.
+    Times are in seconds, sizes in bytes and rates per second.
+"""
+import argparse
+import datetime
+import gc
+import json
+import logging
+import os
+import platform
+import socket
+import shlex
+import shutil
+import statistics
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from remotelogin.connections.tests import servers
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+LOCAL_PROMPT_RE = r'[\$#>] $'
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    return dict(n=len(samples), min=samples[0], median=statistics.median(samples), mean=statistics.mean(samples),
+                max=samples[-1])
+
+
+def to_json(value):
+    """ replaces the float values json does not have (like the +Inf upper bound of the latency histograms)
+        with the strings used by OpenMetrics ("+Inf", "-Inf") and NaN with null
+    """
+    if isinstance(value, float):
+        if value != value:
+            return None
+        if value in (float('inf'), float('-inf')):
+            return '+Inf' if value > 0 else '-Inf'
+    elif isinstance(value, dict):
+        return {k: to_json(v) for k, v in value.items()}
+    elif isinstance(value, (list, tuple)):
+        return [to_json(v) for v in value]
+    return value
+
+
+def timed(f, *args, **kwargs):
+    t0 = time.perf_counter()
+    ret = f(*args, **kwargs)
+    return time.perf_counter() - t0, ret
+
+
+class Targets:
+    """ builds remotelogin connections to the running servers """
+
+    def __init__(self, ssh_port, telnet_port, host='127.0.0.1'):
+        self.host = host
+        self.ssh_port = ssh_port
+        self.telnet_port = telnet_port
+
+    def ssh(self, **kwargs):
+        from remotelogin.connections.ssh import SshConnection
+        return SshConnection(self.host, port=self.ssh_port, username=servers.DEFAULT_USERNAME,
+                             password=servers.DEFAULT_PASSWORD, expected_prompt=servers.DEFAULT_PROMPT_RE, **kwargs)
+
+    def telnet(self, **kwargs):
+        from remotelogin.connections.telnet import TelnetConnectionUnwrapped
+        return TelnetConnectionUnwrapped(self.host, port=self.telnet_port, username=servers.DEFAULT_USERNAME,
+                                         password=servers.DEFAULT_PASSWORD,
+                                         expected_prompt=servers.DEFAULT_PROMPT_RE, **kwargs)
+
+    def local(self, **kwargs):
+        from remotelogin.connections.local import LocalConnection
+        return LocalConnection(with_shell=True, expected_prompt=LOCAL_PROMPT_RE, **kwargs)
+
+    def device(self, **ssh_kwargs):
+        from remotelogin.devices.base import DeviceBase
+        user = dict(username=servers.DEFAULT_USERNAME, password=servers.DEFAULT_PASSWORD)
+        return DeviceBase(self.host, default_ip_address=self.host,
+                          connections=dict(ssh=dict(proto='ssh', port=self.ssh_port, user=user,
+                                                    expected_prompt=servers.DEFAULT_PROMPT_RE, **ssh_kwargs)))
+
+    def terminal(self, kind, hops=1, **terminal_kwargs):
+        from remotelogin.connections.terminal import TerminalConnection
+        return TerminalConnection([getattr(self, kind)() for _ in range(hops)], **terminal_kwargs)
+
+
+def bench_open(targets, kinds, repeat):
+    """ time to open a terminal session (login + prompt setup) and to close it """
+    ret = {}
+    for kind in kinds:
+        opens, closes = [], []
+        for _ in range(repeat):
+            t = targets.terminal(kind)
+            opens.append(timed(t.open)[0])
+            closes.append(timed(t.close)[0])
+        ret[kind] = dict(open=summarize(opens), close=summarize(closes))
+    return ret
+
+
+def bench_commands(targets, kinds, count):
+    """ short commands round trip (check_output) per second on an open session """
+    ret = {}
+    for kind in kinds:
+        with targets.terminal(kind) as t:
+            t.reset_stats()
+            latencies = [timed(t.check_output, 'echo {}'.format(i))[0] for i in range(count)]
+            ret[kind] = dict(commands_per_sec=count / sum(latencies), latency=summarize(latencies),
+                             session_stats=t.stats())
+    return ret
+
+
+def bench_expect_throughput(targets, kinds, size):
+    """ large outputs: how fast the expect loop consumes data until it finds the prompt """
+    ret = {}
+    for kind in kinds:
+        with targets.terminal(kind) as t:
+            t.reset_stats()
+            elapsed, out = timed(t.check_output, 'bytes {}'.format(size), timeout=120)
+            ret[kind] = dict(bytes=len(out), seconds=elapsed, mb_per_sec=len(out) / elapsed / 1e6,
+                             session_stats=t.stats())
+    return ret
+
+
+def bench_expect_throughput_local(targets, size):
+    """ same as bench_expect_throughput but with a real local shell (head -c of /dev/zero through base64) """
+    with targets.terminal('local') as t:
+        elapsed, out = timed(t.check_output, 'head -c {} /dev/zero | base64 -w 80'.format(size * 3 // 4),
+                             timeout=120)
+        return dict(bytes=len(out), seconds=elapsed, mb_per_sec=len(out) / elapsed / 1e6, session_stats=t.stats())
+
+
+def bench_sftp(targets, size):
+    """ sftp put/get MB/s through SshConnection.put_file/get_file """
+    with tempfile.TemporaryDirectory() as tmp:
+        local_file = os.path.join(tmp, 'bench.bin')
+        with open(local_file, 'wb') as f:
+            f.write(os.urandom(size))
+
+        conn = targets.ssh()
+        with conn:
+            put_time, _ = timed(conn.put_file, local_file, 'bench.bin')
+            get_time, _ = timed(conn.get_file, 'bench.bin', os.path.join(tmp, 'bench_get.bin'), replace=True)
+
+    return dict(bytes=size, put_seconds=put_time, get_seconds=get_time,
+                put_mb_per_sec=size / put_time / 1e6, get_mb_per_sec=size / get_time / 1e6)
+
+
+def bench_multi_hop(targets, max_hops, repeat):
+    """ open time of an ssh chain (paramiko proxyjump through the same stand-in server) by number of hops """
+    ret = {}
+    for hops in range(1, max_hops + 1):
+        opens = []
+        for _ in range(repeat):
+            t = targets.terminal('ssh', hops=hops)
+            opens.append(timed(t.open)[0])
+            t.close()
+        ret[str(hops)] = summarize(opens)
+    return ret
+
+
+def run_threads(target, threads):
+    """ runs target(thread index) in that many threads started at the same time. returns the elapsed time """
+    barrier = threading.Barrier(threads + 1)
+    errors = []
+
+    def run(i):
+        barrier.wait()
+        try:
+            target(i)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=run, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    barrier.wait()
+    t0 = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - t0
+    if errors:
+        raise errors[0]
+    return elapsed
+
+
+def bench_contention(targets, threads, lookups, opens):
+    """ many threads sharing one device: looking up its open connection instances (directly and through the
+        device attribute forwarding) and opening/closing their own instances of the same connection
+    """
+    d = targets.device()
+    ret = dict(threads=threads)
+    with d.conn.open():
+        def lookup(i):
+            for _ in range(lookups):
+                d.conn.get_open_instance()
+                d.conn.get_open_instance('ssh')
+                d.is_open
+
+        elapsed = run_threads(lookup, threads)
+        ret['lookups_per_sec'] = threads * lookups * 3 / elapsed
+
+        def open_close(i):
+            for j in range(opens):
+                d.conn.open(instance_name='t{}-{}'.format(i, j)).close()
+
+        elapsed = run_threads(open_close, threads)
+        ret['opens_per_sec'] = threads * opens / elapsed
+
+    return ret
+
+
+def bench_lease(targets, threads, tasks, max_sessions):
+    """ worker threads running short tasks on one device: opening a session per task vs leasing one from the
+        connection pool (at most max_sessions open)
+    """
+    ret = dict(threads=threads, tasks_per_thread=tasks, max_sessions=max_sessions)
+
+    d = targets.device()
+
+    def open_per_task(i):
+        for j in range(tasks):
+            with d.conn.open(instance_name='t{}-{}'.format(i, j)) as conn:
+                conn.check_output('echo {}'.format(j))
+
+    elapsed = run_threads(open_per_task, threads)
+    ret['open_per_task_tasks_per_sec'] = threads * tasks / elapsed
+
+    d = targets.device(max_sessions=max_sessions)
+
+    def lease(i):
+        for j in range(tasks):
+            with d.conn.lease('ssh') as conn:
+                conn.check_output('echo {}'.format(j))
+
+    elapsed = run_threads(lease, threads)
+    ret['lease_tasks_per_sec'] = threads * tasks / elapsed
+    ret['sessions_opened'] = d.conn['ssh'].pool.size
+    d.conn.close_all()
+    return ret
+
+
+def _package_dirs():
+    import fdutils
+    import remotelogin
+    return tuple(os.path.dirname(m.__file__) + os.sep for m in (remotelogin, fdutils))
+
+
+def bench_memory(targets, kinds, sessions):
+    """ python heap bytes per open idle session (tracemalloc, client side only as servers run in another process)
+
+        bytes_per_session is everything allocated while opening (paramiko transport and threads included) and
+        own_bytes_per_session only what was allocated from remotelogin/fdutils code
+    """
+    package_dirs = _package_dirs()
+    ret = {}
+    for kind in kinds:
+        # first open outside of the measure so imports and module level caches do not count
+        targets.terminal(kind).open().close()
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        opened = []
+        try:
+            for _ in range(sessions):
+                opened.append(targets.terminal(kind).open())
+            gc.collect()
+            diff = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        finally:
+            tracemalloc.stop()
+            for t in opened:
+                t.close()
+        total = sum(d.size_diff for d in diff)
+        own = sum(d.size_diff for d in diff if d.traceback[0].filename.startswith(package_dirs))
+        ret[kind] = dict(sessions=sessions, bytes_per_session=total // sessions,
+                         own_bytes_per_session=own // sessions)
+    return ret
+
+
+def _device_db(path):
+    """ sqlite db with the devices table where Device will be stored and a crypto engine for the passwords """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from fdutils import crypto
+    from remotelogin.devices.base_db import Device
+
+    engine = create_engine('sqlite:///' + path)
+    Device.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    Device.set_session(session)
+    crypto.DEFAULT_CRYPTO_ENGINE = crypto.SecuredTextEngine(password=b'benchmarks')
+    return session
+
+
+def bench_devices(count):
+    """ time to load an inventory of encrypted devices from the db: eager (every device fully initialized),
+        lazy (Device.load_many) and lazy plus using every device afterwards
+    """
+    from remotelogin.devices.base_db import Device
+
+    ret = dict(devices=count)
+    with tempfile.TemporaryDirectory() as tmp:
+        session = _device_db(os.path.join(tmp, 'devices.db'))
+
+        users = dict(admin=dict(password='secret'), default_name='admin')
+        connections = dict(ssh=dict(proto='ssh', user='admin'), telnet=dict(proto='telnet', user='admin'),
+                           default_name='ssh')
+        t0 = time.perf_counter()
+        for i in range(count):
+            ip = '10.{}.{}.{}'.format(i >> 16 & 255, i >> 8 & 255, i & 255)
+            d = Device(ip, default_ip_address=ip, users=users, connections=connections, encrypt_passwords=True)
+            d.connectionsjson = d._data_to_json(d.conn)
+            d.usersjson = d._data_to_json(d.users)
+            d.interfacesjson = d._data_to_json(d.interfaces)
+            d.tunnelsjson = d._data_to_json(d.tunnels)
+            session.add(d)
+        session.commit()
+        ret['create_seconds'] = time.perf_counter() - t0
+
+        def load(f):
+            session.expunge_all()
+            gc.collect()
+            return timed(f)
+
+        ret['eager_seconds'], devices = load(Device.get_by_filters_all)
+        ret['lazy_seconds'], devices = load(Device.load_many)
+        ret['lazy_and_use_seconds'] = load(lambda: [d.conn.default for d in Device.load_many()])[0]
+        ret['devices_per_sec_lazy'] = count / ret['lazy_seconds']
+        session.close()
+
+    return ret
+
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES, name)) as f:
+        return f.read()
+
+
+class ReplayConnection:
+    """ answers check_output with recorded outputs after a fixed round trip time and counts the commands sent """
+
+    def __init__(self, outputs, rtt):
+        self.outputs = outputs      # (substring of the command, output) first match wins
+        self.rtt = rtt
+        self.commands = 0
+
+    def check_output(self, command):
+        self.commands += 1
+        time.sleep(self.rtt)
+        for key, output in self.outputs:
+            if key in command:
+                return output
+        raise ValueError('no recorded output for ' + command)
+
+
+def _facts_with_processes(processes):
+    """ the recorded facts output with its processes repeated (with new pids) until there are that many """
+    from remotelogin.oper_sys.linux import facts
+
+    sections = {name: list(lines) for name, lines in facts.iter_sections(_fixture('linux_facts.txt'))}
+    ps = [line.split(None, 1) for line in sections['ps']]
+    smaps = dict(line.split(None, 1) for line in sections['smaps'])
+    sections['ps'], sections['smaps'] = [], []
+    for i in range(processes):
+        pid, args = ps[i % len(ps)]
+        new_pid = str(i + 1)
+        sections['ps'].append('{:>7} {}'.format(new_pid, args))
+        if pid in smaps:
+            sections['smaps'].append(new_pid + ' ' + smaps[pid])
+    return ''.join('@@facts@@ {}\n{}\n'.format(name, '\n'.join(lines)) for name, lines in sections.items())
+
+
+def _memory_per_process_per_pid(conn):
+    """ the memory per process as it was collected before the facts engine: ps and then one smaps per process """
+    mem = {}
+    for line in conn.check_output('ps -eo pid=,args=').splitlines():
+        pid, cmd = line.split(None, 1)
+        private = shared = pss = 0
+        have_pss = False
+        for smaps_line in conn.check_output('cat /proc/{}/smaps'.format(pid)).splitlines():
+            if smaps_line.startswith('Shared'):
+                shared += int(smaps_line.split()[1])
+            elif smaps_line.startswith('Private'):
+                private += int(smaps_line.split()[1])
+            elif smaps_line.startswith('Pss:'):
+                have_pss = True
+                pss += float(smaps_line.split()[1]) + 0.5
+        mem[(cmd, pid)] = (private, pss - private if have_pss else shared)
+    return mem
+
+
+def bench_facts(processes, rtt, repeat):
+    """ memory per process of a host with that many processes replaying recorded outputs with a round trip time:
+        one ps plus one smaps command per process vs the facts engine (one command and one parsing pass)
+    """
+    from remotelogin.oper_sys import os_factory
+    from remotelogin.oper_sys.linux import facts
+
+    linux = os_factory('linux')
+    text = _facts_with_processes(processes)
+    ps_section = text.split('@@facts@@ ps\n', 1)[1].split('@@facts@@', 1)[0]
+    ret = dict(processes=processes, rtt=rtt, output_bytes=len(text))
+
+    conn = ReplayConnection([('@@facts@@', text), ('smaps', _fixture('linux_smaps.txt')), ('ps ', ps_section)], rtt)
+    ret['per_pid_seconds'], _ = timed(_memory_per_process_per_pid, conn)
+    ret['per_pid_commands'] = conn.commands
+
+    conn = ReplayConnection([('@@facts@@', text)], rtt)
+    ret['facts_seconds'] = summarize([timed(linux.get_memory_per_process, conn=conn)[0] for _ in range(repeat)])
+    ret['facts_commands'] = conn.commands // repeat
+
+    ret['parse_seconds'] = summarize([timed(facts.parse, text)[0] for _ in range(repeat)])
+    ret['parse_lines_per_sec'] = text.count('\n') / ret['parse_seconds']['median']
+    return ret
+
+
+def _hex_address(ip, port):
+    """ ip:port as /proc/net/tcp shows it """
+    if ':' in ip:
+        raw = socket.inet_pton(socket.AF_INET6, ip)
+        raw = b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4))
+    else:
+        raw = socket.inet_pton(socket.AF_INET, ip)[::-1]
+    return '{}:{:04X}'.format(raw.hex().upper(), port)
+
+
+def _tcp_table(count):
+    """ the recorded sockets of a load balancer: its listening ones plus the rest repeated with other clients until
+        there are count
+    """
+    from remotelogin.oper_sys.linux import sockets
+
+    recorded = sockets.parse(_fixture('linux_ss.txt'))
+    listening = [s for s in recorded if s.state == 'LISTEN']
+    others = [s for s in recorded if s.state != 'LISTEN']
+    table = list(listening)
+    for i in range(count - len(listening)):
+        s = others[i % len(others)]
+        client = i // 4
+        remote_ip = ('2001:db8:ff::{:x}'.format(client) if ':' in s.remote_ip else
+                     '198.51.{}.{}'.format(client >> 8 & 255, client & 255))
+        table.append(s._replace(remote_ip=remote_ip, remote_port=1024 + i % 60000))
+    return table
+
+
+def _ss_output(table):
+    from remotelogin.oper_sys.linux import sockets
+
+    ss_states = dict(zip(sockets.TCP_STATES, sockets.LinuxShellCmds.SS_TCP_STATES))
+    ss_ip = lambda ip: '[{}]'.format(ip) if ':' in ip else ip
+    return '\n'.join('{} {}:{} {}:{}'.format(ss_states[s.state], ss_ip(s.local_ip), s.local_port,
+                                             ss_ip(s.remote_ip), s.remote_port) for s in table)
+
+
+def _proc_output(table):
+    from remotelogin.oper_sys.linux import sockets
+
+    return '\n'.join('{:02X} {} {}'.format(sockets.TCP_STATES.index(s.state) + 1,
+                                           _hex_address(s.local_ip, s.local_port),
+                                           _hex_address(s.remote_ip, s.remote_port)) for s in table)
+
+
+def _pairs_output(table):
+    """ what the host sends back for LinuxShellCmds.tcp_connection_pairs of the established sockets of the table """
+    from remotelogin.oper_sys.linux import sockets
+
+    return '\n'.join('{} {} {} {}'.format(p.server, p.server_port, p.client, p.client_port)
+                     for p in sockets.connection_pairs(table))
+
+
+def _host_files(table, folder):
+    """ the table as the raw outputs of ss -tan and /proc/net/tcp in files of the folder """
+    from remotelogin.oper_sys.linux import sockets
+
+    ss_states = dict(zip(sockets.TCP_STATES, sockets.LinuxShellCmds.SS_TCP_STATES))
+    ss_ip = lambda ip: '[{}]'.format(ip) if ':' in ip else ip
+    ss = os.path.join(folder, 'ss')
+    with open(ss, 'w') as f:
+        f.write('State Recv-Q Send-Q Local Address:Port Peer Address:Port\n')
+        f.writelines('{} 0 0 {}:{} {}:{}\n'.format(ss_states[s.state], ss_ip(s.local_ip), s.local_port,
+                                                   ss_ip(s.remote_ip), s.remote_port) for s in table)
+    proc = os.path.join(folder, 'tcp')
+    with open(proc, 'w') as f:
+        f.write('  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n')
+        f.writelines('{:4}: {} {} {:02X} 00000000:00000000 00:00000000 00000000 0 0 {} 1\n'.format(
+            i, _hex_address(s.local_ip, s.local_port), _hex_address(s.remote_ip, s.remote_port),
+            sockets.TCP_STATES.index(s.state) + 1, i) for i, s in enumerate(table))
+    return ss, proc
+
+
+def _run_on_host(command, ss, proc):
+    """ output of the command run by sh with ss replaced by the file ss (or taken from the file proc if ss is None) """
+    command = command.replace('/proc/net/tcp /proc/net/tcp6', proc)
+    if ss is None:
+        command = command.replace('command -v ss', 'false')
+    else:
+        command = command.replace('ss -tan', 'cat ' + shlex.quote(ss))
+    return subprocess.run(['sh', '-c', command], stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+def bench_tcp_table(count, rtt, repeat):
+    """ server/client pairs of the established connections of a host with count sockets replaying recorded outputs:
+        netstat listen and established commands parsed line by line vs one ss (or /proc/net/tcp) command paired on
+        the host. The commands replay what the host sends back as the filtering and pairing are done there. The time
+        the host takes to do it (with the local awk) is measured apart, as is the parsing throughput of the whole
+        table
+    """
+    from remotelogin.oper_sys import os_factory
+    from remotelogin.oper_sys.linux import sockets
+
+    linux = os_factory('linux')
+    table = _tcp_table(count)
+    wanted = [s for s in table if s.state in ('ESTABLISHED', 'LISTEN')]
+    ret = dict(sockets=count, established=sum(s.state == 'ESTABLISHED' for s in table), rtt=rtt)
+
+    netstat_listen = '\n'.join('{}:{}'.format(s.local_ip, s.local_port) for s in wanted if s.state == 'LISTEN')
+    netstat = '\n'.join('{}:{} {}:{}'.format(s.local_ip, s.local_port, s.remote_ip, s.remote_port)
+                        for s in wanted if s.state == 'ESTABLISHED')
+    conn = ReplayConnection([('listen', netstat_listen), ('established', netstat)], rtt)
+    ret['netstat_seconds'] = summarize([timed(linux.tcp_get_connections_from_list, 'established', 'listen', ':',
+                                              conn=conn)[0] for _ in range(repeat)])
+    ret['netstat_commands'] = conn.commands // repeat
+
+    # ss and /proc/net/tcp give the same pairs as the host converts the addresses
+    conn = ReplayConnection([('ss -tan', _pairs_output(wanted))], rtt)
+    ret['pairs_seconds'] = summarize([timed(linux.get_tcp_connection_pairs, conn=conn)[0] for _ in range(repeat)])
+    ret['pairs_commands'] = conn.commands // repeat
+
+    for name, output in (('ss', _ss_output), ('proc', _proc_output)):
+        whole = output(table)
+        parse_seconds = summarize([timed(sockets.parse, whole)[0] for _ in range(repeat)])
+        ret[name + '_parse_sockets_per_sec'] = count / parse_seconds['median']
+
+    if shutil.which('awk'):
+        command = linux.cmd.tcp_connection_pairs('ESTABLISHED', True)
+        with tempfile.TemporaryDirectory() as folder:
+            ss, proc = _host_files(table, folder)
+            for name, ss_file in (('ss', ss), ('proc', None)):
+                ret[name + '_host_seconds'] = summarize([timed(_run_on_host, command, ss_file, proc)[0]
+                                                         for _ in range(repeat)])
+
+    return ret
+
+
+def _follow_until(linux, conn, path, pattern, last_offset):
+    """ seconds and lines received following the file from its start until the line ending at last_offset """
+    t0 = time.perf_counter()
+    received = 0
+    for index, offset, line in linux.follow_files([(path, 0)], pattern, conn=conn):
+        received += line is not None
+        if offset >= last_offset:
+            break
+    return time.perf_counter() - t0, received
+
+
+def bench_follow(lines, repeat):
+    """ following a log file of lines through a local connection: filtered on the device (awk) vs every line sent
+        and filtered by the consumer
+    """
+    import re
+    from remotelogin.connections.local import LocalConnection
+    from remotelogin.oper_sys import os_factory
+
+    linux = os_factory('linux')
+    ret = dict(lines=lines)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'app.log')
+        with open(path, 'w') as f:
+            for i in range(lines):
+                f.write('2020-01-01T00:00:{:02d} host app[{}]: {} request {} done\n'.format(
+                    i % 60, i % 1000, 'ERROR' if i % 100 == 0 else 'INFO', i))
+            f.write('2020-01-01T00:00:00 host app[0]: ERROR last\n')
+        size = os.path.getsize(path)
+
+        with LocalConnection().open() as conn:
+            for name, pattern in (('device', 'ERROR'), ('consumer', '')):
+                samples = [_follow_until(linux, conn, path, pattern, size) for _ in range(repeat)]
+                ret[name + '_seconds'] = summarize([s for s, _ in samples])
+                ret[name + '_lines_received'] = samples[0][1]
+
+        error = re.compile('ERROR')
+        with open(path) as f:
+            ret['consumer_matching'] = sum(1 for line in f if error.search(line))
+    ret['device_lines_per_sec'] = lines / ret['device_seconds']['median']
+    return ret
+
+
+def bench_tail(lines, last, repeat):
+    """ last lines of a local file of lines: fdutils.files.tail (counted by blocks from the end on a mmap) vs
+        reading the whole file into a deque
+    """
+    import collections
+    from fdutils import files
+
+    ret = dict(lines=lines, last=last)
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'app.log')
+        with open(path, 'w') as f:
+            for i in range(lines):
+                f.write('2020-01-01T00:00:{:02d} host app[{}]: INFO request {} done\n'.format(i % 60, i % 1000, i))
+        ret['size'] = os.path.getsize(path)
+
+        def deque_tail():
+            with open(path) as f:
+                return [line.rstrip('\n') for line in collections.deque(f, maxlen=last)]
+
+        def tailer_iterate():
+            with open(path) as f:
+                return list(files.Tailer(f, num_lines=last))
+
+        expected = deque_tail()
+        for name, f in (('tail', lambda: files.tail(path, last)), ('tailer_iterator', tailer_iterate),
+                        ('deque', deque_tail)):
+            samples = [timed(f) for _ in range(repeat)]
+            assert sorted(samples[0][1]) == sorted(expected)
+            ret[name + '_seconds'] = summarize([s for s, _ in samples])
+    ret['tail_lines_per_sec'] = last / ret['tail_seconds']['median']
+    return ret
+
+
+def bench_loops(tasks, items, idle_seconds, repeat):
+    """ background loops (like the readers of check_output_nb): a thread per loop (ThreadLoopWithQueue) vs the
+        tasks of a LoopScheduler (LoopTaskWithQueue). Time for the loops to get items each, threads used and cpu
+        spent by loops waiting idle_seconds without data
+    """
+    import queue
+    from fdutils import parallel
+
+    def counter():
+        values = iter(range(items))
+
+        def target():
+            value = next(values, None)
+            return parallel.POISON_PILL if value is None else str(value)
+        return target
+
+    def no_data():
+        raise queue.Empty
+
+    ret = dict(tasks=tasks, items=items, idle_seconds=idle_seconds)
+    for name, cls in (('threads', parallel.ThreadLoopWithQueue), ('scheduler', parallel.LoopTaskWithQueue)):
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            loops = [cls(counter()) for _ in range(tasks)]
+            for loop in loops:
+                loop.start()
+            for loop in loops:
+                loop.join(timeout=60)
+            samples.append(time.perf_counter() - t0)
+            assert all(len(loop.queue.queue) == items for loop in loops)
+        ret[name + '_seconds'] = summarize(samples)
+
+        loops = [cls(no_data) for _ in range(tasks)]
+        cpu = time.process_time()
+        for loop in loops:
+            loop.start()
+        time.sleep(idle_seconds)
+        ret[name + '_threads'] = threading.active_count()
+        for loop in loops:
+            loop.stop()
+        ret[name + '_idle_cpu_seconds'] = time.process_time() - cpu
+    return ret
+
+
+def _synthetic_capture(path, size, hosts):
+    """ pcap file of about size bytes of tcp connections from hosts clients to a server (syn, syn-ack, ack and 5 data
+        packets each, 100 microseconds apart). Returns the number of packets
+    """
+    import numpy as np
+
+    record = np.dtype([('ts_sec', '<u4'), ('ts_usec', '<u4'), ('caplen', '<u4'), ('length', '<u4'),
+                       ('macs', 'V12'), ('ethertype', '>u2'), ('version_ihl', 'u1'), ('tos', 'u1'),
+                       ('total_length', '>u2'), ('ident', '>u2'), ('fragment', '>u2'), ('ttl', 'u1'),
+                       ('proto', 'u1'), ('checksum', '>u2'), ('src', '>u4'), ('dst', '>u4'), ('sport', '>u2'),
+                       ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'), ('offset', 'u1'), ('flags', 'u1'),
+                       ('window', '>u2'), ('tcp_checksum', '>u2'), ('urgent', '>u2'), ('payload', 'V42')])
+    server = 0x0aff0001
+    packets = size // record.itemsize
+    chunk = 1 << 20
+    with open(path, 'wb') as f:
+        f.write(struct.pack('<IHHiIII', 0xa1b2c3d4, 2, 4, 0, 0, 65535, 1))
+        for start in range(0, packets, chunk):
+            i = np.arange(start, min(start + chunk, packets), dtype=np.uint64)
+            conn, kind = i // 8, i % 8
+            client = (0x0a000001 + conn % hosts).astype(np.uint32)
+            client_port = (1024 + conn % 60000).astype(np.uint16)
+            from_server = kind == 1
+            usecs = 1600000000 * 1000000 + i * 100
+
+            r = np.zeros(len(i), dtype=record)
+            r['ts_sec'], r['ts_usec'] = usecs // 1000000, usecs % 1000000
+            r['caplen'] = r['length'] = record.itemsize - 16
+            r['ethertype'], r['version_ihl'], r['ttl'], r['proto'], r['offset'] = 0x0800, 0x45, 64, 6, 0x50
+            r['total_length'] = record.itemsize - 16 - 14
+            r['src'] = np.where(from_server, server, client)
+            r['dst'] = np.where(from_server, client, server)
+            r['sport'] = np.where(from_server, 22, client_port)
+            r['dport'] = np.where(from_server, client_port, 22)
+            client_isn, server_isn = (conn * 7919).astype(np.uint32), (conn * 104729).astype(np.uint32)
+            r['seq'] = np.where(from_server, server_isn, client_isn + (kind > 0))
+            r['ack'] = np.where(kind == 0, 0, np.where(from_server, client_isn + 1, server_isn + 1))
+            r['flags'] = np.choose(np.minimum(kind, 3).astype(np.int64), [0x02, 0x12, 0x10, 0x18])
+            f.write(r.tobytes())
+    return packets
+
+
+def _per_packet_syn_timestamps(path, host_ip):
+    """ the deltas between syns of get_list_of_syn_timestamps_from_host decoding packet by packet """
+    with open(path, 'rb') as f:
+        f.read(24)
+        list_ts = []
+        prev_ts = 0
+        while True:
+            header = f.read(16)
+            if len(header) < 16:
+                return list_ts
+            sec, usec, caplen, _ = struct.unpack('<IIII', header)
+            frame = f.read(caplen)
+            if frame[12:14] != b'\x08\x00' or frame[23] != 6:
+                continue
+            ihl = (frame[14] & 0x0f) * 4
+            if frame[14 + ihl + 13] & 0x02 and socket.inet_ntoa(frame[26:30]) == host_ip:
+                ts = sec + usec / 1000000.
+                if not prev_ts:
+                    prev_ts = ts
+                list_ts.append(ts - prev_ts)
+                prev_ts = ts
+
+
+def bench_pcap(size, hosts, repeat):
+    """ tcp syns of a host and handshakes in a synthetic capture: fdutils.pcap (mmap, columns decoded with numpy by
+        chunks) vs reading and decoding the packets one by one
+    """
+    from fdutils import pcap
+
+    ret = dict(hosts=hosts)
+    host = '10.0.0.1'
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, 'snoop.pcap')
+        ret['packets'] = _synthetic_capture(path, size, hosts)
+        ret['size'] = os.path.getsize(path)
+
+        def syn_timestamps():
+            deltas = pcap.inter_arrival(pcap.read(path, src=host, tcpflags=pcap.TH_SYN).ts)
+            deltas[:1] = 0
+            return deltas.tolist()
+
+        def handshakes():
+            return pcap.handshakes(pcap.read(path, proto='tcp', host=host))
+
+        expected = _per_packet_syn_timestamps(path, host)
+        for name, f in (('syn_timestamps', syn_timestamps), ('per_packet_syn_timestamps',
+                                                              lambda: _per_packet_syn_timestamps(path, host)),
+                        ('handshakes', handshakes)):
+            samples = [timed(f) for _ in range(repeat)]
+            ret[name + '_seconds'] = summarize([s for s, _ in samples])
+            # every connection of the host is established
+            assert len(samples[0][1]) == len(expected)
+    ret['packets_per_sec'] = ret['packets'] / ret['syn_timestamps_seconds']['median']
+    ret['per_packet_packets_per_sec'] = ret['packets'] / ret['per_packet_syn_timestamps_seconds']['median']
+    return ret
+
+
+BENCHMARKS = ('open', 'commands', 'expect', 'sftp', 'multi_hop', 'memory', 'contention', 'lease', 'devices', 'facts',
+              'tcp_table', 'follow', 'tail', 'loops', 'pcap')
+SERVER_BENCHMARKS = BENCHMARKS[:-7]
+
+
+def run_server_benchmarks(only, quick):
+    repeat = 3 if quick else 10
+    remote_kinds = ('ssh', 'telnet')
+    all_kinds = remote_kinds + ('local',)
+
+    results = {}
+    with servers.start_in_subprocess('ssh') as ssh_server, servers.start_in_subprocess('telnet') as telnet_server:
+        targets = Targets(ssh_server.port, telnet_server.port)
+
+        if 'open' in only:
+            results['open'] = bench_open(targets, all_kinds, repeat)
+        if 'commands' in only:
+            results['commands'] = bench_commands(targets, all_kinds, 50 if quick else 500)
+        if 'expect' in only:
+            size = (1 if quick else 10) * 1000000
+            results['expect'] = bench_expect_throughput(targets, remote_kinds, size)
+            results['expect']['local'] = bench_expect_throughput_local(targets, size)
+        if 'sftp' in only:
+            results['sftp'] = bench_sftp(targets, (4 if quick else 64) * 1000000)
+        if 'multi_hop' in only:
+            results['multi_hop'] = bench_multi_hop(targets, 3 if quick else 5, repeat)
+        if 'memory' in only:
+            results['memory'] = bench_memory(targets, all_kinds, 5 if quick else 50)
+        if 'contention' in only:
+            results['contention'] = bench_contention(targets, 64, 2000 if quick else 20000, 1 if quick else 3)
+        if 'lease' in only:
+            results['lease'] = bench_lease(targets, 8, 10 if quick else 50, 4)
+
+    return results
+
+
+def run(only=BENCHMARKS, quick=False):
+    from remotelogin.__version__ import __version__
+
+    results = {}
+    if set(only) & set(SERVER_BENCHMARKS):
+        results.update(run_server_benchmarks(only, quick))
+    if 'devices' in only:
+        results['devices'] = bench_devices(1000 if quick else 20000)
+    if 'facts' in only:
+        results['facts'] = bench_facts(500 if quick else 5000, 0.01, 3 if quick else 10)
+    if 'tcp_table' in only:
+        results['tcp_table'] = bench_tcp_table(100000, 0.01, 3 if quick else 10)
+    if 'follow' in only:
+        results['follow'] = bench_follow(100000 if quick else 1000000, 3 if quick else 5)
+    if 'tail' in only:
+        results['tail'] = bench_tail(1000000 if quick else 10000000, 100000, 3 if quick else 5)
+    if 'loops' in only:
+        results['loops'] = bench_loops(200 if quick else 1000, 100, 1 if quick else 5, 3 if quick else 5)
+    if 'pcap' in only:
+        results['pcap'] = bench_pcap((64 if quick else 1024) * 1000000, 250, 3)
+
+    return dict(meta=dict(remotelogin=__version__, python=platform.python_version(),
+                          platform=platform.platform(), quick=quick,
+                          date=datetime.datetime.utcnow().isoformat(timespec='seconds')),
+                results=results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', default=','.join(BENCHMARKS),
+                        help='comma separated list of benchmarks to run ({})'.format(', '.join(BENCHMARKS)))
+    parser.add_argument('--quick', action='store_true', help='fewer repetitions and smaller payloads')
+    parser.add_argument('--output', help='file where to write the json results (default stdout)')
+    args = parser.parse_args(argv)
+
+    only = [o.strip() for o in args.only.split(',') if o.strip()]
+    unknown = set(only) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    results = to_json(run(only, args.quick))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, allow_nan=False)
+    else:
+        json.dump(results, sys.stdout, indent=2, allow_nan=False)
+        sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,5 @@
 from fdutils import (classes, files, func, lists, net, decorators, regex, parallel, db, html, strings, crypto,
-                     logs, config)
+                     logs, config, structures)
 
 __all__ = ["classes", "files", "func", "lists", "regex", "logs", "config", "crypto",
            "parallel", "structures", "db", "strings"]
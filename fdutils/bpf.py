@@ -1,4 +1,4 @@
-from operator import itemgetter
+import heapq
 import re
 
 #TODO: provide a render function that will make a display filter from a bpf
@@ -12,10 +12,9 @@ import re
 # BPF can also be used to create more succint/faster iptables rules:
 #       https://www.lowendtalk.com/discussion/47469/bpf-a-bytecode-for-filtering
 
-from .structures import Range
-from . import lists
+from .structures import IntervalSet, Range
 
-PORT_RANGE_REGEX = re.compile('^(\d+)\-(\d+)$')
+PORT_RANGE_REGEX = re.compile(r'^(\d+)\-(\d+)$')
 
 
 class BPFComponentBase:
@@ -31,26 +30,38 @@ class BPFComponentBase:
         self.bpf_keyword = name
         self.bpf_range_keyword = range_name
         self.validate = validate
-        self._not = []
-        self._a = []
+        self._not = self._new_list()
+        self._a = self._new_list()
+        # (device, rendered filter) until the filter changes
+        self._rendered = None
 
-    def __nonzero__(self):
+    def __bool__(self):
         """ check for empty filter used in add_prepend function
 
         """
         return bool(self._not or self._a)
 
-    def _convert_values(self, values):
-        return values
+    def _new_list(self):
+        """ items (prepend, value) of an allow or deny list in the order they were added (a dict used as an ordered
+            set)
+        """
+        return {}
 
-    def _remove_range(self, list_to_remove, remove_this):
-        return list_to_remove
+    def _add_items(self, items, prepend, values):
+        for value in values:
+            items[(prepend, value)] = None
 
-    def _merge_range(self, list_to_merge):
-        """ merge IP or port ranges
+    def _remove_items(self, items, prepend, values):
+        for value in values:
+            items.pop((prepend, value), None)
 
-        """
-        return list_to_merge
+    def _convert_values(self, values):
+        return values
+
+    @staticmethod
+    def _prepend(kwargs):
+        prepend = kwargs.get('proto', '') or kwargs.get('p', '')
+        return prepend + ' ' if prepend else ''
 
     def _get_list(self, to):
         if to == 'not':
@@ -66,42 +77,21 @@ class BPFComponentBase:
         """ add a filter to the bpf. This action will overwrite any previous allow or denied value. There is no dns resolution to filter
 
         """
-        prepend = kwargs.get('proto', '') or kwargs.get('p', '')
+        prepend = self._prepend(kwargs)
         add = self._convert_values(add)
 
         if self.validate and any([not re.match(self.validate, str(a)) for a in add]):
             raise ValueError
 
-        if prepend:
-            prepend += ' '
-
-        # generate a list with the prepend + filter values if they don't already exists in corresponding filter list
-        def _gen_prepend_list(current_list):
-            return [(prepend, a) for a in add if (prepend, a) not in current_list]
-
-        # append the values to the corresponding filter list
         main, remove = self._get_list(to)
-
-        main.extend(_gen_prepend_list(main))
-        self.remove_prepend(remove, *add, **kwargs)
-
-        self._merge_range(main)
+        self._add_items(main, prepend, add)
+        self._remove_items(self._get_list(remove)[0], prepend, add)
+        self._rendered = None
 
     def remove_prepend(self, to, *remove, **kwargs):
-
-        prepend = kwargs.pop('proto', '')
-        if prepend:
-            prepend += ' '
-
-        remove = self._convert_values(remove)
-
-        def _gen_prepend_list(current_list):
-            return [(prepend, a) for a in remove if (prepend, a) in current_list]
-
         main, negated = self._get_list(to)
-        lists.del_from_list(main, _gen_prepend_list(main))
-
-        self._remove_range(main, remove)
+        self._remove_items(main, self._prepend(kwargs), self._convert_values(remove))
+        self._rendered = None
 
     def allow(self, *items, **kwargs):
         """ allow packets with values in items
@@ -155,6 +145,17 @@ class BPFComponentBase:
         return return_str
 
     def render(self, previous=None, device=None):
+        if self._rendered is None or self._rendered[0] is not device:
+            self._rendered = (device, self._render(device))
+        render_str = self._rendered[1]
+
+        if previous is not None:
+            if render_str:
+                return previous + ' and ' + render_str
+            return previous
+        return render_str
+
+    def _render(self, device=None):
         render_str = ''
         if self:
 
@@ -167,11 +168,6 @@ class BPFComponentBase:
                 if render_str:
                     render_str += ' and '
                 render_str += 'not (' + tmp_str + ')'
-
-        if previous is not None:
-            if render_str:
-                return previous + ' and ' + render_str
-            return previous
         return render_str
 
     def render_for_display(self, previous=None):
@@ -194,16 +190,16 @@ class BPFComponent(BPFComponentBase):
 
     def __init__(self, name, validate='', range_name=''):
         super(BPFComponent, self).__init__(name, validate, range_name)
-        self._from = []
-        self._to = []
-        self._not_from = []
-        self._not_to = []
-        self._for_tcp = []
-        self._not_for_tcp = []
-        self._for_udp = []
-        self._not_for_udp = []
-
-    def __nonzero__(self):
+        self._from = self._new_list()
+        self._to = self._new_list()
+        self._not_from = self._new_list()
+        self._not_to = self._new_list()
+        self._for_tcp = self._new_list()
+        self._not_for_tcp = self._new_list()
+        self._for_udp = self._new_list()
+        self._not_for_udp = self._new_list()
+
+    def __bool__(self):
         """ check for empty filter used in add_prepend function
 
         """
@@ -258,7 +254,7 @@ class BPFComponent(BPFComponentBase):
     def del_deny_to(self, *items, **kwargs):
         self.remove_prepend('not to', *items, **kwargs)
 
-    def render(self, previous=None, device=None):
+    def _render(self, device=None):
         render_str = ''
         if self:
 
@@ -275,11 +271,6 @@ class BPFComponent(BPFComponentBase):
                 if render_str:
                     render_str += ' and '
                 render_str += 'not (' + tmp_str + ')'
-
-        if previous is not None:
-            if render_str:
-                return previous + ' and ' + render_str
-            return previous
         return render_str
 
     def render_for_display(self, previous=None):
@@ -317,59 +308,48 @@ class BPFComponentPort(BPFComponent):
     def _return_range(self, val):
         return val if isinstance(val, Range) else Range(val, val)
 
-    # TODO: this is doing a linear comparison and I don't expect to be an issue but if needed try to implement a sorted tree
-    def _merge_range(self, list_to_merge):
-        """ compares and compresses ranges
+    def _new_list(self):
+        return PortRanges()
 
-        :param list of Range:
+    def _add_items(self, items, prepend, values):
+        for value in values:
+            items.add(prepend, value)
 
-        """
-        s = sorted(list_to_merge, key=itemgetter(1))
-        j = 0
-        for i in range(len(list_to_merge) - 1):
-            if s[j][1].overlaps(s[i + 1][1]) or s[j][1].is_contiguous_to(s[i + 1][1]):
-                s[j][1].union_update(s[i + 1][1])
-            else:
-                j += 1
-                s[j] = s[i + 1]
-        for i, v in enumerate(s):
-            list_to_merge[i] = v
+    def _remove_items(self, items, prepend, values):
+        """ the ports are removed whatever protocol they were added with """
+        for value in values:
+            items.discard(value)
 
-        del list_to_merge[j + 1:]
 
-    # TODO: this is doing a linear comparison and sorting and I don't expect to be an issue but if needed try to implement a sorted tree for list of Ranges
-    def _remove_range(self, list_to_remove, remove_this):
-        """ compares and compresses ranges
+class PortRanges:
+    """ allow or deny list of ports: an IntervalSet per prepend (protocol) iterated as the (prepend, Range) items of
+        the other lists sorted by port
+    """
 
-        :param list of Range:
+    def __init__(self):
+        self.ranges = {}
 
-        """
-        if not list_to_remove or not remove_this:
-            return
-        j = 0
-        new_list = []
-        current_list = sorted(list_to_remove, key=itemgetter(1))
-        removal_list = sorted(remove_this)
-        for current_to, current_range in current_list:
-            while j < len(removal_list) and removal_list[j] << current_range:
-                j += 1
-            if j < len(removal_list) and not removal_list[j] >> current_range:
-                diff = current_range.difference(removal_list[j], split_if_needed=True)
-                if type(diff) is tuple:
-                    new_list.append((current_to, diff[0]))
-                    new_list.append((current_to, diff[1]))
-                elif diff is not None:
-                    new_list.append((current_to, diff))
-                continue
-            new_list.append((current_to, current_range))
+    def add(self, prepend, port_range):
+        if prepend not in self.ranges:
+            self.ranges[prepend] = IntervalSet()
+        self.ranges[prepend].add(port_range.start, port_range.end)
 
-        for i, v in enumerate(new_list):
-            if i < len(list_to_remove):
-                list_to_remove[i] = v
-            else:
-                list_to_remove.append(v)
+    def discard(self, port_range):
+        for ranges in self.ranges.values():
+            ranges.discard(port_range.start, port_range.end)
+
+    def __bool__(self):
+        return any(self.ranges.values())
+
+    @staticmethod
+    def _items(prepend, ranges):
+        for r in ranges:
+            yield prepend, r
+
+    def __iter__(self):
+        return heapq.merge(*(self._items(prepend, ranges) for prepend, ranges in self.ranges.items()),
+                           key=lambda item: item[1].start)
 
-        del list_to_remove[i + 1:]
 
 # TCP control flags
 tcpflags = 13       # byte location of tcp flag in tcp header
@@ -0,0 +1,152 @@
+""" checksums of local files
+
+    Large files are hashed from a mmap in one hashlib call and smaller ones read in large buffers. hashlib releases
+    the GIL while hashing so many files are hashed at the same time in threads (checksum_files) and a checksum can be
+    calculated in the background while something else is done (submit), like the remote checksum of a transfer:
+
+    local = checksums.submit('/tmp/image.bin', 'sha256')
+    remote = conn.check_output('sha256sum /tmp/image.bin').split()[0]
+    assert local.result() == remote
+
+    The checksums are cached by path, size and modification time so a file is not hashed again until it changes
+"""
+import collections
+import hashlib
+import logging
+import mmap
+import os
+import threading
+from concurrent import futures
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+ALGORITHMS = ('md5', 'sha1', 'sha256', 'sha512', 'blake2b')
+DEFAULT_ALGORITHM = 'md5'
+
+BUFFER_SIZE = 1 << 20
+# files from this size are hashed from a mmap
+MMAP_MIN_SIZE = 1 << 22
+CACHE_MAX_ENTRIES = 4096
+MAX_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+
+
+def new_hash(algorithm=DEFAULT_ALGORITHM):
+    if algorithm not in ALGORITHMS:
+        raise ValueError('Checksum algorithm {} is not one of {}'.format(algorithm, ', '.join(ALGORITHMS)))
+    return hashlib.new(algorithm)
+
+
+def checksum_stream(stream, algorithm=DEFAULT_ALGORITHM, buffer_size=BUFFER_SIZE):
+    """ hex digest of what is left to read of a binary stream """
+    h = new_hash(algorithm)
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    readinto = getattr(stream, 'readinto', None)
+    while True:
+        if readinto is not None:
+            size = readinto(buffer)
+            if not size:
+                break
+            h.update(view[:size])
+        else:
+            data = stream.read(buffer_size)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+
+def _checksum(path, algorithm, size):
+    with open(path, 'rb') as f:
+        if size >= MMAP_MIN_SIZE:
+            h = new_hash(algorithm)
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                h.update(mm)
+            return h.hexdigest()
+        return checksum_stream(f, algorithm)
+
+
+class ChecksumCache:
+    """ checksums by (path, size, modification time, algorithm) keeping the last max_entries of them """
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(path, algorithm, st=None):
+        st = st or os.stat(path)
+        return os.path.realpath(path), st.st_size, st.st_mtime_ns, algorithm
+
+    def get(self, key):
+        with self._lock:
+            digest = self._entries.get(key)
+            if digest is not None:
+                self._entries.move_to_end(key)
+            return digest
+
+    def set(self, key, digest):
+        with self._lock:
+            self._entries[key] = digest
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+cache = ChecksumCache()
+
+
+def checksum(path, algorithm=DEFAULT_ALGORITHM, use_cache=True):
+    """ hex digest of the file
+
+    Args:
+        path (str): file path
+        algorithm (str): one of ALGORITHMS
+        use_cache (bool): take it from the cache if the file did not change since it was calculated
+
+    """
+    st = os.stat(path)
+    key = ChecksumCache.key(path, algorithm, st)
+    if use_cache:
+        digest = cache.get(key)
+        if digest is not None:
+            return digest
+
+    digest = _checksum(path, algorithm, st.st_size)
+    # only cached if the file did not change while it was read
+    if ChecksumCache.key(path, algorithm) == key:
+        cache.set(key, digest)
+    return digest
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = futures.ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='checksum')
+        return _executor
+
+
+def submit(path, algorithm=DEFAULT_ALGORITHM, use_cache=True):
+    """ the checksum of the file calculated in a thread (concurrent.futures.Future of the hex digest) """
+    return _get_executor().submit(checksum, path, algorithm, use_cache)
+
+
+def checksum_files(paths, algorithm=DEFAULT_ALGORITHM, use_cache=True):
+    """ dictionary path -> hex digest of the files hashed at the same time in threads """
+    submitted = {path: submit(path, algorithm, use_cache) for path in paths}
+    return {path: f.result() for path, f in submitted.items()}
@@ -1,12 +1,17 @@
-import collections
+import collections.abc
 import json
 import logging
 import os
 import yaml
+from . import compiled
 from .vars import _resolve_variables, _replace_variables_in_settings
 
 log = logging.getLogger(__name__)
 
+# libyaml parser if pyyaml was built with it
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_Loader = getattr(yaml, 'CLoader', yaml.Loader)
+
 environment_settings = {}
 registered_settings = {}
 cli_settings = {}
@@ -50,36 +55,43 @@ def parse_config(default_config_path=None, environment_var=None, environment_set
     _, ext = os.path.splitext(test_envi_settings_path)
     loader = _get_settings_loaded_and_check_settings_exists(ext, found, test_envi_settings_path)
 
-    with open(test_envi_settings_path) as f:
-        new_environment_settings = loader(f)
-        variables = _resolve_variables(new_environment_settings.pop('vars', {}))
-        _replace_variables_in_settings(new_environment_settings, variables)
+    def compile_settings(content):
+        settings = loader(content) or {}
+        variables = _resolve_variables(settings.pop('vars', None) or {})
+        return _replace_variables_in_settings(settings, variables)
 
-    new_environment_settings.pop('vars', None)
+    new_environment_settings = compiled.load(test_envi_settings_path, compile_settings)
 
     global environment_settings
 
     if environment_settings_config:
         environment_settings.update(new_environment_settings)
         ret = environment_settings
+        updated_sections = new_environment_settings
     else:
+        updated_sections = {}
         if 'run_envi' in new_environment_settings and load_test_envi_key_as_environment:
-            environment_settings.update(new_environment_settings.pop('run_envi'))
+            updated_sections = new_environment_settings.pop('run_envi')
+            environment_settings.update(updated_sections)
         ret = new_environment_settings
 
-    for section, values in registered_settings.items():
-        update_settings_with_user_settings(values['local_vars'], section, paths_vars=values['paths_vars'])
-        if values['after_update']:
-            values['after_update']()
+    # the modules of other sections are updated when they are imported (register_settings)
+    for section in (s for s in updated_sections if s in registered_settings):
+        _update_registered_settings(section)
 
     return ret
 
 
+def yaml_load(stream, safe=True):
+    """ yaml.safe_load (yaml.load if not safe) with the libyaml parser if available """
+    return yaml.load(stream, Loader=_SafeLoader if safe else _Loader)
+
+
 def _get_settings_loaded_and_check_settings_exists(ext, found, test_envi_settings_path):
     if ext == '.json':
-        loader = json.load
+        loader = json.loads
     elif ext in ('.yaml', '.yml'):
-        loader = yaml.safe_load
+        loader = yaml_load
     else:
         raise ValueError("This settings file ({}) has an extension that we don't know how to parse.\n"
                          "The only extensions we can handle are (.json, .yaml and .yml"
@@ -100,10 +112,22 @@ def load_default():
     return parse_config(environment_var='TEST_ENVI_SETTINGS', environment_settings_config=True)
 
 
-def update_settings_with_user_settings(local_vars, section, settings=None, paths_vars=()):
+def _environment_value(value):
+    """ numbers and booleans of OS environment variables are converted (as if written in the settings file) """
+    try:
+        converted = yaml_load(value)
+    except yaml.YAMLError:
+        return value
+    return converted if isinstance(converted, (bool, int, float)) else value
+
+
+def update_settings_with_user_settings(local_vars, section, settings=None, paths_vars=(), names=None):
     """ updates run_envi default settings with environment settings given by user
         the keys are case independent to allow the settings file to be written as lower case but still set the proper
-        key in the settings.py file that is calling this method
+        key in the settings.py file that is calling this method.
+
+        A settings module can also take values from OS environment variables with a dictionary ENV_TO_VARS of
+        variable name -> OS environment variable name. The settings file takes precedence over them
 
     Args:
         local_vars (dict): dictionary from locals() from file calling this method
@@ -111,31 +135,39 @@ def update_settings_with_user_settings(local_vars, section, settings=None, paths
         settings (dict): if given we would use this settings as the default ones instead of the environment settings
         paths_vars (list): list of variables that are a file/dir path and that we want to normalize to avoid issues
                            with back/forward slashes on windows/unix systems
+        names (dict): lower case name -> name of local_vars if already known
 
     Returns:
 
     """
     settings = settings or environment_settings
-    settings_section = settings.get(section, {})
+    settings_section = settings.get(section) or {}
+    env_to_vars = local_vars.get('ENV_TO_VARS') or {}
+    if not settings_section and not env_to_vars:
+        return
+
+    names = names or {l.lower(): l for l in local_vars}
+    values = {}
+    for key, value in settings_section.items():
+        name = names.get(key.lower())
+        if name:
+            values[name] = value
 
-    if settings_section:
+    for name, env_var in env_to_vars.items():
+        name = names.get(name.lower(), name)
+        if name not in values and env_var in os.environ:
+            values[name] = _environment_value(os.environ[env_var])
 
-        settings_section_keys_lower = [k.lower() for k in settings_section.keys()]
-        local_vars_lower = {l.lower(): l for l in local_vars}
+    for name, value in values.items():
+        local_vars[name] = os.path.normpath(value) if value and name in paths_vars else value
 
-        # settings take precendence over OS environment variable
-        # augment settings with OS environment variables if settings does not already include a key for that variable
-        if 'ENV_TO_VARS' in local_vars and local_vars['ENV_TO_VARS']:
-            env_vars_lower = {e.lower(): e for e in local_vars['ENV_TO_VARS']}
-            for v in (e for e in env_vars_lower if e not in settings_section_keys_lower
-                                                   and os.environ.get(local_vars['ENV_TO_VARS'])):
-                settings_section[local_vars[env_vars_lower[v]]] = os.environ.get(local_vars['ENV_TO_VARS'])
 
-        for key, value in [(k, v) for (k, v) in settings_section.items() if k.lower() in local_vars_lower]:
-            key = local_vars_lower[key.lower()]
-            local_vars[key] = value
-            if value and paths_vars and key in paths_vars:
-                local_vars[key] = os.path.normpath(value)
+def _update_registered_settings(section):
+    values = registered_settings[section]
+    update_settings_with_user_settings(values['local_vars'], section, paths_vars=values['paths_vars'],
+                                       names=values['names'])
+    if values['after_update']:
+        values['after_update']()
 
 
 def register_settings(settings_vars, section, paths_vars=(), after_update=None):
@@ -149,10 +181,12 @@ def register_settings(settings_vars, section, paths_vars=(), after_update=None):
             after_update: a function that would get called after any update of settings in case we need to update
 
     """
-    update_settings_with_user_settings(settings_vars, section, paths_vars=paths_vars)
+    names = {v.lower(): v for v in settings_vars}
+    update_settings_with_user_settings(settings_vars, section, paths_vars=paths_vars, names=names)
 
     registered_settings[section] = dict(local_vars=settings_vars,  # locals() from the file calling this
                                         paths_vars=paths_vars,  # what variables from locals() are paths to check
+                                        names=names,  # lower case variable names of locals() to find them
                                         after_update=after_update  # function to call if there is any update to settings
                                         )
 
@@ -186,7 +220,8 @@ def parse_yaml(config_file_path, base_name='bases', safe=True, replace_list=True
     """
     config_folder, config_file = os.path.split(config_file_path)
 
-    loader = yaml.safe_load if safe else yaml.load
+    def loader(yfile):
+        return yaml_load(yfile, safe)
 
     def deep_update(source, overrides):
         """Update a nested dictionary or similar mapping.
@@ -194,9 +229,9 @@ def parse_yaml(config_file_path, base_name='bases', safe=True, replace_list=True
         Modify ``source`` in place.
         """
         for key, value in overrides.items():
-            if value and isinstance(value, collections.Mapping):
+            if value and isinstance(value, collections.abc.Mapping):
                 source[key] = deep_update(source.get(key, {}), value)
-            elif not replace_list and value and isinstance(value, collections.MutableSequence):
+            elif not replace_list and value and isinstance(value, collections.abc.MutableSequence):
                 if key not in source:
                     source[key] = []
                 deletions = []
@@ -214,13 +249,15 @@ def parse_yaml(config_file_path, base_name='bases', safe=True, replace_list=True
         with open(path) as f:
             yfile = f.read()
 
-        problems = get_yaml_syntax_error(yfile)
-        if problems:
-            msg = ('\n' + '#' * 80 + '\n\nYour YAML configuration file {} has problems: \n\n'.format(config_file_path) +
-                  problems)
-            raise Exception(msg)
-
-        return loader(yfile)
+        try:
+            return loader(yfile)
+        except yaml.YAMLError:
+            problems = get_yaml_syntax_error(yfile)
+            if not problems:
+                raise
+        msg = ('\n' + '#' * 80 + '\n\nYour YAML configuration file {} has problems: \n\n'.format(config_file_path) +
+               problems)
+        raise Exception(msg)
 
     cfg = load_yaml(config_file_path)
 
@@ -0,0 +1,98 @@
+""" settings files compiled once
+
+    A settings file is parsed and its variables substituted the first time it is loaded and the result is pickled in
+    CACHE_FOLDER. The next loads (other runs, other processes) take it from there while the file has the same
+    modification time and size, or the same content, and the system variables ({{__PWD__}}...) are the same
+"""
+import hashlib
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+from .vars import system_variables
+
+log = logging.getLogger(__name__)
+
+# empty to parse the settings files every time
+CACHE_FOLDER = os.environ.get('FDUTILS_SETTINGS_CACHE',
+                              os.path.join(os.path.expanduser('~'), '.cache', 'fdutils', 'settings'))
+# files modified less than these seconds before they were compiled are checked by content the next time as
+# they could change again within the resolution of the modification time keeping the same size
+RACY_SECONDS = 2
+
+_VERSION = 1
+
+
+def _cache_path(path):
+    return os.path.join(CACHE_FOLDER, hashlib.sha256(os.path.realpath(path).encode()).hexdigest() + '.pickle')
+
+
+def _read(cache_path):
+    try:
+        with open(cache_path, 'rb') as f:
+            entry = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.debug('Compiled settings {} could not be read: {}'.format(cache_path, e))
+        return None
+
+    if (not isinstance(entry, dict) or entry.get('version') != _VERSION
+            or entry.get('system_variables') != system_variables):
+        return None
+    return entry
+
+
+def _write(cache_path, entry):
+    tmp = None
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=CACHE_FOLDER, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(entry, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_path)
+    except (OSError, pickle.PicklingError) as e:
+        log.debug('Compiled settings {} could not be written: {}'.format(cache_path, e))
+        if tmp:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def load(path, compile_func):
+    """ the settings of the file at path from the cache or compiled by compile_func
+
+    Args:
+        path (str): settings file
+        compile_func (callable): function of the content of the file (str) that returns the settings
+
+    Returns:
+        dict
+
+    """
+    if not CACHE_FOLDER:
+        with open(path) as f:
+            return compile_func(f.read())
+
+    st = os.stat(path)
+    cache_path = _cache_path(path)
+    entry = _read(cache_path)
+    if entry and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size:
+        return entry['settings']
+
+    with open(path, 'rb') as f:
+        content = f.read()
+    digest = hashlib.sha256(content).hexdigest()
+    if entry and entry['digest'] == digest:
+        settings = entry['settings']
+    else:
+        log.debug('Compiling settings file {}'.format(path))
+        settings = compile_func(content.decode())
+
+    trust_mtime = time.time() - st.st_mtime > RACY_SECONDS
+    _write(cache_path, dict(version=_VERSION, mtime_ns=st.st_mtime_ns if trust_mtime else None, size=st.st_size,
+                            digest=digest, system_variables=dict(system_variables), settings=settings))
+    return settings
@@ -1,4 +1,4 @@
-import collections
+import collections.abc
 import logging
 import os
 import re
@@ -76,7 +76,7 @@ def _replace_variable(value, variables):
 def _replace_variables_in_settings(settings, variables):
     if variables:
         for k,v in ((k,v) for (k,v) in settings.items() if v):
-            if isinstance(v, collections.MutableMapping):
+            if isinstance(v, collections.abc.MutableMapping):
                 _replace_variables_in_settings(v, variables)
             elif fdutils.lists.is_list_or_tuple(v):
                 for i, v_item in enumerate(v):
@@ -1,6 +1,9 @@
 import base64
+import collections
 import getpass
+import hashlib
 import os
+import threading
 
 from fdutils.config import environment_settings, update_settings_with_user_settings
 
@@ -10,6 +13,8 @@ from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 
 DEFAULT_HASH_ALGORITHM_NAME = 'SHA256'
+# number of derived keys kept in memory (by password digest, salt, iterations, length and hash algorithm)
+KEYS_CACHE_SIZE = 1024
 
 update_settings_with_user_settings(locals(), 'crypto')
 
@@ -24,7 +29,33 @@ def create_salt(hash_algorithm=DEFAULT_HASH_ALGORITHM):
     return os.urandom(hash_algorithm.digest_size)
 
 
+# (password digest, salt, iterations, length, hash name) -> Fernet cipher
+_ciphers = collections.OrderedDict()
+_ciphers_lock = threading.Lock()
+
+
+def clear_ciphers_cache():
+    with _ciphers_lock:
+        _ciphers.clear()
+
+
 def create_cipher(password, salt, iterations=1000, length=32, hash_algorithm=DEFAULT_HASH_ALGORITHM):
+    """ Fernet cipher with the key derived (PBKDF2) from password and salt
+
+        The last KEYS_CACHE_SIZE ciphers are kept so the same key is derived only once. The password is not part
+        of the cache key, only its digest.
+    """
+    if isinstance(password, str):
+        password = password.encode()
+
+    key = hashlib.sha256(password).digest(), salt, iterations, length, hash_algorithm.name
+    with _ciphers_lock:
+        try:
+            _ciphers.move_to_end(key)
+            return _ciphers[key]
+        except KeyError:
+            pass
+
     kdf = PBKDF2HMAC(
         algorithm=hash_algorithm(),
         length=length,
@@ -32,7 +63,13 @@ def create_cipher(password, salt, iterations=1000, length=32, hash_algorithm=DEF
         iterations=iterations,
         backend=default_backend()
     )
-    return Fernet(base64.urlsafe_b64encode(kdf.derive(password)))
+    cipher = Fernet(base64.urlsafe_b64encode(kdf.derive(password)))
+
+    with _ciphers_lock:
+        _ciphers[key] = cipher
+        while len(_ciphers) > KEYS_CACHE_SIZE:
+            _ciphers.popitem(last=False)
+    return cipher
 
 
 def encrypt(plaintext, password, salt, cipher=None, encoding='utf-8'):
@@ -50,6 +87,36 @@ def decrypt(encrypted, password, salt, cipher=None, encoding='utf-8'):
         raise InvalidKey from e
 
 
+def encrypt_many(plaintexts, password, salt=None, encoding='utf-8'):
+    """ encrypts every text with the same salt so the key is derived once
+
+    Returns:
+        tuple: list of encrypted texts, salt
+
+    """
+    salt = salt or create_salt()
+    password = password or getpass.getpass()
+    cipher = create_cipher(password, salt)
+    return [cipher.encrypt(bytes(plaintext, encoding=encoding)) for plaintext in plaintexts], salt
+
+
+def decrypt_many(encrypted_and_salts, password, encoding='utf-8'):
+    """ decrypts a sequence of (encrypted, salt) deriving the key only once per different salt
+
+    Returns:
+        list: decrypted texts in the same order
+
+    """
+    ciphers = {}
+    ret = []
+    for encrypted, salt in encrypted_and_salts:
+        cipher = ciphers.get(salt)
+        if cipher is None:
+            cipher = ciphers[salt] = create_cipher(password, salt)
+        ret.append(decrypt(encrypted, password, salt, cipher, encoding))
+    return ret
+
+
 def get_password_from_script(script):
     import subprocess
     return subprocess.check_output(script)
@@ -97,6 +164,9 @@ class SecuredTextEngine:
         self.cipher = create_cipher(password or self.password, self.salt, hash_algorithm=self.hash)
 
     def clone(self, salt=None, password=None):
+        """ engine with the same password (unless a new one is given) for another salt. The key of a salt already
+            used is not derived again as create_cipher keeps the last ones
+        """
         return SecuredTextEngine(salt or self.salt, password or self.password, self.encoding, self.hash)
 
     def encrypt(self, text):
@@ -108,6 +178,12 @@ class SecuredTextEngine:
         except InvalidToken as e:
             raise InvalidKey from e
 
+    def encrypt_many(self, texts):
+        return [self.encrypt(text) for text in texts]
+
+    def decrypt_many(self, encrypted_values):
+        return [self.decrypt(encrypted) for encrypted in encrypted_values]
+
 
 def base64_hash(message):
     from hashlib import sha256
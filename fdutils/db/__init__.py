@@ -1,7 +1,7 @@
 from .vendors import SQLite, OracleDB, PostgresDB, create_from_vendor
 from .samixin import NoDBSessionError
 from .sabase import DeclarativeBase, DeclarativeBaseWithTableName
-from .sasessioninit import create_session, create_all, drop_all
+from .sasessioninit import create_session, create_all, drop_all, add_missing_columns
 
 
 
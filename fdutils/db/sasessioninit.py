@@ -1,3 +1,6 @@
+import logging
+
+from sqlalchemy import inspect
 from sqlalchemy.orm import sessionmaker
 
 from .exceptions import DatabaseNotDefinedException
@@ -5,6 +8,8 @@ from .sabase import DeclarativeBase, _DeclarativeBaseWithTableName
 from . import vendors
 from .samixin import SessionMixin
 
+log = logging.getLogger(__name__)
+
 engine = Session = DB_SESSION = None
 
 
@@ -50,6 +55,50 @@ def create_all():
     _DeclarativeBaseWithTableName.metadata.create_all(engine)
 
 
+def add_missing_columns(bind=None, metadatas=None):
+    """ adds to the tables already in the db the nullable columns of their models they do not have (new columns of
+        the models) so a db created by a previous version can still be used. Rows already there get NULL.
+        This migration is not done by create_session or create_all: call it once after upgrading
+
+            create_session()
+            add_missing_columns()
+
+    Args:
+        bind: engine (the one of the session by default)
+        metadatas: metadata of the models (the ones of the declarative bases by default)
+
+    Returns:
+        list: (table, column) names added
+
+    """
+    bind = bind or engine
+    metadatas = metadatas or (DeclarativeBase.metadata, _DeclarativeBaseWithTableName.metadata)
+    inspector = inspect(bind)
+    existing = set(inspector.get_table_names())
+    preparer = bind.dialect.identifier_preparer
+    added = []
+
+    with bind.begin() as conn:
+        for metadata in metadatas:
+            for table in metadata.sorted_tables:
+                if table.name not in existing:
+                    continue
+                columns = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name in columns:
+                        continue
+                    if column.primary_key or not column.nullable:
+                        log.warning('Table {} has no column {} and it cannot be added as it is not nullable'
+                                    ''.format(table.name, column.name))
+                        continue
+                    conn.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(
+                        preparer.format_table(table), preparer.quote(column.name),
+                        column.type.compile(dialect=bind.dialect)))
+                    log.info('Column {} added to the table {}'.format(column.name, table.name))
+                    added.append((table.name, column.name))
+    return added
+
+
 def drop_all():
     DeclarativeBase.metadata.drop_all(engine)
     _DeclarativeBaseWithTableName.metadata.drop_all(engine)
\ No newline at end of file
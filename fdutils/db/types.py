@@ -2,7 +2,7 @@ import json
 
 from sqlalchemy import TypeDecorator, types
 
-from fdutils.crypto import SecuredTextEngine, DEFAULT_HASH_ALGORITHM
+from fdutils.crypto import SecuredTextEngine, create_salt
 from fdutils.func import default_json
 
 
@@ -18,30 +18,35 @@ class ToJSONCapable(TypeDecorator):
 
 
 class Encrypted(TypeDecorator):
-    """ stores data encrypted with its salt
-        whenever we change the data we recreate the salt and hash
+    """ stores data encrypted with its salt appended
+        if recreate_on_save is given every value saved gets a new salt
     """
     impl = types.LargeBinary
 
     def __init__(self, salt=None, password=None, recreate_on_save=False, **kwargs):
         self.crypto = None
-        self.clear = None
         self.password = password
         self.salt = salt
         self.recreate_on_save = recreate_on_save
         super().__init__(**kwargs)
 
-    def _create_crypto(self, force=False):
+    def _create_crypto(self):
         if not self.crypto:
             self.crypto = SecuredTextEngine(salt=self.salt, password=self.password)
-        elif force:
-            self.crypto.recreate_cipher()
+        return self.crypto
 
     def process_bind_param(self, value, dialect):
-        self._create_crypto(force=(self.clear and self.clear != value))
-        return self.crypto.encrypt(value) + self.crypto.salt
+        if value is None:
+            return None
+        crypto = self._create_crypto()
+        if self.recreate_on_save:
+            crypto = crypto.clone(salt=create_salt(crypto.hash))
+        return crypto.encrypt(value) + crypto.salt
 
     def process_result_value(self, value, dialect):
-        self.salt = value[-DEFAULT_HASH_ALGORITHM.digest:]
-        self._create_crypto(force=True)
-        return self.crypto.decrypt(value[:DEFAULT_HASH_ALGORITHM.digest])
\ No newline at end of file
+        if value is None:
+            return None
+        crypto = self._create_crypto()
+        salt_size = crypto.hash.digest_size
+        # the engines (and keys) per salt are cached so reading many rows does not derive the key for each one
+        return crypto.clone(salt=value[-salt_size:]).decrypt(value[:-salt_size])
@@ -1,12 +1,13 @@
+import asyncio
 import contextlib
 import functools
+import sys
 import time
-from datetime import datetime
 from functools import wraps
 
 import fdutils.timer
 from fdutils.exceptions import RetriesExceededError, CapabilityError
-from fdutils import lists, classes
+from fdutils import lists, classes, retries
 
 __author__ = 'Filinto Duran (duranto@gmail.com)'
 
@@ -67,13 +68,15 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
           retry_when=None, retries_timeout=0,
           function_timeout=0, fail_silently=False, return_value_when_fail_silent=None,
           exception_to_raise_when_fail=None, raise_last_exception_when_fail=True, max_delay=None,
-          f=None, args=(), **kwargs):
+          jitter='none', budget=None, f=None, args=(), **kwargs):
     """ Retry decorator function that will retry the decorated function for the number of 'tries' waiting 'delay'
         between retries and increasing 'delay' by the 'backoff' value multiplier, when an exception occurs if
         exceptions_to_check matches the exception is true or if retry_when is check and the lambda function
         returns true. If the number of retries is exceeded we will raise an exception unless we have retry_for check
         and the return value (not the lambda) has a value other than None (i.e. False, '', etc, will be returned)
 
+        Coroutine functions are retried with asyncio.sleep between tries (the event loop is not blocked)
+
      :param int tries: number of times to try the decorated function
      :param float delay: time to wait before retrying
      :param int backoff: exponential backoff if more than 1
@@ -83,7 +86,8 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
      :param retry_when: a lambda or function that if return true will make the function to be retried
      :param float retries_timeout: if not 0, it will be the maximum amount of time that we will retry the
                                    function and the retries. i.e. tries = 20 but retries_timeout = 60,
-                                   retries_timeout might be reach before retries reache 20
+                                   retries_timeout might be reach before retries reache 20. A retry whose delay
+                                   would end after it is not done
      :param float function_timeout: if not 0, it will be the maximum amount of time that we will let the function run
                                     on every retry. One needs to have a finally statement if we are dealing with file
                                     handlers or sockets to properly close them.
@@ -91,6 +95,8 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
                                 retries should not raise an exception
      :param bool raise_last_exception_when_fail: flag to indicate to raise the last exception caught instead of
                                                  RetriesExceededError when retries are more than max
+     :param str jitter: how the delays are randomized (fdutils.retries.JITTERS)
+     :param budget: fdutils.retries.RetryBudget (or the key of a shared one) the retries are taken from
      :param function f: a function to call. If this is not None this will be similar to retry()(f)(*args, **kwargs)
      :param list or tuple args: arguments to pass to f when using retry not as decorator but like a function
      :raise: RetriesExceededException: if it has retry more than 'tries' times with exceptions being raise
@@ -106,6 +112,10 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
      >>> @retry(3, delay=30, backoff=1, exceptions_to_check=wardrobe_malfunction_exception)
      >>> def my_function()...
 
+     >>> # up to 5 tries in 60 seconds with random delays from 1 second (up to 3 times the previous one)
+     >>> @retry(5, delay=1, backoff=2, max_delay=20, jitter='decorrelated', retries_timeout=60)
+     >>> async def connect()...
+
       # another way to call retry in an inline way instead that is useful inside another function
       retry(3, delay=30, backoff=1)(my_function)(*my_function_args, **my_function_kwargs)
 
@@ -115,8 +125,6 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
         exception_to_raise_when_fail:
 
     """
-    start_time = datetime.now()
-
     if backoff < 1:
         raise ValueError("backoff must be greater than 1")
 
@@ -127,95 +135,142 @@ def retry(tries, delay=3, backoff=1, exceptions_to_check=(Exception,), exception
     if delay <= 0:
         raise ValueError("delay must be greater than 0")
 
+    if jitter not in retries.JITTERS:
+        raise ValueError("jitter must be one of " + ', '.join(retries.JITTERS))
+
     if f is not None:
         # we are not using it as a decorator but as a function
         return retry(tries, delay, backoff, exceptions_to_check, exceptions_to_not_retry, retry_when, retries_timeout,
                      function_timeout, fail_silently, return_value_when_fail_silent, exception_to_raise_when_fail,
-                     raise_last_exception_when_fail, max_delay)(f)(*args, **kwargs)
+                     raise_last_exception_when_fail, max_delay, jitter, budget)(f)(*args, **kwargs)
 
     exceptions_to_check = lists.to_sequence(exceptions_to_check, list)
     if function_timeout:
         exceptions_to_check.append(TimeoutError)
     exceptions_to_check = tuple(exceptions_to_check)
+    exceptions_to_not_retry = tuple(lists.to_sequence(exceptions_to_not_retry, list))
 
     if return_value_when_fail_silent is not None:
         fail_silently = True
 
+    if isinstance(budget, str):
+        budget = retries.budget_for(budget)
+
     def deco_retry(f):
-        @wraps(f)
-        def f_retry(*args, **kwargs):
-            remaining_tries, _delay, _start_time = tries, delay, start_time   # make enclosed variables mutable
-            return_value = original_exception = exc_info = None
 
-            with fdutils.timer.SimpleTimer(retries_timeout) as retries_timer:
+        def new_retrier():
+            return retries.Retrier(tries, retries.backoff_delays(delay, backoff, max_delay, jitter), retries_timeout,
+                                   budget)
+
+        def next_delay(retrier, error):
+            """ seconds to wait before the next try or None to give up """
+            _delay = retrier.next_delay()
+            if _delay is None:
+                log.error('Ran out of retries in {} ({})'.format(getattr(f, '__name__', f), retrier.give_up_reason))
+            else:
+                log.warning("{}.\nRetrying {}/{} in {:.2f} seconds...".format(str(error), retrier.attempt, tries,
+                                                                             _delay))
+            return _delay
+
+        def give_up(return_value, exc_info):
+
+            if retry_when and exc_info is None and return_value is not None:
+
+                log.debug('We are returning a value {} as we are checking against a lambda/function and the '
+                          'value is not None'.format(str(return_value)))
+                return return_value
+
+            if exc_info is not None and not fail_silently:
+
+                if raise_last_exception_when_fail:
+                    reraise(*exc_info)
+
+                elif exception_to_raise_when_fail:
+                    raise exception_to_raise_when_fail
+
+                else:
+                    raise RetriesExceededError(tries, exc_info[1]) from exc_info[1]    # Ran out of tries :-(
+
+            else:
+                log.debug('Retries Exceeded but bypassing raising exception per silent_failure flag given '
+                          'to retry function method was set to fail silently...')
+
+                return return_value_when_fail_silent
+
+        if asyncio.iscoroutinefunction(f):
+
+            @wraps(f)
+            async def f_retry(*args, **kwargs):
+                retrier = new_retrier()
 
-                while remaining_tries > 0 and not retries_timer.has_expired:
+                while True:
 
-                    return_value = original_exception = exc_info = None
+                    return_value = exc_info = None
 
                     try:
 
-                        with fdutils.timer.SimpleTimer(function_timeout, raise_timeouterror=True):
-                            # Here we finally call the real function with the respective arguments
-                            return_value = f(*args, **kwargs)
+                        if function_timeout:
+                            return_value = await asyncio.wait_for(f(*args, **kwargs), function_timeout)
+                        else:
+                            return_value = await f(*args, **kwargs)
 
-                        # did not get an exception but check if we have a function to call first
                         if not (retry_when and retry_when(return_value)):
-                            # everything pass, return value
                             return return_value
 
-                        else:
-                            error = 'We will retry as the Lambda/Function was True for ' + str(return_value)
+                        error = 'We will retry as the Lambda/Function was True for ' + str(return_value)
 
                     except exceptions_to_check as original_exception:
 
-                        # is exception instance of one defined not to be retried
-                        if any([isinstance(original_exception, exc) for exc in exceptions_to_not_retry]):
+                        if isinstance(original_exception, exceptions_to_not_retry):
                             raise
 
-                        else:
-                            # store exception in case we need to return it
-                            import sys
-                            exc_info = sys.exc_info()
-                            log.exception('>>Retry Failed<<')
-                            error = original_exception
+                        exc_info = sys.exc_info()
+                        log.exception('>>Retry Failed<<')
+                        error = original_exception
 
-                    remaining_tries -= 1
-                    if remaining_tries > 1:
+                    _delay = next_delay(retrier, error)
+                    if _delay is None:
+                        return give_up(return_value, exc_info)
+                    await asyncio.sleep(_delay)
 
-                        msg = "{}.\nRetrying {}/{} in {} seconds...".format(str(error), (tries - remaining_tries),
-                                                                            tries, _delay)
-                        log.warning(msg)
-                        time.sleep(_delay)
+            return f_retry
 
-                        _delay *= backoff
-                        if max_delay is not None and 0 < max_delay < _delay:
-                            _delay = max_delay
+        @wraps(f)
+        def f_retry(*args, **kwargs):
+            retrier = new_retrier()
 
-            log.error('Ran out of retries in ' + f.__name__)
+            while True:
 
-            if retry_when and return_value is not None and exc_info is not None:
+                return_value = exc_info = None
 
-                log.debug('We are returning a value {} as we are checking against a lambda/function and the '
-                          'value is not None'.format(str(return_value)))
-                return return_value
+                try:
 
-            if exc_info is not None and not fail_silently:
+                    with fdutils.timer.SimpleTimer(function_timeout, raise_timeouterror=True):
+                        # Here we finally call the real function with the respective arguments
+                        return_value = f(*args, **kwargs)
 
-                if raise_last_exception_when_fail and exc_info:
-                    reraise(*exc_info)
+                    # did not get an exception but check if we have a function to call first
+                    if not (retry_when and retry_when(return_value)):
+                        # everything pass, return value
+                        return return_value
 
-                elif exception_to_raise_when_fail:
-                    raise exception_to_raise_when_fail
+                    error = 'We will retry as the Lambda/Function was True for ' + str(return_value)
 
-                else:
-                    raise RetriesExceededError(tries, exc_info) from original_exception    # Ran out of tries :-(
+                except exceptions_to_check as original_exception:
 
-            else:
-                log.debug('Retries Exceeded but bypassing raising exception per silent_failure flag given '
-                          'to retry function method was set to fail silently...')
+                    # is exception instance of one defined not to be retried
+                    if isinstance(original_exception, exceptions_to_not_retry):
+                        raise
 
-                return return_value_when_fail_silent
+                    # store exception in case we need to return it
+                    exc_info = sys.exc_info()
+                    log.exception('>>Retry Failed<<')
+                    error = original_exception
+
+                _delay = next_delay(retrier, error)
+                if _delay is None:
+                    return give_up(return_value, exc_info)
+                time.sleep(_delay)
 
         return f_retry
 
@@ -1,6 +1,7 @@
 import collections
 import functools
 import glob
+import io
 import logging
 import os
 import re
@@ -196,21 +197,238 @@ def get_files_sorted_by_creation(dirpath, match="*.*", reverse=False):
     return sorted(entries, reverse=reverse)
 
 
+TAIL_BLOCK_SIZE = 1 << 16
+
+
+def _mmap(f):
+    """ read only mmap of the open file (None if it is empty) """
+    import mmap
+    if not os.fstat(f.fileno()).st_size:
+        return None
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _line_end(mm, end):
+    """ end without the line terminator (\\n or \\r\\n) the data before end finishes with """
+    if end and mm[end - 1] == 10:
+        end -= 1
+        if end and mm[end - 1] == 13:
+            end -= 1
+    return end
+
+
+def _last_lines_start(mm, end, num_lines, block_size=TAIL_BLOCK_SIZE):
+    """ offset where the last num_lines lines before end start. The lines are counted by blocks and only in the
+        block where they start each line terminator is searched for
+    """
+    pos = _line_end(mm, end)
+    remaining = num_lines
+    while pos > 0:
+        start = max(pos - block_size, 0)
+        count = mm[start:pos].count(b'\n')
+        if count >= remaining:
+            for _ in range(remaining):
+                pos = mm.rfind(b'\n', start, pos)
+            return pos + 1
+        remaining -= count
+        pos = start
+    return 0
+
+
+def _decoder(encoding):
+    if encoding:
+        return lambda line: line.decode(encoding, 'replace')
+    return lambda line: line
+
+
+def tail(path, num_lines=10, encoding='utf-8', block_size=TAIL_BLOCK_SIZE):
+    """ the last num_lines lines of the file in one pass from its end (without their line terminators)
+
+    Args:
+        path (str): file path
+        num_lines (int): lines wanted
+        encoding (str): to decode the lines (bytes if None)
+        block_size (int): bytes counted at a time looking for the line terminators
+
+    """
+    with open(path, 'rb') as f:
+        mm = _mmap(f)
+        if mm is None or num_lines <= 0:
+            return []
+        with mm:
+            data = mm[_last_lines_start(mm, len(mm), num_lines, block_size):]
+    return list(map(_decoder(encoding), data.splitlines()[-num_lines:]))
+
+
+def _reversed_lines(mm, end):
+    """ (offset, line) of the lines before end from the last one """
+    pos = _line_end(mm, end)
+    while pos >= 0:
+        start = mm.rfind(b'\n', 0, pos)
+        line = mm[start + 1:pos]
+        yield start + 1, line[:-1] if line.endswith(b'\r') else line
+        pos = start
+
+
+def iter_lines_reversed(f, end=None, encoding=None):
+    """ yields the lines of the open file f from end (its end if None) to its start. Only one line is in memory at
+        a time as they are searched for on a mmap of the file
+    """
+    decode = _decoder(encoding)
+    mm = _mmap(f)
+    if mm is None:
+        return
+    with mm:
+        for _, line in _reversed_lines(mm, len(mm) if end is None else end):
+            yield decode(line)
+
+
+IN_MODIFY = 0x2
+IN_ATTRIB = 0x4
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+
+
+class FileWatcher:
+    """ waits for the files of a folder to change with inotify (linux) or sleeping poll_interval seconds when it is
+        not available. wait returns after poll_interval seconds anyway so the changes are checked with os.stat
+    """
+
+    def __init__(self, folder, poll_interval=1.0):
+        self.poll_interval = poll_interval
+        self._fd = self._inotify(folder)
+
+    @staticmethod
+    def _inotify(folder):
+        import sys
+        if not sys.platform.startswith('linux'):
+            return None
+        try:
+            import ctypes
+            libc = ctypes.CDLL(None, use_errno=True)
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd < 0:
+                return None
+            mask = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+            if libc.inotify_add_watch(fd, os.fsencode(folder or '.'), mask) < 0:
+                os.close(fd)
+                return None
+            return fd
+        except (OSError, AttributeError):
+            return None
+
+    @property
+    def uses_inotify(self):
+        return self._fd is not None
+
+    def wait(self):
+        if self._fd is None:
+            time.sleep(self.poll_interval)
+            return
+
+        import select
+        if select.select([self._fd], [], [], self.poll_interval)[0]:
+            try:
+                while os.read(self._fd, 1 << 12):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+def follow(path, from_end=True, encoding='utf-8', poll_interval=1.0, stop_event=None, block_size=TAIL_BLOCK_SIZE):
+    """ yields the lines added to the file like tail -F. The file is opened again from its start when it is
+        rotated (another file with its name) or truncated, and it is waited for if it does not exist yet.
+        Only the last line not finished yet is kept in memory
+
+    Args:
+        path (str): file path
+        from_end (bool): only the lines added after it is called (else from the start of the file)
+        encoding (str): to decode the lines (bytes if None)
+        poll_interval (float): seconds between checks of the file when there are no inotify events
+        stop_event (threading.Event): the iteration ends when it is set
+        block_size (int): bytes read at a time
+
+    """
+    decode = _decoder(encoding)
+    watcher = FileWatcher(os.path.dirname(path), poll_interval)
+    f = None
+    partial = b''
+    try:
+        while stop_event is None or not stop_event.is_set():
+            if f is None:
+                try:
+                    f = open(path, 'rb')
+                except FileNotFoundError:
+                    watcher.wait()
+                    continue
+                if from_end:
+                    f.seek(0, 2)
+                from_end = False
+
+            data = f.read(block_size)
+            if data:
+                lines = (partial + data).split(b'\n')
+                partial = lines.pop()
+                for line in lines:
+                    yield decode(line[:-1] if line.endswith(b'\r') else line)
+                continue
+
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                # moved away and not created again yet: anything added to it is still read
+                watcher.wait()
+                continue
+
+            if st.st_ino != os.fstat(f.fileno()).st_ino:
+                log.debug('{} was rotated'.format(path))
+                if partial:
+                    yield decode(partial)
+                f.close()
+                f, partial = None, b''
+            elif st.st_size < f.tell():
+                log.debug('{} was truncated'.format(path))
+                f.seek(0)
+                partial = b''
+            else:
+                watcher.wait()
+    finally:
+        watcher.close()
+        if f is not None:
+            f.close()
+
+
 class Tailer:
-    """ Implements tailing and heading functionality like GNU tail and head commands. """
-    line_terminators = ('\r\n', '\n', '\r')
+    """ Implements tailing functionality like GNU tail command over an open file (text or binary).
+
+        The file is searched from its end on a mmap of it so getting its last lines does not depend on its size:
 
-    def __init__(self, file_name, read_size=1024, num_lines=0, end=True):
+        with open('/var/log/syslog') as f:
+            last = Tailer(f).tail(1000)           # the last 1000 lines in the order of the file
+            for line in Tailer(f, num_lines=10):  # the last 10 lines from the last one
+                ...
+    """
+    # lone \r are not line terminators
+    line_terminators = ('\r\n', '\n')
+
+    def __init__(self, file_name, read_size=TAIL_BLOCK_SIZE, num_lines=0, end=True):
         self.read_size = read_size
         self.file = file_name
         self.start_pos = self.file.tell()
         self.num_lines = num_lines
-        self.captured_data = []
+        self.encoding = getattr(file_name, 'encoding', None) if isinstance(file_name, io.TextIOBase) else None
         if end:
             self.seek_end()
 
     def seek_end(self):
-        self.captured_data = []
         self.seek(0, 2)
 
     def seek(self, pos, whence=0):
@@ -229,73 +447,59 @@ class Tailer:
         Searches backwards from the current file position for a line terminator
         and seeks to the character after it.
         """
-        pos = end_pos = self.file.tell()
-        read_size = self.read_size
-        if pos > read_size:
-            pos -= read_size
-        else:
-            pos = 0
-            read_size = end_pos
-
-        self.seek(pos)
-
-        bytes_read, read_str = self.read(read_size)
-
-        if bytes_read and read_str[-1] in self.line_terminators:
-            # The last charachter is a line terminator, don't count this one
-            bytes_read -= 1
-
-            if read_str[-2:] == '\r\n' and '\r\n' in self.line_terminators:
-                # found crlf
-                bytes_read -= 1
-
-        while bytes_read > 0:
-            # Scan backward, counting the newlines in this bufferfull
-            i = bytes_read - 1
-            while i >= 0:
-                if read_str[i] in self.line_terminators:
-                    self.seek(pos + i + 1)
-                    return self.file.tell()
-                i -= 1
-
-            if pos == 0 or pos - self.read_size < 0:
-                # Not enought lines in the buffer, send the whole file
-                self.seek(0)
-                return None
-
-            pos -= self.read_size
-            self.seek(pos)
-
-            bytes_read, read_str = self.read(self.read_size)
-
+        mm = _mmap(self.file)
+        if mm is not None:
+            with mm:
+                pos = mm.rfind(b'\n', 0, _line_end(mm, self.file.tell()))
+            if pos >= 0:
+                self.seek(pos + 1)
+                return self.file.tell()
+        # Not enough lines, send the whole file
+        self.seek(0)
         return None
 
+    def tail(self, num_lines=None):
+        """ the last num_lines (self.num_lines if None) lines before the current position in the order of the file.
+            The file is left at the start of the first of them
+        """
+        num_lines = self.num_lines if num_lines is None else num_lines
+        mm = _mmap(self.file)
+        if mm is None or num_lines <= 0:
+            return []
+        with mm:
+            end = self.file.tell()
+            start = _last_lines_start(mm, end, num_lines, self.read_size)
+            data = mm[start:_line_end(mm, end)]
+        self.seek(start)
+        return list(map(_decoder(self.encoding), data.splitlines()[-num_lines:]))
+
     def iterator(self):
         """\
-        Return the last lines of the file.
+        Return the last lines of the file (stripped) from the last one. The file is left at the start of the last
+        line returned.
         """
-        i = 1
-
-        while True:
-            prev_pos = self.file.tell()
-            new_pos = self.seek_line()
-            if not new_pos:
-                new_pos = 0
-
-            data = self.file.read(prev_pos - new_pos)
-            self.seek(new_pos)
-            if data:
-                i += 1
-                self.captured_data.append(data.strip())
-                yield data.strip()
-                if not new_pos or (self.num_lines and i > self.num_lines):
-                    raise StopIteration()
-            else:
-                raise StopIteration()
+        mm = _mmap(self.file)
+        if mm is None:
+            return
+        decode = _decoder(self.encoding)
+        pos = self.file.tell()
+        try:
+            with mm:
+                for i, (start, line) in enumerate(_reversed_lines(mm, pos)):
+                    if self.num_lines and i >= self.num_lines:
+                        break
+                    pos = start
+                    yield decode(line).strip()
+        finally:
+            self.seek(pos)
 
     def __iter__(self):
         return self.iterator()
 
+    def follow(self, **kwargs):
+        """ the lines added to the file after the current position (see follow) """
+        return follow(self.file.name, from_end=True, encoding=self.encoding, **kwargs)
+
     def close(self):
         self.file.close()
 
@@ -343,6 +547,64 @@ def name_if_file_exists(full_path_filename, add_index=False):
 indexed_name_if_file_exists = functools.partial(name_if_file_exists, add_index=True)
 
 
+class FileLock:
+    """ exclusive lock on a file shared between processes (and between threads when each one uses its own
+        FileLock). The lock file is created if it does not exist and it is not removed
+
+        with FileLock('/tmp/my_resource.lock'):
+            ...
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+
+    def acquire(self):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        f = open(self.path, 'a+b')
+        try:
+            if os.name == 'nt':
+                import msvcrt
+                f.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after 10 seconds
+                        pass
+            else:
+                import fcntl
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            f.close()
+            raise
+        self._file = f
+
+    def release(self):
+        f, self._file = self._file, None
+        if f is not None:
+            try:
+                if os.name == 'nt':
+                    import msvcrt
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    import fcntl
+                    fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            finally:
+                f.close()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+
 def json_utils_default(obj):
     """ defaults function used by json.dumps function to make datetime values javascript compatible
 
@@ -506,30 +768,24 @@ def utc_now():
     return datetime.utcnow().replace(microsecond=0)
 
 
-def md5_checksum_stream(s, buffer_size=8192):
+def md5_checksum_stream(s, buffer_size=1 << 20):
     """ calculate md5 for a stream in case of a large file that cannot be hold in memory
 
     :param s: stream
     :return:
     """
-    import hashlib
-    m = hashlib.md5()
-    while True:
-        data = s.read(buffer_size)
-        if not data:
-            break
-        m.update(data)
-    return m.hexdigest()
+    from fdutils import checksums
+    return checksums.checksum_stream(s, 'md5', buffer_size)
 
 
 def md5_checksum(filePath):
-    """ calculates md5 using the md5_checksum_stream function
+    """ calculates md5 of a file (see fdutils.checksums.checksum)
 
     :param filePath:
     :return:
     """
-    with open(filePath, 'rb') as fh:
-        return md5_checksum_stream(fh)
+    from fdutils import checksums
+    return checksums.checksum(filePath, 'md5')
 
 # following functions modified
 # from selenium.driver.firefox.webdriver.py
@@ -1,4 +1,5 @@
 import collections
+import collections.abc
 import logging
 
 from fdutils.exceptions import ElementNotUniqueError
@@ -53,8 +54,8 @@ def is_sequence(arg):
         arg is not None
         and not isinstance(arg, str)
         and (
-            isinstance(arg, collections.Sequence)
-            or isinstance(arg, collections.Mapping)
+            isinstance(arg, collections.abc.Sequence)
+            or isinstance(arg, collections.abc.Mapping)
         )
     )
 
@@ -62,7 +63,7 @@ def is_sequence(arg):
 def is_list_or_tuple(data):
     return (
         data is not None
-        and isinstance(data, collections.Sequence)
+        and isinstance(data, collections.abc.Sequence)
         and not isinstance(data, str)
     )
 
@@ -1,21 +1,195 @@
+import collections
+import concurrent.futures
+import ipaddress
 import socket
+import threading
+import time
 
+from fdutils.config import update_settings_with_user_settings
 from fdutils.files import log
 
+# seconds a dns answer is reused before asking again (0 disables the cache)
+DNS_CACHE_TTL = 300
+# seconds a failed lookup (unknown host, dns server not answering) is remembered before trying again
+DNS_NEGATIVE_CACHE_TTL = 30
+DNS_CACHE_SIZE = 4096
+# threads used to resolve a batch of hosts concurrently
+DNS_RESOLVE_WORKERS = 16
+
+update_settings_with_user_settings(locals(), 'net')
+
+
+def _to_socket_family(family):
+    if family in ('ipv4', socket.AF_INET):
+        return socket.AF_INET
+    elif family in ('ipv6', socket.AF_INET6):
+        return socket.AF_INET6
+    return 0
+
+
+class _LookupFailure(collections.namedtuple('_LookupFailure', 'error_type args')):
+    """ a failed lookup as cached: a new exception is raised every time so their tracebacks do not pile up """
+    __slots__ = ()
+
+    def error(self):
+        return self.error_type(*self.args)
+
+
+class Resolver:
+    """ getaddrinfo with a ttl cache of the answers
+
+        Failures are cached too (for negative_ttl seconds) so an unknown host or an unreachable dns server only
+        stalls the first lookup of a host. Concurrent lookups of the same host wait on the same request.
+
+    Args:
+        ttl (float): seconds to keep an answer
+        negative_ttl (float): seconds to keep a failure
+        max_size (int): maximum number of hosts to keep (least recently used are dropped first)
+        max_workers (int): threads used by resolve_many
+
+    """
+
+    def __init__(self, ttl=None, negative_ttl=None, max_size=None, max_workers=None):
+        self.ttl = DNS_CACHE_TTL if ttl is None else ttl
+        self.negative_ttl = DNS_NEGATIVE_CACHE_TTL if negative_ttl is None else negative_ttl
+        self.max_size = max_size or DNS_CACHE_SIZE
+        self.max_workers = max_workers or DNS_RESOLVE_WORKERS
+        self._cache = collections.OrderedDict()    # (host, family) -> (expiration time, addresses or _LookupFailure)
+        self._pending = {}                         # (host, family) -> future of a lookup in progress
+        self._lock = threading.Lock()
+
+    def clear(self, host=None):
+        """ forgets every answer (or only the ones for host) """
+        with self._lock:
+            if host is None:
+                self._cache.clear()
+            else:
+                for key in [k for k in self._cache if k[0] == host]:
+                    del self._cache[key]
+
+    def _get_cached(self, key):
+        try:
+            expires, answer = self._cache[key]
+        except KeyError:
+            return None
+        if expires < time.monotonic():
+            del self._cache[key]
+            return None
+        self._cache.move_to_end(key)
+        return answer
+
+    def _store(self, key, answer):
+        ttl = self.negative_ttl if isinstance(answer, _LookupFailure) else self.ttl
+        if ttl > 0:
+            self._cache[key] = (time.monotonic() + ttl, answer)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False)
+
+    @staticmethod
+    def _lookup(host, family):
+        ret = []
+        for o in socket.getaddrinfo(host, 0, family=family):
+            if o[4][0] not in ret:
+                ret.append(o[4][0])
+        return ret
+
+    def resolve(self, host, family=None):
+        """ returns the list of IPv4/IPv6 addresses of host
+
+        Args:
+            host (str): hostname or ip address
+            family: 'ipv4' or 'ipv6' (or socket.AF_INET/AF_INET6) to get only addresses of that family
+
+        Returns:
+            list: ip addresses as strings
+
+        Raises:
+            socket.gaierror: if the host can not be resolved (failure can be coming from the cache)
+
+        """
+        family = _to_socket_family(family)
+
+        try:
+            ip = ipaddress.ip_address(host)
+        except ValueError:
+            pass
+        else:
+            if not family or family == (socket.AF_INET if ip.version == 4 else socket.AF_INET6):
+                return [str(ip)]
+
+        key = host, family
+        with self._lock:
+            answer = self._get_cached(key)
+            if answer is None:
+                future = self._pending.get(key)
+                is_owner = future is None
+                if is_owner:
+                    future = self._pending[key] = concurrent.futures.Future()
+
+        if answer is None:
+            if is_owner:
+                try:
+                    answer = self._lookup(host, family)
+                except socket.gaierror as e:
+                    answer = _LookupFailure(type(e), e.args)
+                except BaseException as e:
+                    with self._lock:
+                        del self._pending[key]
+                    future.set_exception(e)
+                    raise
+                with self._lock:
+                    self._store(key, answer)
+                    del self._pending[key]
+                future.set_result(answer)
+            else:
+                answer = future.result()
+
+        if isinstance(answer, _LookupFailure):
+            raise answer.error()
+        return list(answer)
+
+    def resolve_many(self, hosts, family=None, max_workers=None):
+        """ resolves hosts concurrently
+
+        Args:
+            hosts: hostnames/ip addresses
+            family: 'ipv4' or 'ipv6' to get only addresses of that family
+            max_workers (int): maximum threads to use (default the one given when creating the resolver)
+
+        Returns:
+            dict: host -> list of ip addresses (empty if it could not be resolved)
+
+        """
+        def resolve(host):
+            try:
+                return self.resolve(host, family)
+            except socket.gaierror:
+                log.debug('Problems doing an nslookup of ' + str(host))
+                return []
+
+        hosts = list(collections.OrderedDict.fromkeys(hosts))
+        workers = min(max_workers or self.max_workers, len(hosts))
+        if workers <= 1:
+            return {host: resolve(host) for host in hosts}
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(hosts, executor.map(resolve, hosts)))
+
+
+default_resolver = Resolver()
+
 
 def nslookup_all(ip, family=None):
-    """ returns a list of IPv4/IPv6 addresses related to an IP/HOST
+    """ returns a list of IPv4/IPv6 addresses related to an IP/HOST (answers are cached by the default resolver)
 
     """
-    family = socket.AF_INET if family == 'ipv4' else socket.AF_INET6 if family == 'ipv6' else 0
-    output = socket.getaddrinfo(ip, 0, family=family)
-    ret = []
-    try:
-        for o in output:
-            ret.append(o[4][0])
-    except socket.gaierror:
-        pass
-    return ret
+    return default_resolver.resolve(ip, family)
+
+
+def nslookup_many(hosts, family=None, max_workers=None):
+    """ resolves many hosts concurrently. returns a dictionary host -> list of IPv4/IPv6 addresses """
+    return default_resolver.resolve_many(hosts, family, max_workers)
 
 
 def set_socket_keepalive(sock, interval, interval_sec=3, max_fails=5):
@@ -48,73 +222,31 @@ def nslookup_v6(ip):
 
 
 def get_list_of_syn_timestamps_from_host(pcap_file, host_ip):
-    """ using libpcap filter the pcap file using the BPF filter for tcp-syn and host src ip
-        Good for finding frequency of host trying to connect to the server where this pcap file was captured
+    """ seconds between the tcp syns (tcp[tcpflags]&tcp-syn=tcp-syn and src host) of host_ip in the pcap file (0 for
+        the first one). Good for finding frequency of host trying to connect to the server where this pcap file was
+        captured
     """
-
-    pc = pcap.pcap(pcap_file)
-    # set BPF filter
-    pc.setfilter('tcp[tcpflags]&tcp-syn=tcp-syn and src host ' + host_ip)
-    prev_ts = 0
-    list_ts = []
-    for ts, pkt in pc:
-        if not prev_ts:
-            prev_ts = ts
-        list_ts.append(ts - prev_ts)
-        prev_ts = ts
-    return list_ts
+    from fdutils import pcap
+    deltas = pcap.inter_arrival(pcap.read(pcap_file, src=host_ip, tcpflags=pcap.TH_SYN).ts)
+    deltas[:1] = 0
+    return deltas.tolist()
 
 
 def check_tcp_3way_handshake_established(pcap_file, src, dst):
-    """ Using libpcap filter the pcap file using the BPF filter for tcp-syn, tcp-syn-ack and tcp-ack and no fin or rst
-    We are going to check 3way handshake is executed
-    """
-    from pcap import pcap
-    import dpkt
-    pc = pcap(pcap_file)
-    # set BPF filter for these two hosts and tcp flags of interest
-    pc.setfilter('tcp[tcpflags]&(tcp-syn|tcp-ack|tcp-fin|tcp-rst)>1 and host {0} and host {1}'.format(src, dst))
-    syn_sent = syn_ack_sent = False
-    src_port = dst_port = first_syn = prev_seq = 0
-    for ts, pkt in pc:
-        eth = dpkt.ethernet.Ethernet(pkt)
-        ip = eth.data
-        tcp = ip.data
-
-        # look for the first syn from src
-        if not tcp.flags & (dpkt.tcp.TH_ACK | dpkt.tcp.TH_SYN):
-            continue
-
-        # convert to string
-        ip_src = socket.inet_ntoa(ip.src)
-        ip_dst = socket.inet_ntoa(ip.dst)
-        ack = tcp.ack
-        seq = tcp.seq
-        if tcp.flags & dpkt.tcp.TH_SYN and ip_src == src:
-            syn_sent = True
-            syn_ack_sent = False
-            src_port = tcp.sport
-            dst_port = tcp.dport
-            first_syn = ts
-            prev_seq = seq
-            log.info("Syn found...at " + str(ts))
-
-        elif (tcp.flags & (dpkt.tcp.TH_SYN | dpkt.tcp.TH_ACK) and ip_dst == src and ip_src == dst and syn_sent and
-              ack == (prev_seq + 1) and src_port == tcp.dport and dst_port == tcp.sport):
-
-            syn_ack_sent = True
-            prev_seq = seq
-            log.info("Syn-Ack found...at " + str(ts))
-
-        elif (tcp.flags & dpkt.tcp.TH_ACK and ip_src == src and ip_dst == dst and syn_ack_sent and
-              ack == (prev_seq + 1) and src_port == tcp.sport and dst_port == tcp.dport):
-
-            # connection established
-
-            return True, first_syn
-        elif src_port in (tcp.sport, tcp.dport) or dst_port in (tcp.sport, tcp.dport):  # tcp fin or rst for tcp connection sent before connection established
-            syn_sent = syn_ack_sent = False
+    """ checks the pcap file has a tcp 3 way handshake (syn, syn-ack and ack) from src to dst
 
+    Returns:
+        tuple: (True, timestamp of the first syn of the first connection established) or (False, 0)
+
+    """
+    from fdutils import pcap
+    established = pcap.handshakes(pcap.read(pcap_file, proto='tcp', host=src).filter(host=dst))
+    established = established[(established['src'] == int(ipaddress.IPv4Address(src))) &
+                              (established['dst'] == int(ipaddress.IPv4Address(dst)))]
+    if len(established):
+        syn_ts = float(established['syn_ts'][0])
+        log.info('Handshake from {} to {} established with a syn at {}'.format(src, dst, syn_ts))
+        return True, syn_ts
     return False, 0
 
 
@@ -1,3 +1,9 @@
+import collections
+import heapq
+import itertools
+import selectors
+import socket
+
 import fdutils
 import threading
 import time
@@ -11,6 +17,16 @@ log = logging.getLogger(__name__)
 
 POISON_PILL = None
 
+# worker threads of the default LoopScheduler (all the LoopTasks of the process run on them)
+LOOP_SCHEDULER_WORKERS = 8
+# calls of the target of a LoopTaskWithQueue in a row before letting other tasks run
+LOOP_TASK_CALLS_PER_STEP = 64
+# longest wait of a LoopTaskWithQueue without data before calling its target again (the wait doubles from
+# sleep_timeout_when_no_data while there is no data)
+LOOP_TASK_MAX_IDLE_WAIT = 0.05
+# seconds between checks of the stop switch of tasks waiting for a file to be readable
+LOOP_TASK_STOP_CHECK_INTERVAL = 1
+
 
 class ThreadLoop(threading.Thread):
 
@@ -134,7 +150,50 @@ class ThreadLoopWithMultipleStopSwitches(ThreadLoop):
         return super().should_stop() or any(e.is_set() for e in self._other_stop_switches)
 
 
-class ThreadLoopWithQueue(ThreadLoop):
+class _QueueData:
+    """ the data put in the queue by a loop """
+
+    def _init_queue(self, q, text_queue, keep_copy):
+        self.queue = q or queue.Queue()
+        self._is_text = text_queue
+        if keep_copy:
+            self.get_data = self._get_data_copy
+            self._queue_data_copy = StringIO() if text_queue else BytesIO()
+        else:
+            self.get_data = self._get_data
+            self._queue_data_copy = None
+
+    def _get_data_copy(self, all=False):
+        try:
+            while True:
+                self._queue_data_copy.write(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if all:
+            return self._queue_data_copy.getvalue()
+        else:
+            return self._queue_data_copy.read()
+
+    def _get_data(self, all=False):
+        data = []
+
+        try:
+            while True:
+                data.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+
+        if self._is_text:
+            return ''.join(data)
+        else:
+            return b''.join(data)
+
+    def get_all_data(self):
+        return self.get_data(True)
+
+
+class ThreadLoopWithQueue(_QueueData, ThreadLoop):
     """ A stoppable thread loop with a Queue to receive data from the target function. We add another
         way to stop the thread by checking for a POISON_PILL in the queue.
     """
@@ -152,14 +211,7 @@ class ThreadLoopWithQueue(ThreadLoop):
         """
 
         super(ThreadLoopWithQueue, self).__init__(target, args=args, kwargs=kwargs, **thread_kwargs)
-        self.queue = q or queue.Queue()
-        self._is_text = text_queue
-        if keep_copy:
-            self.get_data = self._get_data_copy
-            self._queue_data_copy = StringIO() if text_queue else BytesIO()
-        else:
-            self.get_data = self._get_data
-            self._queue_data_copy = None
+        self._init_queue(q, text_queue, keep_copy)
         self.recv_data_timeout = recv_data_timeout
         self.sleep_timeout_when_no_data = sleep_timeout_when_no_data
 
@@ -180,31 +232,406 @@ class ThreadLoopWithQueue(ThreadLoop):
             if self.should_stop() or (self.recv_data_timeout and (time.time() - start_time) > self.recv_data_timeout):
                 break
 
-    def _get_data_copy(self, all=False):
+
+class _Wait:
+    """ a timer (deadline) or a wait for a file to be readable (fileobj) with an optional deadline """
+    __slots__ = ('callback', 'deadline', 'fileobj', 'cancelled', 'fired')
+
+    def __init__(self, callback, deadline=None, fileobj=None):
+        self.callback = callback
+        self.deadline = deadline
+        self.fileobj = fileobj
+        self.cancelled = self.fired = False
+
+
+class LoopScheduler:
+    """ runs loop tasks (LoopTask) on a fixed number of worker threads instead of a thread per task.
+
+        Every step of a task (a call of its target) runs on one of the workers and then the task goes back in line so
+        the tasks take turns. The tasks waiting (between executions, for data or for a file to be readable) and
+        their run timeouts are handled by a single reactor thread with a heap of timers and a selector. The targets
+        SHOULD NOT block as they would hold one of the workers while blocked
+    """
+
+    def __init__(self, workers=None, name='loop-scheduler'):
+        self.workers = workers or LOOP_SCHEDULER_WORKERS
+        self.name = name
+        self._ready = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._commands = collections.deque()
+        self._timers = []
+        self._timer_ids = itertools.count()
+        self._threads = []
+        self._selector = self._wake_r = self._wake_w = None
+        self._shutdown = False
+
+    def __repr__(self):
+        return 'LoopScheduler(workers={}, name={!r})'.format(self.workers, self.name)
+
+    def _start(self):
+        with self._lock:
+            if self._threads or self._shutdown:
+                return
+            self._selector = selectors.DefaultSelector()
+            self._wake_r, self._wake_w = socket.socketpair()
+            self._wake_r.setblocking(False)
+            self._wake_w.setblocking(False)
+            self._selector.register(self._wake_r, selectors.EVENT_READ)
+            self._threads.append(threading.Thread(target=self._reactor, name=self.name + '-reactor', daemon=True))
+            self._threads.extend(threading.Thread(target=self._worker, name='{}-{}'.format(self.name, i), daemon=True)
+                                 for i in range(self.workers))
+            for th in self._threads:
+                th.start()
+
+    def run_soon(self, callback):
+        """ calls callback in one of the workers """
+        if not self._threads:
+            self._start()
+        self._ready.put(callback)
+
+    def call_later(self, delay, callback):
+        """ calls callback in one of the workers after delay seconds. Returns a handle to cancel it """
+        return self._add(_Wait(callback, deadline=time.monotonic() + delay))
+
+    def when_readable(self, fileobj, callback, timeout=None):
+        """ calls callback in one of the workers when fileobj (a file object or descriptor with fileno) is readable
+            or after timeout seconds if given, whatever happens first. Returns a handle to cancel it
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        return self._add(_Wait(callback, deadline=deadline, fileobj=fileobj))
+
+    def cancel(self, handle):
+        handle.cancelled = True
+        if handle.fileobj is not None:
+            self._command(('unregister', handle))
+
+    def _add(self, handle):
+        if not self._threads:
+            self._start()
+        self._command(('add', handle))
+        return handle
+
+    def _command(self, command):
+        with self._lock:
+            self._commands.append(command)
+        self._wake()
+
+    def _wake(self):
         try:
-            while True:
-                self._queue_data_copy.write(self.queue.get_nowait())
-        except queue.Empty:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError, AttributeError):
+            # the reactor already has a wake up pending (or was shut down)
             pass
 
-        if all:
-            return self._queue_data_copy.getvalue()
-        else:
-            return self._queue_data_copy.read()
-
-    def _get_data(self, all=False):
-        data = []
+    def _fire(self, handle):
+        if not handle.cancelled and not handle.fired:
+            handle.fired = True
+            self._ready.put(handle.callback)
 
+    def _unregister(self, handle):
         try:
-            while True:
-                data.append(self.queue.get_nowait())
-        except queue.Empty:
+            self._selector.unregister(handle.fileobj)
+        except (KeyError, ValueError, OSError):
             pass
 
-        if self._is_text:
-            return ''.join(data)
-        else:
-            return b''.join(data)
+    def _reactor(self):
+        while True:
+            with self._lock:
+                commands = list(self._commands)
+                self._commands.clear()
+                if self._shutdown:
+                    break
 
-    def get_all_data(self):
-        return self.get_data(True)
\ No newline at end of file
+            for kind, handle in commands:
+                if kind == 'unregister':
+                    self._unregister(handle)
+                    continue
+                if handle.cancelled:
+                    continue
+                if handle.fileobj is not None:
+                    try:
+                        self._selector.register(handle.fileobj, selectors.EVENT_READ, handle)
+                    except (KeyError, ValueError, OSError):
+                        # closed (its reader will find out) or already waited for
+                        self._fire(handle)
+                        continue
+                if handle.deadline is not None:
+                    heapq.heappush(self._timers, (handle.deadline, next(self._timer_ids), handle))
+
+            while self._timers and (self._timers[0][2].cancelled or self._timers[0][2].fired):
+                heapq.heappop(self._timers)
+            timeout = max(0., self._timers[0][0] - time.monotonic()) if self._timers else None
+
+            for key, _ in self._selector.select(timeout):
+                if key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                else:
+                    self._unregister(key.data)
+                    self._fire(key.data)
+
+            now = time.monotonic()
+            while self._timers and self._timers[0][0] <= now:
+                _, _, handle = heapq.heappop(self._timers)
+                if handle.fileobj is not None and not (handle.cancelled or handle.fired):
+                    self._unregister(handle)
+                self._fire(handle)
+
+        self._selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _worker(self):
+        while True:
+            callback = self._ready.get()
+            if callback is None:
+                break
+            try:
+                callback()
+            except Exception:
+                log.exception('Problems running {} in {}'.format(callback, self))
+
+    def shutdown(self):
+        """ stops the threads of the scheduler (the tasks still running are not stopped) """
+        with self._lock:
+            self._shutdown = True
+            threads, self._threads = self._threads, []
+        if threads:
+            self._wake()
+            for _ in range(self.workers):
+                self._ready.put(None)
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """ the LoopScheduler shared by the LoopTasks of the process """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LoopScheduler()
+        return _scheduler
+
+
+class LoopTask:
+    """ a ThreadLoop run by a LoopScheduler (the one of the process by default) instead of its own thread.
+
+        It has the same arguments and methods (start, stop, join, add_call_on_stop, is_alive...) but the target is
+        called by the workers of the scheduler and the run timeout and the sleep between executions are timers of
+        the scheduler. The callbacks on stop are called by the worker that ran the last step when the task stops
+        itself and stop() waits for them (up to join_timeout) when called by anyone else
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, target, args=(), kwargs=None, stop_switch=None, run_timeout=0, join_timeout=None,
+                 sleep_time_between_execution=0, call_on_stop=None, scheduler=None, name=None, daemon=True):
+        self._target = target
+        self._args = args
+        self._kwargs = kwargs or {}
+        self.name = name or 'LoopTask-{}'.format(next(self._ids))
+        self.daemon = daemon
+        self.stop_switch = stop_switch or threading.Event()
+        self.run_timeout = run_timeout
+        self.join_timeout = join_timeout
+        self.sleep_time_between_executions = sleep_time_between_execution
+        self._execution_timeout = threading.Event()
+        self._lock = threading.Lock()
+        self._call_on_stop = fdutils.lists.to_sequence(call_on_stop)
+        self.call_on_stop_finished = threading.Event()
+        self.scheduler = scheduler or get_scheduler()
+
+        self._state = 'new'
+        self._waiting = self._timeout_handle = None
+        self._step_thread = None
+        self._done = threading.Event()
+
+    def __repr__(self):
+        return '<{} {} {}>'.format(self.__class__.__name__, self.name, self._state)
+
+    @property
+    def stop_after_secs(self):
+        return self.run_timeout or None
+
+    @stop_after_secs.setter
+    def stop_after_secs(self, stop_after):
+        self.run_timeout = stop_after
+
+    def should_stop(self):
+        return self.stop_switch.is_set()
+
+    def is_alive(self):
+        return self._state != 'new' and not self._done.is_set()
+
+    def start(self):
+        with self._lock:
+            if self._state != 'new':
+                raise RuntimeError('{} can only be started once'.format(self))
+            self._state = 'scheduled'
+        self._execution_timeout.clear()
+        if self.run_timeout:
+            self._timeout_handle = self.scheduler.call_later(self.run_timeout, self._timeout_stop)
+        self.scheduler.run_soon(self._step)
+        return self
+
+    def _run_step(self):
+        """ runs the target and returns True if there was nothing to do (the task waits for data) """
+        self._target(*self._args, **self._kwargs)
+        return False
+
+    def _wait_for_data(self):
+        return self.scheduler.call_later(self.sleep_time_between_executions, self._step)
+
+    def _schedule(self, idle):
+        if idle:
+            return self._wait_for_data()
+        if self.sleep_time_between_executions:
+            return self.scheduler.call_later(self.sleep_time_between_executions, self._step)
+        self.scheduler.run_soon(self._step)
+        return None
+
+    def _step(self):
+        with self._lock:
+            if self._state != 'scheduled':
+                return
+            self._state = 'running'
+            self._waiting = None
+            self._step_thread = threading.get_ident()
+
+        idle = False
+        try:
+            if not self.should_stop():
+                idle = self._run_step()
+        except Exception:
+            log.exception('Problems running {}. Stopping it'.format(self))
+            self.stop_switch.set()
+
+        with self._lock:
+            self._step_thread = None
+            if self.should_stop():
+                self._state = 'finishing'
+            else:
+                self._state = 'scheduled'
+                self._waiting = self._schedule(idle)
+                return
+        self._finish()
+
+    def join(self, **kwargs):
+        kwargs.setdefault('timeout', self.join_timeout)
+        if self._state != 'new':
+            self._done.wait(kwargs['timeout'])
+
+    def stop(self):
+        self.stop_switch.set()
+        with self._lock:
+            finish = self._state in ('new', 'scheduled')
+            if finish:
+                self._state = 'finishing'
+                if self._waiting is not None:
+                    self.scheduler.cancel(self._waiting)
+            in_step = self._step_thread == threading.get_ident()
+
+        if finish:
+            self._finish()
+        elif self._call_on_stop and not in_step:
+            # the worker running its last step calls them
+            self.join()
+
+    def _finish(self):
+        self.cancel_timers()
+        try:
+            if self._call_on_stop:
+                exceptions = []
+                for (target, args, kwargs) in self._call_on_stop:
+                    try:
+                        target(*args, **kwargs)
+                    except Exception as e:
+                        exceptions.append(e)
+                if any(exceptions):
+                    raise Exception('Problems with one or more of the methods called at stop') from exceptions[0]
+                self.call_on_stop_finished.set()
+        except Exception:
+            log.exception('problems while executing callback on stop. Execution will continue')
+        finally:
+            # avoid a refcycle if the target has a member that points to the task
+            self._target = self._args = self._kwargs = None
+            with self._lock:
+                self._state = 'done'
+            self._done.set()
+
+    def add_call_on_stop(self, target, args=(), kwargs=None):
+        kwargs = kwargs or {}
+        self._call_on_stop.append((target, args, kwargs))
+
+    def _timeout_stop(self):
+        self._execution_timeout.set()
+        self.stop()
+
+    def cancel_timers(self):
+        if self._timeout_handle is not None:
+            self.scheduler.cancel(self._timeout_handle)
+
+
+class LoopTaskWithQueue(_QueueData, LoopTask):
+    """ a ThreadLoopWithQueue run by a LoopScheduler.
+
+        The target raises queue.Empty when it has no data (instead of blocking for it). The task is then called
+        again after sleep_timeout_when_no_data (doubled while there is no data up to LOOP_TASK_MAX_IDLE_WAIT) or,
+        if wait_readable is given, when that file is readable (or after readable_timeout)
+    """
+
+    def __init__(self, target, args=(), kwargs=None, q=None, recv_data_timeout=0,
+                 sleep_timeout_when_no_data=0.001, text_queue=True, keep_copy=False, wait_readable=None,
+                 readable_timeout=None, **task_kwargs):
+        """
+
+        Args:
+            q (queue.Queue): a queue provided or we would create one
+            recv_data_timeout (float): seconds the target is called in a row while it has data
+            sleep_timeout_when_no_data (float): first wait after the target has no data
+            text_queue (bool): the data is text (bytes if False)
+            keep_copy (bool): keep all the data taken from the queue to give it with get_all_data
+            wait_readable: file object or descriptor the target reads (it is called again when readable)
+            readable_timeout (float): seconds to call the target again while the file is not readable
+            **task_kwargs: LoopTask arguments
+        """
+        super(LoopTaskWithQueue, self).__init__(target, args=args, kwargs=kwargs, **task_kwargs)
+        self._init_queue(q, text_queue, keep_copy)
+        self.recv_data_timeout = recv_data_timeout
+        self.sleep_timeout_when_no_data = sleep_timeout_when_no_data
+        self.wait_readable = wait_readable
+        self.readable_timeout = readable_timeout
+        self._idle_wait = sleep_timeout_when_no_data
+
+    def _run_step(self):
+        start_time = time.monotonic()
+        for _ in range(LOOP_TASK_CALLS_PER_STEP):
+            try:
+                data = self._target(*self._args, **self._kwargs)
+            except queue.Empty:
+                return True
+
+            self._idle_wait = self.sleep_timeout_when_no_data
+            if data == POISON_PILL:
+                self.stop_switch.set()
+                break
+            elif data:
+                self.queue.put(data)
+
+            if self.should_stop() or (self.recv_data_timeout and
+                                      (time.monotonic() - start_time) > self.recv_data_timeout):
+                break
+        return False
+
+    def _wait_for_data(self):
+        if self.wait_readable is not None:
+            timeout = self.readable_timeout or LOOP_TASK_STOP_CHECK_INTERVAL
+            return self.scheduler.when_readable(self.wait_readable, self._step, timeout)
+        wait = self._idle_wait
+        self._idle_wait = min(wait * 2, LOOP_TASK_MAX_IDLE_WAIT)
+        return self.scheduler.call_later(wait, self._step)
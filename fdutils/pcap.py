@@ -0,0 +1,503 @@
+""" pcap and pcapng captures analysed without libpcap
+
+    The capture is mapped in memory and only the record headers are walked in python (one struct unpack per
+    packet). The fields of the packets (ethernet with vlan tags, linux cooked, raw ip and loopback links, ipv4, tcp
+    and udp headers) are then taken from the records of a chunk all at once with numpy, the predicates (like the BPF
+    host, net, port, proto and tcpflags primitives) are boolean masks over those columns and the results are numpy
+    arrays:
+
+        >>> syns = pcap.read('snoop.pcap', src='10.0.0.1', tcpflags=pcap.TH_SYN)
+        >>> syns.ts                                    # float64 seconds since the epoch
+        >>> syns.flows()                               # structured array of src, dst, sport, dport, proto
+        >>> pcap.inter_arrival_stats(syns.ts)          # how often the host tried to connect
+        >>> pcap.handshakes(pcap.read('snoop.pcap', proto='tcp'))
+
+    Only ipv4 packets are kept (addresses are uint32 columns, see to_ip). Captures bigger than memory can be
+    processed a chunk at a time with iter_chunks as only the packets matching the predicates are kept.
+
+    Requires numpy
+"""
+import array
+import ipaddress
+import itertools
+import logging
+import mmap
+import os
+import struct
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+# records decoded at a time by iter_chunks (the columns of a chunk take about 60 bytes per packet)
+CHUNK_PACKETS = 1 << 20
+
+TH_FIN = 0x01
+TH_SYN = 0x02
+TH_RST = 0x04
+TH_PUSH = 0x08
+TH_ACK = 0x10
+TH_URG = 0x20
+
+PROTOCOLS = dict(icmp=1, tcp=6, udp=17, sctp=132)
+
+LINKTYPE_NULL = 0
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LOOP = 108
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_IPV4 = 228
+LINKTYPE_LINUX_SLL2 = 276
+
+COLUMNS = (('ts', np.float64), ('src', np.uint32), ('dst', np.uint32), ('sport', np.uint16), ('dport', np.uint16),
+           ('proto', np.uint8), ('tcpflags', np.uint8), ('seq', np.uint32), ('ack', np.uint32),
+           ('length', np.uint32))
+
+FLOW_DTYPE = np.dtype([('src', np.uint32), ('dst', np.uint32), ('sport', np.uint16), ('dport', np.uint16),
+                       ('proto', np.uint8)])
+
+HANDSHAKE_DTYPE = np.dtype([('src', np.uint32), ('dst', np.uint32), ('sport', np.uint16), ('dport', np.uint16),
+                            ('syn_ts', np.float64), ('synack_ts', np.float64), ('ack_ts', np.float64)])
+
+_PCAP_MAGIC = {b'\xd4\xc3\xb2\xa1': ('<', 1e-6), b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+               b'\x4d\x3c\xb2\xa1': ('<', 1e-9), b'\xa1\xb2\x3c\x4d': ('>', 1e-9)}
+_PCAPNG_SECTION = 0x0a0d0d0a
+_PCAPNG_INTERFACE = 1
+_PCAPNG_ENHANCED_PACKET = 6
+_VLAN_ETHERTYPES = (0x8100, 0x88a8, 0x9100)
+# vlan tags followed (802.1ad q-in-q is two)
+_MAX_VLAN_TAGS = 2
+_PORT_PROTOCOLS = (6, 17, 132)
+
+_ETHERTYPE = np.dtype('>u2')
+_VLAN_TAG = np.dtype([('tci', '>u2'), ('ethertype', '>u2')])
+_IPV4_HEADER = np.dtype([('version_ihl', 'u1'), ('tos', 'u1'), ('total_length', '>u2'), ('ident', '>u2'),
+                         ('fragment', '>u2'), ('ttl', 'u1'), ('proto', 'u1'), ('checksum', '>u2'), ('src', '>u4'),
+                         ('dst', '>u4')])
+_PORTS = np.dtype([('sport', '>u2'), ('dport', '>u2')])
+# up to the flags
+_TCP_HEADER = np.dtype([('sport', '>u2'), ('dport', '>u2'), ('seq', '>u4'), ('ack', '>u4'), ('offset', 'u1'),
+                        ('tcpflags', 'u1')])
+
+
+class Capture:
+    """ the ipv4 packets of a capture as numpy arrays of the same length, one per field:
+
+            ts          seconds since the epoch
+            src, dst    ipv4 addresses (uint32, see to_ip)
+            sport, dport ports of tcp, udp and sctp packets (0 for others and fragments)
+            proto       ip protocol
+            tcpflags, seq, ack  of tcp packets (0 for others)
+            length      length of the packet on the wire
+
+        Indexing with a mask, slice or indices gives another Capture with those packets
+    """
+
+    def __init__(self, **columns):
+        for name, dtype in COLUMNS:
+            setattr(self, name, np.asarray(columns.get(name, ()), dtype=dtype))
+
+    @classmethod
+    def concatenate(cls, captures):
+        captures = list(captures)
+        return cls(**{name: np.concatenate([getattr(c, name) for c in captures]) if captures else ()
+                      for name, _ in COLUMNS})
+
+    def __len__(self):
+        return len(self.ts)
+
+    def __getitem__(self, index):
+        return Capture(**{name: getattr(self, name)[index] for name, _ in COLUMNS})
+
+    def __repr__(self):
+        return '<Capture of {} packets>'.format(len(self))
+
+    def filter(self, **predicates):
+        """ the packets matching the predicates (see read) """
+        return self[match(self, **predicates)]
+
+    def flows(self):
+        """ structured array (FLOW_DTYPE) of the src, dst, sport, dport and proto of every packet """
+        flows = np.empty(len(self), dtype=FLOW_DTYPE)
+        for name in FLOW_DTYPE.names:
+            flows[name] = getattr(self, name)
+        return flows
+
+
+def to_ip(address):
+    """ dotted ipv4 address of an integer address like the ones of Capture.src """
+    return str(ipaddress.IPv4Address(int(address)))
+
+
+def _network(address):
+    network = ipaddress.IPv4Network(address, strict=False)
+    return int(network.netmask), int(network.network_address)
+
+
+def match(capture, host=None, src=None, dst=None, port=None, sport=None, dport=None, proto=None, tcpflags=None):
+    """ boolean mask of the packets of capture matching all the predicates given
+
+    Args:
+        host (str): address or network ('10.0.0.0/8') that is the source or the destination
+        src (str): address or network of the source
+        dst (str): address or network of the destination
+        port (int): source or destination port
+        sport (int): source port
+        dport (int): destination port
+        proto (str or int): tcp, udp, icmp, sctp or the ip protocol number
+        tcpflags (int or tuple): flags that have to be set (TH_SYN | TH_ACK) or a (mask, value) tuple for
+                                 tcp[tcpflags] & mask == value (like (TH_SYN | TH_ACK, TH_SYN) for syns only)
+
+    """
+    mask = np.ones(len(capture), dtype=bool)
+    for column, address in ((None, host), (capture.src, src), (capture.dst, dst)):
+        if address is not None:
+            netmask, network = _network(address)
+            if column is None:
+                mask &= ((capture.src & netmask) == network) | ((capture.dst & netmask) == network)
+            else:
+                mask &= (column & netmask) == network
+
+    if port is not None or sport is not None or dport is not None:
+        mask &= np.isin(capture.proto, _PORT_PROTOCOLS)
+        if port is not None:
+            mask &= (capture.sport == port) | (capture.dport == port)
+        if sport is not None:
+            mask &= capture.sport == sport
+        if dport is not None:
+            mask &= capture.dport == dport
+
+    if proto is not None:
+        mask &= capture.proto == PROTOCOLS.get(proto, proto)
+
+    if tcpflags is not None:
+        flags_mask, value = tcpflags if isinstance(tcpflags, tuple) else (tcpflags, tcpflags)
+        mask &= (capture.proto == PROTOCOLS['tcp']) & ((capture.tcpflags & flags_mask) == value)
+    return mask
+
+
+def _record_header(endian):
+    return np.dtype([('ts_sec', endian + 'u4'), ('ts_frac', endian + 'u4'), ('caplen', endian + 'u4'),
+                     ('length', endian + 'u4')])
+
+
+def _enhanced_packet_header(endian):
+    return np.dtype([('block_type', endian + 'u4'), ('block_length', endian + 'u4'), ('interface', endian + 'u4'),
+                     ('ts_high', endian + 'u4'), ('ts_low', endian + 'u4'), ('caplen', endian + 'u4'),
+                     ('length', endian + 'u4')])
+
+
+def _headers(buf, offsets, dtype):
+    """ array of the dtype headers at offsets of buf (they have to be whole in buf) copied with one gather """
+    dtype = np.dtype(dtype)
+    if not len(offsets):
+        return np.zeros(0, dtype=dtype)
+    return sliding_window_view(buf, dtype.itemsize)[offsets].view(dtype).reshape(-1)
+
+
+def _network_offsets(buf, data, captured, linktype):
+    """ offset of the ip header of every record and whether it has an ethertype of ipv4 (or no ethertype) """
+    l3 = np.zeros(len(data), dtype=np.int64)
+    ipv4 = np.zeros(len(data), dtype=bool)
+
+    ethernet = (linktype == LINKTYPE_ETHERNET) & (data + 14 <= captured)
+    if ethernet.any():
+        offset, end = data[ethernet] + 14, captured[ethernet]
+        ethertype = _headers(buf, offset - 2, _ETHERTYPE)
+        for _ in range(_MAX_VLAN_TAGS):
+            tagged = np.flatnonzero(np.isin(ethertype, _VLAN_ETHERTYPES) & (offset + 4 <= end))
+            if not len(tagged):
+                break
+            ethertype[tagged] = _headers(buf, offset[tagged], _VLAN_TAG)['ethertype']
+            offset[tagged] += 4
+        l3[ethernet] = offset
+        ipv4[ethernet] = ethertype == 0x0800
+
+    for link, header, ethertype_at in ((LINKTYPE_LINUX_SLL, 16, 14), (LINKTYPE_LINUX_SLL2, 20, 0)):
+        cooked = (linktype == link) & (data + header <= captured)
+        if cooked.any():
+            l3[cooked] = data[cooked] + header
+            ipv4[cooked] = _headers(buf, data[cooked] + ethertype_at, _ETHERTYPE) == 0x0800
+
+    for link, header in ((LINKTYPE_RAW, 0), (LINKTYPE_IPV4, 0), (LINKTYPE_NULL, 4), (LINKTYPE_LOOP, 4)):
+        raw = linktype == link
+        if raw.any():
+            l3[raw] = data[raw] + header
+            ipv4[raw] = True
+    return l3, ipv4
+
+
+def _decode(buf, data, captured, linktype):
+    """ columns of the ipv4 packets of the records with data from the offsets data to captured and the mask of
+        those records
+    """
+    l3, ipv4 = _network_offsets(buf, data, captured, linktype)
+    ipv4 &= l3 + 20 <= captured
+    ip = _headers(buf, l3[ipv4], _IPV4_HEADER)
+    valid = ((ip['version_ihl'] >> 4) == 4) & ((ip['version_ihl'] & 0x0f) >= 5)
+    ipv4[ipv4] = valid
+    ip, l3, captured = ip[valid], l3[ipv4], captured[ipv4]
+
+    columns = dict(src=ip['src'], dst=ip['dst'], proto=ip['proto'])
+    for name in ('sport', 'dport', 'seq', 'ack', 'tcpflags'):
+        columns[name] = np.zeros(len(ip), dtype=dict(COLUMNS)[name])
+
+    # only the first fragment has the transport header
+    l4 = l3 + (ip['version_ihl'] & 0x0f).astype(np.int64) * 4
+    first_fragment = (ip['fragment'] & 0x1fff) == 0
+    ports = np.flatnonzero(first_fragment & np.isin(ip['proto'], _PORT_PROTOCOLS) & (l4 + 4 <= captured))
+    header = _headers(buf, l4[ports], _PORTS)
+    columns['sport'][ports], columns['dport'][ports] = header['sport'], header['dport']
+    tcp = first_fragment & (ip['proto'] == PROTOCOLS['tcp']) & (l4 + _TCP_HEADER.itemsize <= captured)
+    tcp = np.flatnonzero(tcp)
+    header = _headers(buf, l4[tcp], _TCP_HEADER)
+    for name in ('seq', 'ack', 'tcpflags'):
+        columns[name][tcp] = header[name]
+    return columns, ipv4
+
+
+def _capture(buf, ts, data, captured, length, linktype):
+    columns, ipv4 = _decode(buf, data, captured, np.broadcast_to(linktype, data.shape))
+    return Capture(ts=ts[ipv4], length=length[ipv4], **columns)
+
+
+def _pcap_chunks(mm, chunk_packets):
+    endian, resolution = _PCAP_MAGIC[mm[:4]]
+    linktype = struct.unpack_from(endian + 'I', mm, 20)[0] & 0xffff
+    caplen_of = struct.Struct(endian + '8xI').unpack_from
+    record_header = _record_header(endian)
+    size = len(mm)
+    position = 24
+    end_of_file = False
+    while not end_of_file:
+        offsets = array.array('q')
+        append = offsets.append
+        try:
+            for _ in itertools.repeat(None, chunk_packets):
+                append(position)
+                position += 16 + caplen_of(mm, position)[0]
+        except struct.error:
+            # no record header at position
+            offsets.pop()
+            end_of_file = True
+        if position > size:
+            offsets.pop()
+            end_of_file = True
+        if end_of_file and position != size:
+            log.debug('The last record of the capture is truncated')
+        if not offsets:
+            break
+
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        records = np.frombuffer(offsets, dtype=np.int64)
+        header = _headers(buf, records, record_header)
+        data = records + 16
+        capture = _capture(buf, header['ts_sec'] + header['ts_frac'] * resolution, data, data + header['caplen'],
+                           header['length'], linktype)
+        del buf
+        yield capture
+
+
+def _interface(mm, position, endian, length):
+    """ linktype, timestamp resolution and offset of an interface description block """
+    linktype = struct.unpack_from(endian + 'H', mm, position + 8)[0]
+    resolution, offset = 1e-6, 0
+    option = position + 16
+    end = position + length - 4
+    while option + 4 <= end:
+        code, size = struct.unpack_from(endian + 'HH', mm, option)
+        if code == 0:
+            break
+        if code == 9:
+            value = mm[option + 4]
+            resolution = 2. ** -(value & 0x7f) if value & 0x80 else 10. ** -value
+        elif code == 14:
+            offset = struct.unpack_from(endian + 'q', mm, option + 4)[0]
+        option += 4 + (size + 3) // 4 * 4
+    return linktype, resolution, offset
+
+
+def _pcapng_chunks(mm, chunk_packets):
+    byte_order = mm[8:12]
+    endian = '<' if byte_order == b'\x4d\x3c\x2b\x1a' else '>'
+    block = struct.Struct(endian + 'II').unpack_from
+    packet_header = _enhanced_packet_header(endian)
+    interfaces = []
+    section_interfaces = 0
+    size = len(mm)
+    position = 0
+    while position + 12 <= size:
+        offsets = array.array('q')
+        append = offsets.append
+        # index of the first packet of every section of the chunk and the interfaces of the sections before it
+        sections = [(0, section_interfaces)]
+        while position + 12 <= size and len(offsets) < chunk_packets:
+            block_type, length = block(mm, position)
+            if length < 12 or position + length > size:
+                log.debug('The last block of the capture is truncated')
+                size = position
+                break
+            if block_type == _PCAPNG_ENHANCED_PACKET:
+                append(position)
+            elif block_type == _PCAPNG_INTERFACE:
+                interfaces.append(_interface(mm, position, endian, length))
+            elif block_type == _PCAPNG_SECTION:
+                if mm[position + 8:position + 12] != byte_order:
+                    raise ValueError('pcapng sections with different byte orders are not supported')
+                section_interfaces = len(interfaces)
+                sections.append((len(offsets), section_interfaces))
+            position += length
+        if not offsets:
+            continue
+
+        linktypes, resolutions, ts_offsets = (np.array(column) for column in zip(*interfaces))
+        first_packets, previous_interfaces = (np.array(column) for column in zip(*sections))
+        buf = np.frombuffer(mm, dtype=np.uint8)
+        records = np.frombuffer(offsets, dtype=np.int64)
+        header = _headers(buf, records, packet_header)
+        section = np.searchsorted(first_packets, np.arange(len(records)), side='right') - 1
+        interface = header['interface'] + previous_interfaces[section]
+        ticks = (header['ts_high'].astype(np.uint64) << np.uint64(32)) | header['ts_low']
+        data = records + 28
+        capture = _capture(buf, ticks * resolutions[interface] + ts_offsets[interface], data,
+                           data + header['caplen'], header['length'], linktypes[interface])
+        del buf
+        yield capture
+
+
+def iter_chunks(path, chunk_packets=None, **predicates):
+    """ generator of the packets of the capture file at path that match the predicates as a Capture for every
+        chunk_packets records read so only the matching packets of a chunk are in memory at a time
+
+    Args:
+        path (str): pcap or pcapng file
+        chunk_packets (int): records per chunk (CHUNK_PACKETS by default)
+        predicates: the ones of match
+
+    """
+    chunk_packets = chunk_packets or CHUNK_PACKETS
+    with open(path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            if mm[:4] in _PCAP_MAGIC:
+                chunks = _pcap_chunks(mm, chunk_packets)
+            elif mm[:4] == struct.pack('<I', _PCAPNG_SECTION):
+                chunks = _pcapng_chunks(mm, chunk_packets)
+            else:
+                raise ValueError('{} is not a pcap or pcapng file'.format(path))
+
+            for capture in chunks:
+                yield capture.filter(**predicates) if predicates else capture
+        finally:
+            chunks = None
+            mm.close()
+
+
+def read(path, **predicates):
+    """ Capture of the packets of the capture file at path that match the predicates (see match and iter_chunks) """
+    return Capture.concatenate(iter_chunks(path, **predicates))
+
+
+def inter_arrival(ts, groups=None):
+    """ seconds since the previous packet (of the same group if given) for every timestamp (nan for the first)
+
+    Args:
+        ts (numpy.ndarray): timestamps
+        groups (numpy.ndarray): group of every timestamp like Capture.src to get the times between the packets of
+                                every source
+
+    """
+    ts = np.asarray(ts, dtype=np.float64)
+    deltas = np.full(len(ts), np.nan)
+    if groups is None:
+        deltas[1:] = np.diff(ts)
+        return deltas
+
+    groups = np.asarray(groups)
+    order = np.lexsort((ts, groups))
+    sorted_deltas = np.full(len(ts), np.nan)
+    sorted_deltas[1:] = np.diff(ts[order])
+    sorted_groups = groups[order]
+    sorted_deltas[1:][sorted_groups[1:] != sorted_groups[:-1]] = np.nan
+    deltas[order] = sorted_deltas
+    return deltas
+
+
+def inter_arrival_stats(ts, groups=None, percentiles=(50, 90, 99)):
+    """ count, mean, std, min, max and percentiles (p50...) of the inter_arrival times """
+    deltas = inter_arrival(ts, groups)
+    deltas = deltas[~np.isnan(deltas)]
+    if not len(deltas):
+        return dict(count=0)
+    stats = dict(count=len(deltas), mean=float(deltas.mean()), std=float(deltas.std()), min=float(deltas.min()),
+                 max=float(deltas.max()))
+    for percentile, value in zip(percentiles, np.percentile(deltas, percentiles)):
+        stats['p{}'.format(percentile)] = float(value)
+    return stats
+
+
+def _keys(src, dst, sport, dport, seq):
+    keys = np.empty((len(src), 2), dtype=np.uint64)
+    keys[:, 0] = (src.astype(np.uint64) << np.uint64(32)) | dst
+    keys[:, 1] = (sport.astype(np.uint64) << np.uint64(48)) | (dport.astype(np.uint64) << np.uint64(32)) | seq
+    return keys
+
+
+def _match_keys(left, right):
+    """ index of the first row of left with the key of every row of right (-1 if there is none) """
+    _, inverse = np.unique(np.concatenate([left, right]), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    first = np.full(len(inverse), len(left), dtype=np.int64)
+    np.minimum.at(first, inverse[:len(left)], np.arange(len(left)))
+    matched = first[inverse[len(left):]]
+    matched[matched == len(left)] = -1
+    return matched
+
+
+def handshakes(capture):
+    """ tcp connections established in the capture (a syn, the syn-ack acknowledging it from the other end and the
+        ack of that syn-ack) as a structured array (HANDSHAKE_DTYPE) with the client as src and the time of the
+        first syn, the first syn-ack and the first ack. Retransmissions are matched to the first packet
+    """
+    c = capture
+    one = np.uint32(1)
+    flags = c.tcpflags & (TH_SYN | TH_ACK | TH_RST)
+    tcp = c.proto == PROTOCOLS['tcp']
+    syn = np.flatnonzero(tcp & (flags == TH_SYN))
+    synack = np.flatnonzero(tcp & (flags == TH_SYN | TH_ACK))
+    ack = np.flatnonzero(tcp & (flags == TH_ACK))
+
+    # syn-acks from the server acknowledging the sequence of a syn
+    syn_of_synack = _match_keys(_keys(c.src[syn], c.dst[syn], c.sport[syn], c.dport[syn], c.seq[syn] + one),
+                                _keys(c.dst[synack], c.src[synack], c.dport[synack], c.sport[synack],
+                                      c.ack[synack]))
+    answered = syn_of_synack >= 0
+    synack, syn_of_synack = synack[answered], syn[syn_of_synack[answered]]
+    after = c.ts[synack] >= c.ts[syn_of_synack]
+    synack, syn_of_synack = synack[after], syn_of_synack[after]
+
+    # acks from the client acknowledging the sequence of the syn-ack
+    synack_of_ack = _match_keys(_keys(c.dst[synack], c.src[synack], c.dport[synack], c.sport[synack],
+                                      c.seq[synack] + one),
+                                _keys(c.src[ack], c.dst[ack], c.sport[ack], c.dport[ack], c.ack[ack]))
+    acked = synack_of_ack >= 0
+    ack, synack_of_ack = ack[acked], synack_of_ack[acked]
+    after = c.ts[ack] >= c.ts[synack[synack_of_ack]]
+    ack, synack_of_ack = ack[after], synack_of_ack[after]
+
+    # the first ack of every connection
+    first_syn, first_ack = np.unique(syn_of_synack[synack_of_ack], return_index=True)
+    ack, synack = ack[first_ack], synack[synack_of_ack[first_ack]]
+
+    established = np.empty(len(first_syn), dtype=HANDSHAKE_DTYPE)
+    for name in ('src', 'dst', 'sport', 'dport'):
+        established[name] = getattr(c, name)[first_syn]
+    established['syn_ts'] = c.ts[first_syn]
+    established['synack_ts'] = c.ts[synack]
+    established['ack_ts'] = c.ts[ack]
+    return established[np.argsort(established['syn_ts'], kind='stable')]
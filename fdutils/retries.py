@@ -0,0 +1,168 @@
+""" delays between tries, deadlines and retry budgets used by fdutils.decorators.retry
+
+    Many clients failing at the same time (all the sessions to a bastion that restarted) and retrying with the same
+    exponential delays retry in lockstep and hit the server all at once every time. The delays are spread with jitter
+    (https://aws.amazon.com/blogs/architecture/exponential-backoff-and-jitter/):
+
+        none           delay, delay * backoff, delay * backoff ** 2... up to max_delay
+        full           a random value between 0 and the delay above
+        equal          half the delay above plus a random value up to the other half
+        decorrelated   a random value between delay and 3 times the previous delay (up to max_delay)
+
+    A RetryBudget per host (budget_for) limits the retries to a ratio of the calls made to it so a host that is down
+    gets a few retries instead of one per client
+"""
+import logging
+import random
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+JITTERS = ('none', 'full', 'equal', 'decorrelated')
+
+# retries allowed per call and retries per second allowed no matter the calls (a budget keeps up to max tokens)
+RETRY_BUDGET_RATIO = 0.2
+RETRY_BUDGET_MIN_PER_SECOND = 1
+RETRY_BUDGET_MAX_TOKENS = 10
+
+
+def backoff_delays(delay, backoff=1, max_delay=None, jitter='none', rand=random):
+    """ generator of the seconds to wait before every retry
+
+    Args:
+        delay (float): first delay
+        backoff (float): multiplier of the delay after every retry
+        max_delay (float): delays are not longer than this if given
+        jitter (str): one of JITTERS
+        rand: random.Random instance to use (the random module if not given)
+
+    """
+    if jitter not in JITTERS:
+        raise ValueError('jitter {} is not one of {}'.format(jitter, ', '.join(JITTERS)))
+
+    def capped(d):
+        return min(d, max_delay) if max_delay else d
+
+    current = delay
+    previous = delay
+    while True:
+        if jitter == 'full':
+            yield rand.uniform(0, capped(current))
+        elif jitter == 'equal':
+            half = capped(current) / 2
+            yield half + rand.uniform(0, half)
+        elif jitter == 'decorrelated':
+            previous = capped(rand.uniform(delay, previous * 3))
+            yield previous
+        else:
+            yield capped(current)
+        current *= backoff
+
+
+class RetryBudget:
+    """ token bucket of retries. Every call deposits ratio tokens, every retry takes a whole one and the bucket also
+        gets min_per_second tokens per second up to max_tokens
+    """
+
+    def __init__(self, ratio=None, min_per_second=None, max_tokens=None):
+        self.ratio = RETRY_BUDGET_RATIO if ratio is None else ratio
+        self.min_per_second = RETRY_BUDGET_MIN_PER_SECOND if min_per_second is None else min_per_second
+        self.max_tokens = RETRY_BUDGET_MAX_TOKENS if max_tokens is None else max_tokens
+        self._tokens = float(self.max_tokens)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'RetryBudget(ratio={}, min_per_second={}, max_tokens={})'.format(self.ratio, self.min_per_second,
+                                                                                self.max_tokens)
+
+    def _add(self, tokens):
+        now = time.monotonic()
+        self._tokens = min(self.max_tokens, self._tokens + tokens + (now - self._last) * self.min_per_second)
+        self._last = now
+
+    def deposit(self):
+        with self._lock:
+            self._add(self.ratio)
+
+    def withdraw(self):
+        """ True if there was a token for a retry """
+        with self._lock:
+            self._add(0)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+    @property
+    def tokens(self):
+        with self._lock:
+            self._add(0)
+            return self._tokens
+
+
+_budgets = {}
+_budgets_lock = threading.Lock()
+
+
+def budget_for(key):
+    """ the RetryBudget shared by everything retrying calls to key (like a host) """
+    with _budgets_lock:
+        budget = _budgets.get(key)
+        if budget is None:
+            budget = _budgets[key] = RetryBudget()
+        return budget
+
+
+class Retrier:
+    """ the tries of one call: how long to wait before the next one or None if there are no more
+
+    Args:
+        tries (int): maximum number of tries
+        delays: iterable of the delays between tries (see backoff_delays)
+        deadline (float): seconds for all the tries (0 for no limit). A retry is not done if its delay would end
+                          after it
+        budget (RetryBudget): the budget the retries are taken from if given. The call is deposited in it when the
+                              Retrier is made (before the first try) so calls that work refill it too
+
+    """
+
+    def __init__(self, tries, delays, deadline=0, budget=None):
+        self.tries = tries
+        self.delays = iter(delays)
+        self.budget = budget
+        self.attempt = 0
+        self.give_up_reason = ''
+        self._deadline = time.monotonic() + deadline if deadline else None
+        if budget is not None:
+            budget.deposit()
+
+    @property
+    def remaining(self):
+        """ seconds left until the deadline (None if there is none) """
+        if self._deadline is None:
+            return None
+        return max(0., self._deadline - time.monotonic())
+
+    def next_delay(self):
+        self.attempt += 1
+
+        if self.attempt >= self.tries:
+            self.give_up_reason = 'tried {} times'.format(self.attempt)
+            return None
+
+        delay = next(self.delays)
+        remaining = self.remaining
+        if remaining is not None and delay >= remaining:
+            self.give_up_reason = 'the deadline is in {:.2f} seconds and the next retry in {:.2f}'.format(remaining,
+                                                                                                       delay)
+            return None
+
+        if self.budget is not None and not self.budget.withdraw():
+            self.give_up_reason = 'the retry budget is exhausted'
+            return None
+
+        return delay
@@ -1,3 +1,4 @@
+import bisect
 import logging
 log = logging.getLogger(__name__)
 
@@ -170,6 +171,91 @@ class Range:
         return self.__dict__ == other.__dict__
 
 
+class IntervalSet:
+    """ set of integers kept as sorted disjoint ranges (ends included) where overlapping or contiguous ranges are
+        merged. The starts and the ends are in two sorted lists so where a range goes is found with bisect and adding
+        or removing one only replaces the ranges it touches
+
+    Args:
+        ranges: Range objects or (start, end) tuples to add
+
+    """
+
+    def __init__(self, ranges=()):
+        self._starts = []
+        self._ends = []
+        for r in ranges:
+            self.add(*self._bounds(r))
+
+    @staticmethod
+    def _bounds(r):
+        if isinstance(r, Range):
+            return r.start, r.end
+        return r
+
+    def add(self, start, end=None):
+        end = start if end is None else end
+        if end < start:
+            raise ValueError('range end {} is lower than its start {}'.format(end, start))
+        # the ranges ending at start - 1 or later and starting at end + 1 or before are merged with this one
+        i = bisect.bisect_left(self._ends, start - 1)
+        j = bisect.bisect_right(self._starts, end + 1)
+        if i < j:
+            start = min(start, self._starts[i])
+            end = max(end, self._ends[j - 1])
+        self._starts[i:j] = [start]
+        self._ends[i:j] = [end]
+
+    def discard(self, start, end=None):
+        end = start if end is None else end
+        i = bisect.bisect_left(self._ends, start)
+        j = bisect.bisect_right(self._starts, end)
+        if i >= j:
+            return
+        # what is left of the first and the last ranges touched
+        starts, ends = [], []
+        if self._starts[i] < start:
+            starts.append(self._starts[i])
+            ends.append(start - 1)
+        if self._ends[j - 1] > end:
+            starts.append(end + 1)
+            ends.append(self._ends[j - 1])
+        self._starts[i:j] = starts
+        self._ends[i:j] = ends
+
+    def update(self, other):
+        for r in other:
+            self.add(*self._bounds(r))
+
+    def difference_update(self, other):
+        for r in other:
+            self.discard(*self._bounds(r))
+
+    def copy(self):
+        new = IntervalSet()
+        new._starts = list(self._starts)
+        new._ends = list(self._ends)
+        return new
+
+    def __contains__(self, item):
+        start, end = self._bounds(item) if isinstance(item, (Range, tuple)) else (item, item)
+        i = bisect.bisect_right(self._starts, start) - 1
+        return i >= 0 and end <= self._ends[i]
+
+    def __iter__(self):
+        return (Range(start, end) for start, end in zip(self._starts, self._ends))
+
+    def __len__(self):
+        """ number of ranges """
+        return len(self._starts)
+
+    def __eq__(self, other):
+        return isinstance(other, IntervalSet) and self._starts == other._starts and self._ends == other._ends
+
+    def __repr__(self):
+        return 'IntervalSet([{}])'.format(', '.join('({}, {})'.format(*r) for r in zip(self._starts, self._ends)))
+
+
 class TcpConnection:
     def __init__(self, server, server_port, client, client_port):
         self.server = server
@@ -0,0 +1 @@
+__author__ = 'Filinto Duran (duranto@gmail.com)'
@@ -0,0 +1,126 @@
+import random
+
+import pytest
+
+from fdutils import bpf
+from fdutils.structures import IntervalSet, Range
+
+
+def runs(ports):
+    """ sorted (start, end) ranges of consecutive ports """
+    ranges = []
+    for port in sorted(ports):
+        if ranges and ranges[-1][1] == port - 1:
+            ranges[-1][1] = port
+        else:
+            ranges.append([port, port])
+    return [tuple(r) for r in ranges]
+
+
+def test_interval_set_like_a_set_of_integers():
+    rand = random.Random(0)
+    for _ in range(200):
+        intervals, model = IntervalSet(), set()
+        for _ in range(rand.randint(1, 40)):
+            start = rand.randint(0, 100)
+            end = start + rand.choice((0, 0, 1, 2, 5, 20))
+            if rand.random() < 0.6:
+                intervals.add(start, end)
+                model.update(range(start, end + 1))
+            else:
+                intervals.discard(start, end)
+                model.difference_update(range(start, end + 1))
+            assert [(r.start, r.end) for r in intervals] == runs(model)
+
+        value = rand.randint(0, 120)
+        assert (value in intervals) == (value in model)
+        assert ((value, value + 2) in intervals) == model.issuperset(range(value, value + 3))
+    assert IntervalSet([Range(1, 3), (4, 6)]) == IntervalSet([(1, 6)])
+    with pytest.raises(ValueError):
+        IntervalSet().add(5, 1)
+
+
+def test_filter_rendered_like_before():
+    f = bpf.BPFFilter()
+    f.hosts.allow('10.0.0.1', '10.0.0.2')
+    f.hosts.deny_from('10.0.0.3')
+    f.ports.allow(22, 23, 24, 80, '1000-2000', 2001)
+    f.ports.deny_to('8080-8090')
+    f.ports.allow_from(5000, 5002, 5001)
+    f.vlans.allow(10)
+    assert f.render() == ('ip and (host 10.0.0.1 or host 10.0.0.2) and not (src host 10.0.0.3) and '
+                          '(portrange 22-24 or port 80 or portrange 1000-2001 or src portrange 5000-5002) and '
+                          'not (dst portrange 8080-8090) and (vlan 10)')
+    f.ports.del_allow(1500)
+    f.ports.del_allow('23-24')
+    f.ports.deny(80)
+    f.hosts.del_allow('10.0.0.1')
+    assert f.render() == ('ip and (host 10.0.0.2) and not (src host 10.0.0.3) and '
+                          '(port 22 or portrange 1000-1499 or portrange 1501-2001 or src portrange 5000-5002) and '
+                          'not (port 80 or dst portrange 8080-8090) and (vlan 10)')
+
+    ports = bpf.BPFComponentPort()
+    ports.allow(1, 3, 5, '7-9', proto='tcp')
+    ports.allow(2, proto='tcp')
+    ports.deny(80, proto='udp')
+    ports.allow(81, proto='udp')
+    # the ranges of every protocol are merged on their own
+    assert ports.render() == ('(tcp portrange 1-3 or tcp port 5 or tcp portrange 7-9 or udp port 81) and '
+                              'not (udp port 80)')
+
+
+def test_port_lists_like_sets_of_ports():
+    rand = random.Random(1)
+    protocols = ('', 'tcp', 'udp')
+    for _ in range(100):
+        ports = bpf.BPFComponentPort()
+        allowed = {p: set() for p in protocols}
+        denied = {p: set() for p in protocols}
+        # protocols in the order they were first added to every list
+        order = {id(allowed): [], id(denied): []}
+        for _ in range(rand.randint(1, 30)):
+            start = rand.randint(1, 60)
+            end = start + rand.choice((0, 0, 1, 3, 10))
+            value = str(start) if start == end else '{}-{}'.format(start, end)
+            values = set(range(start, end + 1))
+            proto = rand.choice(protocols)
+            action = rand.choice(('allow', 'deny', 'del_allow', 'del_deny'))
+            getattr(ports, action)(value, proto=proto)
+
+            # the ports are taken from the other list (or deleted) whatever protocol they were added with
+            add_to, remove_from = (allowed, denied) if action in ('allow', 'del_deny') else (denied, allowed)
+            if not action.startswith('del'):
+                add_to[proto] |= values
+                order[id(add_to)].append(proto)
+            for p in protocols:
+                remove_from[p] -= values
+
+        def expected(lists):
+            first = {p: order[id(lists)].index(p) for p in set(order[id(lists)])}
+            items = sorted((r[0], first[p], r, p) for p in protocols for r in runs(lists[p]))
+            return ' or '.join('{}port {}'.format(p + ' ' if p else '', s) if s == e else
+                               '{}portrange {}-{}'.format(p + ' ' if p else '', s, e) for _, _, (s, e), p in items)
+
+        rendered = []
+        if expected(allowed):
+            rendered.append('(' + expected(allowed) + ')')
+        if expected(denied):
+            rendered.append('not (' + expected(denied) + ')')
+        assert ports.render() == ' and '.join(rendered)
+
+
+def test_render_memoized_until_the_filter_changes(monkeypatch):
+    f = bpf.BPFFilter()
+    f.ports.allow(*range(1, 5000, 2))
+    first = f.render()
+
+    def not_rendered(*args, **kwargs):
+        raise AssertionError('rendered again')
+
+    render_item = bpf.BPFComponentBase._render_item
+    monkeypatch.setattr(bpf.BPFComponentBase, '_render_item', not_rendered)
+    assert f.render() == first
+
+    monkeypatch.setattr(bpf.BPFComponentBase, '_render_item', render_item)
+    f.ports.allow(2)
+    assert f.render() == first.replace('port 1 or port 3', 'portrange 1-3')
@@ -0,0 +1,62 @@
+import hashlib
+import os
+
+import pytest
+
+from fdutils import checksums
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    checksums.cache.clear()
+    yield
+    checksums.cache.clear()
+
+
+@pytest.fixture
+def data_file(tmp_path):
+    path = str(tmp_path / 'data.bin')
+    with open(path, 'wb') as f:
+        f.write(os.urandom(checksums.MMAP_MIN_SIZE + 1))
+    return path
+
+
+@pytest.mark.parametrize('algorithm', checksums.ALGORITHMS)
+def test_checksum_of_small_and_mmap_files(data_file, algorithm, tmp_path):
+    with open(data_file, 'rb') as f:
+        data = f.read()
+    assert checksums.checksum(data_file, algorithm) == hashlib.new(algorithm, data).hexdigest()
+
+    small = str(tmp_path / 'small.bin')
+    with open(small, 'wb') as f:
+        f.write(data[:1000])
+    assert checksums.checksum(small, algorithm) == hashlib.new(algorithm, data[:1000]).hexdigest()
+
+    with pytest.raises(ValueError):
+        checksums.checksum(small, 'crc32')
+
+
+def test_checksums_cached_until_the_file_changes(data_file):
+    first = checksums.checksum(data_file)
+    assert len(checksums.cache) == 1
+    assert checksums.checksum(data_file) == first and len(checksums.cache) == 1
+
+    with open(data_file, 'r+b') as f:
+        f.write(b'changed')
+    st = os.stat(data_file)
+    os.utime(data_file, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    assert checksums.checksum(data_file) != first
+    assert len(checksums.cache) == 2
+
+
+def test_checksum_many_files_at_the_same_time(tmp_path):
+    paths = []
+    for i in range(8):
+        path = str(tmp_path / '{}.bin'.format(i))
+        with open(path, 'wb') as f:
+            f.write(bytes([i]) * (1 << 16))
+        paths.append(path)
+
+    digests = checksums.checksum_files(paths, 'sha256')
+    assert digests == {p: hashlib.sha256(bytes([i]) * (1 << 16)).hexdigest() for i, p in enumerate(paths)}
+    assert checksums.submit(paths[0], 'sha256').result() == digests[paths[0]]
@@ -0,0 +1,60 @@
+import os
+
+import pytest
+
+from fdutils import config
+from fdutils.config import compiled
+
+
+@pytest.fixture
+def settings_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(compiled, 'CACHE_FOLDER', str(tmp_path / 'cache'))
+    monkeypatch.setattr(config, 'environment_settings', {})
+    monkeypatch.setattr(config, 'registered_settings', {})
+    path = tmp_path / 'settings.yaml'
+    path.write_text('vars: {root: /opt/app}\n'
+                    'connections: {socket_timeout: 10, log_folder: "{{ root }}/logs"}\n'
+                    'devices: {facts_max_age: 60}\n')
+    return str(path)
+
+
+def test_settings_compiled_once_until_the_file_changes(settings_file, monkeypatch):
+    assert config.load_config(settings_file)['connections'] == dict(socket_timeout=10, log_folder='/opt/app/logs')
+    assert len(os.listdir(compiled.CACHE_FOLDER)) == 1
+
+    def not_parsed(*args, **kwargs):
+        raise AssertionError('the settings file was parsed again')
+
+    yaml_load = config.yaml_load
+    monkeypatch.setattr(config, 'yaml_load', not_parsed)
+    assert config.load_config(settings_file)['devices'] == dict(facts_max_age=60)
+
+    # the same size and modification time but other content
+    st = os.stat(settings_file)
+    with open(settings_file, 'r+') as f:
+        f.write('vars: {root: /srv/app}')
+    os.utime(settings_file, ns=(st.st_atime_ns, st.st_mtime_ns))
+    monkeypatch.setattr(config, 'yaml_load', yaml_load)
+    assert config.load_config(settings_file)['connections']['log_folder'] == '/srv/app/logs'
+
+
+def test_registered_settings_updated_only_for_their_sections(settings_file, monkeypatch):
+    updates = []
+    connections = dict(SOCKET_TIMEOUT=30, LOG_FOLDER='', RETRIES=1, ENV_TO_VARS=dict(RETRIES='APP_RETRIES'))
+    devices = dict(FACTS_MAX_AGE=300)
+    monkeypatch.setenv('APP_RETRIES', '5')
+    config.register_settings(connections, 'connections', after_update=lambda: updates.append('connections'))
+    config.register_settings(devices, 'devices', after_update=lambda: updates.append('devices'))
+    # OS environment variables are used without a settings file
+    assert connections['RETRIES'] == 5
+
+    config.load_config(settings_file)
+    assert connections['SOCKET_TIMEOUT'] == 10 and connections['LOG_FOLDER'] == '/opt/app/logs'
+    assert devices['FACTS_MAX_AGE'] == 60 and updates == ['connections', 'devices']
+
+    other = os.path.join(os.path.dirname(settings_file), 'other.yaml')
+    with open(other, 'w') as f:
+        f.write('connections: {retries: 2}\n')
+    config.load_config(other)
+    # the settings file takes precedence over the OS environment variables
+    assert connections['RETRIES'] == 2 and updates == ['connections', 'devices', 'connections']
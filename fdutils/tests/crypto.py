@@ -0,0 +1,91 @@
+import time
+
+import pytest
+from sqlalchemy import Column, Integer, create_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from fdutils import crypto
+from fdutils.db.types import Encrypted
+
+PASSWORD = b'my secret'
+
+
+@pytest.fixture(autouse=True)
+def empty_ciphers_cache():
+    crypto.clear_ciphers_cache()
+    yield
+    crypto.clear_ciphers_cache()
+
+
+def test_encrypt_decrypt():
+    encrypted, salt = crypto.encrypt('hello', PASSWORD, None)
+    assert crypto.decrypt(encrypted, PASSWORD, salt) == 'hello'
+    with pytest.raises(crypto.InvalidKey):
+        crypto.decrypt(encrypted, b'bad password', salt)
+
+
+def test_cipher_cache_key():
+    salt = crypto.create_salt()
+    cipher = crypto.create_cipher(PASSWORD, salt)
+    assert crypto.create_cipher(PASSWORD, salt) is cipher
+    assert crypto.create_cipher(PASSWORD.decode(), salt) is cipher
+    assert crypto.create_cipher(PASSWORD, crypto.create_salt()) is not cipher
+    assert crypto.create_cipher(b'other', salt) is not cipher
+    assert crypto.create_cipher(PASSWORD, salt, iterations=2000) is not cipher
+
+
+def test_cipher_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(crypto, 'KEYS_CACHE_SIZE', 3)
+    salts = [crypto.create_salt() for _ in range(4)]
+    ciphers = [crypto.create_cipher(PASSWORD, salt) for salt in salts]
+    assert crypto.create_cipher(PASSWORD, salts[-1]) is ciphers[-1]
+    assert crypto.create_cipher(PASSWORD, salts[0]) is not ciphers[0]
+
+
+def test_cached_cipher_is_faster():
+    salt = crypto.create_salt()
+    t0 = time.perf_counter()
+    crypto.create_cipher(PASSWORD, salt, iterations=100000)
+    derive_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    crypto.create_cipher(PASSWORD, salt, iterations=100000)
+    assert time.perf_counter() - t0 < derive_time / 10
+
+
+def test_encrypt_decrypt_many():
+    texts = ['text {}'.format(i) for i in range(50)]
+    encrypted, salt = crypto.encrypt_many(texts, PASSWORD)
+    other, other_salt = crypto.encrypt('other', PASSWORD, None)
+
+    pairs = [(e, salt) for e in encrypted] + [(other, other_salt)]
+    assert crypto.decrypt_many(pairs, PASSWORD) == texts + ['other']
+
+    engine = crypto.SecuredTextEngine(salt=salt, password=PASSWORD)
+    assert engine.decrypt_many(encrypted) == texts
+    assert engine.decrypt_many(engine.encrypt_many(texts)) == texts
+
+
+def test_encrypted_column():
+    Base = declarative_base()
+
+    class Secret(Base):
+        __tablename__ = 'secrets'
+        id = Column(Integer, primary_key=True)
+        value = Column(Encrypted(password=PASSWORD))
+        salted = Column(Encrypted(password=PASSWORD, recreate_on_save=True))
+
+    engine = create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add_all([Secret(value='value {}'.format(i), salted='salted {}'.format(i)) for i in range(20)])
+    session.add(Secret())
+    session.commit()
+    session.expunge_all()
+
+    secrets = session.query(Secret).order_by(Secret.id).all()
+    assert [s.value for s in secrets] == ['value {}'.format(i) for i in range(20)] + [None]
+    assert [s.salted for s in secrets] == ['salted {}'.format(i) for i in range(20)] + [None]
+    stored = [row[0] for row in engine.execute('select salted from secrets where salted is not null')]
+    assert len({s[-32:] for s in stored}) == 20
@@ -0,0 +1,76 @@
+import os
+import threading
+
+import pytest
+
+from fdutils import files
+
+
+@pytest.fixture
+def log_file(tmp_path):
+    path = str(tmp_path / 'app.log')
+    with open(path, 'w') as f:
+        f.writelines('line {}\n'.format(i) for i in range(10000))
+    return path
+
+
+@pytest.mark.parametrize('block_size', [16, 1 << 16])
+def test_tail_last_lines_by_blocks(log_file, block_size):
+    assert files.tail(log_file, 3, block_size=block_size) == ['line 9997', 'line 9998', 'line 9999']
+    assert len(files.tail(log_file, 20000, block_size=block_size)) == 10000
+    assert files.tail(log_file, 1, encoding=None, block_size=block_size) == [b'line 9999']
+
+    with open(log_file, 'a') as f:
+        f.write('no new line\r\n\r\nlast')
+    assert files.tail(log_file, 3, block_size=block_size) == ['no new line', '', 'last']
+
+
+def test_tailer_iterates_from_the_end(log_file):
+    with open(log_file) as f:
+        tailer = files.Tailer(f, num_lines=2)
+        assert list(tailer) == ['line 9999', 'line 9998']
+        assert f.readline() == 'line 9998\n'
+
+        tailer.seek_end()
+        assert tailer.tail(2) == ['line 9998', 'line 9999']
+        assert tailer.seek_line() == f.tell() and f.readline() == 'line 9997\n'
+
+    # iterating the whole file does not raise RuntimeError (StopIteration in the generator)
+    with open(log_file, 'rb') as f:
+        lines = list(files.Tailer(f))
+    assert len(lines) == 10000 and lines[-1] == b'line 0'
+
+    open(log_file, 'w').close()
+    with open(log_file) as f:
+        assert list(files.Tailer(f)) == [] and files.Tailer(f).tail(10) == []
+
+
+def test_follow_rotated_and_truncated_files(log_file):
+    open(log_file, 'w').close()
+    stop = threading.Event()
+    received = []
+    added = threading.Event()
+
+    def follow():
+        for line in files.follow(log_file, from_end=False, poll_interval=0.05, stop_event=stop):
+            received.append(line)
+            added.set()
+
+    def write(text, mode='a'):
+        added.clear()
+        with open(log_file, mode) as f:
+            f.write(text)
+        assert added.wait(5)
+
+    th = threading.Thread(target=follow)
+    th.start()
+    try:
+        write('first\nsec')
+        write('ond\n')
+        os.rename(log_file, log_file + '.1')
+        write('after rotation\n', 'w')
+        write('truncated\n', 'w')
+    finally:
+        stop.set()
+        th.join()
+    assert received == ['first', 'second', 'after rotation', 'truncated']
@@ -0,0 +1,92 @@
+import queue
+import socket
+import threading
+import time
+
+import pytest
+
+from fdutils import parallel
+
+
+@pytest.fixture
+def scheduler():
+    s = parallel.LoopScheduler(workers=4)
+    yield s
+    s.shutdown()
+
+
+def counter(n):
+    values = iter(range(1, n + 1))
+
+    def target():
+        value = next(values, None)
+        return parallel.POISON_PILL if value is None else str(value)
+    return target
+
+
+def test_many_loops_on_a_few_threads(scheduler):
+    threads = threading.active_count()
+    stopped = []
+    tasks = []
+    for i in range(500):
+        task = parallel.LoopTaskWithQueue(counter(20), scheduler=scheduler)
+        task.add_call_on_stop(stopped.append, args=(i,))
+        tasks.append(task.start())
+
+    for task in tasks:
+        task.join(timeout=10)
+    assert threading.active_count() <= threads + 5
+    assert all(not t.is_alive() and t.call_on_stop_finished.is_set() for t in tasks)
+    assert sorted(stopped) == list(range(500))
+    assert tasks[0].get_all_data() == ''.join(str(i) for i in range(1, 21))
+
+
+def test_run_timeout_and_idle_tasks(scheduler):
+    calls = []
+
+    def no_data():
+        calls.append(time.monotonic())
+        raise queue.Empty
+
+    t0 = time.monotonic()
+    task = parallel.LoopTaskWithQueue(no_data, run_timeout=0.3, scheduler=scheduler).start()
+    task.join(timeout=5)
+    assert task._execution_timeout.is_set() and not task.is_alive()
+    assert 0.3 <= time.monotonic() - t0 < 1
+    # the waits without data grow up to LOOP_TASK_MAX_IDLE_WAIT instead of calling the target every millisecond
+    assert len(calls) < 0.3 / parallel.LOOP_TASK_MAX_IDLE_WAIT + 10
+
+    executions = []
+    task = parallel.LoopTask(executions.append, args=(1,), sleep_time_between_execution=0.05, scheduler=scheduler)
+    task.start()
+    time.sleep(0.3)
+    task.stop()
+    assert 3 <= len(executions) <= 7
+
+
+def test_wait_for_a_readable_file_and_stop(scheduler):
+    r, w = socket.socketpair()
+    r.setblocking(False)
+    closed = threading.Event()
+
+    def read():
+        try:
+            data = r.recv(1024)
+        except BlockingIOError:
+            raise queue.Empty
+        return data.decode() if data else parallel.POISON_PILL
+
+    task = parallel.LoopTaskWithQueue(read, wait_readable=r, scheduler=scheduler, join_timeout=5)
+    task.add_call_on_stop(closed.set)
+    task.start()
+    w.sendall(b'hello')
+    assert task.queue.get(timeout=1) == 'hello'
+
+    # stop() waits for the callbacks
+    task.stop()
+    assert closed.is_set() and not task.is_alive()
+    w.sendall(b'not read')
+    time.sleep(0.1)
+    assert task.get_all_data() == ''
+    r.close()
+    w.close()
@@ -0,0 +1,142 @@
+import socket
+import struct
+
+import pytest
+
+np = pytest.importorskip('numpy', reason='the pcap tests need the pcap extra (pip install -e .[pcap])')
+
+from fdutils import net, pcap
+
+CLIENT, SERVER, OTHER = '10.0.0.1', '10.0.0.2', '192.168.1.9'
+
+
+def ipv4(src, dst, proto, payload, fragment=0):
+    return struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(payload), 1, fragment, 64, proto, 0,
+                       socket.inet_aton(src), socket.inet_aton(dst)) + payload
+
+
+def tcp(src, dst, sport, dport, flags, seq=0, ack=0):
+    return ipv4(src, dst, 6, struct.pack('>HHIIBBHHH', sport, dport, seq, ack, 0x50, flags, 1024, 0, 0))
+
+
+def udp(src, dst, sport, dport):
+    return ipv4(src, dst, 17, struct.pack('>HHHH', sport, dport, 12, 0) + b'data')
+
+
+def ethernet(packet, vlans=(), ethertype=0x0800):
+    tags = b''.join(struct.pack('>HH', 0x8100, vlan) for vlan in vlans)
+    return b'\x02' * 6 + b'\x04' * 6 + tags + struct.pack('>H', ethertype) + packet
+
+
+def write_pcap(path, packets, nanoseconds=False, byteorder='<'):
+    magic = 0xa1b23c4d if nanoseconds else 0xa1b2c3d4
+    with open(path, 'wb') as f:
+        f.write(struct.pack(byteorder + 'IHHiIII', magic, 2, 4, 0, 0, 65535, pcap.LINKTYPE_ETHERNET))
+        for ts, frame in packets:
+            seconds = int(ts)
+            fraction = round((ts - seconds) * (1e9 if nanoseconds else 1e6))
+            f.write(struct.pack(byteorder + 'IIII', seconds, fraction, len(frame), len(frame)) + frame)
+
+
+def block(block_type, body):
+    body += b'\x00' * (-len(body) % 4)
+    return struct.pack('<II', block_type, len(body) + 12) + body + struct.pack('<I', len(body) + 12)
+
+
+def write_pcapng(path, packets_by_interface):
+    """ packets_by_interface: list of (linktype, [(ts, frame)...]) with nanosecond timestamps """
+    blocks = [block(0x0a0d0d0a, struct.pack('<IHHq', 0x1a2b3c4d, 1, 0, -1))]
+    for linktype, _ in packets_by_interface:
+        # if_tsresol of 9 (nanoseconds) and the end of the options
+        blocks.append(block(1, struct.pack('<HHIHHB3xHH', linktype, 0, 65535, 9, 1, 9, 0, 0)))
+    for interface, (_, packets) in enumerate(packets_by_interface):
+        for ts, frame in packets:
+            ticks = round(ts * 1e9)
+            blocks.append(block(6, struct.pack('<IIIII', interface, ticks >> 32, ticks & 0xffffffff, len(frame),
+                                               len(frame)) + frame))
+    with open(path, 'wb') as f:
+        f.write(b''.join(blocks))
+
+
+def connection(ts, sport, established=True):
+    packets = [(ts, ethernet(tcp(CLIENT, SERVER, sport, 22, pcap.TH_SYN, seq=100))),
+               # retransmission of the syn
+               (ts + 1, ethernet(tcp(CLIENT, SERVER, sport, 22, pcap.TH_SYN, seq=100))),
+               (ts + 1.5, ethernet(tcp(SERVER, CLIENT, 22, sport, pcap.TH_SYN | pcap.TH_ACK, seq=2 ** 32 - 1,
+                                       ack=101), vlans=(10,)))]
+    if established:
+        packets.append((ts + 1.75, ethernet(tcp(CLIENT, SERVER, sport, 22, pcap.TH_ACK, seq=101, ack=0))))
+    else:
+        packets.append((ts + 1.75, ethernet(tcp(CLIENT, SERVER, sport, 22, pcap.TH_RST, seq=101))))
+    return packets
+
+
+@pytest.fixture
+def capture_file(tmp_path):
+    packets = (connection(1000.25, 40000, established=False) + connection(1010.5, 40001) +
+               [(1020.0, ethernet(udp(OTHER, SERVER, 5353, 53), vlans=(10, 20))),
+                (1021.0, ethernet(b'\x00' * 28, ethertype=0x0806)),
+                (1022.0, ethernet(ipv4(OTHER, SERVER, 17, b'rest of a datagram', fragment=100)))])
+    path = str(tmp_path / 'snoop.pcap')
+    write_pcap(path, packets)
+    return path
+
+
+def test_read_packets_matching_predicates(capture_file):
+    capture = pcap.read(capture_file)
+    # all but the arp packet
+    assert len(capture) == 10
+    assert capture.ts[0] == 1000.25 and capture.length[-1] == 14 + 20 + 18
+
+    syns = pcap.read(capture_file, src=CLIENT, tcpflags=(pcap.TH_SYN | pcap.TH_ACK, pcap.TH_SYN))
+    assert syns.ts.tolist() == [1000.25, 1001.25, 1010.5, 1011.5]
+    assert set(map(tuple, syns.flows().tolist())) == {(0x0a000001, 0x0a000002, 40000, 22, 6),
+                                                      (0x0a000001, 0x0a000002, 40001, 22, 6)}
+
+    assert len(capture.filter(host='10.0.0.0/8', port=22)) == 8
+    udp_packets = pcap.read(capture_file, proto='udp', dst=SERVER)
+    assert pcap.to_ip(udp_packets.src[0]) == OTHER
+    # fragments other than the first one do not have ports
+    assert (udp_packets.sport.tolist(), udp_packets.dport.tolist()) == ([5353, 0], [53, 0])
+    assert len(capture.filter(dport=53)) == 1 and len(capture.filter(sport=22, tcpflags=pcap.TH_ACK)) == 2
+
+
+def test_pcapng_read_by_chunks(capture_file, tmp_path):
+    ethernet_packets = connection(5.000000001, 50000)
+    # linux cooked capture of the "any" interface
+    cooked = [(4.5, b'\x00' * 14 + struct.pack('>H', 0x0800) + udp(OTHER, SERVER, 1, 2))]
+    path = str(tmp_path / 'snoop.pcapng')
+    write_pcapng(path, [(pcap.LINKTYPE_ETHERNET, ethernet_packets), (pcap.LINKTYPE_LINUX_SLL, cooked)])
+
+    capture = pcap.read(path)
+    assert len(capture) == 5 and capture.ts[0] == pytest.approx(5.000000001, abs=1e-9)
+    assert capture.sport.tolist() == [50000] * 2 + [22, 50000, 1]
+
+    chunks = list(pcap.iter_chunks(path, chunk_packets=2, proto='tcp'))
+    assert [len(c) for c in chunks] == [2, 2, 0]
+    assert pcap.Capture.concatenate(chunks).ts.tolist() == capture.ts[:4].tolist()
+
+    big_endian = str(tmp_path / 'nanoseconds.pcap')
+    write_pcap(big_endian, ethernet_packets, nanoseconds=True, byteorder='>')
+    assert pcap.read(big_endian).seq.tolist() == capture.seq[:4].tolist()
+
+    with pytest.raises(ValueError):
+        list(pcap.iter_chunks(__file__))
+
+
+def test_inter_arrival_and_handshakes(capture_file):
+    capture = pcap.read(capture_file)
+    syns = capture.filter(tcpflags=(pcap.TH_SYN | pcap.TH_ACK, pcap.TH_SYN))
+    assert np.isnan(pcap.inter_arrival(syns.ts)[0])
+    assert pcap.inter_arrival(syns.ts)[1:].tolist() == [1, 9.25, 1]
+    assert pcap.inter_arrival(syns.ts, groups=syns.sport)[[1, 3]].tolist() == [1, 1]
+    stats = pcap.inter_arrival_stats(syns.ts)
+    assert stats['count'] == 3 and stats['max'] == 9.25 and stats['p50'] == 1
+
+    established = pcap.handshakes(capture)
+    assert len(established) == 1
+    assert established[0].tolist() == (0x0a000001, 0x0a000002, 40001, 22, 1010.5, 1012.0, 1012.25)
+
+    assert net.check_tcp_3way_handshake_established(capture_file, CLIENT, SERVER) == (True, 1010.5)
+    assert net.check_tcp_3way_handshake_established(capture_file, SERVER, CLIENT) == (False, 0)
+    assert net.get_list_of_syn_timestamps_from_host(capture_file, CLIENT) == [0, 1, 9.25, 1]
@@ -0,0 +1,119 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from fdutils import retries
+from fdutils.decorators import retry
+from fdutils.exceptions import RetriesExceededError
+
+
+def take(delays, n):
+    return [next(delays) for _ in range(n)]
+
+
+def test_backoff_delays_with_jitter():
+    assert take(retries.backoff_delays(1, 2, max_delay=5), 5) == [1, 2, 4, 5, 5]
+
+    rand = random.Random(0)
+    full = take(retries.backoff_delays(1, 2, max_delay=5, jitter='full', rand=rand), 100)
+    assert all(0 <= d <= 5 for d in full) and len(set(full)) == 100
+    equal = take(retries.backoff_delays(4, 1, jitter='equal', rand=rand), 100)
+    assert all(2 <= d <= 4 for d in equal)
+    decorrelated = take(retries.backoff_delays(1, 1, max_delay=30, jitter='decorrelated', rand=rand), 100)
+    assert all(1 <= d <= 30 for d in decorrelated) and max(decorrelated) > 10
+
+    with pytest.raises(ValueError):
+        next(retries.backoff_delays(1, jitter='random'))
+
+
+class Failing:
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('try {}'.format(self.calls))
+        return self.calls
+
+
+def test_retry_until_it_works_or_the_deadline():
+    f = Failing(2)
+    assert retry(3, delay=0.01, jitter='full')(f)() == 3
+
+    # the next retry would end after the deadline so it gives up without waiting for it
+    f = Failing(10)
+    t0 = time.monotonic()
+    with pytest.raises(ConnectionError):
+        retry(10, delay=0.2, backoff=2, retries_timeout=0.5)(f)()
+    assert f.calls == 2 and time.monotonic() - t0 < 0.4
+
+    f = Failing(10)
+    with pytest.raises(RetriesExceededError):
+        retry(2, delay=0.01, raise_last_exception_when_fail=False)(f)()
+    assert retry(2, delay=0.01, retry_when=lambda v: v < 5, f=Failing(0)) == 2
+
+    refused = []
+
+    def refuse():
+        refused.append(1)
+        raise ConnectionRefusedError
+
+    with pytest.raises(ConnectionRefusedError):
+        retry(3, delay=0.01, exceptions_to_not_retry=ConnectionRefusedError)(refuse)()
+    assert len(refused) == 1
+
+
+def test_retries_taken_from_a_shared_budget():
+    budget = retries.RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    first, second = Failing(10), Failing(10)
+    for f in (first, second):
+        with pytest.raises(ConnectionError):
+            retry(5, delay=0.01, budget=budget)(f)()
+    # the second call only deposited half a retry
+    assert first.calls == 2 and second.calls == 1
+    assert retries.budget_for('host:22') is retries.budget_for('host:22')
+
+
+def test_calls_that_work_refill_the_budget():
+    budget = retries.RetryBudget(ratio=0.5, min_per_second=0, max_tokens=1)
+    with pytest.raises(ConnectionError):
+        retry(5, delay=0.01, budget=budget)(Failing(10))()
+    assert budget.tokens == 0
+
+    works = retry(5, delay=0.01, budget=budget)(lambda: 'ok')
+    assert works() == 'ok' and works() == 'ok'
+    assert budget.tokens == 1
+
+    failing = Failing(10)
+    with pytest.raises(ConnectionError):
+        retry(5, delay=0.01, budget=budget)(failing)()
+    assert failing.calls == 2
+
+
+def test_retry_coroutines_without_blocking_the_loop():
+    calls = []
+
+    @retry(3, delay=0.2, jitter='none')
+    async def connect(name):
+        calls.append(name)
+        if calls.count(name) < 2:
+            raise ConnectionError
+        return name
+
+    async def main():
+        return await asyncio.gather(*(connect(i) for i in range(10)))
+
+    t0 = time.monotonic()
+    assert asyncio.run(main()) == list(range(10))
+    assert len(calls) == 20 and time.monotonic() - t0 < 1
+
+    @retry(2, delay=0.01, function_timeout=0.05)
+    async def hangs():
+        await asyncio.sleep(10)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(hangs())
@@ -0,0 +1,22 @@
+from fdutils.timer import LatencyHistogram
+
+
+def test_histogram_bucket_bounds_are_inclusive():
+    h = LatencyHistogram(buckets=(1.0, 0.1, 0.5))
+    assert h.buckets == (0.1, 0.5, 1.0, float('inf'))
+    for value in (0.05, 0.1, 0.1000001, 0.5, 1.0):
+        h.observe(value)
+    assert h.counts == [2, 2, 1, 0]
+    assert h.cumulative() == [(0.1, 2), (0.5, 4), (1.0, 5), (float('inf'), 5)]
+
+
+def test_histogram_overflow_goes_to_the_inf_bucket():
+    h = LatencyHistogram(buckets=(0.1,))
+    h.observe(0.2)
+    h.observe(1e9)
+    assert h.counts == [0, 2]
+    assert h.as_dict() == dict(buckets=[(0.1, 0), (float('inf'), 2)], sum=0.2 + 1e9, count=2)
+
+    h.clear()
+    assert h.as_dict() == dict(buckets=[(0.1, 0), (float('inf'), 0)], sum=0., count=0)
+
@@ -0,0 +1,199 @@
+import gzip
+import hashlib
+import http.server
+import io
+import os
+import random
+import re
+import tarfile
+import threading
+import time
+
+import pytest
+
+from fdutils import web
+
+CONTENT = random.Random(0).randbytes(3 << 20)
+
+
+def tar_gz(files):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode='w:gz') as tf:
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    return data.getvalue()
+
+
+FILES = {'/firmware.bin': CONTENT, '/firmware.bin.gz': gzip.compress(CONTENT),
+         '/firmware.bin.tar.gz': tar_gz({'firmware.bin': CONTENT, 'conf/version': b'1.2.3'})}
+
+
+class RangeHandler(http.server.BaseHTTPRequestHandler):
+    """ serves FILES with Range support writing chunk_size bytes every delay seconds per connection (like a
+        mirror limiting the bandwidth of each connection). drop_after closes the connection of the first
+        request after that many bytes
+    """
+    protocol_version = 'HTTP/1.1'
+    chunk_size = 1 << 16
+    delay = 0
+    drop_after = None
+    ranges = []
+    statuses = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        content = FILES[self.path]
+        etag = '"{}"'.format(hashlib.md5(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.statuses.append(304)
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+
+        start, end = 0, len(content) - 1
+        m = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range', ''))
+        self.statuses.append(206 if m else 200)
+        if m:
+            start, end = int(m.group(1)), int(m.group(2) or end)
+            self.ranges.append((start, end))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end, len(content)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(end + 1 - start))
+        self.end_headers()
+
+        drop_after = None
+        if type(self).drop_after is not None:
+            drop_after, type(self).drop_after = type(self).drop_after, None
+        sent = 0
+        for i in range(start, end + 1, self.chunk_size):
+            if drop_after is not None and sent >= drop_after:
+                self.close_connection = True
+                return
+            data = content[i:min(i + self.chunk_size, end + 1)]
+            try:
+                self.wfile.write(data)
+            except ConnectionError:
+                # the client got all it wanted of the first response
+                return
+            sent += len(data)
+            if self.delay:
+                time.sleep(self.delay)
+
+
+@pytest.fixture
+def server():
+    RangeHandler.ranges = []
+    RangeHandler.statuses = []
+    RangeHandler.delay = 0
+    RangeHandler.drop_after = None
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), RangeHandler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:{}/firmware.bin'.format(httpd.server_address[1])
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def download(url, folder, extension='', digest=None, **kwargs):
+    if digest is None:
+        digest = hashlib.md5(FILES['/firmware.bin' + extension]).hexdigest()
+    resource = web.HashedURLResource(url + extension, digest, filename='firmware.bin' + extension)
+    os.makedirs(str(folder), exist_ok=True)
+    t0 = time.perf_counter()
+    ret = web.download_resources(resource, local_folder=str(folder), replace=True, **kwargs)
+    elapsed = time.perf_counter() - t0
+    local_filename = ret[resource]['local_filename']
+    if not os.path.isdir(local_filename):
+        with open(local_filename, 'rb') as f:
+            assert f.read() == CONTENT
+    return elapsed
+
+
+def test_split_requests_downloads_the_parts_concurrently(server, tmp_path):
+    download(server, tmp_path, split_requests=True, split_parts=4)
+    # the first part is read from the first response
+    part = len(CONTENT) // 4
+    assert sorted(RangeHandler.ranges) == [(part, 2 * part - 1), (2 * part, 3 * part - 1), (3 * part, 4 * part - 1)]
+
+
+def test_split_requests_retries_only_the_part_that_failed(server, tmp_path):
+    RangeHandler.drop_after = 1 << 16
+    download(server, tmp_path, split_requests=True, split_parts=4)
+    part = len(CONTENT) // 4
+    retried = [r for r in RangeHandler.ranges if r[0] % part]
+    assert len(RangeHandler.ranges) == 4 and len(retried) == 1
+    assert retried[0][0] % part == 1 << 16 and retried[0][1] % part == part - 1
+
+
+def test_split_requests_faster_with_bandwidth_per_connection(server, tmp_path):
+    RangeHandler.delay = 0.01
+    single = download(server, tmp_path)
+    split = download(server, tmp_path, split_requests=True, split_parts=8)
+    assert split * 3 < single
+
+
+@pytest.mark.parametrize('extension', ['.gz', '.tar.gz'])
+def test_unzip_and_hash_while_streaming_with_a_retry(server, tmp_path, extension):
+    RangeHandler.drop_after = 1 << 16
+    download(server, tmp_path, extension, unzip=True)
+    # the decompression goes on after asking for the rest of the file (from the last byte read)
+    [(start, end)] = RangeHandler.ranges
+    assert 0 < start <= 1 << 16 and end == len(FILES['/firmware.bin' + extension]) - 1
+    if extension == '.tar.gz':
+        with open(str(tmp_path / 'firmware.bin' / 'firmware.bin'), 'rb') as f:
+            assert f.read() == CONTENT
+        assert (tmp_path / 'firmware.bin' / 'conf' / 'version').read_bytes() == b'1.2.3'
+    assert [p.name for p in tmp_path.iterdir()] == ['firmware.bin']
+
+
+@pytest.mark.parametrize('extension', ['', '.tar.gz'])
+def test_bad_hash_is_not_left_on_disk(server, tmp_path, extension):
+    with pytest.raises(web.FileHashError):
+        download(server, tmp_path, extension, digest='0' * 32, unzip=True)
+    assert not list(tmp_path.iterdir())
+
+
+def test_cache_revalidates_and_links_the_same_content(server, tmp_path):
+    cache = web.DownloadCache(str(tmp_path / 'cache'))
+    first, second = tmp_path / 'first', tmp_path / 'second'
+    download(server, first, cache=cache)
+    download(server, second, digest='', cache=cache)
+    # the url is revalidated with its ETag and the file is the same content as in the cache
+    assert RangeHandler.statuses == [200, 304]
+    assert (first / 'firmware.bin').stat().st_ino == (second / 'firmware.bin').stat().st_ino
+
+    # with a digest the server is not asked at all
+    download(server, tmp_path / 'third', cache=cache)
+    assert RangeHandler.statuses == [200, 304]
+    assert cache.size() == len(CONTENT)
+
+
+def test_cache_only_one_download_at_a_time(server, tmp_path):
+    RangeHandler.delay = 0.001
+    folder = str(tmp_path / 'cache')
+    threads = [threading.Thread(target=download, args=(server, tmp_path / str(i)),
+                                kwargs=dict(digest='', cache=web.DownloadCache(folder, link=False)))
+               for i in range(4)]
+    for th in threads:
+        th.start()
+    for th in threads:
+        th.join()
+    assert sorted(RangeHandler.statuses) == [200, 304, 304, 304]
+
+
+def test_cache_removes_the_least_recently_used(server, tmp_path):
+    cache = web.DownloadCache(str(tmp_path / 'cache'), max_bytes=len(CONTENT) + len(FILES['/firmware.bin.gz']) - 1)
+    download(server, tmp_path, cache=cache)
+    download(server, tmp_path, '.gz', unzip=True, cache=cache)
+    assert cache.size() == len(FILES['/firmware.bin.gz'])
+    download(server, tmp_path, cache=cache)
+    assert RangeHandler.statuses == [200, 200, 200]
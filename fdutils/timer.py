@@ -1,3 +1,4 @@
+import bisect
 import collections
 import time
 
@@ -165,6 +166,43 @@ class Chronometer:
         self.stop()
 
 
+class LatencyHistogram:
+    """ cumulative histogram of latencies in seconds with fixed upper bounds (like prometheus/openmetrics ones)
+        so observing a value is a bisect and an increment
+    """
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def clear(self):
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def cumulative(self):
+        """ list of (upper bound, count of values <= upper bound) """
+        total = 0
+        ret = []
+        for le, c in zip(self.buckets, self.counts):
+            total += c
+            ret.append((le, total))
+        return ret
+
+    def as_dict(self):
+        return dict(buckets=self.cumulative(), sum=self.sum, count=self.count)
+
+
 def get_timer_from_timeout(timeout):
     """ helper function for _expect_cmd """
     if hasattr(timeout, 'has_expired'):
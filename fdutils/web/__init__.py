@@ -1,4 +1,5 @@
 from .web import (HashedURLResource, HASH_AVAILABLE, FileHashError, download_resources, download_resource,
                   parse_http_url, upload_file_to_site, get_requests_session_for_encrypted_cert)
+from .cache import DownloadCache
 
 
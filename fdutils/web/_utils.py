@@ -9,6 +9,7 @@ import re
 import shutil
 import tarfile
 import tempfile
+import threading
 import urllib.error
 import urllib.parse
 # url/web libraries
@@ -17,20 +18,30 @@ import zipfile
 
 import requests
 import urllib3.exceptions
+from concurrent import futures
 from fdutils.files import get_filename_indexed
 
 log = logging.getLogger(__name__)
 
+# concurrent range requests of a split download and smallest file that is split
+SPLIT_REQUESTS_PARTS = 8
+SPLIT_REQUESTS_MIN_SIZE = 1 << 20
+
+# suffix of a download until its hash is checked
+PART_SUFFIX = '.part'
+
 
 def unzip_archive(local_file, local_folder, replace, filename_suffix_func):
     """ if filename is a .zip or .tar uncompress it """
 
-    # first uncompress any .gz, .bz or .xz not done during download because of hash digest check
+    # first uncompress any .gz, .bz or .xz not done during download (split downloads)
     filename, unzip_file_func = get_unzip_function(local_file)
     if filename != local_file:
         filename = index_file_if_exists(filename_suffix_func, filename, replace)
-        with open(filename, 'wb') as f, unzip_file_func(local_file) as zf:
+        # renamed after so a file replaced gets a new inode (it can be a link to a DownloadCache content)
+        with open(filename + PART_SUFFIX, 'wb') as f, open(local_file, 'rb') as src, unzip_file_func(src) as zf:
             shutil.copyfileobj(zf, f)
+        os.replace(filename + PART_SUFFIX, filename)
         os.remove(local_file)
 
     # second uncompressed/unarchive .tar and .zip files
@@ -65,19 +76,56 @@ def unzip_archive(local_file, local_folder, replace, filename_suffix_func):
     return filename
 
 
-def copyfileobj_counter(fsrc, fdst, length=16 * 1024):
-    """ a clone of shutil.copyfileobj with an added counter for the number of chunks written so far """
-    chunks = 0
-    try:
-        while 1:
-            buf = fsrc.read(length)
-            if not buf:
+class StreamReader:
+    """ file like reader of a download response that updates hasher with every chunk read (the hash of the
+        resource as sent, before it is uncompressed) and when the connection fails asks for the rest of the
+        resource from the last byte read with partial_download (if given). The readers on top of it (decompressors,
+        tarfile) never see the failure so they go on where they were
+    """
+
+    def __init__(self, raw_response, hasher=None, partial_download=None, max_retries=10, sess=None,
+                 sess_response=None):
+        self.raw = raw_response
+        self.hasher = hasher
+        self.partial_download = partial_download
+        self.max_retries = max_retries
+        self.sess = sess
+        self.sess_response = sess_response
+        self.bytes_read = 0
+        self._tries = 0
+
+    def read(self, size=-1):
+        while True:
+            try:
+                data = self.raw.read() if size is None or size < 0 else self.raw.read(size)
                 break
-            fdst.write(buf)
-            chunks += 1
-    except urllib3.exceptions.HTTPError as e:
-        return chunks, e
-    return chunks, 0
+            except urllib3.exceptions.HTTPError:
+                self._tries += 1
+                if not self.partial_download or self._tries >= self.max_retries:
+                    raise
+                log.debug('Retrying a partial download from byte {}'.format(self.bytes_read))
+                self.raw.close()
+                self.sess_response = self.partial_download(self.sess, self.sess_response, self.bytes_read)
+                self.raw = self.sess_response.raw
+
+        if self.hasher is not None:
+            self.hasher.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def drain(self, chunk_size=1 << 15):
+        """ reads what is left (i.e. the padding after a tar archive) so the hash covers the whole resource """
+        while self.read(chunk_size):
+            pass
+
+    def close(self):
+        self.raw.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
 
 
 def partial_http_download(sess, response, starting_byte):
@@ -91,9 +139,124 @@ def partial_http_download(sess, response, starting_byte):
     return new_resp
 
 
+def _pwriter(f):
+    """ function (data, offset) writing to the file at offset without moving its position so threads can write
+        to it at the same time
+    """
+    if hasattr(os, 'pwrite'):
+        fd = f.fileno()
+
+        def pwrite(data, offset):
+            data = memoryview(data)
+            while data:
+                written = os.pwrite(fd, data, offset)
+                data = data[written:]
+                offset += written
+
+        return pwrite
+
+    # no pwrite on windows
+    lock = threading.Lock()
+
+    def seek_write(data, offset):
+        with lock:
+            f.seek(offset)
+            f.write(data)
+
+    return seek_write
+
+
+def range_http_request(sess, request, start, end, **send_kwargs):
+    """ response (streamed) of the bytes start to end (included) of the prepared request """
+    req = request.copy()
+    req.headers['Range'] = 'bytes={}-{}'.format(start, end)
+    response = sess.send(req, stream=True, **send_kwargs)
+    response.raise_for_status()
+    if response.status_code != 206:
+        response.close()
+        raise requests.exceptions.HTTPError('The server did not send a partial content for the range {}-{} of {}'
+                                            ''.format(start, end, request.url), response=response)
+    return response
+
+
+def download_http_segment(sess, request, start, end, pwrite, chunk_size=1 << 15, max_retries=10, response=None,
+                          **send_kwargs):
+    """ writes the bytes start to end (included) of the request with pwrite. Failed requests are retried from the
+        last byte written. response is an already open response whose body starts at start
+    """
+    position = start
+    tries = 0
+    while True:
+        try:
+            if response is None:
+                response = range_http_request(sess, request, position, end, **send_kwargs)
+            for data in response.raw.stream(chunk_size, decode_content=False):
+                data = data[:end + 1 - position]
+                pwrite(data, position)
+                position += len(data)
+                if position > end:
+                    return end + 1 - start
+            raise urllib3.exceptions.ProtocolError('Connection closed at byte {} of the range {}-{}'
+                                                   ''.format(position, start, end))
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            tries += 1
+            if tries >= max_retries:
+                raise
+            log.debug('Retrying the bytes {}-{} of {} ({})'.format(position, end, request.url, e))
+        finally:
+            if response is not None:
+                response.close()
+                response = None
+
+
+def split_http_download(sess, response, local_file, size, parts=SPLIT_REQUESTS_PARTS, chunk_size=1 << 15,
+                        max_retries=10, **send_kwargs):
+    """ downloads the body of response (of size bytes) to local_file with concurrent byte range requests
+
+        The file is preallocated and every part is written in place as it arrives. The first part is read from
+        response itself so only parts - 1 requests are made. Each part is retried on its own
+
+    Args:
+        sess (requests.Session): session with a connection pool of at least parts connections (a new one if None)
+        response (requests.Response): streamed response of the whole resource
+        local_file (str): path of the file
+        size (int): Content-Length of the resource
+        parts (int): number of concurrent requests
+        chunk_size (int): bytes read at a time
+        max_retries (int): tries of each part
+        **send_kwargs: requests.Session.send parameters (timeout, verify, cert, proxies)
+
+    """
+    part_size = max(-(-size // max(parts, 1)), chunk_size)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    own_session = not isinstance(sess, requests.Session)
+    if own_session:
+        sess = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=len(ranges))
+        sess.mount('http://', adapter)
+        sess.mount('https://', adapter)
+
+    try:
+        with open(local_file, 'wb') as f:
+            f.truncate(size)
+            pwrite = _pwriter(f)
+            with futures.ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+                submitted = [executor.submit(download_http_segment, sess, response.request, start, end, pwrite,
+                                             chunk_size, max_retries, response if not start else None, **send_kwargs)
+                             for start, end in ranges]
+                for done in futures.as_completed(submitted):
+                    done.result()
+    finally:
+        response.close()
+        if own_session:
+            sess.close()
+
+
 def save_response_to_file(resource, local_folder, raw_response, content_type, chunk_size, unzip, replace,
                           headers, filename_suffix_func, delete_on_bad_hash,
-                          sess=None, sess_response=None, partial_download_max_retries=10):
+                          sess=None, sess_response=None, partial_download_max_retries=10, split_parts=0,
+                          send_kwargs=None):
     filename = resource.filename
 
     if not filename:
@@ -104,51 +267,97 @@ def save_response_to_file(resource, local_folder, raw_response, content_type, ch
     else:
         partial_download = None
 
-    # ftp does not have content_type so we send filename instead
-    filename, unzip_file_func = get_unzip_function(filename, content_type=content_type or filename, unzip=unzip,
-                                                   digest=resource.digest)
+    # the parts are the bytes sent so the content cannot be encoded (gzip) by the server
+    size = int(headers.get('Content-Length') or 0)
+    split = (split_parts > 1 and partial_download and sess_response is not None and
+             size >= SPLIT_REQUESTS_MIN_SIZE and not headers.get('Content-Encoding'))
+
+    # tar archives are extracted and simple compressions (ftp does not have content_type so we send filename
+    # instead) uncompressed while they are downloaded. Split downloads are uncompressed after
+    untar = unzip and not split and is_tar_archive(filename)
+    if untar:
+        filename, unzip_file_func = get_tar_folder_name(filename), None
+    else:
+        filename, unzip_file_func = get_unzip_function(filename, content_type=content_type or filename,
+                                                       unzip=unzip and not split)
 
     local_file = index_file_if_exists(filename_suffix_func, os.path.join(local_folder, filename), replace)
 
-    stream_to_file_with_retry(chunk_size, local_file, partial_download, partial_download_max_retries, raw_response,
-                              sess_response, sess, unzip_file_func)
+    # written to a temporary path that gets the final name once the hash is checked
+    part_file = local_file + PART_SUFFIX
+    hasher = resource.new_hash() if resource.digest and not split else None
+    try:
+        if split:
+            log.debug('Downloading {} in {} parts'.format(resource.url, split_parts))
+            split_http_download(sess, sess_response, part_file, size, split_parts, chunk_size,
+                                partial_download_max_retries, **(send_kwargs or {}))
+        elif untar:
+            stream_to_folder_with_retry(chunk_size, part_file, partial_download, partial_download_max_retries,
+                                        raw_response, sess_response, sess, hasher)
+        else:
+            stream_to_file_with_retry(chunk_size, part_file, partial_download, partial_download_max_retries,
+                                      raw_response, sess_response, sess, unzip_file_func, hasher)
+    except BaseException:
+        remove_path(part_file)
+        raise
 
     if resource.digest:
         try:
-            resource.check_digest(local_file)
+            resource.check_digest(part_file, file_hash=hasher.hexdigest() if hasher else None)
         except FileHashError:
             if delete_on_bad_hash:
-                os.remove(local_file)
+                remove_path(part_file)
+            else:
+                move_path(part_file, local_file)
             raise
 
-    if unzip:
+    move_path(part_file, local_file)
+
+    if unzip and not untar:
         local_file = unzip_archive(local_file, local_folder, replace, filename_suffix_func)
 
     return local_file
 
 
 def stream_to_file_with_retry(chunk_size, local_file, partial_download, partial_download_max_retries, raw_response,
-                              sess_response, sess, unzip_file_func):
-    """ saves stream from response to file if a http exception we will try to do a partial download """
-    partial_download_tries = total_chunks = 0
-    while partial_download_tries < partial_download_max_retries:
-        mode = 'wb' if not partial_download_tries else 'rb+'
-        with open(local_file, mode) as f, unzip_file_func(raw_response) as zf, raw_response:
-            if partial_download_tries:
-                f.seek(total_chunks * chunk_size)
-            chunks, exception = copyfileobj_counter(zf, f, chunk_size)
-            if exception:
-                if partial_download and (partial_download_tries + 1) < partial_download_max_retries:
-                    total_chunks += chunks
-                    total_bytes = total_chunks * chunk_size
-                    log.debug('Retrying a partial download from byte {}'.format(total_bytes))
-                    partial_download_tries += 1
-                    sess_response = partial_download(sess, sess_response, total_bytes)
-                    raw_response = sess_response.raw
-                else:
-                    raise exception
-            else:
-                break
+                              sess_response, sess, unzip_file_func, hasher=None):
+    """ saves stream from response to file in one pass: every chunk updates hasher and is uncompressed by
+        unzip_file_func as it is received. If a http exception we will try to do a partial download
+    """
+    reader = StreamReader(raw_response, hasher, partial_download, partial_download_max_retries, sess, sess_response)
+    with open(local_file, 'wb') as f, reader, unzip_file_func(reader) as zf:
+        shutil.copyfileobj(zf, f, chunk_size)
+        reader.drain(chunk_size)
+
+
+def stream_to_folder_with_retry(chunk_size, folder, partial_download, partial_download_max_retries, raw_response,
+                                sess_response, sess, hasher=None):
+    """ extracts the tar archive (compressed or not) of the response to folder while it is received """
+    reader = StreamReader(raw_response, hasher, partial_download, partial_download_max_retries, sess, sess_response)
+    os.makedirs(folder, exist_ok=True)
+    with reader, tarfile.open(fileobj=reader, mode='r|*', bufsize=chunk_size) as tf:
+        tf.extractall(path=folder)
+        reader.drain(chunk_size)
+
+
+def remove_path(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def move_path(source, destination):
+    """ renames source to destination. If both are folders the content of source replaces the one with the same
+        names in destination (like extracting an archive on an existing folder)
+    """
+    if os.path.isdir(source) and os.path.isdir(destination):
+        for name in os.listdir(source):
+            remove_path(os.path.join(destination, name))
+            os.replace(os.path.join(source, name), os.path.join(destination, name))
+        os.rmdir(source)
+    else:
+        os.replace(source, destination)
 
 
 def index_file_if_exists(filename_suffix_func, filename, replace):
@@ -171,9 +380,24 @@ def get_http_filename_in_content_disposition(url, headers):
     return filename
 
 
-def get_unzip_function(filename, content_type='', unzip=True, digest=False):
+TAR_EXTENSIONS = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+
+
+def is_tar_archive(filename):
+    return filename.endswith(TAR_EXTENSIONS)
+
+
+def get_tar_folder_name(filename):
+    """ the folder where the archive is extracted (the file name without the tar extensions) """
+    for extension in sorted(TAR_EXTENSIONS, key=len, reverse=True):
+        if filename.endswith(extension):
+            return filename[:-len(extension)]
+    return filename
+
+
+def get_unzip_function(filename, content_type='', unzip=True):
     """ used in streaming web download to uncompress on the fly for simple compression schemes """
-    if unzip and not digest:
+    if unzip:
         if content_type == "application/gzip" or filename.endswith('.gz'):
             return filename[:-3], lambda f: gzip.GzipFile(fileobj=f)
 
@@ -201,18 +425,31 @@ def ftp_download_hashed_resource(resource, local_folder='', chunk_size=1 << 15,
 
 def http_download_hashed_resource(resource, local_folder='', session=None, chunk_size=1 << 15, unzip=False,
                                   split_requests=False, replace=False, filename_suffix_func=get_filename_indexed,
-                                  delete_on_bad_hash=True, **request_kwargs):
+                                  delete_on_bad_hash=True, split_parts=SPLIT_REQUESTS_PARTS, cache=None,
+                                  **request_kwargs):
+    if cache is not None:
+        return cache.download(resource, local_folder, session, chunk_size, unzip, split_requests, replace,
+                              filename_suffix_func, delete_on_bad_hash, split_parts, **request_kwargs)
+
     sess = session or requests
     request_kwargs['stream'] = True
     r = sess.get(resource.url, **request_kwargs)
     r.raise_for_status()
-    r.raw.decode_content = True
-    status_code = r.status_code
-    local_file = save_response_to_file(resource, local_folder, r.raw, r.headers['Content-Type'],
-                                       chunk_size, unzip, replace, r.headers, filename_suffix_func,
-                                       delete_on_bad_hash, sess, r)
+    local_file = save_http_response(resource, r, local_folder, sess, chunk_size, unzip, split_requests, replace,
+                                    filename_suffix_func, delete_on_bad_hash, split_parts, request_kwargs)
+    return r.status_code, local_file
 
-    return status_code, local_file
+
+def save_http_response(resource, r, local_folder='', sess=None, chunk_size=1 << 15, unzip=False,
+                       split_requests=False, replace=False, filename_suffix_func=get_filename_indexed,
+                       delete_on_bad_hash=True, split_parts=SPLIT_REQUESTS_PARTS, request_kwargs=None):
+    """ saves the body of the streamed response r of resource. Returns the path where it was saved """
+    r.raw.decode_content = True
+    send_kwargs = {k: v for k, v in (request_kwargs or {}).items() if k in ('timeout', 'verify', 'cert', 'proxies')}
+    return save_response_to_file(resource, local_folder, r.raw, r.headers.get('Content-Type', ''),
+                                 chunk_size, unzip, replace, r.headers, filename_suffix_func,
+                                 delete_on_bad_hash, sess, r, split_parts=split_parts if split_requests else 0,
+                                 send_kwargs=send_kwargs)
 
 
 def protocol_not_implemented(url):
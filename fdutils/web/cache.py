@@ -0,0 +1,256 @@
+""" content addressed cache of http downloads shared between runs and processes
+
+    cache = DownloadCache('/var/cache/firmware', max_bytes=50 << 30)
+    download_resources('https://mirror/images/fw-1.2.bin', local_folder='.', cache=cache)
+
+    The content of the downloads is kept once per sha256 no matter how many urls point to it. A url is revalidated
+    with a conditional GET (If-None-Match/If-Modified-Since with the ETag/Last-Modified it was received with) and a
+    resource with a digest is taken from the cache without asking the server at all. Only one process downloads a
+    url at a time (the others wait for it and then revalidate what it got), callers get a hard link to the content
+    (a copy if it cannot be linked) and the least recently used content is removed over max_bytes
+"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+from http import HTTPStatus
+
+import requests
+
+from fdutils.files import FileLock, get_filename_indexed
+from ._utils import (FileHashError, SPLIT_REQUESTS_PARTS, index_file_if_exists, move_path, remove_path,
+                     save_http_response, unzip_archive)
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+DEFAULT_MAX_BYTES = 10 << 30
+
+
+def _sha256(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+class DownloadCache:
+    """ the cache on folder:
+
+        objects/ab/abcdef...   content of the downloads named by its sha256 (read only, callers get links to it)
+        entries/<key>.json     a url (or a digest) -> the object with the validators of the response and its name
+        locks/<key>.lock       lock of the url while it is downloaded or revalidated
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_MAX_BYTES, link=True):
+        """
+
+        Args:
+            folder (str): where the cache is (it is created if it does not exist)
+            max_bytes (int): size of the content kept (the least recently used is removed over it)
+            link (bool): give hard links to the callers. They are read only as they share the content of the cache.
+                         Copies are given if False
+
+        """
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.link = link
+
+    def __repr__(self):
+        return 'DownloadCache({!r}, max_bytes={})'.format(self.folder, self.max_bytes)
+
+    def _path(self, *parts):
+        return os.path.join(self.folder, *parts)
+
+    def _object_path(self, content_hash):
+        return self._path('objects', content_hash[:2], content_hash)
+
+    def _lock(self, key):
+        return FileLock(self._path('locks', key + '.lock'))
+
+    def _objects_lock(self):
+        # objects are not removed while they are handed out
+        return FileLock(self._path('locks', 'objects.lock'))
+
+    @staticmethod
+    def url_key(url):
+        return _sha256(url)
+
+    @staticmethod
+    def digest_key(algorithm, digest):
+        return _sha256('{}:{}'.format(algorithm, digest.lower()))
+
+    def _read_entry(self, key):
+        try:
+            with open(self._path('entries', key + '.json')) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if os.path.exists(self._object_path(entry['object'])) else None
+
+    def _write_entry(self, key, entry):
+        folder = self._path('entries')
+        os.makedirs(folder, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=folder, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.replace(tmp, os.path.join(folder, key + '.json'))
+
+    def download(self, resource, local_folder='', session=None, chunk_size=1 << 15, unzip=False,
+                 split_requests=False, replace=False, filename_suffix_func=get_filename_indexed,
+                 delete_on_bad_hash=True, split_parts=SPLIT_REQUESTS_PARTS, **request_kwargs):
+        """ http_download_hashed_resource through the cache. The status code is 304 (NOT_MODIFIED) when the
+            content is taken from the cache
+        """
+        hand_out_args = (resource, local_folder, unzip, replace, filename_suffix_func)
+        digest_key = self.digest_key(resource.algorithm, resource.digest) if resource.digest else None
+        if digest_key:
+            local_file = self._hand_out(self._read_entry(digest_key), *hand_out_args)
+            if local_file:
+                return HTTPStatus.NOT_MODIFIED, local_file
+
+        key = self.url_key(resource.url)
+        with self._lock(key):
+            if digest_key:
+                # downloaded by another process while waiting for the lock
+                local_file = self._hand_out(self._read_entry(digest_key), *hand_out_args)
+                if local_file:
+                    return HTTPStatus.NOT_MODIFIED, local_file
+
+            sess = session or requests
+            fetch_args = (resource, sess, local_folder, chunk_size, split_requests, replace, filename_suffix_func,
+                          delete_on_bad_hash, split_parts, request_kwargs)
+            status_code, entry = self._fetch(self._read_entry(key), *fetch_args)
+            if digest_key:
+                self._check_digest(key, entry, resource)
+            local_file = self._hand_out(entry, *hand_out_args)
+            if local_file is None:
+                # removed from the cache in the meantime
+                status_code, entry = self._fetch(None, *fetch_args)
+                local_file = self._hand_out(entry, *hand_out_args)
+            if digest_key:
+                self._write_entry(digest_key, entry)
+
+        return status_code, local_file
+
+    def _fetch(self, entry, resource, sess, local_folder, chunk_size, split_requests, replace, filename_suffix_func,
+               delete_on_bad_hash, split_parts, request_kwargs):
+        kwargs = dict(request_kwargs, stream=True)
+        if entry and (entry.get('etag') or entry.get('last_modified')):
+            headers = dict(kwargs.get('headers') or {})
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+            kwargs['headers'] = headers
+
+        r = sess.get(resource.url, **kwargs)
+        if entry and r.status_code == HTTPStatus.NOT_MODIFIED:
+            r.close()
+            log.debug('{} has not changed'.format(resource.url))
+            return HTTPStatus.NOT_MODIFIED, entry
+        r.raise_for_status()
+
+        tmp_folder = self._path('tmp')
+        os.makedirs(tmp_folder, exist_ok=True)
+        tmp = tempfile.mkdtemp(dir=tmp_folder)
+        try:
+            try:
+                path = save_http_response(resource, r, tmp, sess, chunk_size, False, split_requests, True,
+                                          filename_suffix_func, delete_on_bad_hash, split_parts, request_kwargs)
+            except FileHashError:
+                # a bad download is never cached but it is given to the caller if asked to keep it
+                for name in os.listdir(tmp):
+                    move_path(os.path.join(tmp, name),
+                              index_file_if_exists(filename_suffix_func, os.path.join(local_folder, name), replace))
+                raise
+
+            content_hash = hashlib.sha256()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    content_hash.update(chunk)
+            content_hash = content_hash.hexdigest()
+
+            obj = self._object_path(content_hash)
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            entry = dict(url=resource.url, object=content_hash, filename=os.path.basename(path),
+                         size=os.path.getsize(path), etag=r.headers.get('ETag'),
+                         last_modified=r.headers.get('Last-Modified'),
+                         digests={resource.algorithm: resource.digest.lower()} if resource.digest else {})
+            os.chmod(path, 0o444)
+            os.replace(path, obj)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+        self._write_entry(self.url_key(resource.url), entry)
+        self.evict(keep=(content_hash,))
+        return r.status_code, entry
+
+    def _check_digest(self, key, entry, resource):
+        """ checks the digest of the content of a url taken from the cache once per algorithm """
+        digest = entry['digests'].get(resource.algorithm)
+        if digest is None:
+            file_hash = resource.new_hash()
+            with open(self._object_path(entry['object']), 'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 16), b''):
+                    file_hash.update(chunk)
+            digest = entry['digests'][resource.algorithm] = file_hash.hexdigest()
+            self._write_entry(key, entry)
+        resource.check_digest(self._object_path(entry['object']), file_hash=digest)
+
+    def _hand_out(self, entry, resource, local_folder, unzip, replace, filename_suffix_func):
+        """ links (or copies) the content of entry to the local folder. None if it is not in the cache anymore """
+        if entry is None:
+            return None
+        obj = self._object_path(entry['object'])
+        local_file = index_file_if_exists(filename_suffix_func,
+                                          os.path.join(local_folder, resource.filename or entry['filename']),
+                                          replace)
+        with self._objects_lock():
+            if not os.path.exists(obj):
+                return None
+            # the time of the objects is the time they were last used
+            os.utime(obj)
+            remove_path(local_file)
+            try:
+                if not self.link:
+                    raise OSError
+                os.link(obj, local_file)
+            except OSError:
+                shutil.copyfile(obj, local_file)
+
+        if unzip:
+            local_file = unzip_archive(local_file, local_folder, replace, filename_suffix_func)
+        return local_file
+
+    def size(self):
+        return sum(size for _, size, _ in self._objects())
+
+    def _objects(self):
+        for root, _, files in os.walk(self._path('objects')):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield st.st_mtime, st.st_size, path
+
+    def evict(self, max_bytes=None, keep=()):
+        """ removes the least recently used content until the cache takes up to max_bytes (self.max_bytes if
+            None) but the objects in keep. Returns the bytes taken after
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        with self._objects_lock():
+            objects = sorted(self._objects())
+            total = sum(size for _, size, _ in objects)
+            for _, size, path in objects:
+                if total <= max_bytes:
+                    break
+                if os.path.basename(path) in keep:
+                    continue
+                log.debug('Removing {} from the download cache'.format(path))
+                os.chmod(path, 0o644)
+                os.remove(path)
+                total -= size
+        return total
@@ -9,7 +9,8 @@ import requests
 
 from fdutils.files import get_filename_indexed, get_filename_timestamped
 from ._utils import (convert_url_to_hashedurlresource, ftp_download_hashed_resource,
-                     http_download_hashed_resource, protocol_not_implemented, FileHashError)
+                     http_download_hashed_resource, protocol_not_implemented, FileHashError, SPLIT_REQUESTS_PARTS)
+from .cache import DownloadCache
 
 import logging
 log = logging.getLogger(__name__)
@@ -41,7 +42,7 @@ def download_resource(url, local_file_name='', hash_digest='', hash_algorithm='m
 
 def download_resources(*urls, local_folder='', chunk_size=1 << 15, session=None, replace=False, threads_count=10,
                        unzip=False, split_requests=False, timestamp=False, delete_on_bad_hash=True,
-                       **request_kwargs):
+                       split_parts=SPLIT_REQUESTS_PARTS, cache=None, **request_kwargs):
     """ downloads one or more web/ftp resources, it also unzip them if they are archived in some known forms
         (gzip, bz2, zip, or tar.gz) and unzip=True, it will also check hash values of the downloaded files if specified.
 
@@ -58,12 +59,18 @@ def download_resources(*urls, local_folder='', chunk_size=1 << 15, session=None,
         threads_count (int):
         unzip (bool): whether to unzip the file after received
         split_requests (bool): whether to use HTTP Byte Range header and do concurrent retrieval of its parts
+                               (only when the server accepts ranges and the file is not sent encoded)
+        split_parts (int): number of concurrent range requests of each file when split_requests
+        cache (DownloadCache or str): cache (or its folder) of the HTTP downloads shared with other runs and
+                                      processes. The status code is 304 for the files taken from it
         **request_kwargs: requests parameters if needed
 
     Returns:
 
     """
     url_resources = set(convert_url_to_hashedurlresource(url, assign_filename=(len(urls) == 1)) for url in urls)
+    if cache is not None and not isinstance(cache, DownloadCache):
+        cache = DownloadCache(cache)
     file_suffix_func = get_filename_indexed if not timestamp else get_filename_timestamped
 
     futures_res = {}
@@ -79,7 +86,7 @@ def download_resources(*urls, local_folder='', chunk_size=1 << 15, session=None,
                 log.debug('Download HTTP(s): {}'.format(url_resource.url))
                 submitted = executor.submit(http_download_hashed_resource, url_resource, local_folder, session,
                                             chunk_size, unzip, split_requests, replace, file_suffix_func,
-                                            delete_on_bad_hash, **request_kwargs)
+                                            delete_on_bad_hash, split_parts, cache, **request_kwargs)
 
             futures_res[submitted] = url_resource
 
@@ -130,13 +137,21 @@ class HashedURLResource:
         self._algorithm = algo_lower
         self._algorithm_function = HASH_AVAILABLE[algo_lower]
 
-    def check_digest(self, filepath, chunk_size=1 << 14):
+    def new_hash(self):
+        """ a hash object of the algorithm to update while the resource is received """
+        return self._algorithm_function()
+
+    def check_digest(self, filepath, chunk_size=1 << 14, file_hash=None):
+        """ raises FileHashError if the hex digest of the file is not the expected one. file_hash is the digest
+            already calculated while it was received, if not given the file is read to calculate it
+        """
         if self.digest:
-            hash = self._algorithm_function()
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(chunk_size), b""):
-                    hash.update(chunk)
-            file_hash = hash.hexdigest()
+            if file_hash is None:
+                hash = self.new_hash()
+                with open(filepath, "rb") as f:
+                    for chunk in iter(lambda: f.read(chunk_size), b""):
+                        hash.update(chunk)
+                file_hash = hash.hexdigest()
             if file_hash != self.digest:
                 raise FileHashError('When downloading URL ({url}) the file downloaded ({filename}) '
                                     'hash "{hash_algorithm} digest ({file_hash}) '
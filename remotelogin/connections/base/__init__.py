@@ -1,7 +1,13 @@
+import itertools
 import logging
+import os
 import threading
+import time
 
-from .. import settings, decorators
+from fdutils.decorators import retry
+from fdutils.files import slugify
+
+from .. import settings, decorators, exceptions
 from .data import DataExchange
 
 log = logging.getLogger(__name__)
@@ -19,6 +25,12 @@ class Connection:
     AUTHENTICATION_KEYS = ()
     ARGUMENTS_ALLOWED = 'buffer_size', 'connect_timeout'
     NON_BLOCKING_JOIN_TIMEOUT = settings.NON_BLOCKING_JOIN_TIMEOUT       # 5 seconds
+    # open the transport with retries (CONNECT_TRIES)
+    RETRY_OPEN = False
+    # connection errors that will not change by trying again
+    _NOT_RETRIED_ERRORS = (exceptions.AuthenticationException, exceptions.PermissionDeniedError,
+                           exceptions.BadSshKeyPasswordError, exceptions.NoDefaultUserError,
+                           exceptions.ConnectionNotOpenError, exceptions.ConnectionOpenError)
 
     def __init__(self, timeout=0, connect_timeout=0, unbuffered_stream=False, remove_empty_on_stream=False):
 
@@ -32,12 +44,16 @@ class Connection:
         self._is_open = False
         self._unbuffered = unbuffered_stream
         self._remove_empty_on_stream = remove_empty_on_stream
+        # folder of the conversation logs of the sessions (see base.conversations). Empty to keep them in memory
+        self.conversation_log_folder = settings.CONVERSATION_LOG_FOLDER
 
         # threading locks/events
         self.lock = None
         self.stop_signal = None
 
     def __eq__(self, other):
+        if not isinstance(other, Connection):
+            return NotImplemented
         return self.__dict__ == other.__dict__
 
     def __ne__(self, other):
@@ -103,15 +119,53 @@ class Connection:
             log.debug('Connection {} Already Opened: '.format(self))
         else:
             self.__init_open_connection__(kwargs.pop('unbuffered', self._unbuffered), self._remove_empty_on_stream)
-            self._open_transport(**kwargs)
+            if self.RETRY_OPEN:
+                self._retry_connect(self._open_transport, **kwargs)
+            else:
+                self._open_transport(**kwargs)
             self._is_open = True
 
         return self
 
+    def _retry_connect(self, f, *args, tries=0, **kwargs):
+        """ calls f (a step to open the connection) retrying it on connection errors with the CONNECT_RETRY settings.
+            The retries to the same host are taken from a budget shared by all its connections so they do not
+            retry all at once when it is down
+
+        Args:
+            f: function to call with args and kwargs
+            tries (int): tries instead of settings.CONNECT_TRIES
+
+        """
+        tries = tries or settings.CONNECT_TRIES
+        if tries <= 1:
+            return f(*args, **kwargs)
+
+        host = getattr(self, 'host', '')
+        budget = None
+        if host and settings.CONNECT_RETRY_BUDGET:
+            budget = 'connect:{}:{}'.format(host, getattr(self, 'port', ''))
+
+        return retry(tries, delay=settings.CONNECT_RETRY_DELAY, backoff=settings.CONNECT_RETRY_BACKOFF,
+                     max_delay=settings.CONNECT_RETRY_MAX_DELAY, jitter=settings.CONNECT_RETRY_JITTER,
+                     retries_timeout=settings.CONNECT_RETRIES_TIMEOUT, exceptions_to_check=(OSError,),
+                     exceptions_to_not_retry=self._NOT_RETRIED_ERRORS, budget=budget, f=f, args=args, **kwargs)
+
     def __init_open_connection__(self, unbuffered, remove_empty_on_stream):
         self.lock = threading.Lock()
         self.stop_signal = threading.Event()
-        self.data = DataExchange(unbuffered, remove_empty_on_stream, host=str(self.transport))
+        self.data = DataExchange(unbuffered, remove_empty_on_stream, host=str(self.transport),
+                                 log_path=self._new_conversation_log_path())
+
+    _log_ids = itertools.count(1)
+
+    def _new_conversation_log_path(self):
+        folder = getattr(self, 'conversation_log_folder', '')
+        if not folder:
+            return None
+        return os.path.join(folder, '{}_{}_{}_{}.jsonl'.format(
+            time.strftime('%Y%m%d-%H%M%S'), slugify(self.__class__.__name__),
+            slugify(str(getattr(self, 'host', '') or 'local')), next(self._log_ids)))
 
     def __enter__(self):
         return self.open()
@@ -134,6 +188,8 @@ class Connection:
                             log.exception("Problems closing: " + str(self))
 
                     self.transport = None
+                    if self.data is not None:
+                        self.data.close_log()
 
     __del__ = close
 
@@ -0,0 +1,153 @@
+""" append-only on-disk log of the conversation (commands sent and data received) of a session
+
+    The exchanges are written as json lines to path and every one gets a fixed size record in path + '.idx' with
+    the time it was sent, its offset in the log and a key of the command sent. The index is sorted by time so time
+    ranges are found with a binary search over the index file and only the exchanges asked for are read.
+
+    >>> log = ConversationLog('/tmp/session.jsonl')
+    >>> list(log.exchanges(start=time.time() - 3600, command='uptime'))
+    [Exchange(time=1589212800.1, meta=None, sent='uptime', received=' 16:00:00 up 10 days, ...')]
+
+    The exchanges of many logs (or any iterables of exchanges sorted by time) are merged in time order with merge
+"""
+import bisect
+import collections
+import datetime
+import heapq
+import json
+import logging
+import os
+import struct
+import threading
+import zlib
+
+from remotelogin.connections import settings
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+class Exchange(collections.namedtuple('Exchange', 'time meta sent received')):
+    """ a command sent (at time, epoch) with its metadata and the data received after it """
+    __slots__ = ()
+
+    def as_timed_dict(self, time_format=TIME_FORMAT):
+        """ as the dictionaries of the conversation lists (time formatted) """
+        return dict(time=datetime.datetime.fromtimestamp(self.time).strftime(time_format), meta=self.meta or '',
+                    sent=self.sent, received=self.received)
+
+
+# time sent, offset of the exchange in the log and crc32 of the command sent
+INDEX_RECORD = struct.Struct('<dQI')
+INDEX_EXTENSION = '.idx'
+
+
+def command_key(sent):
+    return zlib.crc32(sent.strip().encode(encoding=settings.ENCODE_ENCODING_TYPE,
+                                          errors=settings.ENCODE_ERROR_ARGUMENT_VALUE))
+
+
+class _IndexTimes:
+    """ the times of an index file as a read only sequence for bisect """
+
+    def __init__(self, f, size):
+        self._f = f
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        self._f.seek(i * INDEX_RECORD.size)
+        return INDEX_RECORD.unpack(self._f.read(INDEX_RECORD.size))[0]
+
+
+class ConversationLog:
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + INDEX_EXTENSION
+        self._log = self._index = None
+        self._offset = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return 'ConversationLog({!r})'.format(self.path)
+
+    def __len__(self):
+        try:
+            return os.path.getsize(self.index_path) // INDEX_RECORD.size
+        except OSError:
+            return 0
+
+    def append(self, time, meta, sent, received):
+        data = json.dumps([time, meta, sent, received], default=str).encode() + b'\n'
+        with self._lock:
+            if self._log is None:
+                folder = os.path.dirname(self.path)
+                if folder:
+                    os.makedirs(folder, exist_ok=True)
+                self._log = open(self.path, 'ab')
+                self._index = open(self.index_path, 'ab')
+                self._offset = self._log.tell()
+            self._log.write(data)
+            # the index is written after the exchange so it never points past the end of the log
+            self._log.flush()
+            self._index.write(INDEX_RECORD.pack(time, self._offset, command_key(sent)))
+            self._index.flush()
+            self._offset += len(data)
+
+    def close(self):
+        with self._lock:
+            for f in (self._log, self._index):
+                if f is not None:
+                    f.close()
+            self._log = self._index = None
+
+    def __iter__(self):
+        return self.exchanges()
+
+    def exchanges(self, start=None, end=None, command=None):
+        """ the exchanges sent between start and end (epoch times, both included) read lazily
+
+        Args:
+            start (float): from this time (the first exchange if None)
+            end (float): until this time (the last exchange if None)
+            command (str): only the exchanges of this command sent
+
+        """
+        try:
+            index = open(self.index_path, 'rb')
+        except FileNotFoundError:
+            return
+        with index, open(self.path, 'rb') as f:
+            size = os.fstat(index.fileno()).st_size // INDEX_RECORD.size
+            first = 0 if start is None else bisect.bisect_left(_IndexTimes(index, size), start)
+            index.seek(first * INDEX_RECORD.size)
+            key = None if command is None else command_key(command)
+            sent = None if command is None else command.strip()
+            position = None
+
+            for _ in range(first, size):
+                time, offset, crc = INDEX_RECORD.unpack(index.read(INDEX_RECORD.size))
+                if end is not None and time > end:
+                    break
+                if key is not None and crc != key:
+                    continue
+                if offset != position:
+                    f.seek(offset)
+                line = f.readline()
+                position = offset + len(line)
+                exchange = Exchange(*json.loads(line))
+                if sent is None or exchange.sent.strip() == sent:
+                    yield exchange
+
+
+def merge(*sources):
+    """ k-way merge in time order of the exchanges of many conversation logs (or iterables of exchanges sorted by
+        time). Only one exchange of each source is kept in memory at a time
+    """
+    return heapq.merge(*sources, key=lambda e: e.time)
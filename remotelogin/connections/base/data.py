@@ -1,9 +1,10 @@
 import time
-import datetime
 import io
 import logging
+import os
 
 from remotelogin.connections import settings
+from remotelogin.connections.base.conversations import ConversationLog, Exchange
 
 log = logging.getLogger(__name__)
 
@@ -50,17 +51,70 @@ DATA_RECEIVED = "Data Recv from {} <<<<: {}"
 
 
 class DataExchange:
-    def __init__(self, unbuffered=False, remove_empty_on_stream=False, host=""):
+
+    __slots__ = (
+        "_data_sent_timer_meta",
+        "_data_sent",
+        "_data_recv",
+        "_recording",
+        "_duplicate_on",
+        "_stream_is_text",
+        "_recv_as_bytes",
+        "_unbuffered",
+        "_remove_empty_on_stream",
+        "_host",
+        "_cur_host",
+        "_log",
+        "_log_path",
+        "_log_segment",
+    )
+
+    def __init__(self, unbuffered=False, remove_empty_on_stream=False, host="", log_path=None):
+        """
+
+        Args:
+            log_path (str): file where the exchanges are written (see conversations.ConversationLog). If given only
+                            the last exchange is kept in memory. Every flush starts a new segment of the log
+                            (path.2.jsonl, path.3.jsonl, ...)
+        """
         self._data_sent_timer_meta = []
         self._data_sent = []
         self._data_recv = []
         self._recording = True
         self._duplicate_on = False
-        self._new_received = self.new_received
+        self._stream_is_text = False
+        # binary streams get the received text encoded (see new_received)
+        self._recv_as_bytes = False
         self._unbuffered = unbuffered
         self._remove_empty_on_stream = remove_empty_on_stream
         self._host = host
         self._cur_host = host
+        self._log = ConversationLog(log_path) if log_path else None
+        self._log_path = log_path
+        self._log_segment = 1
+
+    @property
+    def log(self):
+        """ the conversations.ConversationLog of the exchanges (None if they are only kept in memory) """
+        return self._log
+
+    def _write_to_log(self, keep=0):
+        """ moves the exchanges but the last keep ones from memory to the log """
+        pending = len(self._data_sent) - keep
+        if self._log is None or pending <= 0:
+            return
+        for i in range(pending):
+            ts, meta = self._data_sent_timer_meta[i]
+            self._log.append(ts, meta, self._data_sent[i], self._get_recv(i))
+        del self._data_sent_timer_meta[:pending]
+        del self._data_sent[:pending]
+        del self._data_recv[:pending]
+
+    def close_log(self):
+        """ writes the exchanges in memory to the log and closes it. It can still be read """
+        if self._log is not None:
+            self._write_to_log()
+            self._log.close()
 
     def _write(self, stream, data, force=False):
         if self._recording or force:
@@ -81,11 +135,15 @@ class DataExchange:
         host="",
     ):
         if record:
+            if self._data_recv and log.isEnabledFor(logging.DEBUG):
+                self._log_last_recv()
+            # the previous exchange is complete
+            self._write_to_log()
             self._data_sent_timer_meta.append((time.time(), metadata))
             data = data if not hide else settings.HIDDEN_DATA_MSG
             self._data_sent.append(data)
             self._stream_is_text = False
-            self.new_received = self._new_received
+            self._recv_as_bytes = False
 
             self._cur_host = host
 
@@ -102,7 +160,7 @@ class DataExchange:
                     stream_is_text = True
                 else:
                     stream_is_text = False
-                    self.new_received = self.new_received_bytes
+                    self._recv_as_bytes = True
 
                 is_ctrl = False
 
@@ -110,16 +168,6 @@ class DataExchange:
                     data = "CTL[ " + control_list[ord(data)] + " ]"
                     is_ctrl = True
 
-                if self._data_recv:
-                    last_recv = self.get_last_recv()
-                    log.debug(
-                        DATA_RECEIVED.format(
-                            self._cur_host,
-                            "CTL[ " + control_list[ord(last_recv)] + " ]"
-                            if len(last_recv) == 1 and ord(last_recv) < 36
-                            else last_recv,
-                        )
-                    )
                 log.debug(DATA_TO_SEND.format(self._cur_host or self._host, data))
 
                 if send_msg_format is None:
@@ -142,8 +190,22 @@ class DataExchange:
 
         self._recording = record
 
+    def _log_last_recv(self):
+        last_recv = self.get_last_recv()
+        log.debug(
+            DATA_RECEIVED.format(
+                self._cur_host,
+                "CTL[ " + control_list[ord(last_recv)] + " ]"
+                if len(last_recv) == 1 and ord(last_recv) < 36
+                else last_recv,
+            )
+        )
+
     def new_received(self, data):
-        self._write(self._data_recv[-1], data)
+        if self._recv_as_bytes:
+            self.new_received_bytes(data)
+        else:
+            self._write(self._data_recv[-1], data)
 
     def new_received_bytes(self, data):
         self._write(
@@ -162,35 +224,61 @@ class DataExchange:
         except IndexError:
             return "Nothing was recorded (nothing sent/received)"
 
-    def get_conversation_list(self, with_sent_time=False):
-        conversation = []
+    def _get_recv(self, i):
+        try:
+            return self._data_recv[i].getvalue()
+        except (ValueError, AttributeError):
+            return "a stream was recorded for this command"
+
+    def exchanges(self, start=None, end=None, command=None):
+        """ the conversations.Exchange tuples (sent time, metadata, sent, received) in time order. The ones in the log
+            are read lazily
+
+        Args:
+            start (float): only exchanges sent from this time (epoch)
+            end (float): only exchanges sent until this time
+            command (str): only the exchanges of this command
+        """
+        if self._log is not None:
+            yield from self._log.exchanges(start, end, command)
+
         for i, s in enumerate(self._data_sent):
-            try:
-                send_recv = (s, self._data_recv[i].getvalue())
-            except (ValueError, AttributeError):
-                send_recv = (s, "a stream was recorded for this command")
+            ts, meta = self._data_sent_timer_meta[i]
+            if ((start is None or ts >= start) and (end is None or ts <= end) and
+                    (command is None or s.strip() == command.strip())):
+                yield Exchange(ts, meta, s, self._get_recv(i))
 
+    def get_conversation_list(self, with_sent_time=False):
+        conversation = []
+        for e in self.exchanges():
+            send_recv = (e.sent, e.received)
             if with_sent_time:
-                send_recv += self._data_sent_timer_meta[i]
+                send_recv += (e.time, e.meta)
             conversation.append(send_recv)
         return conversation
 
     def get_timed_conversation_list(self, time_format="%Y-%m-%d %H:%M:%S"):
-        conversation = self.get_conversation_list(True)
-        timed_conversation = []
-        for exchange in conversation:
-            sent, received, ts, meta = exchange
-            timed_conversation.append(
-                dict(
-                    time=datetime.datetime.fromtimestamp(ts).strftime(time_format),
-                    meta=meta or "",
-                    sent=sent,
-                    received=received,
-                )
-            )
-        return timed_conversation
+        return list(self.iter_timed_conversation(time_format))
+
+    def iter_timed_conversation(self, time_format="%Y-%m-%d %H:%M:%S", start=None, end=None, command=None):
+        """ the exchanges as dictionaries (time formatted, meta, sent and received) built lazily """
+        for e in self.exchanges(start, end, command):
+            yield e.as_timed_dict(time_format)
 
     def flush(self):
+        """ forgets the exchanges so far. With a log they are written to it first and a new segment of the log is
+            started, so exchanges() and the conversation lists only give the exchanges sent after the flush
+
+        Returns:
+            conversations.ConversationLog: the segment of the log with the exchanges flushed (None without a log)
+        """
+        flushed = self._log
+        if flushed is not None:
+            self.close_log()
+            self._log_segment += 1
+            root, extension = os.path.splitext(self._log_path)
+            self._log = ConversationLog('{}.{}{}'.format(root, self._log_segment, extension))
         self._data_sent_timer_meta = []
         self._data_sent = []
         self._data_recv = []
+        return flushed
@@ -12,6 +12,7 @@ class IPConnection(Connection):
     # The default port to be defined by every connection (ssh->22, http->80, ...)
     _IANA_SVC_NAME = ''
     NEEDS_AUTHENTICATION = True
+    RETRY_OPEN = True
 
     AUTHENTICATION_KEYS = ('username', 'password')
     AUTHENTICATION_KEYS_COMBINATIONS = (('username',), ('password',), ('username', 'password'))
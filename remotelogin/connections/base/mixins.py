@@ -8,6 +8,7 @@ import re
 from .. import exceptions, settings
 from ..decorators import must_be_open
 import fdutils
+from fdutils import checksums
 
 log = logging.getLogger(__name__)
 
@@ -71,10 +72,8 @@ class CanExecuteCommands:
 
         :param str command: command to send to the connection
         :param str return_type: one of string, stream or list
-        :rtype: fdutils.parallel.StoppableThreadWithTextQueue
-
         :return:
-        :rtype: fdutils.parallel.StoppableThreadWithQueueAndCallback
+        :rtype: fdutils.parallel.LoopTaskWithQueue
         """
 
         def callback(th):
@@ -89,21 +88,80 @@ class CanExecuteCommands:
         command = command.strip()
         target_out, channel = self._check_output_nb(command, **kwargs)
 
-        th_out = fdutils.parallel.ThreadLoopWithQueue(
-            target_out['target'], args=target_out['args'], run_timeout=run_timeout, join_timeout=self.nb_join_timeout,
-            recv_data_timeout=recv_data_timeout)
+        # the output is read by the workers of the loop scheduler unless the reads block
+        if target_out.get('blocking'):
+            th_out = fdutils.parallel.ThreadLoopWithQueue(
+                target_out['target'], args=target_out['args'], run_timeout=run_timeout,
+                join_timeout=self.nb_join_timeout, recv_data_timeout=recv_data_timeout)
+        else:
+            th_out = fdutils.parallel.LoopTaskWithQueue(
+                target_out['target'], args=target_out['args'], run_timeout=run_timeout,
+                join_timeout=self.nb_join_timeout, recv_data_timeout=recv_data_timeout,
+                wait_readable=target_out.get('wait_readable'), readable_timeout=target_out.get('readable_timeout'))
         th_out.add_call_on_stop(callback, args=(th_out,))
         th_out.add_call_on_stop(channel.close)
         th_out.start()
 
         return th_out
 
+    @must_be_open
+    @contextlib.contextmanager
+    def stream_output(self, command, use_sudo=False, metadata=None, idle_timeout=None, **kwargs):
+        """ runs a command (like a tail -f) and gives an iterator over the lines of its output while it runs.
+            The lines are not kept in the conversation data and the channel of the command is closed when the
+            context exits.
+
+            Nothing is received while the consumer is not asking for lines, so a slow consumer slows down the command
+            too (the transport flow control fills up). The iterator ends when the command ends or the connection is
+            lost
+
+            with conn.stream_output('tail -F /var/log/messages', idle_timeout=1) as lines:
+                for line in lines:
+                    if line is None and should_stop():
+                        break
+
+        :param str command: command to send to the connection
+        :param float idle_timeout: None is given as a line after these seconds without output (never if None)
+        """
+        log.debug("{} - Streaming cmd: {}".format(self.__class__.__name__, command))
+        command = self._get_cmd(command, use_sudo, False)
+        self.data.new_sent(command, metadata=metadata)
+        with self._stream_output(command.strip(), idle_timeout=idle_timeout, **kwargs) as lines:
+            yield lines
+
     def _check_output(self, command, **kwargs):
         pass
 
     def _check_output_nb(self, command, **kwargs):
         pass
 
+    def _stream_output(self, command, **kwargs):
+        raise NotImplementedError('{} can not stream the output of a command'.format(self.__class__.__name__))
+
+
+def iter_lines(read, wait_readable, idle_timeout=None):
+    """ the decoded lines of a stream read in chunks
+
+    :param read: function returning the next chunk of bytes available (b'' at the end of the stream)
+    :param wait_readable: function(timeout) returning True when there is something to read
+    :param float idle_timeout: None is yielded after these seconds without data (never if None)
+    """
+    pending = b''
+    while True:
+        if not wait_readable(idle_timeout):
+            yield None
+            continue
+        data = read()
+        if not data:
+            break
+        lines = (pending + data).split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            yield (line + b'\n').decode(encoding=settings.DECODE_ENCODING_TYPE,
+                                        errors=settings.DECODE_ERROR_ARGUMENT_VALUE)
+    if pending:
+        yield pending.decode(encoding=settings.DECODE_ENCODING_TYPE, errors=settings.DECODE_ERROR_ARGUMENT_VALUE)
+
 
 class B64DecoderWriter:
 
@@ -185,8 +243,9 @@ class CanTransferFiles:
 
     @must_be_open
     def put_file(self, local_file, remote_path='', remote_folder='', replace=True,
-                 check_md5=False, remove_if_bad_md5=False, **put_kwargs):
+                 check_md5=False, remove_if_bad_md5=False, checksum_algorithm=None, **put_kwargs):
         remote_path = self._get_remote_path(local_file, remote_path, remote_folder)
+        local_checksum = self._local_checksum(local_file, checksum_algorithm) if check_md5 else None
         attr = self._put_file(local_file, remote_path, **put_kwargs)
         if attr is None:
             attr = self._get_stat_on_remote_file(remote_path)
@@ -198,7 +257,7 @@ class CanTransferFiles:
             attr.filename = remote_path
 
         if check_md5:
-            self._check_md5_put(local_file, remote_path, remove_if_bad_md5)
+            self._check_checksum_put(local_checksum, remote_path, remove_if_bad_md5, False, checksum_algorithm)
 
         return attr
 
@@ -219,7 +278,7 @@ class CanTransferFiles:
 
     @must_be_open
     def put_file_via_cat(self, local_file, remote_path='', remote_folder='', replace=True,
-                         check_md5=False, remove_if_bad_md5=False, **put_kwargs):
+                         check_md5=False, remove_if_bad_md5=False, checksum_algorithm=None, **put_kwargs):
         """ puts a file using txt messages or base64 encoded data.  Not meant to be used for large files
 
         Args:
@@ -237,6 +296,7 @@ class CanTransferFiles:
         if replace and check_md5:
             remote_path += settings.TEMP_FILE_EXTENSION
 
+        local_checksum = self._local_checksum(local_file, checksum_algorithm) if check_md5 else None
         with open(local_file, 'rb') as f:
             data = f.read()
 
@@ -251,31 +311,42 @@ class CanTransferFiles:
             self.send_cmd_prompt(self.os.cmd.remove(remote_path + '.b64'), **put_kwargs)
 
         if check_md5:
-            self._check_md5_put(local_file, remote_path, remove_if_bad_md5, replace)
+            self._check_checksum_put(local_checksum, remote_path, remove_if_bad_md5, replace, checksum_algorithm)
+            if replace:
+                remote_path = remote_path[:-len(settings.TEMP_FILE_EXTENSION)]
 
         fattr = self._get_stat_on_remote_file(remote_path)
 
         return fattr
 
-    @contextlib.contextmanager
-    def _md5_same_on_files(self, local_file, remote_path):
-        md5sum = self.os.md5sum_clean(self.check_output(self.os.cmd.md5checksum(remote_path)))
-        yield md5sum == fdutils.files.md5_checksum(local_file)
+    @staticmethod
+    def _local_checksum(local_file, algorithm=None):
+        """ the checksum of the local file calculated in a thread (a future) so it overlaps with the transfer or
+            the remote checksum command
+        """
+        return checksums.submit(local_file, algorithm or settings.TRANSFER_CHECKSUM_ALGORITHM)
+
+    def _checksums_match(self, local_checksum, remote_path, algorithm=None):
+        algorithm = algorithm or settings.TRANSFER_CHECKSUM_ALGORITHM
+        remote_checksum = self.os.checksum_clean(self.check_output(self.os.cmd.checksum(remote_path, algorithm)),
+                                                 algorithm)
+        return remote_checksum == local_checksum.result()
 
-    def _check_md5_put(self, local_file, remote_path, remove_if_bad_md5, replace):
-        if not self._md5_same_on_files(local_file, remote_path):
-            log.info('Deleting put file as MD5sum does not match local file checksum')
+    def _check_checksum_put(self, local_checksum, remote_path, remove_if_bad_md5, replace, algorithm=None):
+        if not self._checksums_match(local_checksum, remote_path, algorithm):
+            log.info('Deleting put file as its checksum does not match local file checksum')
             if remove_if_bad_md5:
                 self.send_cmd_prompt(self.os.cmd.remove(remote_path))
             raise exceptions.FileTransferError('Checksums of files after PUT are not equal')
 
         if replace:
             new_remote_path = remote_path[:-len(settings.TEMP_FILE_EXTENSION)]
-            self.send_cmd_prompt(self.os.move(remote_path, new_remote_path, overwrite=True))
+            self.send_cmd_prompt(self.os.cmd.move(remote_path, new_remote_path, overwrite=True))
 
-    def _check_md5_get(self, local_file, remote_path, remove_if_bad_md5):
-        if not self._md5_same_on_files(local_file, remote_path):
-            log.info('Deleting get file as MD5sum does not match remote file checksum')
+    def _check_checksum_get(self, local_file, remote_path, remove_if_bad_md5, algorithm=None):
+        local_checksum = self._local_checksum(local_file, algorithm)
+        if not self._checksums_match(local_checksum, remote_path, algorithm):
+            log.info('Deleting get file as its checksum does not match remote file checksum')
             if remove_if_bad_md5:
                 os.remove(local_file)
             raise exceptions.FileTransferError('Checksums of files after GET are not equal')
@@ -284,7 +355,7 @@ class CanTransferFiles:
 
     @must_be_open
     def get_file(self, remote_file, local_path='', replace=False, local_folder=None,
-                 check_md5=False, remove_if_bad_md5=False, **get_kwargs):
+                 check_md5=False, remove_if_bad_md5=False, checksum_algorithm=None, **get_kwargs):
         """
 
         Args:
@@ -293,6 +364,8 @@ class CanTransferFiles:
             local_folder: path to a directory where to download the file if local_path not given
             replace:
             timestamp:
+            check_md5: compare the checksums of the remote and the local file after the transfer
+            checksum_algorithm: one of fdutils.checksums.ALGORITHMS (settings.TRANSFER_CHECKSUM_ALGORITHM if None)
 
         Returns:
 
@@ -300,13 +373,17 @@ class CanTransferFiles:
         with _get_file_common(remote_file, local_path, replace, local_folder) as local_path:
             self._get_file(remote_file, local_path, **get_kwargs)
 
+        if check_md5:
+            self._check_checksum_get(local_path, remote_file, remove_if_bad_md5, checksum_algorithm)
+
         return os.path.abspath(local_path)
 
     get = get_file
 
     @must_be_open
     def get_file_via_cat(self, remote_file, local_path='', base64_func=None, use_sudo=False, replace=False,
-                         local_folder=None, check_md5=False, remove_if_bad_md5=False, **kwargs):
+                         local_folder=None, check_md5=False, remove_if_bad_md5=False, checksum_algorithm=None,
+                         **kwargs):
 
         with _get_file_common(remote_file, local_path, replace, local_folder) as local_path:
 
@@ -326,11 +403,7 @@ class CanTransferFiles:
                                   reset_on_new_line=True, **kwargs)
 
         if check_md5:
-            self._check_md5_get(local_path, remote_file, remove_if_bad_md5)
-            md5sum = self.os.md5sum_clean(self.check_output(self.os.cmd.md5checksum(remote_file)))
-
-            if md5sum != fdutils.files.md5_checksum(local_path):
-                raise exceptions.FileTransferError('Checksums are not equal')
+            self._check_checksum_get(local_path, remote_file, remove_if_bad_md5, checksum_algorithm)
 
         return os.path.abspath(local_path)
 
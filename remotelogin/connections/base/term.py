@@ -36,6 +36,10 @@ DEFAULT_PROMPT_RESPONSE = None
 
 
 class ExpectAndResponse:
+
+    __slots__ = ('expect', 'response', 'required', 'hidden', 'name', 'flags', 'index', '_count', '_start', '_end',
+                 'kwargs', '_matches')
+
     def __init__(self, expect, response, required=False, hidden=False, name='', flags=re.I|re.M, index=0, count=1,
                  require=False, **kwargs):
         """
@@ -125,16 +129,22 @@ class ExpectAndResponse:
 
 
 class ExpectPasswordAndResponse(ExpectAndResponse):
+    __slots__ = ()
+
     def __init__(self, response, expect=r'(password)\s?\:', hidden=True, required=True, name='password'):
         super().__init__(expect, response, required=required, hidden=hidden, name=name)
 
 
 class ExpectUsernameAndResponse(ExpectAndResponse):
+    __slots__ = ()
+
     def __init__(self, response, expect=r'(username|login)\s?\:\s*$', hidden=False, required=False, name='username'):
         super().__init__(expect, response, required=required, hidden=hidden, name=name)
 
 
 class ExpectPrompt(ExpectAndResponse):
+    __slots__ = ()
+
     def __init__(self, expect=None, required=True, name=DEFAULT_PROMPT_NAME):
         super().__init__(expect, None, required=required, name=name)
 
@@ -4,6 +4,8 @@ import fdutils
 
 class ExpectedRegex:
 
+    __slots__ = ('regex_object', 'callback', 'match_object', 'remove_prompt_to_compare', 'name')
+
     def __init__(self, regex=None, flags=0, name='', remove_prompt_to_compare=True, callback=None):
         """ Container to hold information about an expected regex value
 
@@ -85,10 +87,14 @@ class ExpectedRegex:
 
 
 class ExpectedString(ExpectedRegex):
+    __slots__ = ()
+
     def __init__(self, string, flags=0, name='', remove_prompt_to_compare=True):
         super(ExpectedString, self).__init__(re.escape(string), flags, name, remove_prompt_to_compare)
 
 
 class ExpectedPrompt(ExpectedRegex):
+    __slots__ = ()
+
     def __init__(self, name='', **kwargs):
         super(ExpectedPrompt, self).__init__(None, name=name)
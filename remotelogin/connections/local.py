@@ -1,5 +1,8 @@
 from io import StringIO
+import contextlib
+import os
 import shlex
+import signal
 import socket
 import subprocess
 import logging
@@ -38,14 +41,12 @@ def read_from_file_and_put_in_queue(fd, buff=settings.BUFFER_SIZE):
         return utils.parallel.POISON_PILL
 
 
-# TODO: move to registering events and/or asyncio
 def enqueue_output_unix(fd):
-    #default_selector.register(fd, selectors.EVENT_READ, read_from_file_and_put_in_queue)
-    rfd, wfd, efd = select.select([fd], [], [])
+    rfd, wfd, efd = select.select([fd], [], [], 0)
     if rfd:
         return read_from_file_and_put_in_queue(fd)
-    else:
-        return utils.parallel.POISON_PILL
+    # called again when fd is readable (fdutils.parallel.LoopTaskWithQueue)
+    raise Empty
 
 
 # TODO: look into twisted fdesc to handle non-blocking file descriptors in Windows
@@ -157,7 +158,25 @@ class LocalConnection(term.ConnectionWithTerminal, mixins.CanExecuteCommands, mi
         client.stdin.write(to_bytes(command))
         client.stdin.flush()
 
-        return dict(target=enqueue_output, args=(client.stdout,)), client
+        return (dict(target=enqueue_output, args=(client.stdout,), wait_readable=client.stdout, blocking=ON_WINDOWS),
+                client)
+
+    @contextlib.contextmanager
+    def _stream_output(self, command, idle_timeout=None, **kwargs):
+        # in its own process group so the whole pipeline of the command is stopped with it
+        client = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, shell=True,
+                                  start_new_session=True)
+        fd = client.stdout.fileno()
+        try:
+            yield mixins.iter_lines(lambda: os.read(fd, settings.BUFFER_SIZE),
+                                    lambda timeout: bool(select.select([fd], [], [], timeout)[0]), idle_timeout)
+        finally:
+            try:
+                os.killpg(client.pid, signal.SIGTERM)
+            except (AttributeError, ProcessLookupError):
+                client.terminate()
+            client.wait()
+            client.stdout.close()
 
     def _open_terminal_channel(self, **kwargs):
         return LocalTerminalChannel(self, self._open_pipe(), **kwargs)
@@ -179,6 +198,7 @@ class LocalConnection(term.ConnectionWithTerminal, mixins.CanExecuteCommands, mi
 
 
 class LocalTerminalChannel(channel.TerminalChannel):
+    __slots__ = ('thread_out',)
 
     def __init__(self, conn, channel, **shell_kwargs):
         """
@@ -194,8 +214,15 @@ class LocalTerminalChannel(channel.TerminalChannel):
         shell_kwargs.setdefault('connect_timeout', settings.CONNECTION_LOGIN_LOCAL_TIMEOUT)
         super(LocalTerminalChannel, self).__init__(conn, channel, **shell_kwargs)
 
-        self.thread_out = utils.parallel.ThreadLoopWithQueue(enqueue_output, args=(self.channel.stdout,),
-                                                             recv_data_timeout=settings.NON_BLOCKING_RECEIVED_DATA_TIMEOUT)
+        if ON_WINDOWS:
+            # reads block
+            self.thread_out = utils.parallel.ThreadLoopWithQueue(
+                enqueue_output, args=(self.channel.stdout,),
+                recv_data_timeout=settings.NON_BLOCKING_RECEIVED_DATA_TIMEOUT)
+        else:
+            self.thread_out = utils.parallel.LoopTaskWithQueue(
+                enqueue_output, args=(self.channel.stdout,),
+                recv_data_timeout=settings.NON_BLOCKING_RECEIVED_DATA_TIMEOUT, wait_readable=self.channel.stdout)
         self.thread_out.start()
 
     def _close(self):
@@ -208,7 +235,8 @@ class LocalTerminalChannel(channel.TerminalChannel):
         pass
 
     def _resize_pty(self, cols, rows):
-        self.send(self.os.cmd.resize_pty(cols, rows))
+        # the local shell runs on pipes (no pty), stty would only print an error that could be taken as the prompt
+        pass
 
     def is_active(self):
         return self.channel.poll() is None
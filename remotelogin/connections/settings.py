@@ -33,6 +33,8 @@ ENCODE_ENCODING_TYPE = 'utf-8'
 DECODE_ENCODING_TYPE = 'utf-8'
 
 TEMP_FILE_EXTENSION = '.tmp'
+# checksum compared after a file transfer with check_md5 (one of fdutils.checksums.ALGORITHMS)
+TRANSFER_CHECKSUM_ALGORITHM = 'md5'
 
 NON_BLOCKING_JOIN_TIMEOUT = 5
 
@@ -59,6 +61,29 @@ SFTP_SCP_BUFFER_SIZE = DEFAULT_TRANSPORT_MAX_PACKET_SIZE
 
 DISABLE_HISTORY_RECORDING = None # None means to relay to os default value for can_disable_history
 
+# send history/pty/prompt setup as a single line after login if the os supports it (one prompt wait per hop)
+COMBINE_SHELL_INIT = True
+
+# folder where every session writes its conversation to an append-only log instead of keeping it in memory
+# (see base.conversations). Empty to keep the conversations in memory
+CONVERSATION_LOG_FOLDER = ''
+
+# tries to open a connection to a host and seconds waited before retrying, growing by CONNECT_RETRY_BACKOFF up to
+# CONNECT_RETRY_MAX_DELAY and randomized with CONNECT_RETRY_JITTER (none, full, equal or decorrelated) so sessions that
+# fail at the same time do not retry at the same time. CONNECT_RETRIES_TIMEOUT is the time for all the tries (0 for
+# no limit) and if CONNECT_RETRY_BUDGET the retries to a host are limited by a budget shared by all its connections
+# (see fdutils.retries)
+CONNECT_TRIES = 1
+CONNECT_RETRY_DELAY = 1
+CONNECT_RETRY_BACKOFF = 2
+CONNECT_RETRY_MAX_DELAY = 30
+CONNECT_RETRY_JITTER = 'decorrelated'
+CONNECT_RETRIES_TIMEOUT = 0
+CONNECT_RETRY_BUDGET = True
+# tries to find the username/login prompt of telnet connections
+TELNET_LOGIN_PROMPT_TRIES = 2
+
+# variable name -> OS environment variable to take its value from if it is not in the settings file
 # ENV_TO_VARS = {}
 
 
@@ -2,6 +2,7 @@ import contextlib
 import io
 import logging
 import os
+import queue
 import select
 import time
 
@@ -273,11 +274,20 @@ class SshConnection(term.IPConnectionWithTerminal, mixins.CanExecuteCommands, mi
 
     def _check_output_nb(self, command, *args, **kwargs):
 
+        last_received = [time.monotonic()]
+
         def put_into_queue(c):
-            rl, wl, xl = select.select([c], [], [], 1)
+            rl, wl, xl = select.select([c], [], [], 0)
             if c in rl:
-                return chan.recv(self.buffer_size).decode(encoding=settings.DECODE_ENCODING_TYPE,
-                                                          errors=settings.DECODE_ERROR_ARGUMENT_VALUE)
+                data = chan.recv(self.buffer_size)
+                if not data:
+                    # the command ended
+                    return fdutils.parallel.POISON_PILL
+                last_received[0] = time.monotonic()
+                return data.decode(encoding=settings.DECODE_ENCODING_TYPE, errors=settings.DECODE_ERROR_ARGUMENT_VALUE)
+            elif time.monotonic() - last_received[0] < 1:
+                # called again when the channel is readable
+                raise queue.Empty
             else:
                 return fdutils.parallel.POISON_PILL
 
@@ -286,7 +296,17 @@ class SshConnection(term.IPConnectionWithTerminal, mixins.CanExecuteCommands, mi
             chan.get_pty()
         chan.settimeout(self.timeout)
         chan.exec_command(command)
-        return dict(target=put_into_queue, args=(chan,)), chan
+        return dict(target=put_into_queue, args=(chan,), wait_readable=chan, readable_timeout=1), chan
+
+    @contextlib.contextmanager
+    def _stream_output(self, command, idle_timeout=None, **kwargs):
+        chan = self.ssh_transport.open_session(**self._pop_window_packet_size(kwargs))
+        try:
+            chan.exec_command(command)
+            yield mixins.iter_lines(lambda: chan.recv(self.buffer_size),
+                                    lambda timeout: bool(select.select([chan], [], [], timeout)[0]), idle_timeout)
+        finally:
+            chan.close()
 
     def _paramiko_exec_command_with_channel(self, command, bufsize=-1, timeout=None, get_pty=False, **kwargs):
         """ copied from paramiko.client but returning the channel so we can reuse it"""
@@ -437,6 +457,7 @@ class SshConnection(term.IPConnectionWithTerminal, mixins.CanExecuteCommands, mi
 
 
 class SshTerminalChannel(channel.TerminalChannel):
+    __slots__ = ()
 
     def send(self, string):
         self.channel.sendall(string.encode(encoding=settings.ENCODE_ENCODING_TYPE,
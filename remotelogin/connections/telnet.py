@@ -5,7 +5,6 @@ import telnetlib
 
 from remotelogin.connections import constants
 
-from fdutils.decorators import retry
 from fdutils import net
 from . import settings
 from .terminal import channel, terminal_connection_wrapper
@@ -61,7 +60,7 @@ class TelnetConnectionUnwrapped(term.IPConnectionWithTerminal):
         self.set_keepalive(self.keep_alive_period, transport=client)
 
         if self.username:
-            self._get_login_prompt(client)
+            self._retry_connect(self._get_login_prompt, client, tries=settings.TELNET_LOGIN_PROMPT_TRIES)
 
         if self.password:
             m = client.expect([re.compile(br"password:\s*", flags=re.I)], self.connect_timeout)
@@ -75,7 +74,6 @@ class TelnetConnectionUnwrapped(term.IPConnectionWithTerminal):
 
         return self
 
-    @retry(2, 5)
     def _get_login_prompt(self, client):
         m = client.expect([re.compile(br'(username|login)(\s\w*)*:', flags=re.I)],
                           self.connect_timeout)
@@ -104,9 +102,10 @@ def TelnetConnection(host='', **kwargs):
 
 
 class TelnetTerminalChannel(channel.TerminalChannel):
+    __slots__ = ()
 
     def send(self, data):
-        self.channel._transport.write(data.encode(encoding=settings.ENCODE_ENCODING_TYPE,
+        self.channel.transport.write(data.encode(encoding=settings.ENCODE_ENCODING_TYPE,
                                                   errors=settings.ENCODE_ERROR_ARGUMENT_VALUE))
 
     def set_keepalive(self, interval=0):
@@ -117,13 +116,13 @@ class TelnetTerminalChannel(channel.TerminalChannel):
 
     @channel.TerminalChannel.timeout.setter
     def timeout(self, timeout):
-        self.channel._transport.sock.settimeout(timeout)
+        self.channel.transport.sock.settimeout(timeout)
         self.channel._timeout = timeout
 
     def recv(self, buffer_size=0):
         # telnet reads until new line or timeout reading
         try:
-            data = self.channel._transport.read_until(b'\n', settings.TELNET_TIMEOUT_RECV)\
+            data = self.channel.transport.read_until(b'\n', settings.TELNET_TIMEOUT_RECV)\
                 .decode(encoding=settings.DECODE_ENCODING_TYPE, errors=settings.DECODE_ERROR_ARGUMENT_VALUE)
             return data if data else constants.SOCKET_RECV_NOT_READY
         except EOFError:
@@ -135,6 +134,6 @@ class TelnetTerminalChannel(channel.TerminalChannel):
                                    255, 250, 31,    # IAC SB NAWS
                                    cols, rows,
                                    255, 240)        # IAC SE
-        self.channel._transport.sock.sendall(naws_command)
+        self.channel.transport.sock.sendall(naws_command)
 
 
@@ -17,6 +17,7 @@ from remotelogin.connections import constants, decorators
 from io import StringIO
 
 from remotelogin.connections.terminal import shells, channel
+from remotelogin.connections.terminal.stats import TerminalStats, OPENMETRICS_PREFIX
 from remotelogin.connections import settings, expect, exceptions, base
 import fdutils
 
@@ -165,6 +166,8 @@ class TerminalConnection(
         decoding_errors=None,
         unbuffered_stream=False,
         remove_empty_on_stream=False,
+        combine_shell_init=None,
+        stats_callback=None,
         **shell_kwargs
     ):
         """
@@ -187,6 +190,10 @@ class TerminalConnection(
             decoding_type (str): the encoding type argument to use when decoding bytes
             decoding_errors (str): the encoding errors argument to use when decoding bytes
             chain_all_expects (bool): set all expect methods to return self instead of expect result object
+            combine_shell_init (bool): flag to indicate that after login we send the history, pty and prompt setup
+                                       as a single line (if the os supports it) instead of one command for each
+            stats_callback (callable): called as stats_callback(stats, cmd, latency) every time a command
+                                       latency is recorded (see stats method)
 
 
         Returns:
@@ -208,6 +215,9 @@ class TerminalConnection(
         self.connections = list(connections)
         self._close_base_on_exit = close_base_on_exit
         self.use_unique_prompt = use_unique_prompt
+        self.combine_shell_init = (
+            settings.COMBINE_SHELL_INIT if combine_shell_init is None else combine_shell_init
+        )
 
         self.stderr_to_tmp = stderr_to_tmp
         self.rtt = rtt
@@ -230,6 +240,7 @@ class TerminalConnection(
         self._chain_all_expects = chain_all_expects
 
         self.sleep_time_after_no_data = settings.SOCKET_TIME_SLEEP_NO_DATA_SELECT
+        self._stats = TerminalStats(callback=stats_callback)
         self._last_cmd_was_hidden = False
 
         self.allow_password_unencrypted = allow_passwords_unencrypted
@@ -336,6 +347,9 @@ class TerminalConnection(
         curr = self.current
         curr.shell.prompt_found = curr.shell.expected_prompt
 
+        if self.combine_shell_init and self._send_shell_init(curr):
+            return self
+
         if curr.os.can_disable_history:
             self.send_cmd_prompt(curr.os.cmd.disable_history())
 
@@ -351,6 +365,41 @@ class TerminalConnection(
 
         return self
 
+    def _send_shell_init(self, curr):
+        """ sends the os compound init line (history, pty size and unique prompt) and waits only once for the
+            new prompt. Returns False if the os/shell does not allow it or if the new prompt is not found after
+            sending it, so the caller does each step on its own
+        """
+        if not (self.use_unique_prompt and curr.shell.can_change_prompt):
+            return False
+
+        new_prompt = self.os.get_unique_prompt()
+        init_line = curr.os.cmd.shell_init(
+            prompt=new_prompt,
+            cols=curr.shell.cols if curr.os.can_resize_pty else 0,
+            rows=curr.shell.rows if curr.os.can_resize_pty else 0,
+            disable_history=curr.os.can_disable_history,
+        )
+        if not init_line:
+            return False
+
+        # nothing left from the login (banners, motd) can be taken for the new prompt
+        self.flush_recv()
+        self.send_cmd(init_line)
+        try:
+            # anchor to the end of a line so the echo of the command itself does not count as the new prompt
+            self.get_new_prompt(
+                new_prompt=re.compile("^" + re.escape(new_prompt) + "$", re.M)
+            )
+        except (exceptions.PromptNotFoundError, ConnectionExpectTimeoutError):
+            log.warning(
+                "The shell did not take the combined init line ({}). Sending each step on its own"
+                "".format(init_line)
+            )
+            return False
+
+        return True
+
     def _close_transport(self):
         if not self.transport:
             return
@@ -469,12 +518,32 @@ class TerminalConnection(
             and return the data received
         """
         data = self.transport.recv(buffer_size or self.buffer_size)
+        self._stats.received(data)
         if data:
             data = fdutils.regex.strip_ansi_codes_from_buffer(data)
             # data = MULTILINE_REDUCER.sub(data, r"\n")
             self.data.new_received(data)
         return data
 
+    def stats(self):
+        """ counters of the session hot path: bytes in/out, recv calls and empty polls, time sleeping, time
+            matching regexes, time waiting for prompts and in expects, flush time and the commands latency
+            histogram (from sending a command until the expect/prompt that follows it)
+
+        Returns:
+            dict
+        """
+        return self._stats.as_dict()
+
+    def stats_openmetrics(self, prefix=OPENMETRICS_PREFIX, **labels):
+        """ stats in OpenMetrics text format. The host label is added if not given """
+        labels.setdefault("host", self.host)
+        return self._stats.to_openmetrics(prefix=prefix, labels=labels)
+
+    def reset_stats(self):
+        self._stats.clear()
+        return self
+
     def recv_wait(self, wait_for, buffer_size=None):
         """ a receive with a timer to wait looping through recv and buffering the received data """
         data = ""
@@ -605,24 +674,31 @@ class TerminalConnection(
         timeout = timeout or terminal.shell.timeout_for_prompt
 
         t0 = time.time()
+        t_wait = time.perf_counter()
 
         while True:
             data = self.recv()
             if data:
                 data_received += data
                 if prompt_regex:
+                    t_regex = time.perf_counter()
                     m = prompt_regex.search(data_received)
+                    self._stats.regex_time += time.perf_counter() - t_regex
                     if m:
                         prompt_found = m.group(0)
                         timer_expired = False
                         break
-                    time.sleep(self.sleep_time_after_no_data)
+                    self._stats.sleep(self.sleep_time_after_no_data)
                     continue
 
             elif (time.time() - t0) > timeout:
                 break
 
-            time.sleep(self.sleep_time_after_no_data)
+            self._stats.sleep(self.sleep_time_after_no_data)
+
+        self._stats.prompt_wait_time += time.perf_counter() - t_wait
+        if prompt_found:
+            self._stats.command_done()
 
         return data_received, timer_expired, prompt_found
 
@@ -653,6 +729,14 @@ class TerminalConnection(
                 "we have not implemented non blocking in terminal mode"
             )
 
+    def _stream_output(self, command, **kwargs):
+        if self._is_current_terminal_socket():
+            return self.current_conn._stream_output(command, **kwargs)
+        else:
+            raise NotImplementedError(
+                "we have not implemented streaming the output of a command in terminal mode"
+            )
+
     def check_output(
         self,
         command,
@@ -719,6 +803,13 @@ class TerminalConnection(
         Returns:
 
         """
+        t_flush = time.perf_counter()
+        try:
+            return self._flush_recv(force_ctrl_c, timeout)
+        finally:
+            self._stats.flush_time += time.perf_counter() - t_flush
+
+    def _flush_recv(self, force_ctrl_c, timeout):
         t0 = time.time()
         flush_data = 1
         while flush_data:
@@ -734,12 +825,12 @@ class TerminalConnection(
         # if we have data and we timedout and force ctrl c is on, send ctrl-c and re-flush
         if remaining_time < 0 and flush_data and force_ctrl_c:
             self.send_ctrl_c()
-            return self.flush_recv(False)
+            return self._flush_recv(False, settings.FLUSH_RECV_TIMEOUT)
 
         elif remaining_time > 0.01:
             sleep_for =  settings.FLUSH_RECV_TIMEOUT/ 5.
-            time.sleep(sleep_for)
-            return self.flush_recv(False, timeout=remaining_time-sleep_for)
+            self._stats.sleep(sleep_for)
+            return self._flush_recv(False, remaining_time - sleep_for)
 
         return self
 
@@ -790,7 +881,7 @@ class TerminalConnection(
             self.flush_recv()
         for cmd in cmds:
             self.send(cmd, True, **send_kwargs)
-            time.sleep(time_between)
+            self._stats.sleep(time_between)
         return self
 
     def send_sudo_cmd(
@@ -871,6 +962,7 @@ class TerminalConnection(
                 cmd += self.new_line
 
         self.transport.send(cmd)
+        self._stats.sent(cmd, is_command=new_line)
         self.last_cmd_sent = cmd
         self.data.new_sent(
             cmd,
@@ -1210,7 +1302,7 @@ class TerminalConnection(
                 stream.write(recv)
 
             else:
-                time.sleep(time_to_sleep_between_recv)
+                self._stats.sleep(time_to_sleep_between_recv)
 
         return stream
 
@@ -1225,16 +1317,34 @@ class TerminalConnection(
         reset_buffer=False,
     ):
         def _check_match(comp_buff):
-            return comp_buff and expect_cmd.find_expected_values_and_prompt_in_buffer(
-                comp_buff, self.prompt
+            if not comp_buff:
+                return comp_buff
+            t_regex = time.perf_counter()
+            try:
+                return expect_cmd.find_expected_values_and_prompt_in_buffer(
+                    comp_buff, self.prompt
+                )
+            finally:
+                self._stats.regex_time += time.perf_counter() - t_regex
+
+        t_expect = time.perf_counter()
+        try:
+            return self._expect_cmd_loop(
+                expect_cmd, _check_match, timeout, reset_on_new_line, buffer_size, reset_buffer
             )
+        finally:
+            self._stats.expect_time += time.perf_counter() - t_expect
 
+    def _expect_cmd_loop(
+        self, expect_cmd, _check_match, timeout, reset_on_new_line, buffer_size, reset_buffer
+    ):
         # accumulated responses from server
         if reset_buffer:
             buff = ""
         else:
             buff = self.data.get_last_recv()
             if buff and _check_match(buff):
+                self._stats.command_done()
                 return expect_cmd
 
         # reset expected values counter in case we are reusing an expect object
@@ -1279,6 +1389,7 @@ class TerminalConnection(
                 buff += recv
 
                 if _check_match(buff):
+                    self._stats.command_done()
                     break
 
                 if reset_on_new_line:
@@ -1287,7 +1398,7 @@ class TerminalConnection(
                         buff = buff[new_line_split:]
 
             else:  # SOCKET_RECV_NOT_READY
-                time.sleep(self.sleep_time_after_no_data)
+                self._stats.sleep(self.sleep_time_after_no_data)
         else:  # no break
             if timer.has_expired:
                 buff = buff[-settings.BUFFER_SIZE_TO_RETURN_WHEN_ERROR :]
@@ -8,6 +8,8 @@ log = logging.getLogger(__name__)
 
 
 class TerminalShell:
+    __slots__ = ("shell", "os")
+
     def __init__(self, conn, **shell_kwargs):
         if hasattr(conn, "username"):
             shell_kwargs.setdefault(
@@ -28,6 +30,8 @@ class TerminalChannel(TerminalShell):
 
     """
 
+    __slots__ = ("channel", "conn")
+
     def __init__(self, conn, channel, **shell_kwargs):
         """
 
@@ -7,6 +7,10 @@ class ShellLoginInformation:
     """ utility class for multilevel logins
 
     """
+    __slots__ = ('connect_timeout', 'timeout_for_prompt', 'number_of_lines_for_prompt', 'new_line', 'banner',
+                 'welcome_message', 'expected_prompt', 'prompt_found', 'can_change_prompt', 'cols', 'rows', 'timeout',
+                 'sudo_list', 'skip_prompt_check', 'ask_response_list', 'pwd', 'disable_history')
+
     # TODO: if arguments are added function pass_args should be changed to reflect it
     def __init__(self,
                  connect_timeout=0,
@@ -43,6 +47,7 @@ class ShellLoginInformation:
         self.number_of_lines_for_prompt = number_of_lines_for_prompt
         self.new_line = new_line
         self.banner = banner_message
+        self.welcome_message = []
         self.expected_prompt = expected_prompt
         self.prompt_found = expected_prompt
         self.can_change_prompt = can_change_prompt
@@ -61,5 +66,6 @@ class ShellLoginInformation:
             setattr(self, attr, getattr(conn, attr))
 
     def update(self, **properties):
-        self.__dict__.update(properties)
+        for k, v in properties.items():
+            setattr(self, k, v)
 
@@ -0,0 +1,166 @@
+import logging
+import time
+
+from fdutils.timer import LatencyHistogram
+from remotelogin.connections import settings
+
+log = logging.getLogger(__name__)
+
+
+__author__ = "Filinto Duran (duranto@gmail.com)"
+
+
+OPENMETRICS_PREFIX = "remotelogin_terminal"
+
+
+class TerminalStats:
+    """ counters of where the time of a terminal session goes. Everything is a plain attribute increment or a
+        perf_counter difference so it can be left on all the time
+
+        bytes_in/bytes_out are the bytes of the text received/sent once encoded (settings.ENCODE_ENCODING_TYPE).
+        Only text that is not ascii has to be encoded to count them
+    """
+
+    COUNTERS = (
+        "bytes_in",
+        "bytes_out",
+        "recv_calls",
+        "empty_polls",
+        "commands",
+        "sleep_time",
+        "regex_time",
+        "prompt_wait_time",
+        "expect_time",
+        "flush_time",
+    )
+
+    __slots__ = COUNTERS + ("command_latency", "callback", "_cmd", "_cmd_start")
+
+    def __init__(self, callback=None):
+        """
+
+        Args:
+            callback (callable): if given it is called as callback(stats, cmd, latency) every time a command
+                                 latency is recorded
+        """
+        self.callback = callback
+        self.command_latency = LatencyHistogram()
+        self.clear()
+
+    def clear(self):
+        for c in self.COUNTERS:
+            setattr(self, c, 0)
+        self.command_latency.clear()
+        self._cmd = None
+        self._cmd_start = 0.
+
+    def sleep(self, secs):
+        time.sleep(secs)
+        self.sleep_time += secs
+
+    def received(self, data):
+        self.recv_calls += 1
+        if data:
+            self.bytes_in += _size(data)
+        else:
+            self.empty_polls += 1
+
+    def sent(self, data, is_command=False):
+        self.bytes_out += _size(data)
+        if is_command:
+            self._cmd = data
+            self._cmd_start = time.perf_counter()
+
+    def command_done(self):
+        """ closes the latency measure of the last command sent (if any is pending) """
+        if self._cmd is None:
+            return
+
+        latency = time.perf_counter() - self._cmd_start
+        cmd, self._cmd = self._cmd, None
+        self.commands += 1
+        self.command_latency.observe(latency)
+
+        if self.callback is not None:
+            try:
+                self.callback(self, cmd, latency)
+            except Exception:
+                log.exception("problems calling the stats callback")
+
+    def as_dict(self):
+        ret = {c: getattr(self, c) for c in self.COUNTERS}
+        ret["command_latency"] = self.command_latency.as_dict()
+        return ret
+
+    def to_openmetrics(self, prefix=OPENMETRICS_PREFIX, labels=None):
+        return to_openmetrics(self.as_dict(), prefix=prefix, labels=labels)
+
+
+def _size(data):
+    """ bytes of the data (text is encoded only if it is not ascii) """
+    if isinstance(data, bytes) or data.isascii():
+        return len(data)
+    return len(data.encode(encoding=settings.ENCODE_ENCODING_TYPE, errors=settings.ENCODE_ERROR_ARGUMENT_VALUE))
+
+
+def _format_labels(labels, extra=None):
+    labels = dict(labels or {})
+    if extra:
+        labels.update(extra)
+    if not labels:
+        return ""
+    return (
+        "{"
+        + ",".join(
+            '{}="{}"'.format(k, str(v).replace("\\", r"\\").replace('"', r"\""))
+            for k, v in sorted(labels.items())
+        )
+        + "}"
+    )
+
+
+def _format_float(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+def to_openmetrics(stats, prefix=OPENMETRICS_PREFIX, labels=None):
+    """ converts the dictionary returned by TerminalConnection.stats() to OpenMetrics text exposition format
+
+    Args:
+        stats (dict): stats dictionary
+        prefix (str): metric names prefix
+        labels (dict): labels to add to every metric (i.e. dict(host='myhost'))
+
+    Returns:
+        str
+    """
+    lines = []
+    lbl = _format_labels(labels)
+
+    for name in TerminalStats.COUNTERS:
+        if name not in stats:
+            continue
+        if name.endswith("_time"):
+            metric = "{}_{}_seconds".format(prefix, name[: -len("_time")])
+        else:
+            metric = "{}_{}".format(prefix, name)
+        lines.append("# TYPE {} counter".format(metric))
+        lines.append("{}_total{} {}".format(metric, lbl, stats[name]))
+
+    latency = stats.get("command_latency")
+    if latency:
+        metric = prefix + "_command_latency_seconds"
+        lines.append("# TYPE {} histogram".format(metric))
+        for le, count in latency["buckets"]:
+            lines.append(
+                "{}_bucket{} {}".format(
+                    metric, _format_labels(labels, dict(le=_format_float(le))), count
+                )
+            )
+        lines.append("{}_sum{} {}".format(metric, lbl, latency["sum"]))
+        lines.append("{}_count{} {}".format(metric, lbl, latency["count"]))
+
+    lines.append("# EOF")
+    return "\n".join(lines) + "\n"
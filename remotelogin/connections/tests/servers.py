@@ -0,0 +1,541 @@
+""" in-process stand-in servers used by the tests and the benchmarks so they do not need a real host
+
+    - FakeShell: a tiny line based shell that understands what remotelogin sends after login (prompt, stty,
+      history) and a few commands to generate output
+    - SshServer: paramiko ServerInterface with password auth, pty/shell, exec, sftp and direct-tcpip (proxyjump)
+    - TelnetServer: asyncio telnet server with login/password prompts and the fake shell
+
+    Servers can be started in a child process (start_in_subprocess) so their cpu/memory does not get mixed
+    with the client side measurements
+"""
+import asyncio
+import logging
+import multiprocessing
+import os
+import re
+import select
+import shlex
+import socket
+import tempfile
+import threading
+
+import paramiko
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+DEFAULT_USERNAME = 'bench'
+DEFAULT_PASSWORD = 'bench'
+DEFAULT_HOSTNAME = 'benchhost'
+DEFAULT_PROMPT = DEFAULT_HOSTNAME + '$ '
+
+# regex of DEFAULT_PROMPT to pass as expected_prompt so opening does not wait for the prompt timeout
+DEFAULT_PROMPT_RE = re.escape(DEFAULT_HOSTNAME) + r'\$ '
+
+PS1_RE = re.compile(r"""^export PS1=(['"])(?P<prompt>.*)\1$""")
+
+IAC, SB, SE = 255, 250, 240
+WILL, WONT, DO, DONT = 251, 252, 253, 254
+
+
+class FakeShell:
+    """ minimal shell. Commands can be chained with ';' and known commands are:
+
+        export PS1='...', set +o/-o history, stty ..., echo ..., hostname, whoami, true, cd, exit,
+        lines N [width] (prints N numbered lines of width chars), bytes N (prints N bytes in lines of 80 chars)
+    """
+
+    def __init__(self, prompt=DEFAULT_PROMPT, hostname=DEFAULT_HOSTNAME, username=DEFAULT_USERNAME):
+        self.prompt = prompt
+        self.hostname = hostname
+        self.username = username
+        self.exited = False
+
+    def run(self, line):
+        out = []
+        for cmd in (c.strip() for c in line.split(';')):
+            if cmd:
+                out.append(self._run_one(cmd))
+        return ''.join(out)
+
+    def _run_one(self, cmd):
+        if cmd.endswith('2>&1'):
+            cmd = cmd[:-len('2>&1')].strip()
+
+        m = PS1_RE.match(cmd)
+        if m:
+            self.prompt = m.group('prompt')
+            return ''
+
+        try:
+            args = shlex.split(cmd)
+        except ValueError:
+            args = cmd.split()
+
+        name, args = args[0], args[1:]
+
+        if name in ('set', 'stty', 'true', 'cd', 'export', 'unset'):
+            return ''
+        elif name == 'echo':
+            return ' '.join(args) + '\n'
+        elif name == 'hostname':
+            return self.hostname + '\n'
+        elif name == 'whoami':
+            return self.username + '\n'
+        elif name == 'exit':
+            self.exited = True
+            return ''
+        elif name == 'lines':
+            count = int(args[0])
+            width = int(args[1]) if len(args) > 1 else 80
+            return ''.join('{:0{}d}'.format(i, width) + '\n' for i in range(count))
+        elif name == 'bytes':
+            size = int(args[0])
+            full, rest = divmod(size, 80)
+            return ('x' * 79 + '\n') * full + ('x' * (rest - 1) + '\n' if rest > 1 else '')
+
+        return 'fakesh: {}: command not found\n'.format(name)
+
+
+class LineBuffer:
+    """ pty-like line discipline: echoes what it gets, returns complete lines and converts \\n to \\r\\n """
+
+    def __init__(self, echo=True):
+        self.echo = echo
+        self._buffer = ''
+
+    def feed(self, data):
+        """ returns (data to echo back, list of complete lines) """
+        data = data.replace('\r\n', '\n').replace('\r', '\n')
+        self._buffer += data
+        *lines, self._buffer = self._buffer.split('\n')
+        return (to_crlf(data) if self.echo else ''), lines
+
+
+def to_crlf(data):
+    return data.replace('\n', '\r\n')
+
+
+def strip_telnet_commands(data):
+    """ removes telnet IAC sequences (NAWS, NOP, option negotiations) from the client data """
+    out = bytearray()
+    i = 0
+    size = len(data)
+    while i < size:
+        b = data[i]
+        if b != IAC:
+            out.append(b)
+            i += 1
+        elif i + 1 < size and data[i + 1] == SB:
+            end = data.find(bytes((IAC, SE)), i + 2)
+            i = size if end == -1 else end + 2
+        elif i + 1 < size and data[i + 1] in (WILL, WONT, DO, DONT):
+            i += 3
+        else:
+            i += 2
+    return bytes(out)
+
+
+# #############################          SSH          #########################
+
+class _StubSFTPHandle(paramiko.SFTPHandle):
+
+    def stat(self):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.fstat(self.readfile.fileno()))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def chattr(self, attr):
+        return paramiko.SFTP_OK
+
+
+class _StubSFTPServer(paramiko.SFTPServerInterface):
+    """ sftp served from a local folder """
+
+    def __init__(self, server, root, *args, **kwargs):
+        super().__init__(server, *args, **kwargs)
+        self.root = root
+
+    def _realpath(self, path):
+        return os.path.join(self.root, self.canonicalize(path).lstrip('/'))
+
+    def list_folder(self, path):
+        path = self._realpath(path)
+        try:
+            ret = []
+            for name in os.listdir(path):
+                attr = paramiko.SFTPAttributes.from_stat(os.stat(os.path.join(path, name)))
+                attr.filename = name
+                ret.append(attr)
+            return ret
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    def stat(self, path):
+        try:
+            return paramiko.SFTPAttributes.from_stat(os.stat(self._realpath(path)))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+    lstat = stat
+
+    def open(self, path, flags, attr):
+        path = self._realpath(path)
+        try:
+            fd = os.open(path, flags | getattr(os, 'O_BINARY', 0), getattr(attr, 'st_mode', None) or 0o666)
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+
+        if flags & os.O_WRONLY:
+            mode = 'ab' if flags & os.O_APPEND else 'wb'
+        elif flags & os.O_RDWR:
+            mode = 'a+b' if flags & os.O_APPEND else 'r+b'
+        else:
+            mode = 'rb'
+
+        f = os.fdopen(fd, mode)
+        handle = _StubSFTPHandle(flags)
+        handle.filename = path
+        handle.readfile = handle.writefile = f
+        return handle
+
+    def remove(self, path):
+        try:
+            os.remove(self._realpath(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def rename(self, oldpath, newpath):
+        try:
+            os.rename(self._realpath(oldpath), self._realpath(newpath))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def mkdir(self, path, attr):
+        try:
+            os.mkdir(self._realpath(path))
+        except OSError as e:
+            return paramiko.SFTPServer.convert_errno(e.errno)
+        return paramiko.SFTP_OK
+
+    def chattr(self, path, attr):
+        return paramiko.SFTP_OK
+
+
+class _SshServerInterface(paramiko.ServerInterface):
+
+    def __init__(self, server):
+        self.server = server
+        self.tunnels = {}
+
+    def get_allowed_auths(self, username):
+        return 'password'
+
+    def check_auth_password(self, username, password):
+        if username == self.server.username and password == self.server.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == 'session':
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_direct_tcpip_request(self, chanid, origin, destination):
+        self.tunnels[chanid] = destination
+        return paramiko.OPEN_SUCCEEDED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_window_change_request(self, channel, width, height, pixelwidth, pixelheight):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        threading.Thread(target=_serve_ssh_shell, args=(channel, self.server.new_shell()), daemon=True).start()
+        return True
+
+    def check_channel_exec_request(self, channel, command):
+        threading.Thread(target=_serve_ssh_exec, args=(channel, self.server.new_shell(), command),
+                         daemon=True).start()
+        return True
+
+
+def _serve_ssh_shell(channel, shell):
+    lines = LineBuffer()
+    try:
+        channel.sendall(('Welcome to ' + shell.hostname + '\r\n' + shell.prompt).encode())
+        while not shell.exited:
+            data = channel.recv(1 << 15)
+            if not data:
+                break
+            echo, complete = lines.feed(data.decode(errors='ignore'))
+            out = [echo]
+            for line in complete:
+                out.append(to_crlf(shell.run(line)))
+                if shell.exited:
+                    break
+                out.append(shell.prompt)
+            channel.sendall(''.join(out).encode())
+    except (OSError, EOFError):
+        pass
+    finally:
+        _close_quietly(channel)
+
+
+def _serve_ssh_exec(channel, shell, command):
+    try:
+        channel.sendall(shell.run(command.decode(errors='ignore')).encode())
+        channel.send_exit_status(0)
+    except (OSError, EOFError):
+        pass
+    finally:
+        _close_quietly(channel)
+
+
+def _pump(channel, sock):
+    """ moves data between a direct-tcpip channel and the socket to its destination """
+    try:
+        while True:
+            r, _, _ = select.select([channel, sock], [], [])
+            if channel in r:
+                data = channel.recv(1 << 15)
+                if not data:
+                    break
+                sock.sendall(data)
+            if sock in r:
+                data = sock.recv(1 << 15)
+                if not data:
+                    break
+                channel.sendall(data)
+    except (OSError, EOFError):
+        pass
+    finally:
+        _close_quietly(sock)
+        _close_quietly(channel)
+
+
+def _close_quietly(o):
+    try:
+        o.close()
+    except Exception:
+        pass
+
+
+class _Server:
+    """ common start/stop and context manager of the stand-in servers """
+
+    def __init__(self, host='127.0.0.1', port=0, username=DEFAULT_USERNAME, password=DEFAULT_PASSWORD,
+                 prompt=DEFAULT_PROMPT, hostname=DEFAULT_HOSTNAME):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.prompt = prompt
+        self.hostname = hostname
+        self._thread = None
+        self._stop = threading.Event()
+
+    def new_shell(self):
+        return FakeShell(self.prompt, self.hostname, self.username)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        raise NotImplementedError
+
+    def stop(self):
+        self._stop.set()
+
+
+class SshServer(_Server):
+    """ ssh server with a fake shell, exec, sftp (served from root folder) and direct-tcpip tunnels """
+
+    def __init__(self, root=None, host_key=None, **kwargs):
+        super().__init__(**kwargs)
+        self.root = root or tempfile.mkdtemp(prefix='remotelogin_bench_')
+        self.host_key = host_key or paramiko.RSAKey.generate(2048)
+        self._sock = None
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.host, self.port))
+        self._sock.listen(100)
+        self._sock.settimeout(0.2)
+        self.port = self._sock.getsockname()[1]
+        self._thread = threading.Thread(target=self._accept_loop, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        super().stop()
+        _close_quietly(self._sock)
+
+    def _accept_loop(self):
+        while not self._stop.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            threading.Thread(target=self._serve_transport, args=(client,), daemon=True).start()
+
+    def _serve_transport(self, client):
+        transport = paramiko.Transport(client)
+        transport.add_server_key(self.host_key)
+        transport.set_subsystem_handler('sftp', paramiko.SFTPServer, _StubSFTPServer, self.root)
+        server = _SshServerInterface(self)
+        try:
+            transport.start_server(server=server)
+        except (paramiko.SSHException, EOFError, OSError):
+            return
+
+        while transport.is_active() and not self._stop.is_set():
+            channel = transport.accept(0.5)
+            if channel is None:
+                continue
+            destination = server.tunnels.pop(channel.get_id(), None)
+            if destination is not None:
+                try:
+                    sock = socket.create_connection(destination)
+                except OSError:
+                    channel.close()
+                    continue
+                threading.Thread(target=_pump, args=(channel, sock), daemon=True).start()
+
+        transport.close()
+
+
+# #############################          TELNET          #########################
+
+class TelnetServer(_Server):
+    """ asyncio telnet server asking for login/password and then running a fake shell """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._loop = None
+        self._server = None
+        self._started = threading.Event()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run_loop, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._server.close()
+            pending = asyncio.all_tasks(self._loop)
+            for task in pending:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*pending, return_exceptions=True))
+            self._loop.close()
+
+    def stop(self):
+        super().stop()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+
+    async def _read_line(self, reader, lines):
+        while True:
+            data = await reader.read(1 << 15)
+            if not data:
+                return None
+            _, complete = lines.feed(strip_telnet_commands(data).decode(errors='ignore'))
+            if complete:
+                return complete[0]
+
+    async def _handle(self, reader, writer):
+        try:
+            writer.write(b'login: ')
+            await writer.drain()
+            username = await self._read_line(reader, LineBuffer(echo=False))
+            writer.write(b'\r\nPassword: ')
+            await writer.drain()
+            password = await self._read_line(reader, LineBuffer(echo=False))
+
+            if username is None or (username.strip(), (password or '').strip()) != (self.username, self.password):
+                writer.write(b'\r\nLogin incorrect\r\n')
+                return
+
+            shell = self.new_shell()
+            lines = LineBuffer()
+            writer.write(('\r\nWelcome to ' + shell.hostname + '\r\n' + shell.prompt).encode())
+            await writer.drain()
+
+            while not shell.exited:
+                data = await reader.read(1 << 15)
+                if not data:
+                    break
+                echo, complete = lines.feed(strip_telnet_commands(data).decode(errors='ignore'))
+                out = [echo]
+                for line in complete:
+                    out.append(to_crlf(shell.run(line)))
+                    if shell.exited:
+                        break
+                    out.append(shell.prompt)
+                writer.write(''.join(out).encode())
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+
+SERVERS = dict(ssh=SshServer, telnet=TelnetServer)
+
+
+def _subprocess_main(kind, kwargs, port_queue, stop_event):
+    # clients dropping the connection on close is expected, do not let paramiko report it on stderr
+    logging.getLogger('paramiko').setLevel(logging.CRITICAL)
+    server = SERVERS[kind](**kwargs).start()
+    port_queue.put(server.port)
+    stop_event.wait()
+    server.stop()
+
+
+class ServerProcess:
+    """ runs one of the SERVERS in a child process. Use as context manager or call stop() """
+
+    def __init__(self, kind, **kwargs):
+        ctx = multiprocessing.get_context('spawn')
+        self._stop = ctx.Event()
+        port_queue = ctx.Queue()
+        self.process = ctx.Process(target=_subprocess_main, args=(kind, kwargs, port_queue, self._stop), daemon=True)
+        self.process.start()
+        self.port = port_queue.get(timeout=60)
+        self.host = kwargs.get('host', '127.0.0.1')
+
+    def stop(self):
+        self._stop.set()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.terminate()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def start_in_subprocess(kind, **kwargs):
+    return ServerProcess(kind, **kwargs)
@@ -0,0 +1,35 @@
+from fdutils.timer import LatencyHistogram
+from remotelogin.connections.terminal import stats
+
+
+def test_terminal_stats_in_openmetrics_format():
+    terminal_stats = stats.TerminalStats()
+    terminal_stats.command_latency = LatencyHistogram(buckets=(0.5,))
+    terminal_stats.sent('ls\n', is_command=True)
+    terminal_stats.received('')
+    terminal_stats.received('file\n')
+    terminal_stats.command_done()
+    terminal_stats.command_latency.observe(2)
+    terminal_stats.regex_time = 0.25
+
+    text = terminal_stats.to_openmetrics(prefix='term', labels=dict(host='my"host'))
+    lines = text.splitlines()
+    assert lines[:4] == ['# TYPE term_bytes_in counter', 'term_bytes_in_total{host="my\\"host"} 5',
+                         '# TYPE term_bytes_out counter', 'term_bytes_out_total{host="my\\"host"} 3']
+    assert 'term_regex_seconds_total{host="my\\"host"} 0.25' in lines
+    assert 'term_empty_polls_total{host="my\\"host"} 1' in lines
+    histogram = lines[lines.index('# TYPE term_command_latency_seconds histogram'):]
+    assert histogram[1:3] == ['term_command_latency_seconds_bucket{host="my\\"host",le="0.5"} 1',
+                              'term_command_latency_seconds_bucket{host="my\\"host",le="+Inf"} 2']
+    assert histogram[4:] == ['term_command_latency_seconds_count{host="my\\"host"} 2', '# EOF']
+    assert text.endswith('# EOF\n')
+
+    assert stats.to_openmetrics({}) == '# EOF\n'
+
+
+def test_bytes_counted_encoded():
+    terminal_stats = stats.TerminalStats()
+    terminal_stats.sent('caf\u00e9\n')
+    terminal_stats.received('\u2500\u2500')
+    terminal_stats.received(b'\xe2\x94\x80')
+    assert (terminal_stats.bytes_out, terminal_stats.bytes_in) == (6, 9)
@@ -0,0 +1,55 @@
+from remotelogin.connections.tests import servers
+from remotelogin.connections.telnet import TelnetConnectionUnwrapped
+from remotelogin.connections.terminal import TerminalConnection
+
+
+class NoChainingShell(servers.FakeShell):
+    """ shell that does not understand commands chained with ';' """
+
+    def run(self, line):
+        if ';' in line:
+            return 'fakesh: syntax error near unexpected token ;\n'
+        return super().run(line)
+
+
+class NoChainingTelnetServer(servers.TelnetServer):
+
+    def new_shell(self):
+        return NoChainingShell(self.prompt, self.hostname, self.username)
+
+
+def terminal(server):
+    return TerminalConnection([TelnetConnectionUnwrapped(server.host, port=server.port,
+                                                         username=servers.DEFAULT_USERNAME,
+                                                         password=servers.DEFAULT_PASSWORD,
+                                                         expected_prompt=servers.DEFAULT_PROMPT_RE,
+                                                         timeout_for_prompt=1, can_change_prompt=True)])
+
+
+def test_shell_init_combined_in_one_line():
+    with servers.TelnetServer() as server:
+        with terminal(server) as conn:
+            assert conn.check_output('whoami') == servers.DEFAULT_USERNAME
+            sent = [e.sent for e in conn.data.exchanges()]
+        assert sum('; ' in s for s in sent) == 1 and not any(s.startswith('export PS1') for s in sent)
+
+
+def test_shell_init_falls_back_to_one_step_at_a_time():
+    with NoChainingTelnetServer() as server:
+        with terminal(server) as conn:
+            assert conn.check_output('whoami') == servers.DEFAULT_USERNAME
+            assert conn.check_output('hostname') == servers.DEFAULT_HOSTNAME
+            sent = [e.sent for e in conn.data.exchanges()]
+        # the combined line and then every step on its own
+        assert sum('; ' in s for s in sent) == 1 and any(s.startswith('export PS1') for s in sent)
+
+
+def test_live_session_counts_its_traffic():
+    with servers.TelnetServer() as server:
+        with terminal(server) as conn:
+            conn.reset_stats()
+            assert conn.check_output('whoami') == servers.DEFAULT_USERNAME
+            counters = conn.stats()
+    assert counters['bytes_out'] >= len('whoami\n') and counters['bytes_in'] >= len(servers.DEFAULT_USERNAME)
+    assert counters['recv_calls'] >= 1 and counters['commands'] == 1
+    assert counters['command_latency']['count'] == 1 and counters['regex_time'] > 0
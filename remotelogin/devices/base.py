@@ -1,6 +1,8 @@
+import contextlib
 import logging
 import os
 import threading
+import time
 import weakref
 
 from sqlalchemy import orm, Column, Integer, String, Boolean, TypeDecorator, Binary, UniqueConstraint
@@ -9,6 +11,7 @@ from sqlalchemy.ext.hybrid import hybrid_property
 from remotelogin import oper_sys
 from remotelogin.connections import settings
 from remotelogin.devices.exceptions import ConnectionInstanceOpenError
+from remotelogin.devices import settings as device_settings
 from remotelogin.devices.settings import DEFAULT_STORAGE_FOLDER, ENCRYPT_PASSWORDS_IN_DB, LOCATION
 
 import fdutils as utils
@@ -20,6 +23,29 @@ from . import managers
 
 log = logging.getLogger(__name__)
 
+# attributes created by DeviceBase.hydrate. A device loaded lazily from the db is hydrated the first time any of them,
+# any other public attribute it does not have (like the connection methods it forwards), crypto_engine or
+# encrypt_salt are used
+HYDRATED_ATTRIBUTES = frozenset(('conn', 'files', 'users', 'interfaces', 'tunnels', 'cmd', 'lock', '_services'))
+
+_lazy_loading = threading.local()
+
+
+@contextlib.contextmanager
+def lazy_loading():
+    """ devices loaded from the db inside this context are not decrypted nor get their managers until they are used
+    """
+    previous = getattr(_lazy_loading, 'enabled', False)
+    _lazy_loading.enabled = True
+    try:
+        yield
+    finally:
+        _lazy_loading.enabled = previous
+
+
+def is_lazy_loading():
+    return device_settings.LAZY_LOAD_FROM_DB or getattr(_lazy_loading, 'enabled', False)
+
 
 class OSColumn(ToJSONCapable):
     """Enables OS class storage by encoding and decoding on the fly."""
@@ -62,7 +88,7 @@ class DeviceBase:
     os_version = Column(String, default='')
     model = Column(String, default='')
     encrypt_passwords = Column(Boolean, default=False)
-    encrypt_salt = Column(Binary)
+    _encrypt_salt = Column('encrypt_salt', Binary)
     save_conversations = Column(Boolean, default=True)
     os = Column(OSColumn)
     folder = Column(String, default='')
@@ -74,13 +100,16 @@ class DeviceBase:
     tunnelsjson = Column('tunnels', ToJSONCapable)
     usersjson = Column('users', ToJSONCapable)
     interfacesjson = Column('interfaces', ToJSONCapable)
-    #facts = Column(ToJSONCapable)
+    # fact name -> dict(timestamp=epoch when collected, value=fact as json) see get_facts
+    factsjson = Column('facts', ToJSONCapable)
 
     __table_args__ = (
         UniqueConstraint('host', 'location', 'serial'),
     )
 
-    crypto_engine = None
+    # (host, ip_type) of a device created with resolve_host=False until its host is resolved
+    _unresolved_host = None
+    _unresolved_interface = 'default'
 
     EXPECTED_PROMPT = None
 
@@ -88,7 +117,7 @@ class DeviceBase:
                  storage_path='', users=None, connections=None, interfaces=None, tunnels=None,
                  save_conversations=True, ip_type='ipv4', encrypt_passwords=False,
                  serial='', vendor='', hw_version='', os_version='', model='', fw_version='',
-                 hostname='', admin='None', group='', can_change_prompt=None, facts=None):
+                 hostname='', admin='None', group='', can_change_prompt=None, facts=None, resolve_host=None):
         """ initializes the device
 
         Args:
@@ -102,7 +131,9 @@ class DeviceBase:
             connections (dict): dictionary to be passed to managers.connections.Connection.add_connections
             ip_type (str): ipv4 or ipv6
             save_conversations (bool): save conversations of connections or not [True]
-            facts (dict): facts about the device (memory, processes, commands available, etc.)
+            facts (dict): facts about the device (memory, processes, commands available, etc.) stored as collected now
+            resolve_host (bool): look up the host ip address now or on the first connection (see resolve_hosts to
+                                 resolve many devices at once). Defaults to settings.RESOLVE_HOST_ON_CREATION
         """
         self.id = None
         self._host = hostname or host
@@ -125,21 +156,141 @@ class DeviceBase:
         self.os_version = os_version
         self.fw_version = fw_version
         self.model = model
+        self.factsjson = {}
 
         # managers
         self.conn = self.files = self.users = self.interfaces = self.tunnels = None
 
         self.cmd = None
         self.os = self.init_os(os_name)
+        if facts:
+            self.set_facts(facts)
         self.encrypt_passwords = encrypt_passwords
         self.lock = self._services = self.encrypt_salt = self.crypto_engine = None
 
         self.init(users=users, connections=connections, interfaces=interfaces, tunnels=tunnels)
 
+        if resolve_host is None:
+            resolve_host = device_settings.RESOLVE_HOST_ON_CREATION
+
+        if default_ip_address or resolve_host or not host:
+            self._add_default_interface(host, default_ip_address, ip_type)
+        else:
+            self._unresolved_host = (host, ip_type)
+
+    def _add_default_interface(self, host, default_ip_address=None, ip_type='ipv4', name='default'):
         # default connection will use this to connect to it
         default_ip_address = get_ip_from_default_or_hostname(host, default_ip_address, ip_type)
         if default_ip_address and default_ip_address not in self.interfaces.ip_addresses:
-            self.interfaces.add('default', ip=default_ip_address)
+            self.interfaces.add(name, ip=default_ip_address)
+        return default_ip_address
+
+    @property
+    def unresolved_host(self):
+        """ (host, ip_type) if the host of the device has not been resolved yet """
+        return self._unresolved_host
+
+    def resolve_host(self, ip_address=None):
+        """ looks up the host of a device created with resolve_host=False (or given a new host) and adds it as an
+            interface. If it can not be resolved the host stays unresolved and is looked up again the next time (the
+            failure is cached for a while by fdutils.net.default_resolver)
+
+        Args:
+            ip_address (str): address already looked up for the host ('' if it could not be resolved) so it is not
+                              looked up again
+
+        """
+        if self._unresolved_host:
+            with self.lock:
+                if self._unresolved_host:
+                    host, ip_type = self._unresolved_host
+                    if ip_address is None or ip_address:
+                        ip_address = self._add_default_interface(host, ip_address, ip_type, self._unresolved_interface)
+                    if ip_address:
+                        self._unresolved_host = None
+
+    def set_facts(self, facts, timestamp=None):
+        """ stores the facts (fact name -> fact) as collected at timestamp (now by default) """
+        timestamp = time.time() if timestamp is None else timestamp
+        stored = dict(self.factsjson or {})    # a new dict so the db column is seen as modified
+        for name, value in facts.items():
+            stored[name] = dict(timestamp=timestamp, value=self.os.facts_to_json(name, value))
+        self.factsjson = stored
+
+    def facts_timestamp(self, name):
+        """ epoch when the fact was collected or None if there is none stored """
+        stored = (self.factsjson or {}).get(name)
+        return stored['timestamp'] if stored else None
+
+    def stale_facts(self, names=(), max_age=None):
+        """ the facts (of names or the default ones) that are not stored or are older than max_age seconds """
+        max_age = device_settings.FACTS_MAX_AGE if max_age is None else max_age
+        oldest = time.time() - max_age
+        stale = []
+        for name in names or device_settings.FACTS or self.os.FACTS:
+            timestamp = self.facts_timestamp(name)
+            if timestamp is None or timestamp < oldest:
+                stale.append(name)
+        return stale
+
+    def _fact_names(self, names):
+        """ the names given (or the default ones) checked against the facts of the os """
+        names = names or tuple(device_settings.FACTS or self.os.FACTS)
+        unknown = [name for name in names if name not in self.os.FACTS]
+        if unknown:
+            raise ValueError('Unknown facts: {}. The facts of {} are: {}'.format(
+                ', '.join(unknown), self.os.__class__.__name__, ', '.join(self.os.FACTS) or 'none'))
+        return names
+
+    def refresh_facts(self, *names, conn=None):
+        """ collects the facts (the default ones if no names) from the device with one command and stores them
+
+        Args:
+            *names: facts to collect. See the FACTS of the device os
+            conn: connection to use. A session leased from the default connection pool if not given
+
+        Raises:
+            ValueError: if a name is not a fact of the device os
+
+        """
+        names = self._fact_names(names)
+        if conn is None:
+            with self.conn.lease() as conn:
+                facts = self.os.get_facts(*names, conn=conn)
+        else:
+            facts = self.os.get_facts(*names, conn=conn)
+
+        with self.lock:
+            self.set_facts(facts)
+        return facts
+
+    def get_facts(self, *names, max_age=None, conn=None):
+        """ the stored facts of the device. Only the ones missing or older than max_age seconds are collected again
+            (all of them in one command)
+
+            device.get_facts('memory', 'file_systems', max_age=60)['memory'].free
+
+        Args:
+            *names: facts to return. The default ones (settings.FACTS or every fact of the os) if not given
+            max_age (float): seconds a stored fact is still good (settings.FACTS_MAX_AGE by default)
+            conn: connection to use to refresh the facts
+
+        Returns:
+            dict: fact name -> fact
+
+        Raises:
+            ValueError: if a name is not a fact of the device os or the os did not return it
+
+        """
+        names = self._fact_names(names)
+        stale = self.stale_facts(names, max_age)
+        refreshed = self.refresh_facts(*stale, conn=conn) if stale else {}
+        stored = self.factsjson or {}
+        missing = [name for name in names if name not in refreshed and name not in stored]
+        if missing:
+            raise ValueError('{} did not return the facts: {}'.format(self.os.__class__.__name__, ', '.join(missing)))
+        return {name: refreshed[name] if name in refreshed else self.os.facts_from_json(name, stored[name]['value'])
+                for name in names}
 
     @property
     def connections(self):
@@ -147,19 +298,47 @@ class DeviceBase:
 
     @property
     def default_ip_address(self):
+        self.resolve_host()
         if self.interfaces.default:
             return self.interfaces.default.default_ip
         return ''
 
+    @property
+    def crypto_engine(self):
+        """ fdutils.crypto.SecuredTextEngine of the passwords of the device (None if they are not encrypted) """
+        self._lazy_hydrate()
+        return self.__dict__.get('_crypto_engine')
+
+    @crypto_engine.setter
+    def crypto_engine(self, crypto_engine):
+        self.__dict__['_crypto_engine'] = crypto_engine
+
+    @hybrid_property
+    def encrypt_salt(self):
+        self._lazy_hydrate()
+        return self._encrypt_salt
+
+    @encrypt_salt.setter
+    def encrypt_salt(self, salt):
+        self._encrypt_salt = salt
+
+    @encrypt_salt.expression
+    def encrypt_salt(cls):
+        return cls._encrypt_salt
+
     @hybrid_property
     def host(self):
         return self._host
 
     @host.setter
     def host(self, host):
-        host_ip = get_ip_from_default_or_hostname(host)
-        if host_ip and host_ip not in self.interfaces.ip_addresses:
-            self.interfaces.add(host, ip=host_ip)
+        # looked up as the host given when creating the device: now or (with settings.RESOLVE_HOST_ON_CREATION off)
+        # on the first connection or with resolve_hosts. Only one host waits to be resolved at a time
+        self.resolve_host()
+        self._unresolved_host = (host, '')
+        self._unresolved_interface = host
+        if device_settings.RESOLVE_HOST_ON_CREATION:
+            self.resolve_host()
 
     def init_os(self, os_name):
         if isinstance(os_name, oper_sys.base.OSBase):
@@ -171,6 +350,44 @@ class DeviceBase:
 
     @orm.reconstructor
     def init(self, **kwargs):
+        if not kwargs and is_lazy_loading():
+            # loaded from the db as a light record. hydrate will be called the first time a manager is needed
+            for attr in HYDRATED_ATTRIBUTES:
+                self.__dict__.pop(attr, None)
+            self.__dict__['_hydrated'] = False
+            return
+
+        self.hydrate(**kwargs)
+
+    @property
+    def is_hydrated(self):
+        return self.__dict__.get('_hydrated', True) is True
+
+    def hydrate(self, **kwargs):
+        """ decrypts the credentials, creates the managers and adds to them the users, tunnels, interfaces and
+            connections stored in the db columns (or given in kwargs)
+        """
+        self.__dict__['_hydrated'] = None    # in progress
+        try:
+            self._hydrate(**kwargs)
+        except Exception:
+            self.__dict__['_hydrated'] = False
+            raise
+        self.__dict__['_hydrated'] = True
+
+    def _lazy_hydrate(self):
+        """ hydrates a device loaded lazily. Returns False if it is being hydrated by this thread """
+        if self.__dict__.get('_hydrated', True) is True:
+            return True
+        # one lock per device (dict.setdefault is atomic so concurrent first uses get the same one)
+        with self.__dict__.setdefault('_hydrate_lock', threading.RLock()):
+            state = self.__dict__.get('_hydrated', True)
+            if state is False:
+                self.hydrate()
+            # None: used by hydrate itself
+            return state is not None
+
+    def _hydrate(self, **kwargs):
 
         self.crypto_engine = None
 
@@ -240,6 +457,12 @@ class DeviceBase:
 
     def __getattr__(self, item):
         """ defaults to send commands to the default connection """
+        if self.__dict__.get('_hydrated', True) is not True and (item in HYDRATED_ATTRIBUTES or
+                                                                 not item.startswith('_')):
+            if not self._lazy_hydrate():
+                raise AttributeError(item)
+            return getattr(self, item)
+
         if 'conn' in self.__dict__ and self.conn:
             try:
                 return getattr(self.conn, item)
@@ -248,7 +471,7 @@ class DeviceBase:
                     'There are two possible options for this error here: '
                     '\n - There are No Open Connections and you were trying a connection method "{method}".'
                     '\n - There is a typo in calling "{method}" item.'.format(method=item))
-        raise AttributeError
+        raise AttributeError(item)
 
 
 class OSCmd:
@@ -2,7 +2,7 @@ import logging
 
 from sqlalchemy import event
 
-from .base import DeviceWithEncryptionSettings
+from .base import DeviceWithEncryptionSettings, lazy_loading
 from .utils import transform_password
 from remotelogin.connections import settings
 
@@ -43,6 +43,24 @@ class DeviceDeclarativeBase(db.DeclarativeBase):
     def get_by_filters_all(cls, **filters):
         return cls._return_device_if_conn_present(cls.query.filter_by(**filters).all())
 
+    @classmethod
+    def load_many(cls, filters=None, lazy=True):
+        """ loads all the devices matching the filters in one query
+
+        Args:
+            filters (dict): filter_by arguments (i.e. dict(location='lab1')). All devices if not given
+            lazy (bool): devices are returned as light records. Credentials decryption, managers and connections
+                         information are created the first time the device is used (see DeviceBase.hydrate)
+
+        Returns:
+            list: devices
+        """
+        query = cls.query.filter_by(**(filters or {}))
+        if not lazy:
+            return query.all()
+        with lazy_loading():
+            return query.all()
+
     def _data_to_json(self, item_manager):
 
         data = item_manager.make_serializable()
@@ -59,6 +77,7 @@ class DeviceDeclarativeBase(db.DeclarativeBase):
         return data
 
     def save(self):
+        self.resolve_host()
         self.connectionsjson = self._data_to_json(self.conn)
         self.usersjson = self._data_to_json(self.users)
         self.interfacesjson = self._data_to_json(self.interfaces)
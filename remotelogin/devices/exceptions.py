@@ -18,6 +18,10 @@ class ConnectionInstanceOpenError(ConnectionError):
     """ failing trying to find a connection or instance open """
 
 
+class ConnectionLeaseTimeoutError(ConnectionError):
+    """ every session of the connection pool was leased and none was given back in time """
+
+
 class UnknownConnectionError(ConnectionError):
     """ wrong name or instance """
 
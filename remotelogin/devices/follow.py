@@ -0,0 +1,246 @@
+import asyncio
+import collections
+import glob
+import logging
+import os
+import queue
+import re
+import threading
+import time
+
+from fdutils.files import slugify
+from remotelogin.devices import settings
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+LogLine = collections.namedtuple('LogLine', 'device filename offset line')
+
+
+class SegmentWriter:
+    """ writes lines to files of up to max_bytes (path.1.log, path.2.log, ...) keeping only the last segments of
+        them. Writing goes on after the last segment found when it is created again
+    """
+
+    def __init__(self, path, max_bytes=None, segments=None):
+        self.path = path
+        self.max_bytes = settings.FOLLOW_SEGMENT_BYTES if max_bytes is None else max_bytes
+        self.segments = settings.FOLLOW_SEGMENTS if segments is None else segments
+        self._file = None
+        self._size = 0
+        self._index = max(self._existing(), default=0)
+
+    def _segment(self, index):
+        return '{}.{}.log'.format(self.path, index)
+
+    def _existing(self):
+        pattern = re.compile(re.escape(self.path) + r'\.(\d+)\.log$')
+        for path in glob.glob(glob.escape(self.path) + '.*.log'):
+            m = pattern.match(path)
+            if m:
+                yield int(m.group(1))
+
+    def write(self, line):
+        data = (line + '\n').encode()
+        if self._file is None or (self.max_bytes and self._size + len(data) > self.max_bytes and self._size):
+            self._rotate()
+        self._file.write(data)
+        self._size += len(data)
+
+    def _rotate(self):
+        if self._file is None and self._index and os.path.getsize(self._segment(self._index)) < self.max_bytes:
+            # carry on with the last segment
+            self._file = open(self._segment(self._index), 'ab')
+            self._size = self._file.tell()
+            return
+
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._index += 1
+        self._file = open(self._segment(self._index), 'wb')
+        self._size = 0
+        if self.segments:
+            for index in self._existing():
+                if index <= self._index - self.segments:
+                    os.remove(self._segment(index))
+
+    def flush(self):
+        if self._file:
+            self._file.flush()
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class LogFollower:
+    """ follows log files of many devices at the same time giving their lines as LogLine tuples
+
+        The lines are filtered on the devices (pattern and exclude are awk regexes) and every device follows all
+        its files with one command on a leased session (device.conn.lease). The lines go through a queue of
+        max_lines so when the consumer is slow the devices stop being read. If the session is lost the files are
+        followed again from the offset of the last line received (from their start if they were rotated).
+
+        with LogFollower({dev1: '/var/log/messages', dev2: ['/var/log/syslog', '/var/log/auth.log']},
+                         pattern='error|fail') as follower:
+            for line in follower:
+                print(line.device.host, line.filename, line.line)
+
+        It can also be used as an async iterator (async for line in follower). When segments_folder is given, the
+        lines are also written to rotated segments per device and file (segments_folder/host/file.N.log)
+    """
+
+    def __init__(self, targets, pattern='', exclude='', offsets=None, max_lines=None, segments_folder=None,
+                 segment_bytes=None, segments=None, reconnect_wait=None, conn_name=None):
+        """
+
+        Args:
+            targets (dict): device -> path or list of paths of the files to follow
+            pattern (str): only the lines matching this regex
+            exclude (str): leave out the lines matching this regex
+            offsets (dict): (device host, path) -> byte offset to start following from (the end of the file if
+                            not given). See the offsets property
+            max_lines (int): lines waiting to be consumed before the devices are not read anymore
+            segments_folder (str): folder where to write the lines to segments
+            segment_bytes (int): maximum size of a segment
+            segments (int): segments kept per file
+            reconnect_wait (float): seconds waited before following again after the session is lost
+            conn_name (str): connection of the devices used (the default connection if not given)
+
+        """
+        self.targets = {device: [files] if isinstance(files, str) else list(files)
+                        for device, files in dict(targets).items()}
+        self.pattern = pattern
+        self.exclude = exclude
+        self.segments_folder = segments_folder
+        self.segment_bytes = segment_bytes
+        self.segments = segments
+        self.reconnect_wait = settings.FOLLOW_RECONNECT_WAIT if reconnect_wait is None else reconnect_wait
+        self.conn_name = conn_name
+
+        self._offsets = dict(offsets or {})
+        self._queue = queue.Queue(settings.FOLLOW_MAX_LINES if max_lines is None else max_lines)
+        self._stop = threading.Event()
+        self._threads = []
+
+    @property
+    def offsets(self):
+        """ (device host, path) -> offset of the file after the last line received, to follow on from there """
+        return dict(self._offsets)
+
+    def start(self):
+        if not self._threads:
+            for device, files in self.targets.items():
+                th = threading.Thread(target=self._follow, args=(device, files), daemon=True,
+                                      name='follow-{}'.format(device.host))
+                self._threads.append(th)
+            for th in self._threads:
+                th.start()
+        return self
+
+    def stop(self, timeout=None):
+        """ stops following the files. The lines not consumed yet are dropped and the iteration ends """
+        self._stop.set()
+        for th in self._threads:
+            th.join(timeout)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def get(self, timeout=None):
+        """ the next line. None if there is none after timeout seconds or if the follower was stopped """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._stop.is_set():
+            wait = settings.FOLLOW_IDLE_TIMEOUT
+            if deadline is not None:
+                wait = min(max(deadline - time.monotonic(), 0), wait)
+            try:
+                return self._queue.get(timeout=wait)
+            except queue.Empty:
+                if deadline is not None and time.monotonic() >= deadline:
+                    return None
+        return None
+
+    def __iter__(self):
+        self.start()
+        while True:
+            line = self.get()
+            if line is None:
+                return
+            yield line
+
+    async def __aiter__(self):
+        self.start()
+        loop = asyncio.get_event_loop()
+        while not self._stop.is_set():
+            line = await loop.run_in_executor(None, self.get, settings.FOLLOW_IDLE_TIMEOUT)
+            if line is not None:
+                yield line
+
+    def run(self):
+        """ follows the files until stopped (from another thread) only writing the lines to the segments """
+        for _ in self:
+            pass
+
+    def _put(self, item):
+        # waits for room in the queue while not stopped
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=settings.FOLLOW_IDLE_TIMEOUT)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _writers(self, device, files):
+        if not self.segments_folder:
+            return {}
+        folder = os.path.join(self.segments_folder, slugify(device.host))
+        return {f: SegmentWriter(os.path.join(folder, slugify(f)), self.segment_bytes, self.segments) for f in files}
+
+    def _follow(self, device, files):
+        writers = self._writers(device, files)
+        try:
+            while not self._stop.is_set():
+                try:
+                    self._follow_once(device, files, writers)
+                except Exception:
+                    log.exception('Problems following {} on {}'.format(', '.join(files), device.host))
+                if not self._stop.is_set():
+                    log.info('Following again {} on {} in {} seconds'.format(', '.join(files), device.host,
+                                                                         self.reconnect_wait))
+                    self._stop.wait(self.reconnect_wait)
+        finally:
+            for writer in writers.values():
+                writer.close()
+
+    def _follow_once(self, device, files, writers):
+        host = device.host
+        with device.conn.lease(self.conn_name) as conn:
+            followed = [(f, self._offsets.get((host, f))) for f in files]
+            for received in device.os.follow_files(followed, self.pattern, self.exclude, conn=conn,
+                                                   idle_timeout=settings.FOLLOW_IDLE_TIMEOUT):
+                if self._stop.is_set():
+                    return
+                if received is None:
+                    for writer in writers.values():
+                        writer.flush()
+                    continue
+
+                index, offset, line = received
+                filename = files[index]
+                if line is not None:
+                    if filename in writers:
+                        writers[filename].write(line)
+                    if not self._put(LogLine(device, filename, offset, line)):
+                        return
+                self._offsets[(host, filename)] = offset
@@ -8,6 +8,7 @@ from functools import partialmethod
 from remotelogin.devices.exceptions import (ConnectionInstanceOpenError, DuplicatedConnectionError,
                                           UnknownConnectionError, UnknownUserError)
 from remotelogin.devices.properties import ConnectionInfo, UserInfo, KNOWN_CONNECTION_PROTOCOLS
+from remotelogin.connections.base import conversations
 from fdutils.db import NoDBSessionError
 
 from .base import ManagerWithItems
@@ -15,6 +16,38 @@ from .base import ManagerWithItems
 log = logging.getLogger(__name__)
 
 
+class InstanceKey(str):
+    """ identifies an open instance of a connection: instance name, user, tunnel and interface used to open it
+
+        It is the '$$' joined string of them (what was used as key before) so it can still be looked up, filtered
+        and dumped to json as a string, with the parts available as attributes
+    """
+    __slots__ = ()
+    SEPARATOR = '$$'
+
+    def __new__(cls, name, username, tunnel, interface):
+        return super().__new__(cls, cls.SEPARATOR.join((name, username, tunnel, interface)))
+
+    def __getnewargs__(self):
+        return tuple(self.split(self.SEPARATOR))
+
+    @property
+    def name(self):
+        return self.split(self.SEPARATOR)[0]
+
+    @property
+    def username(self):
+        return self.split(self.SEPARATOR)[1]
+
+    @property
+    def tunnel(self):
+        return self.split(self.SEPARATOR)[2]
+
+    @property
+    def interface(self):
+        return self.split(self.SEPARATOR)[3]
+
+
 class OpenConnectionInstanceUser:
     """ helper class to avoid having a user of an open connection closing the connection inadvertently
         when used in a context (with ...)
@@ -37,7 +70,8 @@ class OpenConnectionInstance:
     """ class needed to keep track of the connection and properly capture when the connection is closed
         so we can retrieve the data related to the device """
 
-    def __init__(self, manager, conn_name, instance_name, user, tunnel=None, interface=None, **other_conn_args):
+    def __init__(self, manager, conn_name, instance_name, user, tunnel=None, interface=None, private=False,
+                 **other_conn_args):
         self.__tunnel = tunnel
         self.__conn = None
         self.conn_name = conn_name
@@ -47,6 +81,10 @@ class OpenConnectionInstance:
         self.__is_close = False
         self.__other_conn_args = other_conn_args
         self._user = user
+        # private instances (like the pool sessions) are not in the manager open instances
+        self.private = private
+        # handle given to the users of get_open_instance (one per open instance instead of one per call)
+        self.user_handle = OpenConnectionInstanceUser(self)
 
         # do the opening
         self.__open()
@@ -55,6 +93,10 @@ class OpenConnectionInstance:
     def identifier(self):
         return self.conn_name, self.instance_name
 
+    @property
+    def connection(self):
+        return self.__conn
+
     def __enter__(self):
         return self
 
@@ -97,7 +139,8 @@ class OpenConnectionInstance:
     def __close(self):
         if not self.__conn or self.__is_close:
             return
-        self.__manager._delete_open_connection_instance(self.conn_name, self.instance_name)
+        if not self.private:
+            self.__manager._delete_open_connection_instance(self.conn_name, self.instance_name)
         if self.__tunnel:
             self.__conn.send_cmd('exit')
         self.__conn.close()
@@ -113,8 +156,12 @@ class ConnectionsManager(ManagerWithItems):
     ItemTypeName = 'connections'
 
     def __init__(self, *args, **kwargs):
+        # conn name -> InstanceKey -> OpenConnectionInstance
         self._open_instances = {}
+        # one lock per (conn name, instance name) being opened (dict.setdefault is atomic, no manager lock needed)
         self._conn_locks = {}
+        # first open instance still open. used when no connection name/instance is given
+        self._default_instance = None
         self.default_tunnel = kwargs.pop('default_tunnel', '')
         super(ConnectionsManager, self).__init__(*args, **kwargs)
 
@@ -144,18 +191,20 @@ class ConnectionsManager(ManagerWithItems):
             else:
                 return self.open(name=name, instance_name=instance_name, user=user, tunnel=tunnel, interface=interface)
 
+        if not (name or instance_name or user or tunnel or interface):
+            default_instance = self._default_instance
+            if default_instance is not None:
+                return default_instance.user_handle
+
         if not self.open_instances and not open_if_close:
             raise ConnectionInstanceOpenError('There are no open connections')
 
         open_conn = None
 
         if name:
-            if name in self.open_instances:
-                open_conn = self.open_instances[name]
+            open_conn = self.open_instances.get(name)
         else:
-            open_instances = list(self.open_instances.values())
-            if open_instances:
-                open_conn = open_instances[0]
+            open_conn = next(iter(self.open_instances.values()), None)
 
         if not open_conn:
             return raise_or_return_new()
@@ -163,7 +212,9 @@ class ConnectionsManager(ManagerWithItems):
         if not instance_name:
             # just get the first open instance
             if not user and not tunnel and not interface:
-                instance_name = list(open_conn.keys())[0]
+                instance_name = next(iter(open_conn), None)
+                if instance_name is None:
+                    return raise_or_return_new()
             else:
                 instance_name = self._get_instance_name_and_check_exists_for_user(self.DEFAULT_INSTANCE_NAME,
                                                                                   open_conn, user)
@@ -171,10 +222,28 @@ class ConnectionsManager(ManagerWithItems):
         elif instance_name not in open_conn:
             instance_name = self._get_instance_name_and_check_exists_for_user(instance_name, open_conn, user)
 
-        return OpenConnectionInstanceUser(open_conn[instance_name])
+        try:
+            return open_conn[instance_name].user_handle
+        except KeyError:
+            # closed by another thread meanwhile
+            return raise_or_return_new()
 
     get_open_instance_or_new = functools.partialmethod(get_open_instance, open_if_close=True)
 
+    def lease(self, name=None, timeout=None):
+        """ checks out a session of the connection (default if no name) from its pool for the duration of a context.
+            The session is kept open for the next lease when the context exits
+
+            with device.conn.lease('ssh') as conn:
+                conn.check_output('uptime')
+
+        Args:
+            name (str): name of the connection
+            timeout (float): seconds to wait for a session if the connection max_sessions are all leased
+
+        """
+        return self[name].lease(timeout)
+
     def _get_instance_name_and_check_exists_for_user(self, instance_name, open_conn, username):
         instance_name_with_user = self._get_instance_name_augmented(instance_name,
                                                                     user_or_username=username)
@@ -188,12 +257,17 @@ class ConnectionsManager(ManagerWithItems):
         return instance_name
 
     def _get_connection_instance_lock(self, conn_name, instance_name):
-        """ creates a thread lock for every tuple conn_name instance_name """
+        """ thread lock for every tuple conn_name instance_name """
+        key = conn_name, instance_name
+        return self._conn_locks.get(key) or self._conn_locks.setdefault(key, threading.Lock())
+
+    def _add_open_connection_instance(self, open_instance):
+        # only opening and closing take the lock, lookups read the registry without it
         with self.manager_lock:
-            if not (conn_name, instance_name) in self._conn_locks:
-                self._conn_locks[(conn_name, instance_name)] = threading.Lock()
-            return self._conn_locks[(conn_name, instance_name)]
-                                      
+            self.open_instances.setdefault(open_instance.conn_name, {})[open_instance.instance_name] = open_instance
+            if self._default_instance is None:
+                self._default_instance = open_instance
+
     def _delete_open_connection_instance(self, name, instance):
         """ delete open connection instance and if there are no more open instances for a connection it removes
             the reference key from the open_instances dictionary
@@ -201,11 +275,17 @@ class ConnectionsManager(ManagerWithItems):
         if name not in self.open_instances:
             log.debug(name + " connection was tried to be closed but is not present " + str(self.open_instances))
             return
-        with self._get_connection_instance_lock(name, instance):
-            if instance in self.open_instances[name]:
-                del self.open_instances[name][instance]
-            if not self.open_instances[name]:
-                del self.open_instances[name]
+
+        # the default instance pointer has to change together with the removal
+        with self.manager_lock:
+            open_conn = self.open_instances.get(name, {})
+            removed = open_conn.pop(instance, None)
+            if not open_conn:
+                self.open_instances.pop(name, None)
+
+            if removed is not None and removed is self._default_instance:
+                self._default_instance = next((open_instance for open_conn in list(self.open_instances.values())
+                                               for open_instance in list(open_conn.values())), None)
 
     def _get_instance_name_augmented(self, instance_name, user_or_username=None, tunnel=None, interface=None):
         if not user_or_username:
@@ -216,7 +296,7 @@ class ConnectionsManager(ManagerWithItems):
 
         username = user_or_username.username if isinstance(user_or_username, UserInfo) else user_or_username
 
-        return '$$'.join((instance_name, username, tunnel_name, interface_name))
+        return InstanceKey(instance_name, username, tunnel_name, interface_name)
 
     def _add_multiple(self, item_type, func, default_name=None, default_tunnel=None, **items):
         if default_tunnel:
@@ -246,6 +326,9 @@ class ConnectionsManager(ManagerWithItems):
         :return:
         """
 
+        # devices created with resolve_host=False look up their host on the first connection
+        self._dev.resolve_host()
+
         with self._get_connection_instance_lock(name, instance_name):
 
             conn, user, instance_name = self._items[name].new_open_instance(user, instance_name, tunnel, interface,
@@ -263,19 +346,27 @@ class ConnectionsManager(ManagerWithItems):
     def get_all_conversations_flat_default(self):
         return self.get_all_conversations_flat(self._default_item_name)
 
-    def open(self, name=None, user=None, instance_name=None, tunnel=None, interface=None, **conn_args):
+    def iter_all_exchanges(self, conn_names=(), start=None, end=None, command=None):
+        """ the exchanges (conversations.Exchange) of every session of the connections merged in time order and read
+            lazily (see ConnectionInfo.iter_exchanges)
+        """
+        return conversations.merge(*(self._items[c].iter_exchanges(start=start, end=end, command=command)
+                                     for c in self._items if not conn_names or c in conn_names))
+
+    def open(self, name=None, user=None, instance_name=None, tunnel=None, interface=None, private=False,
+             **conn_args):
         """ Opens a connection instance given by name of the connection and an instance name
-            in case we have more than one instance of the same name """
+            in case we have more than one instance of the same name. A private instance is only reachable through
+            the object returned (it is not one of the open_instances nor the default one)
+        """
 
         name = name or self._default_item_name
         instance_name = instance_name or self.DEFAULT_INSTANCE_NAME
 
-        open_instance = OpenConnectionInstance(self, name, instance_name, user, tunnel, interface, **conn_args)
-
-        if open_instance.conn_name not in self.open_instances:
-            self.open_instances[open_instance.conn_name] = {}
-
-        self.open_instances[open_instance.conn_name][open_instance.instance_name] = open_instance
+        open_instance = OpenConnectionInstance(self, name, instance_name, user, tunnel, interface, private,
+                                               **conn_args)
+        if not private:
+            self._add_open_connection_instance(open_instance)
 
         log.debug('Connection {} with instance name {} and user {} was open successfully'
                   ''.format(open_instance.conn_name, instance_name, user or self.users.default))
@@ -363,8 +454,12 @@ class ConnectionsManager(ManagerWithItems):
     #TODO: add_local
 
     def close_all(self):
-        for conn_open_instances in self.open_instances.values():
-            for conn in conn_open_instances.values():
+        for info in self._items.values():
+            if info.pool:
+                info.pool.close()
+
+        for conn_open_instances in list(self.open_instances.values()):
+            for conn in list(conn_open_instances.values()):
                 try:
                     conn.close_on_manager_del()
                 except Exception:
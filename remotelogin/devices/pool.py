@@ -0,0 +1,205 @@
+import collections
+import contextlib
+import itertools
+import logging
+import threading
+import time
+
+from remotelogin.devices import settings
+from remotelogin.devices.exceptions import ConnectionLeaseTimeoutError
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+
+class ConnectionPool:
+    """ open sessions of a device connection that are leased to one user at a time and kept open when given back
+        so the next lease does not pay for the login again
+
+        At most max_sessions are open at the same time (0 for no limit). When all are leased, lease waits until one
+        is given back or the timeout expires. Sessions idle for more than idle_timeout seconds are closed.
+    """
+
+    INSTANCE_NAME_PREFIX = 'lease'
+
+    def __init__(self, conn_info, max_sessions=None, idle_timeout=None):
+        """
+
+        Args:
+            conn_info (remotelogin.devices.properties.ConnectionInfo): connection of the device to open sessions of
+            max_sessions (int): maximum number of sessions open at the same time (0 no limit)
+            idle_timeout (float): seconds an idle session is kept open
+
+        """
+        self._conn_info = conn_info
+        self.max_sessions = settings.LEASE_MAX_SESSIONS if max_sessions is None else max_sessions
+        self.idle_timeout = settings.LEASE_IDLE_TIMEOUT if idle_timeout is None else idle_timeout
+
+        # (time given back, session, expected prompt at login) most recently used on the right
+        self._idle = collections.deque()
+        self._sessions = 0                  # open (or being opened) sessions, leased or idle
+        self._cond = threading.Condition()
+        self._ids = itertools.count()
+        self._reaper = None
+        self._closed = False
+
+    @property
+    def size(self):
+        return self._sessions
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    @contextlib.contextmanager
+    def lease(self, timeout=None):
+        """ checks out an open session (or opens a new one) for the duration of the context
+
+        Args:
+            timeout (float): seconds to wait for a session if max_sessions are already leased
+
+        Raises:
+            ConnectionLeaseTimeoutError: if no session was given back before the timeout
+
+        """
+        session, prompt = self.checkout(timeout)
+        try:
+            yield session.user_handle
+        finally:
+            self.checkin(session, prompt)
+
+    def checkout(self, timeout=None):
+        """ returns an open session and its expected prompt. It has to be given back with checkin """
+        timeout = settings.LEASE_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        to_close = []
+
+        try:
+            with self._cond:
+                while True:
+                    if self._closed:
+                        raise ConnectionError('This pool is closed')
+
+                    while self._idle:
+                        _, session, prompt = self._idle.pop()
+                        if self._is_healthy(session):
+                            return session, prompt
+                        self._sessions -= 1
+                        to_close.append(session)
+
+                    if not self.max_sessions or self._sessions < self.max_sessions:
+                        self._sessions += 1
+                        break
+
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise ConnectionLeaseTimeoutError(
+                            'No session of {} was given back in {} seconds (max_sessions: {})'
+                            ''.format(self._conn_info.name, timeout, self.max_sessions))
+                    self._cond.wait(remaining)
+        finally:
+            self._close_sessions(to_close)
+
+        try:
+            # private so get_open_instance and the device attribute forwarding never hand it to someone else
+            session = self._conn_info.open(
+                instance_name='{}{}'.format(self.INSTANCE_NAME_PREFIX, next(self._ids)), private=True)
+        except BaseException:
+            self._discard()
+            raise
+
+        return session, session.connection.prompt
+
+    def checkin(self, session, prompt):
+        """ gives back a session checked out. It is kept open for the next lease if it is still usable """
+        try:
+            if self._closed or not self._is_healthy(session):
+                raise ConnectionError('session closed')
+            self._reset(session, prompt)
+        except Exception:
+            log.debug('Session {} of {} could not be reused'.format(session.instance_name, self._conn_info.name))
+            self._close_sessions([session])
+            self._discard()
+            return
+
+        with self._cond:
+            self._idle.append((time.monotonic(), session, prompt))
+            self._cond.notify()
+            self._schedule_reap()
+
+    def reap(self):
+        """ closes the sessions idle for more than idle_timeout seconds """
+        expired = []
+        with self._cond:
+            self._reaper = None
+            limit = time.monotonic() - self.idle_timeout
+            while self._idle and self._idle[0][0] <= limit:
+                expired.append(self._idle.popleft()[1])
+            self._sessions -= len(expired)
+            if expired:
+                self._cond.notify(len(expired))
+            self._schedule_reap()
+
+        self._close_sessions(expired)
+        return len(expired)
+
+    def close(self):
+        """ closes the idle sessions. Leased sessions are closed when given back """
+        with self._cond:
+            self._closed = True
+            if self._reaper:
+                self._reaper.cancel()
+                self._reaper = None
+            idle = [session for (_, session, _) in self._idle]
+            self._idle.clear()
+            self._sessions -= len(idle)
+            self._cond.notify_all()
+
+        self._close_sessions(idle)
+
+    def _discard(self):
+        with self._cond:
+            self._sessions -= 1
+            self._cond.notify()
+
+    def _schedule_reap(self):
+        # called with the condition lock held
+        if self._idle and not self._reaper and not self._closed and self.idle_timeout:
+            wait = max(self._idle[0][0] + self.idle_timeout - time.monotonic(), 0)
+            self._reaper = threading.Timer(wait, self._reap_or_ignore)
+            self._reaper.daemon = True
+            self._reaper.start()
+
+    def _reap_or_ignore(self):
+        try:
+            self.reap()
+        except ReferenceError:
+            # the device (and its connections manager) is gone
+            pass
+
+    @staticmethod
+    def _is_healthy(session):
+        try:
+            return bool(session.connection.is_open and session.connection._is_active())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _reset(session, prompt):
+        """ leaves nothing pending to be read. A session whose prompt was changed is not reused as the original
+            prompt is only known as a regex
+        """
+        conn = session.connection
+        if conn.prompt != prompt:
+            raise ValueError('the prompt was changed')
+        # only waits (sending a ctrl-c) if something is still being received
+        conn.flush_recv(force_ctrl_c=True, timeout=0)
+
+    @staticmethod
+    def _close_sessions(sessions):
+        for session in sessions:
+            try:
+                session.close()
+            except Exception:
+                log.exception('Problems closing the session {}'.format(session.instance_name))
@@ -5,12 +5,14 @@ import weakref
 from uuid import uuid4, UUID
 
 from remotelogin.connections import terminal, ssh, telnet, command, local
+from remotelogin.connections.base import conversations
 from remotelogin.devices.exceptions import (
     UserAuthenticationValuesError,
     NotImplementedProtocolError,
     NoDefaultInterfaceError,
 )
 from remotelogin.connections.exceptions import NoDefaultUserError
+from remotelogin.devices.pool import ConnectionPool
 from fdutils import lists, net
 
 log = logging.getLogger(__name__)
@@ -141,7 +143,7 @@ def _get_ips_from_ip_attr(ip, hostname):
             ips = [ipaddress.ip_address(_ip)]
 
         except ValueError:
-            ips = [ipaddress.ip_address(_) for _ in net.nslookup_all(ip)]
+            ips = [ipaddress.ip_address(_) for _ in net.nslookup_all(_ip)]
 
         ret.extend(_ for _ in ips if _ not in ret)
 
@@ -305,10 +307,20 @@ class ConnectionInfo:
         "all_kwargs",
         "interface",
         "tunnel",
+        "max_sessions",
+        "pool",
     )
 
     def __init__(
-        self, proto, name, manager, user=None, interface=None, tunnel=None, **conn_args
+        self,
+        proto,
+        name,
+        manager,
+        user=None,
+        interface=None,
+        tunnel=None,
+        max_sessions=None,
+        **conn_args
     ):
 
         if proto not in KNOWN_CONNECTION_PROTOCOLS:
@@ -330,6 +342,8 @@ class ConnectionInfo:
         self.manager = weakref.proxy(manager)
         self.data = {}
         self.name = name
+        self.max_sessions = max_sessions
+        self.pool = None
         self.expected_prompt = conn_args.get("expected_prompt", None)
         self._conn_cls = (
             self._cls.wrapped_connection
@@ -379,6 +393,9 @@ class ConnectionInfo:
         if "os" in ret:
             del ret["os"]
 
+        if self.max_sessions is not None:
+            ret["max_sessions"] = self.max_sessions
+
         return ret
 
     def _get_default_instance(self, cls, default_value):
@@ -539,13 +556,17 @@ class ConnectionInfo:
         return instance, user, instance_name
 
     def data_conversations_iterator(self, instance_names=()):
+        for instance_name, data in self._instances_data(instance_names):
+            yield instance_name, data.get_timed_conversation_list()
+
+    def _instances_data(self, instance_names=()):
         for instance_name, instance_conversations in (
             (name, v)
             for (name, v) in self.data.items()
             if not instance_names or name in instance_names
         ):
             for data in instance_conversations:
-                yield instance_name, data.get_timed_conversation_list()
+                yield instance_name, data
 
     def conversations(self, instance_names=()):
         ret = {}
@@ -559,15 +580,26 @@ class ConnectionInfo:
 
         return ret
 
-    def conversations_flat(self, instance_names=()):
-        conversations = []
+    def iter_exchanges(self, instance_names=(), start=None, end=None, command=None):
+        """ the exchanges (conversations.Exchange) of every session of the instances merged in time order. Sessions
+            with a conversation log are read lazily from it
 
-        for instance_name, conversation in self.data_conversations_iterator(
-            instance_names
-        ):
-            conversations.extend(conversation)
+        Args:
+            instance_names (tuple of str): only these instances (all by default)
+            start (float): only exchanges sent from this time (epoch)
+            end (float): only exchanges sent until this time
+            command (str): only the exchanges of this command
+        """
+        return conversations.merge(*(data.exchanges(start, end, command)
+                                     for _, data in self._instances_data(instance_names)))
+
+    def iter_conversations(self, instance_names=(), time_format="%Y-%m-%d %H:%M:%S", **filters):
+        """ like conversations_flat but building the dictionaries lazily (see iter_exchanges for the filters) """
+        for e in self.iter_exchanges(instance_names, **filters):
+            yield e.as_timed_dict(time_format)
 
-        return sorted(conversations, key=lambda m: m["time"])
+    def conversations_flat(self, instance_names=()):
+        return list(self.iter_conversations(instance_names))
 
     def conversations_string(
         self, template="\n>>> Sent ({date}): >>{sent}<<\n\nReceived: {received}"
@@ -576,7 +608,7 @@ class ConnectionInfo:
             template.format(
                 date=s["time"], sent=s["sent"].strip(), received=s["received"]
             )
-            for s in self.conversations_flat()
+            for s in self.iter_conversations()
         )
 
     def __enter__(self):
@@ -588,6 +620,17 @@ class ConnectionInfo:
     def open(self, user=None, instance_name=None, **conn_args):
         return self.manager.open(self.name, user, instance_name, **conn_args)
 
+    def get_pool(self):
+        """ pool of open sessions of this connection used by lease """
+        if self.pool is None:
+            with self.manager.manager_lock:
+                if self.pool is None:
+                    self.pool = ConnectionPool(self, self.max_sessions)
+        return self.pool
+
+    def lease(self, timeout=None):
+        return self.get_pool().lease(timeout)
+
     def close(self, instance_name=None):
         self.manager.close(self.name, instance_name)
 
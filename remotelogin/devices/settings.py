@@ -5,7 +5,30 @@ from fdutils.config import register_settings
 DEFAULT_STORAGE_FOLDER = os.path.expanduser("~")
 ENCRYPT_PASSWORDS_IN_DB = True
 LOCATION = ''
+# devices loaded from the db are not decrypted nor get their managers created until they are used
+LAZY_LOAD_FROM_DB = False
+# look up the ip address of the device host when the device is created. If False, it is done on its first connection
+RESOLVE_HOST_ON_CREATION = True
+# connection pools (device.conn.lease). maximum sessions open per connection (0 no limit), seconds to wait for a
+# session when all are leased and seconds an idle session is kept open
+LEASE_MAX_SESSIONS = 0
+LEASE_TIMEOUT = 60
+LEASE_IDLE_TIMEOUT = 300
+# device facts (device.get_facts). names collected when none are given (empty for all the facts the os has), seconds a
+# stored fact is used before collecting it again and devices refreshed at the same time by utils.refresh_facts
+FACTS = ()
+FACTS_MAX_AGE = 300
+FACTS_REFRESH_WORKERS = 16
+# log followers (follow.LogFollower). lines waiting to be consumed before the devices are not read, seconds waited to
+# follow the files again after a session is lost, seconds between checks of a stop while there are no lines and size
+# in bytes and number kept of the segments the lines are written to
+FOLLOW_MAX_LINES = 10000
+FOLLOW_RECONNECT_WAIT = 5
+FOLLOW_IDLE_TIMEOUT = 1
+FOLLOW_SEGMENT_BYTES = 64 * 1024 * 1024
+FOLLOW_SEGMENTS = 10
 
+# variable name -> OS environment variable to take its value from if it is not in the settings file
 # ENV_TO_VARS = {}
 
 register_settings(globals(), 'devices')
\ No newline at end of file
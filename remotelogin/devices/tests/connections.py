@@ -1,3 +1,5 @@
+import json
+import pickle
 import re
 import time
 
@@ -13,6 +15,8 @@ from remotelogin.devices.base_db import Device
 from remotelogin.devices.base_db_named import TableNamedDevice
 from remotelogin.devices.exceptions import UnknownConnectionError, DuplicatedConnectionError, ConnectionInstanceOpenError
 from remotelogin.devices.tests.utils import update_db_config
+from remotelogin.oper_sys.linux import LinuxOS
+from remotelogin.oper_sys.linux.shellcommands import LinuxShellCmds
 
 DEF_CONN_DICT = dict(proto='ssh', user=dict(username='learner', password='mypassword'), port='922',
                      expected_prompt=r'{username}@.+?:~\$ ')
@@ -323,6 +327,44 @@ def test_ssh_conn_open_multiple_instances_same_connection():
         with d.conn.open(instance_name='c2') as c2:
             assert c2.check_output('whoami') == d.users.default.username
 
+def test_ssh_conn_lease_reuses_session_up_to_max_sessions():
+    conn_info = dict(DEF_CONN_DICT, max_sessions=1)
+    d = DeviceBase('localhost', connections=dict(default=conn_info))
+    with d.conn.lease() as c1:
+        assert c1.check_output('whoami') == d.users.default.username
+        name = c1.instance_name
+        with pytest.raises(exceptions.ConnectionLeaseTimeoutError):
+            with d.conn.lease(timeout=0.1):
+                pass
+    with d.conn.lease() as c2:
+        assert c2.instance_name == name
+        assert c2.check_output('whoami') == d.users.default.username
+
+def test_leased_sessions_are_not_open_instances():
+    from remotelogin.connections.tests import servers
+
+    with servers.SshServer() as server:
+        user = dict(username=servers.DEFAULT_USERNAME, password=servers.DEFAULT_PASSWORD)
+        d = DeviceBase('127.0.0.1', default_ip_address='127.0.0.1',
+                       connections=dict(ssh=dict(proto='ssh', port=server.port, user=user,
+                                                 expected_prompt=servers.DEFAULT_PROMPT_RE)))
+        try:
+            with d.conn.lease() as leased:
+                assert leased.check_output('whoami') == servers.DEFAULT_USERNAME
+                assert not d.conn.open_instances
+                with pytest.raises(ConnectionInstanceOpenError):
+                    d.conn.get_open_instance()
+
+                with d.conn.open() as opened:
+                    assert d.conn.get_open_instance().instance_name == opened.instance_name
+                    assert d.check_output('hostname') == servers.DEFAULT_HOSTNAME
+                    assert [i.private for i in d.conn.open_instances['ssh'].values()] == [False]
+            assert not d.conn.open_instances
+            assert d.conn['ssh'].pool.idle == 1
+        finally:
+            d.conn.close_all()
+
+
 def test_telnet_conn_open_multiple_instances_same_connection():
     conn_info = dict(DEF_TELNET_CONN_DICT)
     d = DeviceBase('localhost', connections=dict(default=conn_info))
@@ -511,8 +553,7 @@ def test_ssh_connection_with_different_file_storage_of_converstation_for_new_ope
     from io import StringIO
     mystream = StringIO()
     conn_info['data_stream'] = mystream
-    d = DeviceBase('localhost', connections=dict(default=conn_info))
-    d.os.can_change_prompt = False
+    d = DeviceBase('localhost', connections=dict(default=conn_info), can_change_prompt=False)
     with d.conn.open():
         assert d.conn.check_output('whoami') == d.users.default.username
 
@@ -581,12 +622,22 @@ def test_device_uses_currently_open_connection_when_using_connection_cmd_directl
     with d.conn.open(user='mysshuser'):
         assert d.check_output('whoami') == 'mysshuser'
 
+class UnquotedPromptCmds(LinuxShellCmds):
+
+    def set_prompt(self, prompt):
+        return 'export PS1=' + str(prompt)
+
+
+class UnquotedPromptOS(LinuxOS):
+    # its own commands instance so the shared linux one is not modified
+    cmd = UnquotedPromptCmds()
+
+
 def test_device_add_set_prompt_while_connecting():
     DEF_CONN_DICT = dict(proto='ssh', port=922)
     user1 = properties.UserInfo(password='mypassword', expected_prompt=r'{username}@.+?\:\~\$ ')
-    d = DeviceBase('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1))
-    d.os.can_change_prompt = True
-    d.os.cmd.set_prompt = lambda prompt: 'export PS1=' + str(prompt)
+    d = DeviceBase('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1),
+                   os_name=UnquotedPromptOS(can_change_prompt=True))
     with d.conn.open():
         assert re.search(constants.UNIQUE_PROMPT_RE, d.conn.prompt)
 
@@ -602,8 +653,8 @@ def test_device_add_set_prompt_implicit_by_device_os():
 def test_connection_override_device_os_set_prompt():
     DEF_CONN_DICT = dict(proto='ssh', port=922)
     user1 = properties.UserInfo(password='mypassword', expected_prompt=r'{username}@.+?:~\$ ')
-    d = linux.LinuxDevice('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1))
-    d.os.can_change_prompt = False
+    d = linux.LinuxDevice('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1),
+                          can_change_prompt=False)
     with d.conn.open():
         assert re.search(user1.expected_prompt.format(username='learner'),
                          d.conn.prompt.replace('\\', '')) is not None
@@ -614,8 +665,7 @@ def test_saving_restoring_connections_to_db():
 
     DEF_CONN_DICT = dict(proto='ssh', port=922)
     user1 = properties.UserInfo(password='mypassword', expected_prompt=r'{username}@.+?:~\$ ')
-    d = Device('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1))
-    d.os.can_change_prompt = False
+    d = Device('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1), can_change_prompt=False)
     with d.conn.open():
         assert re.search(user1.expected_prompt.format(username='learner'),
                          d.conn.prompt.replace('\\', '')) is not None
@@ -641,8 +691,7 @@ def test_saving_restoring_connections_to_db_custom_name():
 
     DEF_CONN_DICT = dict(proto='ssh', port=922)
     user1 = properties.UserInfo(password='mypassword', expected_prompt=r'{username}@.+?:~\$ ')
-    d = Devices2('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1))
-    d.os.can_change_prompt = False
+    d = Devices2('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1), can_change_prompt=False)
     with d.conn.open():
         assert re.search(user1.expected_prompt.format(username='learner'),
                          d.conn.prompt.replace('\\', '')) is not None
@@ -886,10 +935,9 @@ def test_saving_restoring_connections_multihop_to_db():
 
     d = Device('localhost',
                connections=dict(ssh={'tunnel': dict(hops=jump_boxes)}),
-               users=dict(learner=user1), encrypt_passwords=True)
+               users=dict(learner=user1), encrypt_passwords=True, can_change_prompt=False)
 
     t0 = time.time()
-    d.os.can_change_prompt = False
     with d.conn.open():
         print(time.time() - t0)
         assert re.search(user1.expected_prompt.format(username='learner'),
@@ -940,8 +988,7 @@ def test_remove_user_related_info_from_connection():
                          password='mypassword', expected_prompt=r'{username}@.+?:~\$ ')
     user1 = properties.UserInfo(password='mypassword', expected_prompt=r'{username}@.+?:~\$ ')
 
-    d = DeviceBase('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1))
-    d.os.can_change_prompt = False
+    d = DeviceBase('localhost', connections=dict(ssh=DEF_CONN_DICT), users=dict(learner=user1), can_change_prompt=False)
 
     for user_attr in ('username', 'password', 'key_filename', 'key_password'):
         with pytest.raises(AttributeError):
@@ -1013,3 +1060,155 @@ def test_mix_tunnel_encrypted_keys_after_telnet_raises_notimplementederror():
     with pytest.raises(NotImplementedError):
         with d.conn.open(tunnel='default', user='mysshuser'):  # using mysshuser for the connection after the tunnel
             pass
+
+
+def test_open_instances_registry_default_instance():
+    """ the default instance is the first open one still open and instances are keyed by InstanceKey """
+    from types import SimpleNamespace
+    from remotelogin.devices.managers.connections import InstanceKey
+
+    d = DeviceBase('localhost', default_ip_address='127.0.0.1', connections=dict(ssh=DEF_CONN_DICT))
+    key = d.conn._get_instance_name_augmented('default')
+    assert key == InstanceKey('default', 'learner', 'default', 'default')
+    # the keys are still the strings used before
+    assert key == 'default$$learner$$default$$default' and {key: 1} == {'default$$learner$$default$$default': 1}
+    assert (key.name, key.username, key.tunnel, key.interface) == ('default', 'learner', 'default', 'default')
+    assert json.dumps({key: 1}) == '{"default$$learner$$default$$default": 1}'
+    assert pickle.loads(pickle.dumps(key)).username == 'learner'
+
+    instances = [SimpleNamespace(conn_name='ssh', instance_name=InstanceKey(str(i), 'learner', 'default', 'default'),
+                                 user_handle=i) for i in range(3)]
+    for instance in instances:
+        d.conn._add_open_connection_instance(instance)
+
+    assert d.conn.get_open_instance() == 0
+    assert d.conn.get_open_instance('ssh', '2$$learner$$default$$default') == 2
+
+    d.conn._delete_open_connection_instance('ssh', instances[0].instance_name)
+    assert d.conn.get_open_instance() == 1
+
+    for instance in instances[1:]:
+        d.conn._delete_open_connection_instance('ssh', instance.instance_name)
+    assert not d.conn.open_instances
+    with pytest.raises(ConnectionInstanceOpenError):
+        d.conn.get_open_instance()
+
+
+def test_conversation_log_time_and_command_lookup_and_merge(tmp_path):
+    from remotelogin.connections.base import conversations
+    from remotelogin.connections.local import LocalConnection
+
+    conn = LocalConnection()
+    conn.conversation_log_folder = str(tmp_path)
+    with conn:
+        for cmd in ('echo a', 'echo b', 'echo a'):
+            conn.check_output(cmd)
+        exchanges = list(conn.data.exchanges())
+        assert [(e.sent, e.received) for e in exchanges] == [('echo a', 'a'), ('echo b', 'b'), ('echo a', 'a')]
+        assert conn.data.get_conversation_list() == [('echo a', 'a'), ('echo b', 'b'), ('echo a', 'a')]
+    assert len(conn.data.log) == 3
+
+    log = conversations.ConversationLog(conn.data.log.path)
+    assert list(log.exchanges(command='echo a')) == [exchanges[0], exchanges[2]]
+    assert list(log.exchanges(start=exchanges[1].time)) == exchanges[1:]
+    assert list(log.exchanges(end=exchanges[1].time, command='echo b')) == [exchanges[1]]
+
+    other = [conversations.Exchange((exchanges[0].time + exchanges[1].time) / 2, None, 'other', '')]
+    assert list(conversations.merge(log, other)) == [exchanges[0], other[0]] + exchanges[1:]
+
+
+def test_conversation_log_flush_starts_a_new_segment(tmp_path):
+    import logging
+    from remotelogin.connections.base import data
+    from remotelogin.connections.local import LocalConnection
+
+    class Records(logging.Handler):
+        def __init__(self):
+            super().__init__(logging.DEBUG)
+            self.messages = []
+
+        def emit(self, record):
+            self.messages.append(record.getMessage())
+
+    records = Records()
+    data.log.addHandler(records)
+    level = data.log.level
+    data.log.setLevel(logging.DEBUG)
+
+    conn = LocalConnection()
+    conn.conversation_log_folder = str(tmp_path)
+    try:
+        with conn:
+            conn.check_output('echo a')
+            conn.check_output('echo b')
+            flushed = conn.data.flush()
+            assert [e.sent for e in flushed] == ['echo a', 'echo b']
+            assert list(conn.data.exchanges()) == [] and conn.data.get_conversation_list() == []
+
+            conn.check_output('echo c')
+            assert conn.data.get_conversation_list() == [('echo c', 'c')]
+            assert conn.data.log.path == flushed.path[:-len('.jsonl')] + '.2.jsonl'
+    finally:
+        data.log.removeHandler(records)
+        data.log.setLevel(level)
+    assert [e.sent for e in flushed] == ['echo a', 'echo b']
+
+    # the data received is logged before the exchange is written to the log
+    received = [m for m in records.messages if m.startswith('Data Recv')]
+    assert [m.rpartition(': ')[2] for m in received] == ['a']
+
+
+def test_transfer_checksums_compared_with_the_remote_checksum(tmp_path):
+    import os
+    from remotelogin.connections.exceptions import FileTransferError
+    from remotelogin.connections.local import LocalConnection
+
+    source = str(tmp_path / 'image.bin')
+    with open(source, 'wb') as f:
+        f.write(os.urandom(1 << 16))
+
+    conn = LocalConnection()
+    with conn:
+        conn.put_file(source, remote_path=str(tmp_path / 'put.bin'), check_md5=True, checksum_algorithm='sha256')
+        got = conn.get_file(source, local_path=str(tmp_path / 'got.bin'), check_md5=True)
+        assert open(got, 'rb').read() == open(source, 'rb').read()
+
+        # the remote file changes after it is copied
+        conn._get_file = lambda remote_file, local_path: open(local_path, 'wb').write(b'corrupted')
+        with pytest.raises(FileTransferError):
+            conn.get_file(source, local_path=str(tmp_path / 'bad.bin'), check_md5=True, remove_if_bad_md5=True)
+        assert not os.path.exists(str(tmp_path / 'bad.bin'))
+
+
+def test_connections_retry_their_open_with_a_budget_per_host(monkeypatch):
+    import socket
+    from remotelogin.connections import settings
+    from remotelogin.connections.ssh import SshConnection
+    from fdutils import retries
+
+    s = socket.socket()
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+
+    monkeypatch.setattr(settings, 'CONNECT_TRIES', 3)
+    monkeypatch.setattr(settings, 'CONNECT_RETRY_DELAY', 0.01)
+    opens = []
+    open_transport = SshConnection._open_transport
+
+    def count_opens(self, **kwargs):
+        opens.append(self.port)
+        return open_transport(self, **kwargs)
+
+    monkeypatch.setattr(SshConnection, '_open_transport', count_opens)
+    with pytest.raises(ConnectionError):
+        SshConnection('127.0.0.1', port=port, username='user', password='password').open()
+    assert opens == [port] * 3
+
+    # the retries to the host are limited once its budget is used
+    budget = retries.budget_for('connect:127.0.0.1:{}'.format(port))
+    monkeypatch.setattr(budget, 'min_per_second', 0)
+    monkeypatch.setattr(budget, '_tokens', 0)
+    with pytest.raises(ConnectionError):
+        SshConnection('127.0.0.1', port=port, username='user', password='password').open()
+    assert len(opens) == 4
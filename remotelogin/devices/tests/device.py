@@ -1,11 +1,22 @@
 from remotelogin.devices.base import DeviceBase
 from remotelogin.devices.base_db import Device
+from remotelogin.devices import settings as device_settings
+from remotelogin.devices.follow import LogFollower, SegmentWriter
 from remotelogin.devices.settings import DEFAULT_STORAGE_FOLDER
 from remotelogin.devices.tests.utils import update_db_config
+from remotelogin.devices.utils import resolve_hosts, refresh_facts
+from remotelogin.devices.managers.connections import ConnectionsManager
+from remotelogin.connections.local import LocalConnection
 from remotelogin.oper_sys.linux import LinuxOS
 from remotelogin.oper_sys.windows import WindowsOS
+from fdutils import net
+from fdutils.net import Resolver
+import contextlib
 import os
 import pytest
+import shutil
+import socket
+import time
 
 
 def test_base():
@@ -87,3 +98,330 @@ def test_default_ip_persistent():
 
     d2 = Device.get_by_hostname('localhost')
     assert d2.default_ip_address == '127.0.0.1'
+
+
+def test_deferred_host_resolution():
+    d = DeviceBase('localhost', ip_type='ipv4', resolve_host=False)
+    assert d.unresolved_host == ('localhost', 'ipv4')
+    assert d.interfaces.ip_addresses == []
+    assert d.default_ip_address == '127.0.0.1'
+    assert d.unresolved_host is None
+
+
+def test_resolve_hosts_of_many_devices(monkeypatch):
+    devices = [DeviceBase(host, ip_type='ipv4', resolve_host=False) for host in ('localhost', 'localhost', 'nowhere')]
+    lookups = []
+
+    def nslookup_many(hosts, family=None, max_workers=None):
+        lookups.append(sorted(hosts))
+        return {host: ['127.0.0.1'] if host == 'localhost' else [] for host in hosts}
+
+    def nslookup_all(*args, **kwargs):
+        raise AssertionError('looked up one host at a time')
+
+    monkeypatch.setattr(net, 'nslookup_many', nslookup_many)
+    monkeypatch.setattr(net, 'nslookup_all', nslookup_all)
+    resolve_hosts(devices)
+    assert lookups == [['localhost', 'nowhere']]
+    assert [d.unresolved_host for d in devices] == [None, None, ('nowhere', 'ipv4')]
+    assert [d.interfaces.ip_addresses for d in devices] == [['127.0.0.1'], ['127.0.0.1'], []]
+
+    # the host that could not be resolved is looked up again the next time
+    monkeypatch.setattr(net, 'nslookup_many', lambda hosts, *args: {host: ['10.0.0.9'] for host in hosts})
+    resolve_hosts(devices)
+    assert devices[2].unresolved_host is None
+    assert devices[2].interfaces.ip_addresses == ['10.0.0.9']
+
+
+def test_host_setter_does_not_look_up_the_host(monkeypatch):
+    monkeypatch.setattr(device_settings, 'RESOLVE_HOST_ON_CREATION', False)
+    d = DeviceBase('localhost', default_ip_address='127.0.0.1')
+    lookups = []
+
+    def nslookup_all(host, *args, **kwargs):
+        lookups.append(host)
+        return ['10.0.0.2']
+
+    monkeypatch.setattr(net, 'nslookup_all', nslookup_all)
+    d.host = 'otherhost'
+    assert lookups == []
+    assert d.unresolved_host == ('otherhost', '')
+    d.resolve_host()
+    assert lookups == ['otherhost']
+    assert d.unresolved_host is None
+    assert d.interfaces.ip_addresses == ['127.0.0.1', '10.0.0.2']
+
+
+def test_resolver_caches_failures(monkeypatch):
+    calls = []
+
+    def getaddrinfo(host, *args, **kwargs):
+        calls.append(host)
+        raise socket.gaierror('unknown host')
+
+    monkeypatch.setattr(socket, 'getaddrinfo', getaddrinfo)
+    resolver = Resolver()
+    errors = []
+    for _ in range(3):
+        with pytest.raises(socket.gaierror) as e:
+            resolver.resolve('nowhere.invalid')
+        errors.append(e.value)
+    assert calls == ['nowhere.invalid']
+    # every cached failure is a new exception so the tracebacks do not keep growing
+    assert len({id(e) for e in errors}) == 3
+    assert all(str(e) == 'unknown host' for e in errors)
+    assert resolver.resolve_many(['nowhere.invalid', '10.0.0.1']) == {'nowhere.invalid': [], '10.0.0.1': ['10.0.0.1']}
+
+
+FACTS_OUTPUT = """@@facts@@ meminfo
+MemTotal:        6147400 kB
+MemFree:         4851804 kB
+@@facts@@ uptime
+350735.47 1370290.99
+"""
+
+
+class FactsConnection:
+
+    def __init__(self):
+        self.commands = []
+
+    def check_output(self, command):
+        self.commands.append(command)
+        return FACTS_OUTPUT
+
+
+def test_facts_are_only_collected_when_stale():
+    d = DeviceBase('localhost', default_ip_address='127.0.0.1')
+    conn = FactsConnection()
+
+    facts = d.get_facts('memory', 'uptime', conn=conn)
+    assert facts['memory'].total == 6147400 and facts['uptime'] == 350735.47
+    assert len(conn.commands) == 1
+
+    # served from the stored facts as json
+    assert d.get_facts('memory', 'uptime', conn=conn) == facts
+    assert d.factsjson['memory']['value']['free'] == 4851804
+    assert len(conn.commands) == 1
+
+    # only the stale one is collected again
+    d.factsjson['uptime']['timestamp'] -= 1000
+    assert d.stale_facts(('memory', 'uptime'), max_age=60) == ['uptime']
+    d.get_facts('memory', 'uptime', max_age=60, conn=conn)
+    assert len(conn.commands) == 2 and 'meminfo' not in conn.commands[1]
+
+
+def test_unknown_facts_are_value_errors(monkeypatch):
+    d = DeviceBase('localhost', default_ip_address='127.0.0.1')
+    conn = FactsConnection()
+    with pytest.raises(ValueError, match='Unknown facts: cpu'):
+        d.get_facts('memory', 'cpu', conn=conn)
+    assert conn.commands == []
+
+    monkeypatch.setattr(LinuxOS, 'get_facts', lambda self, *names, conn=None: {})
+    with pytest.raises(ValueError, match='did not return the facts: memory'):
+        d.get_facts('memory', conn=conn)
+def test_refresh_facts_of_many_devices(monkeypatch):
+    collected = []
+
+    def get_facts(self, *names, conn=None, **options):
+        collected.append(names)
+        return {name: 1.0 for name in names}
+
+    monkeypatch.setattr(LinuxOS, 'get_facts', get_facts)
+    monkeypatch.setattr(ConnectionsManager, 'lease', lambda self, name=None, timeout=None: contextlib.nullcontext())
+
+    fresh = DeviceBase('localhost', default_ip_address='127.0.0.1', facts=dict(uptime=5.0))
+    devices = [DeviceBase('localhost', default_ip_address='127.0.0.1') for _ in range(3)] + [fresh]
+    assert refresh_facts(devices, ('uptime',)) == {}
+    assert collected == [('uptime',)] * 3
+    assert fresh.get_facts('uptime') == dict(uptime=5.0)
+    assert all(d.facts_timestamp('uptime') <= time.time() for d in devices)
+
+
+def test_facts_persistent():
+    update_db_config()
+    d = Device('localhost', default_ip_address='127.0.0.1')
+    d.get_facts('memory', conn=FactsConnection())
+    d.save()
+
+    d2 = Device.get_by_hostname('localhost')
+    assert d2.get_facts('memory', conn=FactsConnection())['memory'].total == 6147400
+    assert not d2.stale_facts(('memory',))
+
+
+def test_db_from_before_facts_gets_the_column(tmp_path):
+    from sqlalchemy import create_engine, MetaData
+    from sqlalchemy.orm import sessionmaker
+    from fdutils.db import add_missing_columns
+
+    path = str(tmp_path / 'devices.db')
+    shutil.copy(os.path.join(os.path.dirname(__file__), 'testdb.db'), path)
+    engine = create_engine('sqlite:///' + path)
+    # only the devices table: other tests map more models (i.e. devices2, also in testdb.db) to the shared metadata
+    metadata = MetaData()
+    Device.__table__.tometadata(metadata)
+
+    assert add_missing_columns(engine, [metadata]) == [('devices', 'facts')]
+    assert add_missing_columns(engine, [metadata]) == []
+
+    session = sessionmaker(bind=engine)()
+    hosts = [host for host, in session.query(Device.host)]
+    session.add(Device('newhost', default_ip_address='127.0.0.1', facts=dict(uptime=1.5), encrypt_passwords=False))
+    session.commit()
+    session.expunge_all()
+    assert [host for host, in session.query(Device.host)] == hosts + ['newhost']
+    assert session.query(Device).filter_by(host='newhost').one().factsjson['uptime']['value'] == 1.5
+
+
+def device_db(tmp_path, monkeypatch, count=1):
+    """ session of a new sqlite db (set as the Device session) with count encrypted devices stored """
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from fdutils import crypto
+
+    engine = create_engine('sqlite:///' + str(tmp_path / 'devices.db'))
+    Device.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    monkeypatch.setattr(Device, '_session', session)
+    monkeypatch.setattr(crypto, 'DEFAULT_CRYPTO_ENGINE', crypto.SecuredTextEngine(password=b'tests'))
+
+    for i in range(count):
+        d = Device('10.0.0.{}'.format(i + 1), default_ip_address='10.0.0.{}'.format(i + 1), encrypt_passwords=True,
+                   users=dict(admin=dict(password='secret'), default_name='admin'),
+                   connections=dict(ssh=dict(proto='ssh', user='admin'), default_name='ssh'))
+        for name in ('conn', 'users', 'interfaces', 'tunnels'):
+            setattr(d, name + 'json' if name != 'conn' else 'connectionsjson', d._data_to_json(getattr(d, name)))
+        session.add(d)
+    session.commit()
+    session.expunge_all()
+    return session
+
+
+def test_lazy_devices_work_like_eager_ones(tmp_path, monkeypatch):
+    from remotelogin.devices.base import lazy_loading
+    from remotelogin.devices.exceptions import ConnectionInstanceOpenError
+
+    session = device_db(tmp_path, monkeypatch)
+    eager, = Device.load_many(lazy=False)
+    assert eager.is_hydrated
+    session.expunge_all()
+
+    lazy, = Device.load_many()
+    assert not lazy.is_hydrated
+    # the connection methods are forwarded as with an eager device
+    for d in (eager, lazy):
+        with pytest.raises(ConnectionInstanceOpenError):
+            d.check_output('whoami')
+    assert lazy.is_hydrated
+    assert lazy.users.default.password == eager.users.default.password == 'secret'
+    session.expunge_all()
+
+    for attr in ('crypto_engine', 'encrypt_salt'):
+        lazy, = Device.load_many()
+        assert getattr(lazy, attr) is not None and lazy.is_hydrated
+        session.expunge_all()
+    assert lazy.crypto_engine.salt == lazy.encrypt_salt == eager.encrypt_salt
+
+    with lazy_loading():
+        assert not Device.query.one().is_hydrated
+    session.expunge_all()
+    assert Device.query.one().is_hydrated
+
+
+def test_lazy_devices_hydrated_once_by_many_threads(tmp_path, monkeypatch):
+    import threading
+    from remotelogin.devices.exceptions import ConnectionInstanceOpenError
+
+    session = device_db(tmp_path, monkeypatch, count=3)
+    devices = Device.load_many()
+    assert not any(d.is_hydrated for d in devices)
+
+    hydrated = []
+    hydrate = Device._hydrate
+
+    def slow_hydrate(self, **kwargs):
+        hydrated.append(self.host)
+        time.sleep(0.05)
+        hydrate(self, **kwargs)
+
+    monkeypatch.setattr(Device, '_hydrate', slow_hydrate)
+    start = threading.Barrier(8)
+    used, errors = set(), []
+
+    def use(attr):
+        start.wait()
+        for d in devices:
+            try:
+                used.add((d.host, attr, id(getattr(d, attr))))
+            except ConnectionInstanceOpenError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=use, args=(attr,))
+               for attr in ('conn', 'users', 'crypto_engine', 'check_output') * 2]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert sorted(hydrated) == sorted(d.host for d in devices)
+    assert all(d.is_hydrated for d in devices)
+    # every thread got the same managers and the forwarded method failed as on an eager device
+    assert len(used) == 3 * len(devices) and len(errors) == 2 * len(devices)
+    session.close()
+
+
+def _follow_lines(follower, count, timeout=10):
+    lines = []
+    with follower:
+        while len(lines) < count:
+            line = follower.get(timeout)
+            assert line is not None, 'no lines after {} seconds'.format(timeout)
+            lines.append(line)
+    return lines
+
+
+def test_log_follower_filters_on_the_device_and_resumes_from_the_offsets(monkeypatch, tmp_path):
+    conn = LocalConnection().open()
+
+    @contextlib.contextmanager
+    def lease(self, name=None, timeout=None):
+        yield conn
+
+    monkeypatch.setattr(ConnectionsManager, 'lease', lease)
+    d = DeviceBase('localhost', default_ip_address='127.0.0.1')
+    log_file = tmp_path / 'app.log'
+    log_file.write_text('old ERR\n')
+
+    try:
+        with open(log_file, 'a') as f:
+            f.write('ok\nERR 1\nERR ignore\nERR 2\n')
+        # from after the first line
+        follower = LogFollower({d: str(log_file)}, pattern='ERR', exclude='ignore', segments_folder=str(tmp_path),
+                               offsets={('localhost', str(log_file)): 8})
+        lines = _follow_lines(follower, 2)
+        assert [(l.device, l.line, l.offset) for l in lines] == [(d, 'ERR 1', 17), (d, 'ERR 2', 34)]
+        assert follower.offsets == {('localhost', str(log_file)): 34}
+        segments = list((tmp_path / 'localhost').iterdir())
+        assert len(segments) == 1 and segments[0].read_text() == 'ERR 1\nERR 2\n'
+
+        # rotated while not following: the new file is read from its start
+        log_file.write_text('ERR 3\n')
+        lines = _follow_lines(LogFollower({d: str(log_file)}, pattern='ERR', offsets=follower.offsets), 1)
+        assert (lines[0].line, lines[0].offset) == ('ERR 3', 6)
+    finally:
+        conn.close()
+
+
+def test_segments_are_rotated(tmp_path):
+    path = str(tmp_path / 'segs' / 'app')
+    writer = SegmentWriter(path, max_bytes=10, segments=2)
+    for i in range(5):
+        writer.write('line {}'.format(i))
+    writer.close()
+    assert sorted(os.listdir(str(tmp_path / 'segs'))) == ['app.4.log', 'app.5.log']
+
+    writer = SegmentWriter(path, max_bytes=100, segments=2)
+    writer.write('line 5')
+    writer.close()
+    assert (tmp_path / 'segs' / 'app.5.log').read_text() == 'line 4\nline 5\n'
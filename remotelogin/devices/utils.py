@@ -1,7 +1,9 @@
 import collections
+import concurrent.futures
 import logging
 
 import fdutils as utils
+from remotelogin.devices import settings
 
 log = logging.getLogger(__name__)
 
@@ -20,22 +22,80 @@ def transform_password(values, crypto_engine_function):
             values[_k] = crypto_engine_function(_v)
 
 
+def ip_type_to_family(ip_type):
+    ip_type = str(ip_type).lower()
+    if ip_type in ('v4', '4', 'ipv4', 'ip4'):
+        return 'ipv4'
+    elif ip_type in ('v6', '6', 'ipv6', 'ip6'):
+        return 'ipv6'
+    return None
+
+
 def get_ip_from_default_or_hostname(hostname, default_ip='', ip_type=''):
     """ in case default ip is not given we try to get it from the hostname """
-    if ip_type.lower() in ('v4', '4', 4, 'ipv4', 'ip4'):
-        family = 'ipv4'
-    elif ip_type.lower() in ('v6', '6', 6, 'ipv6', 'ip6'):
-        family = 'ipv6'
-    else:
-        family = None
-
     if not default_ip and hostname:
         try:
-            ip_from_hostname = utils.net.nslookup_all(hostname, family)
+            ip_from_hostname = utils.net.nslookup_all(hostname, ip_type_to_family(ip_type))
             if ip_from_hostname:
                 return ip_from_hostname[0]
         except Exception:
             log.debug('Problems doing an nslookup of ' + str(hostname))
             return ''
     else:
-        return default_ip
\ No newline at end of file
+        return default_ip
+
+
+def resolve_hosts(devices, max_workers=None):
+    """ resolves concurrently the hosts of the devices created with resolve_host=False so the dns lookups are not
+        done one after the other when they are used
+
+    Args:
+        devices: devices to resolve
+        max_workers (int): maximum number of lookups at the same time
+
+    """
+    devices = [d for d in devices if d.unresolved_host]
+    by_family = collections.defaultdict(set)
+    for d in devices:
+        by_family[ip_type_to_family(d.unresolved_host[1])].add(d.unresolved_host[0])
+
+    addresses = {}
+    for family, hosts in by_family.items():
+        for host, ips in utils.net.nslookup_many(hosts, family, max_workers).items():
+            addresses[host, family] = ips[0] if ips else ''
+
+    for d in devices:
+        host, ip_type = d.unresolved_host
+        d.resolve_host(addresses[host, ip_type_to_family(ip_type)])
+
+
+def refresh_facts(devices, names=(), max_age=None, max_workers=None):
+    """ refreshes concurrently the facts of the devices that are missing or older than max_age seconds. Every device
+        gets its stale facts with one command. Devices whose facts are all fresh are not connected to
+
+    Args:
+        devices: devices to refresh
+        names: facts to refresh (the default ones of each device if not given)
+        max_age (float): seconds a stored fact is still good (settings.FACTS_MAX_AGE by default)
+        max_workers (int): maximum number of devices refreshed at the same time (settings.FACTS_REFRESH_WORKERS)
+
+    Returns:
+        dict: device -> exception raised while refreshing it (empty if all of them were refreshed)
+
+    """
+    stale = [(d, s) for d, s in ((d, d.stale_facts(names, max_age)) for d in devices) if s]
+    if not stale:
+        return {}
+
+    def refresh(device_and_names):
+        device, stale_names = device_and_names
+        try:
+            device.refresh_facts(*stale_names)
+        except Exception as e:
+            log.exception('Problems refreshing the facts of {}'.format(device.host))
+            return device, e
+        return device, None
+
+    workers = min(max_workers or settings.FACTS_REFRESH_WORKERS, len(stale))
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        return {d: e for d, e in executor.map(refresh, stale) if e is not None}
@@ -1,38 +1,131 @@
+import logging
+
 from . import base, busybox, cisco, linux, unix, windows, alcatel, ilo
 
+log = logging.getLogger(__name__)
+
 __author__ = 'Filinto Duran (duranto@gmail.com)'
 
+# entry point group where other packages can register their OS classes (name = os name, value = OSBase subclass)
+# i.e. in setup.py: entry_points={'remotelogin.oper_sys': ['junos = mypackage.junos:JunOS']}
+PLUGINS_ENTRY_POINT = 'remotelogin.oper_sys'
+
+# os name -> OS class
+_registry = {}
+
+# os names already looked up (including the prefix matches like win32 -> win) -> OS class
+_resolved = {}
+
+_plugins_loaded = False
+
+# OS instances shared by every connection/device created with the same os class and kwargs
+_shared_os = {}
+
+
+def register_os(os_cls, *names):
+    """ registers an OS class so os_factory can find it by any of the names (or by its name attribute)
+
+    Args:
+        os_cls (type): OSBase subclass
+        *names: names to use for this class. os_factory will also match os names starting with them
+
+    Returns: os_cls so it can be used as class decorator
+
+    """
+    for name in names or (os_cls.name,):
+        _registry[name.lower()] = os_cls
+    _resolved.clear()
+    return os_cls
+
+
+def _load_plugins():
+    global _plugins_loaded
+    if _plugins_loaded:
+        return False
+    _plugins_loaded = True
+
+    try:
+        from importlib.metadata import entry_points
+        eps = entry_points()
+        eps = eps.select(group=PLUGINS_ENTRY_POINT) if hasattr(eps, 'select') else eps.get(PLUGINS_ENTRY_POINT, ())
+    except ImportError:
+        try:
+            import pkg_resources
+        except ImportError:
+            return False
+        eps = pkg_resources.iter_entry_points(PLUGINS_ENTRY_POINT)
+
+    found = False
+    for ep in eps:
+        try:
+            register_os(ep.load(), ep.name)
+            found = True
+        except Exception:
+            log.exception('problems loading the os plugin ' + str(ep))
+    return found
+
+
+def _find_os_class(os_name):
+    os_cls = _registry.get(os_name)
+    if os_cls is None:
+        prefixes = [name for name in _registry if os_name.startswith(name)]
+        if prefixes:
+            os_cls = _registry[max(prefixes, key=len)]
+    return os_cls
+
+
+def get_os_class(os_name):
+    """ returns the OS class registered for this name (or for the longest registered name this name starts with) """
+    os_name = os_name.lower()
+    try:
+        return _resolved[os_name]
+    except KeyError:
+        pass
+
+    os_cls = _find_os_class(os_name)
+    if os_cls is None and _load_plugins():
+        os_cls = _find_os_class(os_name)
+    if os_cls is None:
+        raise ValueError('This os ({}) is not defined yet'.format(os_name))
+
+    _resolved[os_name] = os_cls
+    return os_cls
+
+
+def _get_os(os_cls, **os_kwargs):
+    if not os_cls.is_shareable:
+        return os_cls(**os_kwargs)
+
+    key = os_cls, tuple(sorted(os_kwargs.items()))
+    try:
+        return _shared_os[key]
+    except KeyError:
+        pass
+    except TypeError:   # unhashable kwarg value
+        return os_cls(**os_kwargs)
+    return _shared_os.setdefault(key, os_cls(**os_kwargs).freeze())
+
 
-# TODO: autoregister/plugin vendors
 def os_factory(os_name='', **os_kwargs):
     """ returns an OS instance. defaults to LinuxOS
 
+        OS objects do not keep session information so the same read only instance is returned for the same os and
+        kwargs (unless the OS class sets is_shareable to False). Use its copy() to get one that can be modified
+
     Args:
         os_name:
 
     Returns: remotelogin.oper_sys.base.OSBase
 
     """
-    if not os_name:
-        return linux.LinuxOS()
+    return _get_os(get_os_class(os_name) if os_name else linux.LinuxOS, **os_kwargs)
 
-    os_name = os_name.lower()
 
-    platform_to_object = dict(
-        linux=linux.LinuxOS,
-        win=windows.WindowsOS,
-        windows=windows.WindowsOS,
-        win32=windows.WindowsOS,
-        darwin=unix.UnixOS,
-        alcatel=alcatel.AlcatelOS,
-        cisco=cisco.CiscoIOS,
-        ios=cisco.CiscoIOS,
-        ilo=ilo.iLOOS,
-        cisco_ace=cisco.CiscoIOSACE,
-        busybox=busybox.BusyBoxOS
-    )
-    for _os, _os_obj in platform_to_object.items():
-        if os_name.startswith(_os):
-            return _os_obj(**os_kwargs)
-    else:
-        raise ValueError('This os ({}) is not defined yet'.format(os_name))
+register_os(linux.LinuxOS, 'linux')
+register_os(windows.WindowsOS, 'win', 'windows', 'win32')
+register_os(unix.UnixOS, 'darwin')
+register_os(alcatel.AlcatelOS, 'alcatel')
+register_os(cisco.CiscoIOS, 'cisco', 'ios')
+register_os(ilo.iLOOS, 'ilo')
+register_os(cisco.CiscoIOSACE, 'cisco_ace')
+register_os(busybox.BusyBoxOS, 'busybox')
@@ -37,7 +37,7 @@ class AlcatelOS(OSBase):
     unique_prompt_format = '@@fidozqkyPROMPT@@'
     reset_prompt_on_exit = True
 
-    def __init__(self, can_change_prompt=True):
+    def __init__(self, can_change_prompt=None):
         super().__init__(can_change_prompt=can_change_prompt)
 
     @contextlib.contextmanager
@@ -1,9 +1,23 @@
 import abc
+import copy
+import functools
 import re
 
 
 RANDOM_PROMPT_LENGTH = 8
 
+# max number of different arguments to remember per command builder method
+CMD_CACHE_SIZE = 256
+
+
+def memoize_cmd(f):
+    """ caches the string returned by a command builder method. Only for methods whose result depends on their
+        (hashable) arguments alone as OSCommands instances are singletons shared by every connection, and only where
+        building the string takes long enough to matter (facts and tcp_sockets take 3-10us against 0.3us from the
+        cache). One line formatters take under 1us to build and are not cached
+    """
+    return functools.lru_cache(maxsize=CMD_CACHE_SIZE)(f)
+
 
 class OSCommands:
     """ base class for OS commands that return strings
@@ -41,17 +55,33 @@ class OSCommands:
     def cd(self, new_folder):
         return "cd {}".format(new_folder)
 
+    def checksum(self, file_path, algorithm='md5'):
+        """ prints the checksum of the file (algorithm is one of fdutils.checksums.ALGORITHMS) """
+        if algorithm == 'md5' and hasattr(self, 'md5checksum'):
+            return self.md5checksum(file_path)
+        raise ValueError('{} has no command for {} checksums'.format(self.__class__.__name__, algorithm))
+
     def disable_history(self):
         pass
 
     def enable_history(self):
         pass
 
+    def shell_init(self, prompt='', cols=0, rows=0, disable_history=False):
+        """ one line that disables history, resizes the pty and sets the prompt so a new shell can be setup in a
+            single round trip. The prompt part is always last so the new prompt is the first thing we get back.
+            None means the OS cannot chain commands and each step needs to be sent on its own
+        """
+        return None
+
 
 def set_locals(klass, locs, OS_KWARGS_TYPES):
-    for l in [l for l in locs if not hasattr(klass, l)]:
-        if l in OS_KWARGS_TYPES and locs[l] is None:
-            setattr(klass, l, locs[l])
+    """ sets the given (not None) __init__ arguments as instance attributes overriding the class defaults. Subclass
+        __init__ arguments need to default to None so the class attributes stay the defaults of each OS
+    """
+    for l, v in locs.items():
+        if l != 'self' and v is not None:
+            setattr(klass, l, OS_KWARGS_TYPES[l](v) if l in OS_KWARGS_TYPES else v)
 
 
 class OSBase:
@@ -80,6 +110,14 @@ class OSBase:
     can_change_prompt = False
     can_disable_history = False
 
+    # names of the facts get_facts can collect
+    FACTS = ()
+
+    # os_factory shares one (read only) instance between all the connections with the same os/kwargs. OSes that
+    # keep per session state in the instance need to set this to False
+    is_shareable = True
+    _frozen = False
+
     @classmethod
     def pop_os_properties_from_kwargs(cls, **kwargs):
         os_props = {}
@@ -89,7 +127,7 @@ class OSBase:
         return os_props, kwargs
 
     OS_KWARGS = 'can_resize_pty', 'can_change_prompt', 'can_disable_history', 'reset_prompt_on_exit', 'default_prompt'
-    OS_KWARGS_TYPES = dict(can_resize_pty=bool, can_change_promp=bool, can_disable_history=bool,
+    OS_KWARGS_TYPES = dict(can_resize_pty=bool, can_change_prompt=bool, can_disable_history=bool,
                            reset_prompt_on_exit=bool)
 
     # NOTE: if we change/add kwargs we need to synchronize arguments in DeviceBase.init_os method
@@ -107,6 +145,56 @@ class OSBase:
         elif not self.cmd:
             self.cmd = self.shell_cmds_module.get_instance()
 
+    def __setattr__(self, key, value):
+        if self._frozen:
+            raise AttributeError('{} is shared and cannot be modified. Get a different instance from os_factory '
+                                 'passing the attributes as kwargs or a private one with copy()'
+                                 ''.format(self.__class__.__name__))
+        super().__setattr__(key, value)
+
+    def freeze(self):
+        """ makes the instance read only (os_factory does it for the instances it shares) """
+        object.__setattr__(self, '_frozen', True)
+        return self
+
+    def copy(self):
+        """ a private instance that can be modified (i.e. device.os = device.os.copy()). The commands (cmd) are still
+            the shared ones
+        """
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.__dict__.pop('_frozen', None)
+        return new
+
+    def __deepcopy__(self, memo):
+        # connection copies keep using the shared instance
+        if self.is_shareable:
+            return self
+        new = self.__class__.__new__(self.__class__)
+        memo[id(self)] = new
+        new.__dict__.update(copy.deepcopy(self.__dict__, memo))
+        return new
+
+    def get_facts(self, *names, conn=None, **options):
+        """ collects facts (memory, file systems, etc.) of the host with one command
+
+        Returns:
+            dict: fact name -> fact
+        """
+        raise NotImplementedError('{} does not collect facts'.format(self.__class__.__name__))
+
+    def checksum_clean(self, data, algorithm='md5'):
+        """ the checksum (lower case hex) in the output of cmd.checksum """
+        return self.md5sum_clean(data)
+
+    def facts_to_json(self, name, value):
+        """ a fact returned by get_facts as something that can be stored as json """
+        return value
+
+    def facts_from_json(self, name, data):
+        """ the fact stored with facts_to_json """
+        return data
+
     def base64_clean(self, data):
         return data
 
@@ -22,8 +22,9 @@ class CiscoIOS(OSBase):
     cmd = shellcommands.CiscoIOSShellCmds()
     ssh_app = 'ssh'
     name = 'cisco'
+    is_shareable = False    # is_level_privileged is per session
 
-    def __init__(self, can_change_prompt=True):
+    def __init__(self, can_change_prompt=None):
         super(CiscoIOS, self).__init__(can_change_prompt=can_change_prompt)
         self.is_level_privileged = False
 
@@ -0,0 +1,317 @@
+""" collection of linux facts (memory, file systems, memory per process, interfaces) from procfs/sysfs
+
+    All the facts asked for are gathered with one remote command (see LinuxShellCmds.facts) whose output is split in
+    sections and parsed in one pass into namedtuple records.
+
+    >>> facts.collect(conn, os.cmd, ('memory', 'processes_memory'))
+    {'memory': Memory(total=16314584, ...), 'processes_memory': {1: ProcessMemory(pid=1, cmd='/sbin/init', ...)}}
+
+"""
+import collections
+import ipaddress
+import itertools
+import logging
+import re
+
+from .shellcommands import LinuxShellCmds
+
+log = logging.getLogger(__name__)
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+# sizes are in kB (file systems in blocks of the block_size asked for)
+Memory = collections.namedtuple('Memory', 'total used free shared buffers cache available swap_total swap_used '
+                                          'swap_free')
+FileSystem = collections.namedtuple('FileSystem', 'filesystem blocks used available percentage mounted')
+ProcessMemory = collections.namedtuple('ProcessMemory', 'pid cmd args private shared')
+Interface = collections.namedtuple('Interface', 'name encapsulation mac mtu ip bcast mask addresses '
+                                                'rx_packets rx_errors rx_dropped rx_overruns rx_frame rx_bytes '
+                                                'tx_packets tx_errors tx_dropped tx_overruns tx_carrier tx_bytes '
+                                                'collisions')
+
+PSS_ADJUST = 0.5    # kB added per Pss line as the average error due to truncation (taken from ps_mem)
+
+# /sys/class/net/<interface>/type to the encapsulation name shown by ifconfig
+ENCAPSULATIONS = {1: 'Ethernet', 772: 'Local Loopback', 768: 'IPIP Tunnel', 776: 'IPv6-in-IPv4', 65534: 'UNSPEC'}
+
+# interface statistics file to Interface field
+_NET_STATISTICS = dict(rx_packets='rx_packets', rx_errors='rx_errors', rx_dropped='rx_dropped',
+                       rx_fifo_errors='rx_overruns', rx_frame_errors='rx_frame', rx_bytes='rx_bytes',
+                       tx_packets='tx_packets', tx_errors='tx_errors', tx_dropped='tx_dropped',
+                       tx_fifo_errors='tx_overruns', tx_carrier_errors='tx_carrier', tx_bytes='tx_bytes',
+                       collisions='collisions')
+
+
+_SECTION_RE = re.compile(re.escape(LinuxShellCmds.FACTS_SECTION_MARKER) + r' (\w+)$')
+
+
+def iter_sections(text):
+    """ yields (section name, iterator over the lines of the section) walking the output only once.
+        Each iterator has to be consumed before moving to the next section
+    """
+    current = [None]
+
+    def section_of(line):
+        m = _SECTION_RE.match(line)
+        if m:
+            current[0] = m.group(1)
+        return current[0]
+
+    for name, lines in itertools.groupby(text.splitlines(), section_of):
+        if name is not None:
+            next(lines)     # the marker line
+            yield name, lines
+
+
+# ###################       section parsers        ################################
+
+def parse_meminfo(lines):
+    values = {}
+    for line in lines:
+        key, _, value = line.partition(':')
+        if value:
+            values[key] = int(value.split()[0])
+
+    total = values.get('MemTotal', 0)
+    free = values.get('MemFree', 0)
+    buffers = values.get('Buffers', 0)
+    cache = values.get('Cached', 0) + values.get('SReclaimable', 0)
+    swap_total = values.get('SwapTotal', 0)
+    swap_free = values.get('SwapFree', 0)
+    return Memory(total=total, used=total - free - buffers - cache, free=free, shared=values.get('Shmem', 0),
+                  buffers=buffers, cache=cache, available=values.get('MemAvailable', free + buffers + cache),
+                  swap_total=swap_total, swap_used=swap_total - swap_free, swap_free=swap_free)
+
+
+def parse_uptime(lines):
+    """ seconds since boot from /proc/uptime """
+    for line in lines:
+        fields = line.split()
+        if fields:
+            return float(fields[0])
+    return 0.0
+
+
+def parse_df(lines):
+    file_systems = []
+    for line in lines:
+        fields = line.split(None, 5)
+        if len(fields) < 6 or not fields[1].isdigit():
+            continue    # header
+        percentage = fields[4].rstrip('%')
+        file_systems.append(FileSystem(fields[0], int(fields[1]), int(fields[2]), int(fields[3]),
+                                       int(percentage) if percentage.isdigit() else None, fields[5]))
+    return file_systems
+
+
+def parse_ps(lines):
+    """ pid -> (cmd, args) """
+    processes = {}
+    for line in lines:
+        fields = line.split(None, 2)
+        if len(fields) > 1 and fields[0].isdigit():
+            processes[int(fields[0])] = (fields[1], fields[2] if len(fields) > 2 else '')
+    return processes
+
+
+def parse_smaps(lines):
+    """ pid -> (private, shared) in kB. shared is taken from the proportional set size when the kernel has it """
+    memory = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) != 5 or not fields[0].isdigit():
+            continue
+        pid, private, shared, pss, pss_lines = fields
+        private, pss_lines = int(private), int(pss_lines)
+        if pss_lines:
+            shared = int(pss) + pss_lines * PSS_ADJUST - private
+        else:
+            shared = int(shared)
+        memory[int(pid)] = (private, shared)
+    return memory
+
+
+def parse_net_devices(lines):
+    """ interface -> {attribute: value} from the 'path:value' lines of LinuxShellCmds.net_devices """
+    devices = collections.defaultdict(dict)
+    for line in lines:
+        path, _, value = line.partition(':')
+        parts = path.split('/')
+        if len(parts) < 6:
+            continue
+        devices[parts[4]][parts[-1]] = value.strip()
+    return devices
+
+
+def parse_ip_addresses(lines):
+    """ interface -> list of ipaddress.ip_interface (ipv4 first) and the broadcast of the first ipv4 address """
+    addresses = collections.defaultdict(lambda: ([], []))
+    broadcasts = {}
+    for line in lines:
+        fields = line.split()
+        if len(fields) < 4 or fields[2] not in ('inet', 'inet6'):
+            continue
+        name = fields[1].split('@')[0]
+        try:
+            address = ipaddress.ip_interface(fields[3])
+        except ValueError:
+            continue
+        addresses[name][fields[2] == 'inet6'].append(address)
+        if fields[2] == 'inet' and name not in broadcasts and len(fields) > 5 and fields[4] == 'brd':
+            broadcasts[name] = fields[5]
+    return {name: (v4 + v6, broadcasts.get(name, '')) for name, (v4, v6) in addresses.items()}
+
+
+# ###################       facts        ################################
+
+def _join_processes_memory(ps, smaps):
+    """ processes without memory (kernel threads) or whose smaps could not be read are left out """
+    processes = {}
+    for pid, (private, shared) in smaps.items():
+        cmd, args = ps.get(pid, ('', ''))
+        processes[pid] = ProcessMemory(pid, cmd, args, private, shared)
+    return processes
+
+
+def _int(value, default=0):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _join_interfaces(devices, addresses):
+    interfaces = {}
+    for name, attributes in devices.items():
+        ips, bcast = addresses.get(name, ((), ''))
+        first = ips[0] if ips else None
+        encapsulation = _int(attributes.get('type'), None)
+        stats = {field: _int(attributes.get(stat)) for stat, field in _NET_STATISTICS.items()}
+        interfaces[name] = Interface(name=name, encapsulation=ENCAPSULATIONS.get(encapsulation, str(encapsulation)),
+                                     mac=attributes.get('address', ''), mtu=_int(attributes.get('mtu')),
+                                     ip=str(first.ip) if first else '', bcast=bcast,
+                                     mask=str(first.netmask) if first else '',
+                                     addresses=tuple(str(ip) for ip in ips), **stats)
+    return interfaces
+
+
+# section name -> (function(os commands, **options) returning the command, parser of the section lines)
+SECTIONS = dict(
+    meminfo=(lambda cmds, **options: cmds.meminfo(), parse_meminfo),
+    uptime=(lambda cmds, **options: cmds.cat('/proc/uptime'), parse_uptime),
+    df=(lambda cmds, block_size='k', **options: cmds.df_posix(block_size), parse_df),
+    ps=(lambda cmds, **options: cmds.pid_and_args(), parse_ps),
+    smaps=(lambda cmds, pid=None, **options: cmds.processes_memory(str(pid or '[0-9]*')), parse_smaps),
+    net=(lambda cmds, interface=None, **options: cmds.net_devices(interface or '*'), parse_net_devices),
+    ip=(lambda cmds, interface=None, **options: cmds.ip_addresses(interface or ''), parse_ip_addresses),
+)
+
+# fact name -> (sections needed, function creating the fact from the parsed sections)
+FACTS = dict(
+    memory=(('meminfo',), lambda meminfo: meminfo),
+    uptime=(('uptime',), lambda uptime: uptime),
+    file_systems=(('df',), lambda df: df),
+    processes_memory=(('ps', 'smaps'), _join_processes_memory),
+    interfaces=(('net', 'ip'), _join_interfaces),
+)
+
+
+def _sections_of(names):
+    sections = []
+    for name in names:
+        try:
+            needed = FACTS[name][0]
+        except KeyError:
+            raise ValueError('Unknown fact {} (use one of {})'.format(name, ', '.join(FACTS)))
+        sections.extend(s for s in needed if s not in sections)
+    return sections
+
+
+def command(cmds, names=None, **options):
+    """ the command that collects the facts
+
+    Args:
+        cmds (remotelogin.oper_sys.linux.shellcommands.LinuxShellCmds): os commands
+        names (iterable of str): facts to collect (all by default)
+        **options: block_size of df ('k' or 'm'), pid (only the memory of this process) and interface (only this one)
+
+    """
+    return cmds.facts(tuple((s, SECTIONS[s][0](cmds, **options)) for s in _sections_of(names or FACTS)))
+
+
+def parse(text, names=None):
+    """ parses the output of the facts command and returns a dictionary fact name -> fact """
+    names = names or tuple(FACTS)
+    sections = _sections_of(names)
+    parsed = {}
+    for section, lines in iter_sections(text):
+        if section in sections:
+            parsed[section] = SECTIONS[section][1](lines)
+
+    for section in sections:
+        if section not in parsed:
+            log.debug('section {} not found in the facts output'.format(section))
+            parsed[section] = SECTIONS[section][1](())
+
+    return {name: FACTS[name][1](*(parsed[s] for s in FACTS[name][0])) for name in names}
+
+
+def collect(conn, cmds, names=None, **options):
+    """ collects the facts in one round trip
+
+    Args:
+        conn: open connection
+        cmds (remotelogin.oper_sys.linux.shellcommands.LinuxShellCmds): os commands
+        names (iterable of str): facts to collect (all by default). One of memory, uptime, file_systems,
+                                 processes_memory and interfaces
+        **options: see command
+
+    Returns:
+        dict: fact name -> fact
+
+    Raises:
+        ValueError: if no connection is given
+
+    """
+    if conn is None:
+        raise ValueError('An open connection (conn) to the device is needed to collect its facts')
+    names = tuple(names or FACTS)
+    return parse(conn.check_output(command(cmds, names, **options)), names)
+
+
+# fact name -> (record, None for a single record, list for a list of them or the field the records are keyed by)
+RECORDS = dict(
+    memory=(Memory, None),
+    file_systems=(FileSystem, list),
+    processes_memory=(ProcessMemory, 'pid'),
+    interfaces=(Interface, 'name'),
+)
+
+
+def _asdict(record):
+    return record._asdict() if hasattr(record, '_asdict') else dict(record)
+
+
+def to_json(name, value):
+    """ a fact as something that can be stored as json (records as dictionaries) """
+    if name not in RECORDS or value is None:
+        return value
+    _, kind = RECORDS[name]
+    if kind is None:
+        return _asdict(value)
+    return [_asdict(record) for record in (value if kind is list else value.values())]
+
+
+def _record(record_cls, data):
+    return record_cls(**{k: tuple(v) if isinstance(v, list) else v for k, v in data.items()})
+
+
+def from_json(name, data):
+    """ the fact stored with to_json """
+    if name not in RECORDS or data is None:
+        return data
+    record_cls, kind = RECORDS[name]
+    if kind is None:
+        return _record(record_cls, data)
+    records = [_record(record_cls, d) for d in data]
+    return records if kind is list else {getattr(r, kind): r for r in records}
@@ -1,4 +1,7 @@
+import shlex
+
 import fdutils
+from .. import base
 from ..unix import shellcommands
 
 import logging
@@ -112,6 +115,152 @@ class LinuxShellCmds(shellcommands.UnixShellCmds):
     def get_pid_and_cmd_from_ps(self):
         return 'ps -Af | ' + self.get_fields_from_text(first=6, fields=(2,))
 
+    ##############      Facts Functions     ###############################
+
+    FACTS_SECTION_MARKER = '@@facts@@'
+
+    @base.memoize_cmd
+    def facts(self, sections):
+        """ one command that prints the output of every section command after a marker line with the section name.
+            stderr is discarded so processes that go away while reading /proc do not fail the whole command
+
+        :param tuple of (str, str) sections: pairs of section name and command
+        """
+        return '{{ {}; }} 2>/dev/null'.format(
+            '; '.join("echo '{} {}'; {}".format(self.FACTS_SECTION_MARKER, name, cmd) for name, cmd in sections))
+
+    def meminfo(self):
+        return 'cat /proc/meminfo'
+
+    def df_posix(self, block_size='k'):
+        # -P keeps every file system in one line even with long device names
+        return 'df -P -' + block_size
+
+    def pid_and_args(self):
+        return 'ps -eo pid=,args='
+
+    def processes_memory(self, pid='[0-9]*'):
+        """ the smaps_rollup (smaps before kernel 4.14) of the processes summed up in one pass to a line
+            'pid private shared pss pss_lines' (in kB) per process. grep skips the files that cannot be read
+        """
+        return ("f=smaps; [ -r /proc/self/smaps_rollup ] && f=smaps_rollup; "
+                "grep -sH -e '^Private' -e '^Shared' -e '^Pss:' /proc/{}/$f | "
+                "awk -F: '$1 != f {{if (p) print p, pr, sh, ps, n; f=$1; split(f, a, \"/\"); p=a[3]; pr=sh=ps=n=0}} "
+                "$2 ~ /^Private/ {{pr+=$3}} $2 ~ /^Shared/ {{sh+=$3}} $2 == \"Pss\" {{ps+=$3; n++}} "
+                "END {{if (p) print p, pr, sh, ps, n}}'".format(pid))
+
+    def net_devices(self, interface='*'):
+        """ 'path:value' lines of the type, address, mtu and statistics of the interfaces taken from sysfs """
+        return ("grep -sH '' /sys/class/net/{0}/type /sys/class/net/{0}/address /sys/class/net/{0}/mtu "
+                "/sys/class/net/{0}/statistics/*".format(interface))
+
+    def ip_addresses(self, interface=''):
+        return 'ip -o addr show' + (' dev ' + interface if interface else '')
+
+    ##############      TCP Sockets Functions     ###############################
+
+    # tcp states as netstat shows them in the order of their code in /proc/net/tcp (01 to 0B)
+    TCP_STATES = ('ESTABLISHED', 'SYN_SENT', 'SYN_RECV', 'FIN_WAIT1', 'FIN_WAIT2', 'TIME_WAIT', 'CLOSE', 'CLOSE_WAIT',
+                  'LAST_ACK', 'LISTEN', 'CLOSING')
+    # the same states as ss shows them
+    SS_TCP_STATES = ('ESTAB', 'SYN-SENT', 'SYN-RECV', 'FIN-WAIT-1', 'FIN-WAIT-2', 'TIME-WAIT', 'UNCONN', 'CLOSE-WAIT',
+                     'LAST-ACK', 'LISTEN', 'CLOSING')
+
+    # awk functions rendering a /proc/net/tcp address as ip:port like ss shows it (ipv4 and ipv4 mapped ips are
+    # dotted, other ipv6 ips are compressed with :: as inet_ntop does) so it can be matched and paired the same way.
+    # al does it for the local addresses converting each one once (a server only has a few)
+    PROC_ADDRESS_AWK = ('BEGIN { for (i = 0; i < 256; i++) x[sprintf("%02X", i)] = i } '
+                        'function v6(s,  g, i, w, run, best, start, ip) { for (i = 0; i < 4; i++) { '
+                        'w = substr(s, i * 8 + 1, 8); g[i * 2] = x[substr(w, 7, 2)] * 256 + x[substr(w, 5, 2)]; '
+                        'g[i * 2 + 1] = x[substr(w, 3, 2)] * 256 + x[substr(w, 1, 2)] } '
+                        'run = best = 0; for (i = 0; i < 8; i++) if (g[i]) run = 0; '
+                        'else if (++run > best) { best = run; start = i - run + 1 } '
+                        'ip = ""; for (i = 0; i < 8; i++) if (best > 1 && i == start) { ip = ip "::"; i += best - 1 } '
+                        'else ip = ip (ip == "" || ip ~ /:$/ ? "" : ":") sprintf("%x", g[i]); return ip } '
+                        'function a(s,  n, ip) { n = length(s); ip = substr(s, n - 12, 8); '
+                        'if (n == 13 || substr(s, 1, 24) == "0000000000000000FFFF0000") '
+                        'ip = x[substr(ip, 7, 2)] "." x[substr(ip, 5, 2)] "." '
+                        'x[substr(ip, 3, 2)] "." x[substr(ip, 1, 2)]; '
+                        'else ip = v6(s); return ip ":" (x[substr(s, n - 3, 2)] * 256 + x[substr(s, n - 1, 2)]) } '
+                        'function al(s) { return s in l ? l[s] : (l[s] = a(s)) } ')
+
+    # awk function pair(listening, local_address, remote_address) printing the connections of the sockets (addresses
+    # as ss shows them) as 'server_ip server_port client_ip client_port'. The server side is the one whose port is
+    # listened on. The listening sockets come first (in ss and in each /proc file) so the connections are printed as
+    # they come and only the ones with no listening socket yet wait to the end
+    PAIRS_AWK = ('BEGIN { split("* 0.0.0.0 ::", w); for (k in w) any[w[k]] = 1 } '
+                 'function bare(s) { if (index(s, "[")) s = substr(s, 2, length(s) - 2); '
+                 'return index(s, "::ffff:") == 1 && index(s, ".") ? substr(s, 8) : s } '
+                 'function pair(listening, local, remote,  i, p, r) { '
+                 'match(local, /:[^:]*$/); i = bare(substr(local, 1, RSTART - 1)); p = substr(local, RSTART + 1); '
+                 'if (listening) { if (i in any) port[p] = 1; else on[i " " p] = 1; return } '
+                 'match(remote, /:[^:]*$/); r = bare(substr(remote, 1, RSTART - 1)) " " substr(remote, RSTART + 1); '
+                 'if (p in port || (i " " p) in on) print i, p, r; else wait[++n] = i " " p " " r } '
+                 'END { for (k = 1; k <= n; k++) { split(wait[k], f); '
+                 'if (f[2] in port || (f[1] " " f[2]) in on) print wait[k]; else print f[3], f[4], f[1], f[2] } } ')
+
+    def _tcp_sockets_awk(self, states, filter_loopback, family, match, ss_action, proc_action, functions='',
+                         proc_addresses=False):
+        """ command running awk with ss_action (on the fields of ss -tan) or proc_action (on the fields of
+            /proc/net/tcp, with the functions of PROC_ADDRESS_AWK if proc_addresses) for the tcp sockets filtered as in
+            tcp_sockets. functions are awk functions for both actions
+        """
+        codes = [self.TCP_STATES.index(state) for state in states]
+        ss_filter = ['NR > 1']
+        proc_filter = ['$1 != "sl"']
+        if codes:
+            ss_filter.append('$1 ~ /^({})$/'.format('|'.join(self.SS_TCP_STATES[c] for c in codes)))
+            proc_filter.append('({})'.format(' || '.join('$4 == "{:02X}"'.format(c + 1) for c in codes)))
+        if filter_loopback:
+            ss_filter.append(r'$4 !~ /^(127\.|\[::1\]|::1:|\[::ffff:127\.|::ffff:127\.)/')
+            proc_filter.append('$2 !~ /^(......7F|00000000000000000000000001000000|'
+                               '0000000000000000FFFF0000......7F):/')
+
+        awk_match = proc_functions = ''
+        if match:
+            ss_text, proc_text = 'index($4 " " $5, m)', 'index(al($2) " " a($3), m)'
+            if 'LISTEN' in states:
+                listen = self.TCP_STATES.index('LISTEN')
+                ss_text = '$1 == "{}" || {}'.format(self.SS_TCP_STATES[listen], ss_text)
+                proc_text = '$4 == "{:02X}" || {}'.format(listen + 1, proc_text)
+            ss_filter.append('({})'.format(ss_text))
+            proc_filter.append('({})'.format(proc_text))
+            awk_match = ' -v m=' + shlex.quote(match)
+        if match or proc_addresses:
+            proc_functions = self.PROC_ADDRESS_AWK
+
+        ss_family = {'inet': ' -4', 'inet6': ' -6'}.get(family, '')
+        proc_files = {'inet': '/proc/net/tcp', 'inet6': '/proc/net/tcp6'}.get(family, '/proc/net/tcp /proc/net/tcp6')
+        return ("{{ if command -v ss >/dev/null; then ss -tan{} | awk{} '{}{} {{{}}}'; "
+                "else awk{} '{}{}{} {{{}}}' {}; fi; }} 2>/dev/null"
+                "".format(ss_family, awk_match, functions, ' && '.join(ss_filter), ss_action, awk_match, functions,
+                          proc_functions, ' && '.join(proc_filter), proc_action, proc_files))
+
+    @base.memoize_cmd
+    def tcp_sockets(self, states=(), filter_loopback=False, family='', match=''):
+        """ 'state local_address remote_address' per tcp socket. Taken from ss if it is installed (states as ss names
+            and addresses as ip:port) or else from /proc/net/tcp and tcp6 (states and addresses in hex).
+            The filtering by state, loopback and text is done by awk on the device. The errors are sent to /dev/null
+
+        :param tuple of str states: only sockets on these states (netstat names like ESTABLISHED or LISTEN)
+        :param bool filter_loopback: leave out sockets whose local address is a loopback address
+        :param str family: 'inet' or 'inet6' only (both by default)
+        :param str match: only sockets with this text in their local or remote ip:port. The LISTEN sockets are kept
+            if LISTEN is one of the states
+        """
+        return self._tcp_sockets_awk(states, filter_loopback, family, match, 'print $1, $4, $5', 'print $4, $2, $3')
+
+    @base.memoize_cmd
+    def tcp_connection_pairs(self, state='ESTABLISHED', filter_loopback=False, family='', match=''):
+        """ 'server_ip server_port client_ip client_port' per tcp connection on the state (a netstat name). The
+            sockets are taken and filtered as in tcp_sockets (with the LISTEN ones) and paired by the same awk on the
+            device (see PAIRS_AWK) so only the ips and ports are sent back
+        """
+        listen = self.TCP_STATES.index('LISTEN')
+        return self._tcp_sockets_awk((state, 'LISTEN'), filter_loopback, family, match,
+                                     'pair($1 == "{}", $4, $5)'.format(self.SS_TCP_STATES[listen]),
+                                     'pair($4 == "{:02X}", al($2), a($3))'.format(listen + 1), self.PAIRS_AWK,
+                                     proc_addresses=True)
 
 Instance = None
 
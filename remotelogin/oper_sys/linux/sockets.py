@@ -0,0 +1,206 @@
+""" tcp connection table of a linux host taken with one command (LinuxShellCmds.tcp_sockets) from ss or
+    /proc/net/tcp{,6}
+
+    The output is parsed by columns into a TcpTable (one list per field): it is split once and the columns of
+    addresses and states are converted converting each distinct value only once, as the same addresses and states are
+    repeated over and over on busy hosts. parse gives the sockets as TcpSocket tuples
+
+    The server/client pairs of the connections (LinuxShellCmds.tcp_connection_pairs) are paired on the host and only
+    their ips and ports are parsed (parse_pairs)
+"""
+import collections
+import itertools
+import socket
+
+from fdutils.structures import TcpConnection
+
+from .shellcommands import LinuxShellCmds
+
+__author__ = 'Filinto Duran (duranto@gmail.com)'
+
+TcpSocket = collections.namedtuple('TcpSocket', 'state local_ip local_port remote_ip remote_port')
+TcpTable = collections.namedtuple('TcpTable', 'states local_ips local_ports remote_ips remote_ports')
+
+TCP_STATES = LinuxShellCmds.TCP_STATES
+
+# any state name (netstat, ss or /proc/net/tcp hex code) -> netstat name
+_STATE_NAMES = dict(zip(LinuxShellCmds.SS_TCP_STATES, TCP_STATES))
+_STATE_NAMES.update(('{:02X}'.format(i + 1), state) for i, state in enumerate(TCP_STATES))
+_STATE_NAMES.update((state, state) for state in TCP_STATES)
+
+# addresses that mean any address of the host
+WILDCARD_ADDRESSES = frozenset(('*', '0.0.0.0', '::'))
+
+
+def to_states(states):
+    """ normalizes states given as a string (separated by |) or a sequence of netstat/ss names to netstat names """
+    if not states:
+        return ()
+    if isinstance(states, str):
+        states = states.split('|')
+    normalized = []
+    for state in states:
+        name = state.strip().upper()
+        name = _STATE_NAMES.get(name) or _STATE_NAMES.get(name.replace('_', '-')) or \
+            _STATE_NAMES.get(name.replace('-', '_').replace('WAIT_', 'WAIT'))
+        if name is None:
+            raise ValueError('Unknown tcp state {} (use one of {})'.format(state, ', '.join(TCP_STATES)))
+        if name not in normalized:
+            normalized.append(name)
+    return tuple(normalized)
+
+
+def _hex_to_ip(address):
+    raw = bytes.fromhex(address)
+    if len(raw) == 4:
+        return socket.inet_ntop(socket.AF_INET, raw[::-1])
+    # ipv6 is stored as four 32 bit words in host (little endian) order
+    ip = socket.inet_ntop(socket.AF_INET6, b''.join(raw[i:i + 4][::-1] for i in range(0, 16, 4)))
+    return _unmap(ip)
+
+
+def _unmap(ip):
+    # ipv4 addresses on ipv6 sockets
+    return ip[7:] if ip.startswith('::ffff:') and '.' in ip else ip
+
+
+def _ss_ip(address):
+    return _unmap(address.strip('[]'))
+
+
+def _ss_port(port):
+    return 0 if port == '*' else int(port)
+
+
+def _convert(column, convert):
+    """ converts every value of the column converting each distinct value only once """
+    converted = {value: convert(value) for value in set(column)}
+    return list(map(converted.__getitem__, column))
+
+
+def _ports(column):
+    try:
+        return list(map(int, column))
+    except ValueError:
+        # ss shows * as the remote port of listening sockets
+        return _convert(column, _ss_port)
+
+
+def _addresses(column, hex_format):
+    """ (ips, ports) of a column of addresses """
+    if hex_format:
+        # fixed width hex ip and 4 hex digits port
+        return (_convert([a[:-5] for a in column], _hex_to_ip),
+                list(map(int, [a[-4:] for a in column], itertools.repeat(16))))
+    distinct = set(column)
+    if len(distinct) * 2 < len(column):
+        # the local addresses of a server: split only the distinct ones
+        split = {a: a.rpartition(':') for a in distinct}
+        ips = {a: _ss_ip(ip) for a, (ip, _, _) in split.items()}
+        ports = {a: _ss_port(port) for a, (_, _, port) in split.items()}
+        return list(map(ips.__getitem__, column)), list(map(ports.__getitem__, column))
+    split = [a.rpartition(':') for a in column]
+    return _convert([s[0] for s in split], _ss_ip), _ports([s[2] for s in split])
+
+
+def parse_table(text):
+    """ the TcpTable of the output of LinuxShellCmds.tcp_sockets """
+    tokens = text.split()
+    if len(tokens) % 3:
+        # drop a line cut short
+        tokens = tokens[:len(tokens) - len(tokens) % 3]
+    if not tokens:
+        return TcpTable([], [], [], [], [])
+
+    states = tokens[0::3]
+    hex_format = len(states[0]) == 2
+    local_ips, local_ports = _addresses(tokens[1::3], hex_format)
+    remote_ips, remote_ports = _addresses(tokens[2::3], hex_format)
+    return TcpTable(_convert(states, _STATE_NAMES.get), local_ips, local_ports, remote_ips, remote_ports)
+
+
+def parse(text):
+    """ the TcpSocket tuples of the output of LinuxShellCmds.tcp_sockets """
+    return list(map(TcpSocket, *parse_table(text)))
+
+
+def parse_pairs(text):
+    """ the fdutils.structures.TcpConnection of the output of LinuxShellCmds.tcp_connection_pairs """
+    tokens = text.split()
+    # drop a line cut short
+    del tokens[len(tokens) - len(tokens) % 4:]
+    return list(map(TcpConnection, tokens[0::4], map(int, tokens[1::4]), tokens[2::4], map(int, tokens[3::4])))
+
+
+def to_table(sockets):
+    """ the TcpTable of a sequence of TcpSocket """
+    return TcpTable(*map(list, zip(*sockets))) if sockets else TcpTable([], [], [], [], [])
+
+
+def collect_table(conn, cmds, states=(), filter_loopback=False, family='', match=''):
+    """ the tcp sockets of the host in one command
+
+    Args:
+        conn: open connection
+        cmds (remotelogin.oper_sys.linux.shellcommands.LinuxShellCmds): os commands
+        states: only sockets on these states (i.e. 'ESTABLISHED|LISTEN' or ('ESTABLISHED', 'LISTEN'))
+        filter_loopback (bool): leave out the sockets on loopback addresses
+        family (str): 'inet' or 'inet6' only
+        match (str): only the sockets with this text in their addresses (and the LISTEN ones if LISTEN is one of the
+            states). See LinuxShellCmds.tcp_sockets
+
+    Returns:
+        TcpTable: the sockets by columns
+
+    Raises:
+        ValueError: if there is no connection
+
+    """
+    if conn is None:
+        raise ValueError('An open connection (conn) to the device is needed to collect its tcp sockets')
+    return parse_table(conn.check_output(cmds.tcp_sockets(to_states(states), filter_loopback, family, match)))
+
+
+def collect(conn, cmds, states=(), filter_loopback=False, family='', match=''):
+    """ the list of TcpSocket of the host in one command (see collect_table) """
+    return list(map(TcpSocket, *collect_table(conn, cmds, states, filter_loopback, family, match)))
+
+
+def collect_pairs(conn, cmds, state='ESTABLISHED', filter_loopback=False, family='', match=''):
+    """ fdutils.structures.TcpConnection of the sockets on the state in one command paired on the host (see
+        connection_pairs for the pairing and collect_table for the arguments)
+    """
+    if conn is None:
+        raise ValueError('An open connection (conn) to the device is needed to collect its tcp sockets')
+    return parse_pairs(conn.check_output(cmds.tcp_connection_pairs(to_states(state)[0], filter_loopback, family,
+                                                                   match)))
+
+
+def connection_pairs(table, state='ESTABLISHED'):
+    """ fdutils.structures.TcpConnection (server, server port, client, client port) of the sockets on the state.
+        The server side is the one whose port is listened on (by any LISTEN socket of the sockets)
+
+    :param TcpTable or list of TcpSocket table: the sockets
+    """
+    if not isinstance(table, TcpTable):
+        table = to_table(table)
+
+    listening = set()
+    listening_any = set()
+    for s, ip, port in zip(table.states, table.local_ips, table.local_ports):
+        if s == 'LISTEN':
+            if ip in WILDCARD_ADDRESSES:
+                listening_any.add(port)
+            else:
+                listening.add((ip, port))
+
+    pairs = []
+    append = pairs.append
+    for s, local_ip, local_port, remote_ip, remote_port in zip(*table):
+        if s != state:
+            continue
+        if local_port in listening_any or (local_ip, local_port) in listening:
+            append(TcpConnection(local_ip, local_port, remote_ip, remote_port))
+        else:
+            append(TcpConnection(remote_ip, remote_port, local_ip, local_port))
+    return pairs
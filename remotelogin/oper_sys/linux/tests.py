@@ -0,0 +1,263 @@
+import shlex
+import shutil
+import subprocess
+
+import pytest
+
+from remotelogin import oper_sys
+from remotelogin.oper_sys import os_factory
+from remotelogin.oper_sys.linux import LinuxOS
+from remotelogin.oper_sys.linux import facts, sockets
+
+FACTS_OUTPUT = """@@facts@@ meminfo
+MemTotal:        6147400 kB
+MemFree:         4851804 kB
+MemAvailable:    5606720 kB
+Buffers:           63012 kB
+Cached:           858700 kB
+SwapCached:            0 kB
+Shmem:              9484 kB
+SReclaimable:      62992 kB
+SwapTotal:       1048572 kB
+SwapFree:        1048060 kB
+@@facts@@ df
+Filesystem     1024-blocks     Used Available Capacity Mounted on
+/dev/sda1         51474912 18511408  30325832      38% /
+/dev/mapper/vg0-data 264212084 183784720 67072500 74% /var/lib/my data
+@@facts@@ ps
+    1 /sbin/init splash
+    2 [kthreadd]
+  911 nginx: master process /usr/sbin/nginx
+@@facts@@ smaps
+1 1820 1544 2210 1
+911 852 3104 0 0
+@@facts@@ net
+/sys/class/net/eth0/type:1
+/sys/class/net/lo/type:772
+/sys/class/net/eth0/address:02:fc:00:00:00:01
+/sys/class/net/eth0/mtu:1400
+/sys/class/net/eth0/statistics/rx_bytes:22306670
+/sys/class/net/eth0/statistics/rx_fifo_errors:3
+/sys/class/net/eth0/statistics/tx_carrier_errors:2
+@@facts@@ ip
+1: lo    inet 127.0.0.1/8 scope host lo\\       valid_lft forever preferred_lft forever
+4: eth0    inet6 fe80::fc:ff:fe00:1/64 scope link \\       valid_lft forever preferred_lft forever
+4: eth0    inet 192.0.2.2/24 brd 192.0.2.255 scope global eth0\\       valid_lft forever preferred_lft forever
+"""
+
+
+class FakeConnection:
+
+    def __init__(self, output):
+        self.output = output
+        self.commands = []
+
+    def check_output(self, command):
+        self.commands.append(command)
+        return self.output
+
+
+@pytest.mark.parametrize('name', ['linux', 'darwin', 'alcatel', 'cisco', 'cisco_ace', 'busybox'])
+def test_os_keeps_its_defaults_unless_given(name):
+    assert os_factory(name).can_change_prompt is False
+    assert os_factory(name, can_change_prompt=None).can_change_prompt is False
+    assert os_factory(name, can_change_prompt=1).can_change_prompt is True
+
+
+
+def test_shared_os_is_read_only_but_can_be_copied():
+    shared = os_factory('linux')
+    with pytest.raises(AttributeError):
+        shared.can_change_prompt = True
+
+    private = shared.copy()
+    private.can_change_prompt = True
+    assert private.can_change_prompt is True and shared.can_change_prompt is False
+    assert private.cmd is shared.cmd and os_factory('linux') is shared
+
+
+def test_os_constructor_errors_are_not_chained_to_the_cache_miss():
+    class BrokenOS(LinuxOS):
+        def __init__(self, **kwargs):
+            raise RuntimeError('broken')
+
+    with pytest.raises(RuntimeError) as error:
+        oper_sys._get_os(BrokenOS)
+    assert error.value.__context__ is None
+
+
+def test_facts_parse_every_section():
+    f = facts.parse(FACTS_OUTPUT)
+
+    mem = f['memory']
+    assert mem.total == 6147400 and mem.free == 4851804 and mem.available == 5606720
+    assert mem.cache == 858700 + 62992
+    assert mem.used == mem.total - mem.free - mem.buffers - mem.cache
+    assert mem.swap_used == 512
+
+    assert [(fs.mounted, fs.percentage) for fs in f['file_systems']] == [('/', 38), ('/var/lib/my data', 74)]
+
+    processes = f['processes_memory']
+    assert set(processes) == {1, 911}
+    assert processes[1] == facts.ProcessMemory(1, '/sbin/init', 'splash', 1820, 2210 + facts.PSS_ADJUST - 1820)
+    # without Pss the shared memory is used as is
+    assert (processes[911].cmd, processes[911].private, processes[911].shared) == ('nginx:', 852, 3104)
+
+    eth0 = f['interfaces']['eth0']
+    assert (eth0.encapsulation, eth0.mac, eth0.mtu) == ('Ethernet', '02:fc:00:00:00:01', 1400)
+    assert (eth0.ip, eth0.bcast, eth0.mask) == ('192.0.2.2', '192.0.2.255', '255.255.255.0')
+    assert eth0.addresses == ('192.0.2.2/24', 'fe80::fc:ff:fe00:1/64')
+    assert (eth0.rx_bytes, eth0.rx_overruns, eth0.tx_carrier, eth0.tx_packets) == (22306670, 3, 2, 0)
+    assert f['interfaces']['lo'].encapsulation == 'Local Loopback'
+
+
+def test_facts_missing_sections_are_empty():
+    f = facts.parse('@@facts@@ meminfo\n', ('memory', 'file_systems', 'processes_memory'))
+    assert f['memory'].total == 0
+    assert f['file_systems'] == [] and f['processes_memory'] == {}
+
+
+def test_facts_only_the_sections_asked_for_in_one_command():
+    linux = os_factory('linux')
+    conn = FakeConnection(FACTS_OUTPUT)
+
+    assert len(linux.get_memory_per_process(conn=conn, processes=('nginx',))) == 1
+    assert linux.get_mem_stats(1, conn=conn) == (1820, 2210 + facts.PSS_ADJUST - 1820)
+    assert linux.free_mem(conn=conn).total == 6147400
+    assert linux.ifconfig_parser('eth0', conn=conn).ip == '192.0.2.2'
+    assert linux.ifconfig_parser('eth1', conn=conn) is None
+
+    assert len(conn.commands) == 5
+    assert '/proc/1/$f' in conn.commands[1]
+    assert 'meminfo' in conn.commands[2] and 'smaps' not in conn.commands[2]
+
+    with pytest.raises(ValueError):
+        linux.get_facts('cpu', conn=conn)
+    with pytest.raises(ValueError, match='connection'):
+        linux.free_mem()
+
+
+def test_facts_json_round_trip():
+    import json
+
+    f = facts.parse(FACTS_OUTPUT)
+    stored = json.loads(json.dumps({name: facts.to_json(name, value) for name, value in f.items()}))
+    assert {name: facts.from_json(name, value) for name, value in stored.items()} == f
+
+
+SS_OUTPUT = """LISTEN 0.0.0.0:443 0.0.0.0:*
+LISTEN [::]:22 [::]:*
+ESTAB 192.0.2.2:443 198.51.100.7:50312
+ESTAB [::ffff:192.0.2.2]:22 [::ffff:198.51.100.8]:40100
+ESTAB 192.0.2.2:41000 203.0.113.5:5432
+TIME-WAIT [2001:db8::2]:443 [2001:db8::99]:51000
+"""
+
+PROC_OUTPUT = """0A 00000000:01BB 00000000:0000
+0A 00000000000000000000000000000000:0016 00000000000000000000000000000000:0000
+01 020200C0:01BB 076433C6:C488
+01 0000000000000000FFFF0000020200C0:0016 0000000000000000FFFF0000086433C6:9CA4
+01 020200C0:A028 057100CB:1538
+06 B80D0120000000000000000002000000:01BB B80D0120000000000000000099000000:C738
+"""
+
+
+def test_tcp_sockets_from_ss_and_proc_are_the_same():
+    ss = sockets.parse(SS_OUTPUT)
+    assert ss == sockets.parse(PROC_OUTPUT)
+    assert ss[1] == sockets.TcpSocket('LISTEN', '::', 22, '::', 0)
+    assert ss[3] == sockets.TcpSocket('ESTABLISHED', '192.0.2.2', 22, '198.51.100.8', 40100)
+    assert ss[5] == sockets.TcpSocket('TIME_WAIT', '2001:db8::2', 443, '2001:db8::99', 51000)
+    assert sockets.parse('') == []
+
+
+PAIRS_OUTPUT = """192.0.2.2 443 198.51.100.7 50312
+192.0.2.2 22 198.51.100.8 40100
+203.0.113.5 5432 192.0.2.2 41000
+2001:db8::2 443 2001:db8::99"""
+
+
+def test_tcp_connection_pairs_in_one_command_paired_on_the_host():
+    linux = os_factory('linux')
+    conn = FakeConnection(PAIRS_OUTPUT)
+
+    pairs = [(p.server, p.server_port, p.client, p.client_port) for p in linux.get_tcp_connection_pairs(conn=conn)]
+    # the last line was cut short
+    assert pairs == [('192.0.2.2', 443, '198.51.100.7', 50312), ('192.0.2.2', 22, '198.51.100.8', 40100),
+                     ('203.0.113.5', 5432, '192.0.2.2', 41000)]
+    assert len(linux.get_tcp_connection_pairs(filtered_by='5432', conn=conn)) == 3
+
+    assert len(conn.commands) == 2
+    assert "-v m=5432 " in conn.commands[1] and "-v m=" not in conn.commands[0]
+    assert 'ESTAB|LISTEN' in conn.commands[0] and '$4 == "01" || $4 == "0A"' in conn.commands[0]
+    assert sockets.parse_pairs('') == []
+
+    assert sockets.to_states('established|time-wait') == ('ESTABLISHED', 'TIME_WAIT')
+    with pytest.raises(ValueError):
+        sockets.to_states('OPEN')
+    with pytest.raises(ValueError, match='connection'):
+        linux.get_tcp_connection_pairs()
+
+
+PROC_NET_TCP = """  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode
+   0: 00000000:01BB 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 1 1
+   1: 00000000000000000000000000000000:0016 00000000000000000000000000000000:0000 0A 00000000:00000000 0 0 0 6 1
+   2: 0100007F:1538 0100007F:A029 01 00000000:00000000 00:00000000 00000000     0        0 2 1
+   3: 020200C0:01BB 076433C6:C488 01 00000000:00000000 00:00000000 00000000     0        0 3 1
+   4: 020200C0:A028 057100CB:1538 01 00000000:00000000 00:00000000 00000000     0        0 4 1
+   5: 0000000000000000FFFF0000020200C0:0016 0000000000000000FFFF0000086433C6:9CA4 01 00000000:00000000 0 0 0 5 1
+   6: B80D0120000000000000000002000000:01BB B80D0120000000000000000099000000:C738 06 00000000:00000000 0 0 0 0 1
+"""
+
+SS_TAN = """State      Recv-Q Send-Q Local Address:Port       Peer Address:Port
+LISTEN     0      128    0.0.0.0:443              0.0.0.0:*
+LISTEN     0      128    [::]:22                  [::]:*
+ESTAB      0      0      127.0.0.1:5432           127.0.0.1:41001
+ESTAB      0      0      192.0.2.2:443            198.51.100.7:50312
+ESTAB      0      0      [::ffff:192.0.2.2]:22    [::ffff:198.51.100.8]:40100
+ESTAB      0      0      192.0.2.2:41000          203.0.113.5:5432
+TIME-WAIT  0      0      [2001:db8::2]:443        [2001:db8::99]:51000
+"""
+
+
+class ShellConnection:
+    """ runs the commands with sh reading /proc/net/tcp from a file and without ss unless given its output """
+
+    def __init__(self, proc_net_tcp, ss_output=None):
+        self.proc_net_tcp = proc_net_tcp
+        self.ss_output = ss_output
+
+    def check_output(self, command):
+        command = command.replace('/proc/net/tcp /proc/net/tcp6', str(self.proc_net_tcp))
+        if self.ss_output is None:
+            command = command.replace('command -v ss', 'false')
+        else:
+            command = command.replace('ss -tan', 'printf %s {}'.format(shlex.quote(self.ss_output)))
+        return subprocess.run(['sh', '-c', command], stdout=subprocess.PIPE, universal_newlines=True).stdout
+
+
+@pytest.mark.skipif(shutil.which('awk') is None, reason='needs awk')
+@pytest.mark.parametrize('ss', [False, True])
+def test_tcp_connection_pairs_filtered_by_awk(tmp_path, ss):
+    proc_net_tcp = tmp_path / 'tcp'
+    proc_net_tcp.write_text(PROC_NET_TCP)
+    conn = ShellConnection(proc_net_tcp, SS_TAN if ss else None)
+    linux = os_factory('linux')
+
+    def pairs(filtered_by):
+        return [(p.server, p.server_port, p.client, p.client_port)
+                for p in linux.get_tcp_connection_pairs(filtered_by=filtered_by, conn=conn)]
+
+    assert pairs('5432') == [('203.0.113.5', 5432, '192.0.2.2', 41000)]
+    assert pairs(':443 ') == [('192.0.2.2', 443, '198.51.100.7', 50312)]
+    # ipv4 mapped addresses are matched dotted
+    assert pairs('198.51.100.8') == [('192.0.2.2', 22, '198.51.100.8', 40100)]
+    assert pairs("no'match") == []
+    assert len(pairs(None)) == 3
+    # ipv6 ips are shown compressed also when taken from /proc
+    assert [(p.server, p.server_port, p.client, p.client_port)
+            for p in linux.get_tcp_connection_pairs('TIME_WAIT', filtered_by='db8::99', conn=conn)] == \
+        [('2001:db8::2', 443, '2001:db8::99', 51000)]
+    # the listening sockets are only kept when asked for
+    assert linux.get_tcp_connections('ESTABLISHED', match='443', conn=conn) == \
+        [sockets.TcpSocket('ESTABLISHED', '192.0.2.2', 443, '198.51.100.7', 50312)]
@@ -22,10 +22,6 @@ class UnixOS(base.OSBase):
     sudo = 'sudo'
     name = 'unix'
 
-    def __init__(self, **kwargs):
-        kwargs.setdefault('can_change_prompt', True)
-        super(UnixOS, self).__init__(**kwargs)
-
     @property
     def path(self):
         import posixpath
@@ -87,6 +83,38 @@ class UnixOS(base.OSBase):
         with conn:
             return conn.send_cmd(cmd).expect_prompt(timeout=time_to_wait)
 
+    def follow_files(self, files, pattern='', exclude='', conn=None, idle_timeout=None):
+        """ follows the files (like tail -F) with one command filtering the lines on the device with awk
+
+            for index, offset, line in os.follow_files([('/var/log/messages', None)], 'error', conn=conn):
+                ...
+
+        Args:
+            files (list of (str, int)): file paths and the byte offset to follow them from (None from their end)
+            pattern (str): awk regex of the lines to get
+            exclude (str): awk regex of the lines to leave out
+            conn: open connection that can stream the output of a command
+            idle_timeout (float): None is yielded after these seconds without lines
+
+        Yields:
+            (int, int, str): the index of the file in files, the offset of the file after the line and the line
+                             (None when the offset moved forward without lines matching)
+
+        """
+        cmd = self.cmd.follow_files(tuple((f, o) for f, o in files), pattern, exclude, self.gnu_path)
+        with conn.stream_output(cmd, idle_timeout=idle_timeout) as lines:
+            for line in lines:
+                if line is None:
+                    yield None
+                    continue
+                fields = line.rstrip('\n').split(' ', 2)
+                try:
+                    index, offset = int(fields[0]), int(fields[1])
+                except (IndexError, ValueError):
+                    log.debug('Unexpected line following files: ' + line)
+                    continue
+                yield index, offset, fields[2] if len(fields) > 2 else None
+
     # TODO: fix!!!! extracted from connections.terminal.
     def _can_execute_as_sudo(self, cmd):
         """ checks if cmd is one of the sudo commands available.
@@ -131,12 +159,15 @@ class UnixOS(base.OSBase):
         :param state:
         :return:
         """
-        connections, e = conn.check_output(self.get_tcp_connections(state=state, as_text=True, family=family, filter_netstat_stderr=True, **kwargs))
+        connections = conn.check_output(self.cmd.get_tcp_connections(state=state, family=family, **kwargs))
         ret = collections.defaultdict(list)
-        for conn in connections:
-            local_addr, external_addr, state = conn.split()
-            local_ip, local_port = local_addr.split(':')
-            external_ip, external_port = external_addr.split(':')
+        for line in connections.splitlines():
+            try:
+                local_addr, external_addr, state = line.split()
+                local_ip, local_port = local_addr.rsplit(':', 1)
+                external_ip, external_port = external_addr.rsplit(':', 1)
+            except ValueError:
+                continue    # headers
             ret[state].append(dict(local_ip=local_ip, local_port=local_port, remote_ip=external_ip, remote_port=external_port))
         return ret
 
@@ -168,19 +199,19 @@ class UnixOS(base.OSBase):
 
         # TODO: maybe put all commands to be sshed into one line separated by semi-colon, or implement a multicommand 'send_command' function tha returns a list of results for every command
         # split netstat listen addresses to get the ports and addresses it is listening on:
-        o, e = conn.check_output(netstat_listen_cmd)    # o is output string, e is error
+        o = conn.check_output(netstat_listen_cmd)
         listening_on = collections.defaultdict(list)
-        if not e and o:
-            for line in o:
+        if o:
+            for line in o.splitlines():
                 ip, port = line.strip().rsplit(sep, 1)
                 if ip == all_interfaces:
                     ip = 'ALL'
                 listening_on[ip].append(port)
 
         # split netstat response pair
-        o, e = conn.check_output(netstat_cmd)
-        if not e and o:
-            for line in o:
+        o = conn.check_output(netstat_cmd)
+        if o:
+            for line in o.splitlines():
                 ips = line.strip().split()
                 ip_1, port_1 = ips[0].rsplit(sep, 1)     # local ip and port
                 ip_2, port_2 = ips[1].rsplit(sep, 1)
@@ -1,5 +1,6 @@
 from .. import base
 import re
+import shlex
 
 import fdutils
 
@@ -28,6 +29,16 @@ class UnixShellCmds(base.OSCommands):
     def set_prompt(self, prompt):
         return "export PS1='{}'".format(prompt)
 
+    def shell_init(self, prompt='', cols=0, rows=0, disable_history=False):
+        cmds = []
+        if disable_history:
+            cmds.append(self.disable_history())
+        if cols and rows:
+            cmds.append(self.resize_pty(cols, rows))
+        if prompt:
+            cmds.append(self.set_prompt(prompt))
+        return '; '.join(cmds) or None
+
     def exit_status(self):
         return "echo $?"
 
@@ -93,6 +104,48 @@ class UnixShellCmds(base.OSCommands):
     def tail(self, gnu_path):
         return gnu_path + 'tail '
 
+    # bytes of a followed file read without any line matching after which its offset is sent anyway so resuming
+    # the follow does not filter them again
+    FOLLOW_PROGRESS_BYTES = 1048576
+
+    # tail -F messages (merged with the lines) of a file rotated/truncated (read again from its start) or missing
+    _FOLLOW_AWK = ('/^tail: .*(has been replaced|has appeared|file truncated)/ {o = 0; p = 0; next} '
+                   '/^tail: .*(inaccessible|cannot open|No such file)/ {next} '
+                   '{o += length($0) + 1} '
+                   '$0 ~ re && (ex == "" || $0 !~ ex) {print i " " o " " $0; p = o; fflush(); next} '
+                   'o - p >= n {print i " " o; p = o; fflush()}')
+
+    def follow_files(self, files, pattern='', exclude='', gnu_path=''):
+        """ follows (tail -F) the files printing 'index offset line' for every line that matches the pattern and
+            does not match exclude (awk regexes applied on the device), where index is the position of the file in
+            files and offset is the byte of the file right after the line. A line 'index offset' is printed after
+            FOLLOW_PROGRESS_BYTES without matches.
+
+            Each file is read from its offset, from its end if the offset is None or from its start if the file is
+            now smaller than the offset (it was rotated or truncated)
+
+        :param list of (str, int or None) files: paths and offsets of the files
+        :param str pattern: only lines matching this regex
+        :param str exclude: leave out lines matching this regex
+        """
+        def awk_var(value):
+            # awk processes the escape sequences of -v assignments
+            return shlex.quote(value.replace('\\', '\\\\'))
+
+        follows = []
+        for i, (filename, offset) in enumerate(files):
+            path = shlex.quote(filename)
+            start = 'o=$s' if offset is None else 'o={}; [ "$s" -lt "$o" ] && o=0'.format(int(offset))
+            follows.append(
+                '{{ s=$(wc -c < {path} 2>/dev/null); s=${{s:-0}}; {start}; '
+                '{tail}-c +$((o + 1)) -F {path} 2>&1 | LC_ALL=C $a -v i={i} -v o="$o" -v p="$o" -v n={n} '
+                '-v re={re} -v ex={ex} \'{awk}\'; }} &'.format(
+                    path=path, start=start, tail=self.tail(gnu_path), i=i, n=self.FOLLOW_PROGRESS_BYTES,
+                    re=awk_var(pattern), ex=awk_var(exclude), awk=self._FOLLOW_AWK))
+        # mawk reads its input in blocks unless it is interactive (which other awks ignore or do not know)
+        return ("{{ a=awk; awk -W interactive 'BEGIN {{}}' </dev/null && a='awk -W interactive'; {} wait; }} "
+                "2>/dev/null".format(' '.join(follows)))
+
     def add_user_to_group_linux_only(self, username, group_name):   # linux
         return '/usr/sbin/usermod -a -G {0} {1}'.format(group_name, username)
 
@@ -215,6 +268,13 @@ class UnixShellCmds(base.OSCommands):
         return 'md5sum "{}"'.format(file_path)
     md5sum = md5checksum
 
+    CHECKSUM_COMMANDS = dict(md5='md5sum', sha1='sha1sum', sha256='sha256sum', sha512='sha512sum', blake2b='b2sum')
+
+    def checksum(self, file_path, algorithm='md5'):
+        if algorithm not in self.CHECKSUM_COMMANDS:
+            return super().checksum(file_path, algorithm)
+        return '{} "{}"'.format(self.CHECKSUM_COMMANDS[algorithm], file_path)
+
     def remove(self, file_path, force=True):
         flags = '-f' if force else ''
         return "rm {flags} {file_path}".format(flags=flags, file_path=file_path)
@@ -118,7 +118,7 @@ class WindowsOS(base.OSBase):
             return path_putty
         return None
 
-    def __init__(self, can_change_prompt=True):
+    def __init__(self, can_change_prompt=None):
         super(WindowsOS, self).__init__(can_change_prompt=can_change_prompt)
         self.ssh_app = self._get_ssh_app()
         self.shell_app = os.environ.get('CSIDL_SYSTEM', r'c:\Windows\System32') + r'\cmd.exe'
@@ -162,6 +162,12 @@ class WindowsOS(base.OSBase):
             return lines[1].lower().replace(' ', '')
         raise ValueError('No MD5 data found')
 
+    def checksum_clean(self, data, algorithm='md5'):
+        lines = data.splitlines()
+        if lines and ' hash of' in lines[0]:
+            return lines[1].lower().replace(' ', '')
+        raise ValueError('No {} data found'.format(algorithm.upper()))
+
     def get_info_from_list_file(self, dir_data, filename):
         for line in dir_data.splitlines():
             if filename in line:
@@ -91,6 +91,13 @@ class Win32ShellCmds(base.OSCommands):
     def md5checksum(self, file):
         return 'certutil -hashfile "{}" MD5'.format(file)
 
+    CHECKSUM_ALGORITHMS = dict(md5='MD5', sha1='SHA1', sha256='SHA256', sha512='SHA512')
+
+    def checksum(self, file_path, algorithm='md5'):
+        if algorithm not in self.CHECKSUM_ALGORITHMS:
+            return super().checksum(file_path, algorithm)
+        return 'certutil -hashfile "{}" {}'.format(file_path, self.CHECKSUM_ALGORITHMS[algorithm])
+
     def remove(self, file_path, force=True):
         flags = '-f' if force else ''
         return "del {flags} {file_path}".format(flags=flags, file_path=file_path)
@@ -21,6 +21,9 @@ requires = ['pyyaml',
             'scp',
             'sqlalchemy']
 
+# fdutils.pcap (and its tests) need numpy with sliding_window_view
+extras_require = {'pcap': ['numpy>=1.20']}
+
 package_data={'': ['MANIFEST.in','README.md'],
               'remotelogin': ['known_ports.csv', 'sample_settings.yaml'],
               'remotelogin.oper_sys.busybox': ['base64.sh'],
@@ -31,24 +34,27 @@ package_data={'': ['MANIFEST.in','README.md'],
 setup(
     name=pname,
     version=info['__version__'],
-    packages=find_packages(exclude=()),
+    packages=find_packages(exclude=('benchmarks', 'benchmarks.*')),
     url=info['__url__'],
     author=info['__author__'],
     author_email=info['__email__'],
     description=info['__description__'],
     long_description=long_description,
-    python_requires=">=3.4",
+    python_requires=">=3.7",
     install_requires=requires,
+    extras_require=extras_require,
     classifiers=[
         'Development Status :: 4 - Beta',
         'Environment :: Console',
         'Operating System :: OS Independent',
         'Intended Audience :: Automation',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
     ],
     include_package_data=True,
     package_data=package_data